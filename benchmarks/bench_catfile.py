@@ -0,0 +1,67 @@
+"""
+git オブジェクトの読み取り速度（objects/sec）を比較する。
+
+    python benchmarks/bench_catfile.py [OBJECTS]
+
+HEAD のツリーにある blob を最大 OBJECTS 個（既定 500）読み、次の方式を計測する:
+
+- subprocess: オブジェクトごとに `git cat-file -p` を起動する
+- batch:      CatFile（常駐する `git cat-file --batch`）でまとめて読む（キャッシュなし）
+- single:     CatFile で1個ずつ要求する（パイプラインなし、キャッシュなし）
+- cached:     CatFile の LRU キャッシュから読む
+- check:      CatFile.info()（`--batch-check`、内容は転送しない）
+"""
+import subprocess
+import sys
+import time
+
+from komitto.git_utils import CatFile
+
+
+def head_blobs(limit: int):
+    output = subprocess.run(["git", "ls-tree", "-r", "HEAD"], capture_output=True, text=True).stdout
+    return [line.split()[2] for line in output.splitlines() if line.split()[1] == "blob"][:limit]
+
+
+def report(label: str, count: int, elapsed: float):
+    print(f"{label:>10}: {count / elapsed:12,.0f} objects/s  ({elapsed * 1000:8.1f} ms for {count})")
+
+
+def main():
+    shas = head_blobs(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
+    if not shas:
+        print("no blobs in HEAD")
+        return
+    print(f"{len(shas)} blobs")
+
+    start = time.perf_counter()
+    for sha in shas:
+        subprocess.run(["git", "cat-file", "-p", sha], capture_output=True)
+    report("subprocess", len(shas), time.perf_counter() - start)
+
+    with CatFile(cache_bytes=0) as cat:
+        # git の起動は計測に含めない
+        cat.read_one(shas[0])
+        cat.info(shas[:1])
+        start = time.perf_counter()
+        cat.read(shas)
+        report("batch", len(shas), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for sha in shas:
+            cat.read_one(sha)
+        report("single", len(shas), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        cat.info(shas)
+        report("check", len(shas), time.perf_counter() - start)
+
+    with CatFile() as cat:
+        cat.read(shas)
+        start = time.perf_counter()
+        cat.read(shas)
+        report("cached", len(shas), time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+diff のコンテキストの付け方ごとに、diff 取得のレイテンシとプロンプトのトークン数を比較する。
+
+    python benchmarks/bench_context.py [COMMITS] [BUDGET]
+
+直近の COMMITS 件（既定 30）のコミットを changeset として再現し、次の方式を計測する:
+
+- U0:       `git diff -U0`（従来どおり）
+- adaptive: `git diff -U0` + 1回の `git cat-file --batch` でファイルごとにコンテキストを選ぶ（[git] context = "auto"）
+- U10:      `git diff -U10` をもう1回実行する
+- function: `git diff --function-context` をもう1回実行する
+"""
+import subprocess
+import sys
+import time
+
+from komitto.diff_context import expand_diff_context
+from komitto.prompt import render_file_xml, split_diff
+from komitto.tokens import estimate_tokens
+
+
+def git_diff(parent: str, commit: str, *options: str) -> str:
+    cmd = ["git", "diff", "--no-prefix", "--full-index", *options, parent, commit]
+    return subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8").stdout
+
+
+def prompt_tokens(diff: str) -> int:
+    return estimate_tokens("\n".join(render_file_xml(fd) for fd in split_diff(diff)))
+
+
+def measure(label: str, fn, commits, results):
+    elapsed = 0.0
+    tokens = 0
+    for parent, commit in commits:
+        start = time.perf_counter()
+        diff = fn(parent, commit)
+        elapsed += time.perf_counter() - start
+        tokens += prompt_tokens(diff)
+    results.append((label, elapsed / len(commits), tokens / len(commits)))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    budget = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    shas = subprocess.run(["git", "rev-list", "--no-merges", f"--max-count={count}", "HEAD"],
+                          capture_output=True, text=True).stdout.split()
+    commits = [(sha + "^", sha) for sha in shas if subprocess.run(
+        ["git", "rev-parse", "-q", "--verify", sha + "^"], capture_output=True).returncode == 0]
+    if not commits:
+        print("no commits with a parent")
+        return
+
+    git_config = {"context": "auto", "context_budget": budget}
+    results = []
+    measure("U0", lambda p, c: git_diff(p, c, "-U0"), commits, results)
+    measure("adaptive", lambda p, c: expand_diff_context(git_diff(p, c, "-U0"), git_config), commits, results)
+    measure("U10", lambda p, c: git_diff(p, c, "-U10"), commits, results)
+    measure("function", lambda p, c: git_diff(p, c, "--function-context"), commits, results)
+
+    base_tokens = results[0][2]
+    print(f"{len(commits)} commits, context budget {budget} tokens (averages per changeset)")
+    for label, latency, tokens in results:
+        print(f"{label:>9}: {latency * 1000:7.1f} ms  {tokens:9,.0f} tokens  ({tokens / base_tokens:5.2f}x U0)")
+
+
+if __name__ == "__main__":
+    main()
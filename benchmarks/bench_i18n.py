@@ -0,0 +1,78 @@
+"""
+i18n.t() のスループットとカタログ読み込みの起動コストを計測する。
+
+    python benchmarks/bench_i18n.py [iterations]
+
+比較用に、旧実装（呼び出し毎にドット区切りキーでネストした辞書を辿る方式）も同じ条件で計測する。
+"""
+import sys
+import time
+
+from komitto import i18n
+
+KEYS = [
+    "main.generating",
+    "config.system_prompt",
+    "prompt.recent_logs_instruction",
+    "learn.auto_init_created",
+    "no.such.key",
+]
+
+
+def legacy_t(key, *args):
+    """コンパイル済みカタログ導入前の t() 相当の実装"""
+    lang = i18n.get_current_language()
+    value = i18n._load_translations(lang)
+    for k in key.split('.'):
+        if isinstance(value, dict) and k in value:
+            value = value[k]
+        else:
+            if lang != "en":
+                value = i18n._load_translations("en")
+                for k_en in key.split('.'):
+                    if isinstance(value, dict) and k_en in value:
+                        value = value[k_en]
+                    else:
+                        return key
+                break
+            return key
+    if not isinstance(value, str):
+        return key
+    if args:
+        try:
+            return value.format(*args)
+        except IndexError:
+            return value
+    return value
+
+
+def bench_lookup(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for key in KEYS:
+            fn(key, "x")
+    elapsed = time.perf_counter() - start
+    return iterations * len(KEYS) / elapsed
+
+
+def bench_startup(lang, rounds=200):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        i18n._load_translations.cache_clear()
+        i18n.compile_catalog.cache_clear()
+        i18n.compile_catalog(lang)
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    for lang in ("en", "ja"):
+        i18n.set_language(lang)
+        print(f"[{lang}] catalog load + compile: {bench_startup(lang):.3f} ms")
+        i18n.compile_catalog(lang)
+        print(f"[{lang}] t() compiled: {bench_lookup(i18n.t, iterations):,.0f} calls/s")
+        print(f"[{lang}] t() legacy:   {bench_lookup(legacy_t, iterations):,.0f} calls/s")
+
+
+if __name__ == "__main__":
+    main()
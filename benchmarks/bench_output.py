@@ -0,0 +1,68 @@
+"""
+大きなプロンプトの出力経路のスループットを計測する。
+
+    python benchmarks/bench_output.py [SIZE_MB ...]
+
+既定は 1 / 10 / 100 MB。次の経路を計測する:
+
+- file:      --output FILE（分割書き込み）
+- pipe:      --output - の相当（`cat > /dev/null` へのパイプ）
+- spill:     大きなプロンプトの保存（save_prompt）
+- clipboard: copy_to_clipboard（xclip / wl-copy / pbcopy などが使える場合のみ）
+- console:   従来のフォールバック（rich の console.print、10 MB まで）
+"""
+import io
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from rich.console import Console
+
+from komitto.output import ClipboardError, _write_chunks, clipboard_command, copy_to_clipboard, save_prompt, write_output
+
+
+def sample_text(size: int) -> str:
+    line = "+    result = transform(item)  # 変更 <chunk>\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def pipe(text: str):
+    proc = subprocess.Popen(["cat"], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    _write_chunks(proc.stdin, text.encode("utf-8"))
+    proc.stdin.close()
+    proc.wait()
+
+
+def main():
+    sizes = [float(arg) for arg in sys.argv[1:]] or [1, 10, 100]
+    has_clipboard = clipboard_command() is not None
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_mb in sizes:
+            text = sample_text(int(size_mb * 1024 * 1024))
+            results = {
+                "file": timed(lambda: write_output(text, str(Path(tmp) / "prompt.txt"))),
+                "pipe": timed(lambda: pipe(text)),
+                "spill": timed(lambda: save_prompt(text, Path(tmp) / "prompts")),
+            }
+            if has_clipboard:
+                try:
+                    results["clipboard"] = timed(lambda: copy_to_clipboard(text, timeout=120))
+                except ClipboardError as e:
+                    print(f"clipboard failed: {e}")
+            if size_mb <= 10:
+                results["console"] = timed(lambda: Console(file=io.StringIO(), width=120).print(text))
+
+            summary = "  ".join(f"{name} {size_mb / elapsed:8.1f} MB/s" for name, elapsed in results.items())
+            print(f"{size_mb:6.1f} MB: {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+フル再送による再生成と refine（会話継続＋短い追加指示）のレイテンシとトークン数を比較する。
+
+    git add ... && python benchmarks/bench_refine.py [-m MODEL] [instruction]
+
+komitto.toml の [llm] 設定（または -m で指定したモデル）を使って実際に API を呼び出す。
+"""
+import argparse
+import time
+
+from komitto.config import load_config, resolve_config
+from komitto.git_utils import get_git_diff
+from komitto.history import build_history_context
+from komitto.llm import create_llm_client
+from komitto.prompt import build_prompt
+from komitto.refine import Candidate, CandidateHistory, MODE_REFINE
+
+
+def run(client, messages):
+    text, usage = "", None
+    start = time.perf_counter()
+    for chunk, u in client.stream_chat(messages):
+        text += chunk or ""
+        usage = u or usage
+    return text, usage or {}, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("instruction", nargs="?", default="shorter")
+    parser.add_argument("-m", "--model")
+    args = parser.parse_args()
+
+    config = resolve_config(load_config(), model_name=args.model)
+    llm_config = config.get("llm", {})
+    history_context = build_history_context(config)
+    prompt = build_prompt(
+        config["prompt"]["system"],
+        history_context.text if history_context else None,
+        "",
+        get_git_diff(exclude_patterns=config.get("git", {}).get("exclude", [])),
+    )
+    client = create_llm_client(llm_config)
+    history = CandidateHistory(prompt)
+
+    text, usage, elapsed = run(client, history.full_messages())
+    history.add(Candidate(text=text, usage=usage, elapsed=elapsed, messages=history.full_messages()))
+    print(f"initial: {elapsed:.2f}s {usage}")
+
+    _, usage, elapsed = run(client, history.full_messages())
+    print(f"regenerate (full resend): {elapsed:.2f}s {usage}")
+
+    messages = history.refine_messages(args.instruction)
+    _, usage, elapsed = run(client, messages)
+    refined = history.add(Candidate(text="", mode=MODE_REFINE, usage=usage, elapsed=elapsed, messages=messages))
+    print(f"refine '{args.instruction}': {elapsed:.2f}s {usage}")
+    print(history.compare_to_full(refined))
+
+
+if __name__ == "__main__":
+    main()
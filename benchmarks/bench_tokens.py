@@ -0,0 +1,35 @@
+"""
+送信前のトークン見積もり（komitto.tokens.estimate_tokens）の速度を測る。
+
+    python benchmarks/bench_tokens.py [SIZE_MB ...]
+
+リポジトリの `git log -p` を指定サイズまで繰り返したテキストで計測する。
+"""
+import subprocess
+import sys
+import time
+
+from komitto.tokens import estimate_tokens
+
+
+def sample_text(size: int) -> str:
+    text = subprocess.run(["git", "log", "-p", "-n", "500"], capture_output=True, text=True, encoding="utf-8").stdout
+    text = text or "def f(x):\n    return x * 2  # サンプル\n"
+    return (text * (size // len(text) + 1))[:size]
+
+
+def main():
+    sizes = [float(arg) for arg in sys.argv[1:]] or [0.1, 1, 10]
+    for size_mb in sizes:
+        text = sample_text(int(size_mb * 1024 * 1024))
+        runs = []
+        for _ in range(5):
+            start = time.perf_counter()
+            tokens = estimate_tokens(text)
+            runs.append(time.perf_counter() - start)
+        best = min(runs)
+        print(f"{size_mb:>6.1f} MB: {tokens:>10,} tokens ({len(text) / tokens:.2f} chars/token) in {best * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
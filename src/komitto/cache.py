@@ -0,0 +1,188 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import platformdirs
+
+# [cache] の既定値: この日数使われていないエントリと、上限（バイト）を超えた分の古いエントリを消す
+DEFAULT_MAX_AGE_DAYS = 30
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# 開いたときの掃除は前回からこの秒数が過ぎている場合だけ行う。長く動くプロセスでは書き込み件数ごとにも行う
+PRUNE_INTERVAL = 24 * 60 * 60
+PRUNE_EVERY = 1000
+# 読み込んだエントリの updated_at（最終利用時刻）は、これより古い場合だけ更新する（読み込みのたびには書かない）
+TOUCH_AFTER = 24 * 60 * 60
+
+_META_NAMESPACE = "cache"
+_PRUNED_KEY = "pruned_at"
+
+def default_cache_dir() -> Path:
+    """
+    OS標準のユーザーキャッシュディレクトリ
+    Linux: ~/.cache/komitto, macOS: ~/Library/Caches/komitto, Windows: %LOCALAPPDATA%\\komitto\\Cache
+    """
+    return Path(platformdirs.user_cache_dir("komitto"))
+
+class Cache:
+    """
+    SQLite に JSON 値を保存するシンプルなキー・バリューキャッシュ。
+    namespace ごとにキーを分けて使う（例: "file_xml", "file_summary"）。
+    1つのインスタンスは複数スレッドから共有できる。
+
+    max_age_days / max_bytes を指定すると、使われていないエントリと容量を超えた分の古いエントリを
+    開いたとき（PRUNE_INTERVAL ごと）と PRUNE_EVERY 件書き込むごとに消す。
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_age_days: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        if path is None:
+            path = default_cache_dir() / "cache.sqlite3"
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_age_days = max_age_days or None
+        self.max_bytes = max_bytes or None
+        self._writes = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_updated_at ON entries (updated_at)")
+        if self._prune_due():
+            self.prune()
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        return self.get_many(namespace, [key]).get(key)
+
+    def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        stale = []
+        touch_before = time.time() - TOUCH_AFTER
+        # SQLite のプレースホルダ上限を避けるため分割して問い合わせる
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT key, value, updated_at FROM entries WHERE namespace = ? AND key IN ({placeholders})",
+                    (namespace, *batch)
+                ).fetchall()
+            for key, value, updated_at in rows:
+                found[key] = json.loads(value)
+                if updated_at < touch_before:
+                    stale.append(key)
+        if stale:
+            self._touch(namespace, stale)
+        return found
+
+    def _touch(self, namespace: str, keys: List[str]) -> None:
+        """使われたエントリの最終利用時刻を更新して、期限切れで消されないようにする"""
+        now = time.time()
+        with self._lock, self._conn:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                self._conn.execute(
+                    f"UPDATE entries SET updated_at = ? WHERE namespace = ? AND key IN ({placeholders})",
+                    (now, namespace, *batch)
+                )
+
+    def put(self, namespace: str, key: str, value: Any) -> None:
+        self.put_many(namespace, [(key, value)])
+
+    def put_many(self, namespace: str, items: Iterable[Tuple[str, Any]]) -> None:
+        now = time.time()
+        rows = [(namespace, key, json.dumps(value, ensure_ascii=False), now) for key, value in items]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+        self._writes += len(rows)
+        if self._writes >= PRUNE_EVERY and (self.max_age_days or self.max_bytes):
+            self.prune()
+
+    def _prune_due(self) -> bool:
+        if not (self.max_age_days or self.max_bytes):
+            return False
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT updated_at FROM entries WHERE namespace = ? AND key = ?",
+                (_META_NAMESPACE, _PRUNED_KEY)
+            ).fetchone()
+        return row is None or row[0] < time.time() - PRUNE_INTERVAL
+
+    def _used_bytes(self) -> int:
+        """データベースのうち使用中のページの大きさ（空きページは再利用されるので数えない）"""
+        page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = self._conn.execute("PRAGMA page_count").fetchone()[0]
+        free = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (pages - free) * page_size
+
+    def prune(self) -> int:
+        """
+        max_age_days より長く使われていないエントリを消し、使用量が max_bytes を超えていれば
+        最終利用時刻の古いものから消す。消した件数を返す
+        """
+        now = time.time()
+        removed = 0
+        with self._lock, self._conn:
+            if self.max_age_days:
+                removed += self._conn.execute(
+                    "DELETE FROM entries WHERE updated_at < ? AND namespace != ?",
+                    (now - self.max_age_days * 86400, _META_NAMESPACE)
+                ).rowcount
+            used = self._used_bytes() if self.max_bytes else 0
+            if self.max_bytes and used > self.max_bytes:
+                # ページの使用量と値の大きさの比で、残す値の合計を見積もる（インデックスなどの分を含めるため）
+                payload = self._conn.execute(
+                    "SELECT COALESCE(SUM(LENGTH(CAST(value AS BLOB)) + LENGTH(key)), 0) FROM entries"
+                ).fetchone()[0]
+                keep = payload * self.max_bytes // used
+                removed += self._conn.execute(
+                    "DELETE FROM entries WHERE rowid IN ("
+                    " SELECT rowid FROM ("
+                    "  SELECT rowid, SUM(LENGTH(CAST(value AS BLOB)) + LENGTH(key))"
+                    "   OVER (ORDER BY updated_at DESC, rowid DESC) AS total FROM entries)"
+                    " WHERE total > ?)",
+                    (keep,)
+                ).rowcount
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                (_META_NAMESPACE, _PRUNED_KEY, json.dumps(now), now)
+            )
+        self._writes = 0
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+def open_cache(config: dict) -> Optional[Cache]:
+    """
+    設定で有効な場合にキャッシュを開く。開けない環境では None を返してキャッシュなしで動作させる。
+    max_age_days / max_bytes に 0 を指定すると、その条件では消さない
+    """
+    cache_config = config.get("cache", {})
+    if not cache_config.get("enabled", True):
+        return None
+    try:
+        path = cache_config.get("path")
+        return Cache(Path(path) if path else None,
+                     max_age_days=float(cache_config.get("max_age_days", DEFAULT_MAX_AGE_DAYS)),
+                     max_bytes=int(cache_config.get("max_bytes", DEFAULT_MAX_BYTES)))
+    except (OSError, sqlite3.Error):
+        return None
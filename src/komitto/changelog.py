@@ -0,0 +1,289 @@
+import hashlib
+import re
+import subprocess
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .i18n import t
+from .llm import create_llm_client
+from .scheduler import run_bounded
+
+COMMIT_SUMMARY_NAMESPACE = "commit_summary"
+
+# 要約の形式を変えたら上げる（キャッシュ済みの要約を無効化するため）
+CHANGELOG_FORMAT_VERSION = "1"
+
+DEFAULT_BATCH_SIZE = 40
+MAX_BODY_CHARS = 400
+
+# Conventional Commits の type(scope)!: subject 形式（subject 先頭の絵文字はそのまま残す）
+_CONVENTIONAL_RE = re.compile(r"^(?P<type>[A-Za-z]+)(?:\((?P<scope>[^)]*)\))?(?P<breaking>!)?:\s*(?P<subject>.*)$")
+
+# セクションの既定の並び順。履歴に現れたそれ以外の type は出現数順に後ろへ並べる
+_TYPE_ORDER = ["feat", "fix", "perf", "refactor", "docs", "style", "test", "build", "ci", "chore", "revert"]
+
+OTHER_TYPE = "other"
+
+_RECORD_SEP = "\x1e"
+_FIELD_SEP = "\x1f"
+
+@dataclass
+class CommitEntry:
+    """changelog 用に保持する1コミット分の情報（本文は要約用に切り詰めて持つ）"""
+    sha: str
+    type: str
+    scope: str
+    subject: str
+    body: str = ""
+    breaking: bool = False
+
+def parse_subject(subject: str) -> Tuple[str, str, str, bool]:
+    """件名から (type, scope, subject, breaking) を取り出す。規約に沿わない件名は type='other'"""
+    match = _CONVENTIONAL_RE.match(subject.strip())
+    if not match:
+        return OTHER_TYPE, "", subject.strip(), False
+    return (
+        match.group("type").lower(),
+        (match.group("scope") or "").strip(),
+        match.group("subject").strip(),
+        bool(match.group("breaking"))
+    )
+
+def count_commits(rev_range: str) -> Optional[int]:
+    """範囲内のコミット数（プログレスバー用）。取得できない場合は None"""
+    result = subprocess.run(
+        ["git", "rev-list", "--count", "--no-merges", rev_range],
+        capture_output=True, text=True, encoding='utf-8'
+    )
+    if result.returncode != 0:
+        return None
+    try:
+        return int(result.stdout.strip())
+    except ValueError:
+        return None
+
+def iter_commits(rev_range: str) -> Iterator[CommitEntry]:
+    """
+    git log の出力を逐次読み込みながらコミットを返す。
+    出力全体をメモリに載せないため、数千コミットの範囲でも使用メモリは一定に保たれる。
+    途中で閉じられた場合（break など）は git log を止めるだけで、終了コードは確認しない。
+    """
+    cmd = [
+        "git", "log", "--no-merges",
+        f"--format=%H{_FIELD_SEP}%s{_FIELD_SEP}%b{_RECORD_SEP}",
+        rev_range
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8')
+    buffer = ""
+    try:
+        while True:
+            data = proc.stdout.read(65536)
+            if not data:
+                break
+            buffer += data
+            *records, buffer = buffer.split(_RECORD_SEP)
+            for record in records:
+                entry = _parse_record(record)
+                if entry:
+                    yield entry
+        # 最後まで読んだときだけ終了コードを確認する
+        stderr = proc.stderr.read()
+        if proc.wait() != 0:
+            raise RuntimeError(stderr.strip() or f"git log {rev_range} failed")
+        entry = _parse_record(buffer)
+        if entry:
+            yield entry
+    finally:
+        proc.stdout.close()
+        proc.stderr.close()
+        if proc.poll() is None:
+            proc.terminate()
+            proc.wait()
+
+def _parse_record(record: str) -> Optional[CommitEntry]:
+    record = record.strip("\n")
+    if not record:
+        return None
+    sha, _, rest = record.partition(_FIELD_SEP)
+    subject, _, body = rest.partition(_FIELD_SEP)
+    c_type, scope, text, breaking = parse_subject(subject)
+    body = body.strip()
+    breaking = breaking or "BREAKING CHANGE" in body
+    return CommitEntry(
+        sha=sha.strip(),
+        type=c_type,
+        scope=scope,
+        subject=text,
+        body=body[:MAX_BODY_CHARS],
+        breaking=breaking
+    )
+
+def _summary_key(llm_config: dict, sha: str) -> str:
+    raw = "\0".join([CHANGELOG_FORMAT_VERSION, str(llm_config.get("provider", "")), str(llm_config.get("model", "")), sha])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _batch_prompt(entries: List[CommitEntry]) -> str:
+    lines = []
+    for entry in entries:
+        lines.append(f"<commit sha=\"{entry.sha[:12]}\">\n{entry.subject}\n{entry.body}\n</commit>")
+    return t("prompt.changelog_instruction", "\n".join(lines))
+
+def _parse_batch_response(text: str, entries: List[CommitEntry]) -> Dict[str, str]:
+    by_prefix = {entry.sha[:12]: entry.sha for entry in entries}
+    summaries = {}
+    for line in text.splitlines():
+        line = line.strip().lstrip("-*").strip()
+        prefix, sep, summary = line.partition(":")
+        prefix = prefix.strip().strip("`")
+        if sep and prefix in by_prefix and summary.strip():
+            summaries[by_prefix[prefix]] = summary.strip()
+    return summaries
+
+def _type_title(c_type: str) -> str:
+    """既知の type は翻訳済みの見出しに、履歴から学んだ type はそのまま見出しにする"""
+    key = f"changelog.type_{c_type}"
+    title = t(key)
+    return c_type if title == key else title
+
+class ChangelogBuilder:
+    """
+    コミット範囲からリリースノートを組み立てる。
+    コミットごとの要約は SHA をキーにキャッシュされるので、範囲が重なる実行では再利用される。
+    """
+
+    def __init__(self, config: dict, cache=None, client_factory=None):
+        self.llm_config = config.get("llm", {})
+        self.cache = cache
+        self.client_factory = client_factory or create_llm_client
+        self.concurrency = max(1, int(self.llm_config.get("map_concurrency", 4)))
+        self.batch_size = max(1, int(self.llm_config.get("changelog_batch_size", DEFAULT_BATCH_SIZE)))
+        self.use_llm = bool(self.llm_config.get("provider"))
+
+        # (type, scope) -> [(sha, subject, breaking)]
+        self.groups: Dict[Tuple[str, str], List[Tuple[str, str, bool]]] = OrderedDict()
+        self.type_counts: Counter = Counter()
+        self.summaries: Dict[str, str] = {}
+
+    def collect(self, rev_range: str, on_progress: Optional[Callable[[int], None]] = None) -> int:
+        """
+        範囲内のコミットを読み込み、type/scope ごとにまとめる。
+        要約が未キャッシュのコミットは batch_size ごとにまとめて並列に要約する。
+        """
+        count = 0
+
+        def batches() -> Iterator[List[CommitEntry]]:
+            # run_bounded が必要な分だけ読み進めるので、LLM が git log の読み込みに追いつかない場合でもメモリは一定
+            nonlocal count
+            pending: List[CommitEntry] = []
+            for entry in iter_commits(rev_range):
+                count += 1
+                self.type_counts[entry.type] += 1
+                self.groups.setdefault((entry.type, entry.scope), []).append((entry.sha, entry.subject, entry.breaking))
+
+                if self.use_llm:
+                    pending.append(entry)
+                    if len(pending) >= self.batch_size:
+                        yield pending
+                        pending = []
+                elif on_progress:
+                    on_progress(1)
+            if pending:
+                yield pending
+
+        for batch, future in run_bounded(self._summarize_batch, batches(), self.concurrency):
+            future.result()
+            if on_progress:
+                on_progress(len(batch))
+
+        return count
+
+    def _summarize_batch(self, entries: List[CommitEntry]) -> None:
+        keys = {entry.sha: _summary_key(self.llm_config, entry.sha) for entry in entries}
+        cached = self.cache.get_many(COMMIT_SUMMARY_NAMESPACE, keys.values()) if self.cache else {}
+
+        missing = []
+        for entry in entries:
+            key = keys[entry.sha]
+            if key in cached:
+                self.summaries[entry.sha] = cached[key]
+            else:
+                missing.append(entry)
+
+        if missing:
+            client = self.client_factory(self.llm_config)
+            text = ""
+            for chunk, _ in client.stream(_batch_prompt(missing)):
+                if chunk:
+                    text += chunk
+            generated = _parse_batch_response(text, missing)
+            self.summaries.update(generated)
+            if self.cache:
+                self.cache.put_many(COMMIT_SUMMARY_NAMESPACE, [(keys[sha], s) for sha, s in generated.items()])
+
+    def ordered_types(self) -> List[str]:
+        known = [c_type for c_type in _TYPE_ORDER if c_type in self.type_counts]
+        learned = [c_type for c_type, _ in self.type_counts.most_common()
+                   if c_type not in _TYPE_ORDER and c_type != OTHER_TYPE]
+        tail = [OTHER_TYPE] if OTHER_TYPE in self.type_counts else []
+        return known + learned + tail
+
+    def render_markdown(self, rev_range: str) -> str:
+        lines = [f"# {t('changelog.title', rev_range)}", ""]
+
+        breaking = [(sha, subject) for entries in self.groups.values() for sha, subject, is_breaking in entries if is_breaking]
+        if breaking:
+            lines.append(f"## ⚠️ {t('changelog.breaking_changes')}")
+            lines.append("")
+            for sha, subject in breaking:
+                lines.append(f"- {self.summaries.get(sha, subject)} ({sha[:7]})")
+            lines.append("")
+
+        for c_type in self.ordered_types():
+            scopes = [(scope, entries) for (g_type, scope), entries in self.groups.items() if g_type == c_type]
+            if not scopes:
+                continue
+            lines.append(f"## {_type_title(c_type)}")
+            lines.append("")
+            for scope, entries in sorted(scopes, key=lambda item: item[0]):
+                prefix = f"**{scope}:** " if scope else ""
+                for sha, subject, _ in entries:
+                    lines.append(f"- {prefix}{self.summaries.get(sha, subject)} ({sha[:7]})")
+            lines.append("")
+
+        return "\n".join(lines).rstrip() + "\n"
+
+def generate_changelog(config: dict, rev_range: str, cache=None) -> Optional[str]:
+    """
+    `komitto changelog A..B` のエントリポイント。
+    進捗は stderr に表示し、Markdown は stdout に出力する（リダイレクトしてファイルに保存できる）。
+    """
+    import sys
+    from rich.console import Console
+    from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, MofNCompleteColumn, TimeElapsedColumn
+
+    console = Console(stderr=True)
+    if not rev_range or ".." not in rev_range:
+        console.print(t("changelog.invalid_range"), style="yellow")
+        return None
+
+    builder = ChangelogBuilder(config, cache=cache)
+    try:
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("{task.description}"),
+            BarColumn(),
+            MofNCompleteColumn(),
+            TimeElapsedColumn(),
+            console=console,
+            transient=True
+        ) as progress:
+            task = progress.add_task(t("changelog.progress", rev_range), total=count_commits(rev_range))
+            builder.collect(rev_range, lambda n: progress.advance(task, n))
+    except Exception as e:
+        console.print(f"[#e06c75]❌ {t('changelog.failed', e)}[/#e06c75]")
+        return None
+
+    markdown = builder.render_markdown(rev_range)
+    sys.stdout.write(markdown)
+    return markdown
@@ -0,0 +1,36 @@
+import argparse
+import sys
+
+# コンソールスクリプトの入口。--json/--stdio は komitto.main とその import（Rich、pyperclip、エディタ、
+# LLM クライアント）より前にここで振り分け、エディタプラグインからの起動を軽くする
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Generate semantic commit prompt for LLMs from git diff.")
+    parser.add_argument('context', nargs='*', help='Optional context or comments about the changes')
+    parser.add_argument('-i', '--interactive', action='store_true', help='Enable interactive mode to review/edit the message')
+    parser.add_argument('-c', '--context-name', dest='context_name', help='Specify a context profile from config')
+    parser.add_argument('-t', '--template', help='Specify a prompt template from config')
+    parser.add_argument('-m', '--model', help='Specify a model config from config')
+    parser.add_argument('--compare', nargs=2, metavar=('CTX1', 'CTX2'), help='Compare two contexts (by name)')
+    parser.add_argument('--split-packages', dest='split_packages', action='store_true', help='Commit each monorepo package separately')
+    parser.add_argument('--dry-run', dest='dry_run', action='store_true', help='Print estimated tokens and cost per prompt section without sending')
+    parser.add_argument('--force', action='store_true', help='Overwrite an existing hook (hook install)')
+    parser.add_argument('--offline', action='store_true', help='Build a heuristic message locally without calling an LLM')
+    parser.add_argument('--json', action='store_true', help='Emit newline-delimited JSON events instead of rendering (no clipboard)')
+    parser.add_argument('--stdio', action='store_true', help='Serve JSON requests from stdin and emit JSON events (for editor plugins)')
+    parser.add_argument('--preview', action='store_true', help='Review the prompt by section with token counts and exclude files/chunks before sending (implies -i)')
+    parser.add_argument('--resume', action='store_true', help='Reopen the last generation session from the journal without calling the LLM')
+    parser.add_argument('-o', '--output', metavar='FILE', help='Write the prompt to FILE ("-" for stdout) instead of the clipboard, without calling the LLM')
+    parser.add_argument('--profile', nargs='?', const='', metavar='FILE', help='Profile each pipeline stage (cProfile, tracemalloc, import time) and write a report to FILE (default: the cache directory)')
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    if args.stdio or args.json:
+        from .headless import run_json, run_stdio
+        sys.exit(run_stdio() if args.stdio else run_json(args))
+    from .main import main as run_main
+    run_main(args)
+
+if __name__ == "__main__":
+    main()
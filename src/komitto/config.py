@@ -2,6 +2,7 @@ import sys
 from pathlib import Path
 import platformdirs
 import copy
+import re
 
 try:
     import tomllib
@@ -32,6 +33,11 @@ def load_config():
                 "go.sum",
                 "*.lock"
             ]
+        },
+        "cache": {
+            "enabled": True,
+            "file_summaries": False,
+            "summary_threshold": 30000
         }
     }
 
@@ -120,11 +126,29 @@ system = \"\"\"
 # [llm]
 # # Uncomment and configure below to use AI auto-generation
 # # AI自動生成を使用する場合は以下をコメントアウト解除して設定してください
-# provider = "openai" # "openai", "gemini", "anthropic"
+# provider = "openai" # "openai", "gemini", "anthropic", "ollama", "llamacpp"
 # model = "gpt-4o"
 # # api_key = "sk-..." # Optional if environment variable is set / 省略時は環境変数を使用
 # # base_url = "http://localhost:11434/v1" # For Ollama etc. / Ollamaなどの場合
 # # history_limit = 5 # Number of past commits to include / プロンプトに含める過去のコミット数
+# # history_max_files = 10 # File lines listed per past commit (0 = all) / 過去のコミット1件あたりに載せるファイル行数
+# # history_collapse = 4 # Collapse a directory into one line from this many files (0 = off) / この数以上のファイルを持つディレクトリを1行にまとめる
+# # offline = false # Never call the LLM; build a heuristic draft locally (same as --offline) / LLM を呼ばずにローカルで下書きを作る
+# # map_reduce = "auto" # Summarize huge changesets in parts first ("auto", true, false) / 巨大な変更を分割要約してから生成
+# # max_input_chars = 300000 # Prompt size that triggers map-reduce / map-reduce に切り替えるプロンプトサイズ
+# # map_group_chars = 60000 # Size of each summarized part / 分割要約の1単位のサイズ
+# # map_concurrency = 4 # Parallel summary requests / 並列要約リクエスト数
+# # timeout = 120 # Overall request timeout in seconds / リクエスト全体のタイムアウト（秒）
+# # connect_timeout = 10 # Connection timeout / 接続のタイムアウト
+# # first_token_timeout = 30 # Give up (and retry) if no token arrives in time / 最初のトークンが届かない場合は打ち切って再試行
+# # max_retries = 2 # Retries on 429/5xx with jittered backoff (honors Retry-After) / 429・5xx 時の再試行回数
+# # retry_backoff = 1.0 # Base backoff in seconds / 再試行の基本待ち時間（秒）
+# # max_cost = 0.05 # USD per request, estimated locally before sending / 送信前に見積もる1回あたりの費用上限（USD）
+# # cost_guard = "stop" # "stop" or "compact" (send large files as line counts) / 超過時に中止するか、大きなファイルを行数のみにして送るか
+# # candidates = 3 # Alternatives generated at once with "n" in the TUI (one request where the provider supports it) / TUI の n で一度に生成する候補数
+# # candidate_temperature = 0.9 # Sampling temperature for those candidates / 候補生成時の temperature
+# # rpm = 60 # Requests per minute shared by every komitto process using this key (queues instead of 429s) / 同じキーを使う全プロセスで共有する毎分のリクエスト数
+# # tpm = 90000 # Tokens per minute, shared the same way / 同様に共有する毎分のトークン数
 
 [git]
 # Files to exclude from the diff (glob patterns)
@@ -138,6 +162,63 @@ exclude = [
     "go.sum",
     "*.lock"
 ]
+# Surrounding context for small changes: "auto" (enclosing function or a few lines, per file) or "none" (-U0)
+# 小さな変更に付ける周辺のコンテキスト: "auto"（ファイルごとに関数全体か前後数行）または "none"（-U0 のまま）
+# context = "auto"
+# context_budget = 2000       # Extra tokens for context across the changeset / changeset 全体で使う追加トークン数
+# context_lines = 3           # Fallback when no enclosing function is found / 関数が見つからない場合の前後の行数
+# function_context_lines = 60 # Max lines of function context on each side / 関数コンテキストの前後それぞれの最大行数
+# context_max_changed = 80    # Files with more changed lines stay at -U0 / 変更行数がこれを超えるファイルは -U0 のまま
+
+# [cache]
+# # Per-file cache keyed by blob SHAs (stored in the user cache directory)
+# # blob SHA をキーにしたファイル単位のキャッシュ（ユーザーキャッシュディレクトリに保存）
+# enabled = true
+# # For large changesets, send one-line summaries for files unchanged since the previous run
+# # 大きな変更では、前回の実行から変わっていないファイルを1行要約で送る
+# file_summaries = false
+# summary_threshold = 30000 # chars / 文字数
+# # Entries unused for this many days, and the oldest entries beyond max_bytes, are removed (0 = keep)
+# # この日数使われていないエントリと、max_bytes を超えた分の古いエントリを消す（0 = 消さない）
+# max_age_days = 30
+# max_bytes = 268435456
+
+# [output]
+# # Prompts larger than this are saved to a file and only the path is copied
+# # これより大きいプロンプトはファイルに保存し、パスだけをクリップボードにコピーする
+# clipboard_max_bytes = 1048576
+# clipboard_timeout = 5 # seconds / 秒
+
+# [session]
+# # Journal of streamed generations for `komitto --resume` (stored in the user cache directory)
+# # `komitto --resume` 用の生成の記録（ユーザーキャッシュディレクトリに保存）
+# enabled = true
+# max_bytes = 4194304 # Rotated when exceeded (one old generation is kept) / 超えたらローテーション（1世代を保持）
+
+# [message]
+# # Cleanup and checks applied to generated messages / 生成されたメッセージの整形と検証
+# enabled = true # Strip code fences and preambles, wrap the body / コードフェンスや前置きを除き、本文を折り返す
+# subject_max = 72
+# body_width = 72 # 0 = no wrapping / 0 で折り返さない
+# conventional = false # Validate `type(scope): description` / Conventional Commits 形式を検証する
+# types = ["feat", "fix", "docs", "style", "refactor", "perf", "test", "build", "ci", "chore", "revert"]
+# scopes = [] # Allowed scopes (empty = any) / 許可する scope（空なら制限なし）
+# require_scope = false
+# repair = true # On a rule violation, send a short repair request instead of regenerating / 違反時は再生成せず短い修正依頼を送る
+
+# [monorepo]
+# # Summarize each touched package separately, then write one message with a section per package
+# # 変更のあったパッケージごとに要約し、パッケージ別のセクションを持つメッセージを生成する
+# enabled = true
+# packages = ["apps/web", "services/api"] # Path prefixes; if empty, the nearest marker file decides / 空なら最も近いマーカーファイルで判定
+# markers = ["pyproject.toml", "package.json"]
+# split_commits = false # One commit per package (same as --split-packages) / パッケージごとに別々のコミットにする
+
+# [hook]
+# # Settings for the hook installed by `komitto hook install` / `komitto hook install` で入れるフックの設定
+# budget = 2.0 # Never delay `git commit` longer than this (seconds) / git commit を待たせる最大秒数
+# speculate = true # Keep generating in the background after the budget / 予算切れ後もバックグラウンドで生成を続ける
+# model = "fast" # Model profile from [models] / [models] のモデル設定名
 
 # --- Advanced Settings (Templates & Contexts) ---
 # You can define reusable templates and contexts for different workflows.
@@ -149,6 +230,12 @@ exclude = [
 # [models.gpt4]
 # provider = "openai"
 # model = "gpt-4o"
+# timeout = 60 # Timeouts and retries can be set per model / タイムアウトと再試行はモデルごとにも設定可能
+
+# [pricing."gpt-4o"]
+# # USD per 1M tokens, used by --dry-run and max_cost / 100万トークンあたりの単価（USD）。--dry-run と max_cost で使用
+# input = 2.5
+# output = 10.0
 
 # [contexts.release]
 # template = "simple"
@@ -213,11 +300,29 @@ system = \"\"\"
 # [llm]
 # # Uncomment and configure below to use AI auto-generation
 # # AI自動生成を使用する場合は以下をコメントアウト解除して設定してください
-# provider = "openai" # "openai", "gemini", "anthropic"
+# provider = "openai" # "openai", "gemini", "anthropic", "ollama", "llamacpp"
 # model = "gpt-4o"
 # # api_key = "sk-..." # Optional if environment variable is set / 省略時は環境変数を使用
 # # base_url = "http://localhost:11434/v1" # For Ollama etc. / Ollamaなどの場合
 # # history_limit = 5 # Number of past commits to include / プロンプトに含める過去のコミット数
+# # history_max_files = 10 # File lines listed per past commit (0 = all) / 過去のコミット1件あたりに載せるファイル行数
+# # history_collapse = 4 # Collapse a directory into one line from this many files (0 = off) / この数以上のファイルを持つディレクトリを1行にまとめる
+# # offline = false # Never call the LLM; build a heuristic draft locally (same as --offline) / LLM を呼ばずにローカルで下書きを作る
+# # map_reduce = "auto" # Summarize huge changesets in parts first ("auto", true, false) / 巨大な変更を分割要約してから生成
+# # max_input_chars = 300000 # Prompt size that triggers map-reduce / map-reduce に切り替えるプロンプトサイズ
+# # map_group_chars = 60000 # Size of each summarized part / 分割要約の1単位のサイズ
+# # map_concurrency = 4 # Parallel summary requests / 並列要約リクエスト数
+# # timeout = 120 # Overall request timeout in seconds / リクエスト全体のタイムアウト（秒）
+# # connect_timeout = 10 # Connection timeout / 接続のタイムアウト
+# # first_token_timeout = 30 # Give up (and retry) if no token arrives in time / 最初のトークンが届かない場合は打ち切って再試行
+# # max_retries = 2 # Retries on 429/5xx with jittered backoff (honors Retry-After) / 429・5xx 時の再試行回数
+# # retry_backoff = 1.0 # Base backoff in seconds / 再試行の基本待ち時間（秒）
+# # max_cost = 0.05 # USD per request, estimated locally before sending / 送信前に見積もる1回あたりの費用上限（USD）
+# # cost_guard = "stop" # "stop" or "compact" (send large files as line counts) / 超過時に中止するか、大きなファイルを行数のみにして送るか
+# # candidates = 3 # Alternatives generated at once with "n" in the TUI (one request where the provider supports it) / TUI の n で一度に生成する候補数
+# # candidate_temperature = 0.9 # Sampling temperature for those candidates / 候補生成時の temperature
+# # rpm = 60 # Requests per minute shared by every komitto process using this key (queues instead of 429s) / 同じキーを使う全プロセスで共有する毎分のリクエスト数
+# # tpm = 90000 # Tokens per minute, shared the same way / 同様に共有する毎分のトークン数
 
 [git]
 # Files to exclude from the diff (glob patterns)
@@ -231,6 +336,63 @@ exclude = [
     "go.sum",
     "*.lock"
 ]
+# Surrounding context for small changes: "auto" (enclosing function or a few lines, per file) or "none" (-U0)
+# 小さな変更に付ける周辺のコンテキスト: "auto"（ファイルごとに関数全体か前後数行）または "none"（-U0 のまま）
+# context = "auto"
+# context_budget = 2000       # Extra tokens for context across the changeset / changeset 全体で使う追加トークン数
+# context_lines = 3           # Fallback when no enclosing function is found / 関数が見つからない場合の前後の行数
+# function_context_lines = 60 # Max lines of function context on each side / 関数コンテキストの前後それぞれの最大行数
+# context_max_changed = 80    # Files with more changed lines stay at -U0 / 変更行数がこれを超えるファイルは -U0 のまま
+
+# [cache]
+# # Per-file cache keyed by blob SHAs (stored in the user cache directory)
+# # blob SHA をキーにしたファイル単位のキャッシュ（ユーザーキャッシュディレクトリに保存）
+# enabled = true
+# # For large changesets, send one-line summaries for files unchanged since the previous run
+# # 大きな変更では、前回の実行から変わっていないファイルを1行要約で送る
+# file_summaries = false
+# summary_threshold = 30000 # chars / 文字数
+# # Entries unused for this many days, and the oldest entries beyond max_bytes, are removed (0 = keep)
+# # この日数使われていないエントリと、max_bytes を超えた分の古いエントリを消す（0 = 消さない）
+# max_age_days = 30
+# max_bytes = 268435456
+
+# [output]
+# # Prompts larger than this are saved to a file and only the path is copied
+# # これより大きいプロンプトはファイルに保存し、パスだけをクリップボードにコピーする
+# clipboard_max_bytes = 1048576
+# clipboard_timeout = 5 # seconds / 秒
+
+# [session]
+# # Journal of streamed generations for `komitto --resume` (stored in the user cache directory)
+# # `komitto --resume` 用の生成の記録（ユーザーキャッシュディレクトリに保存）
+# enabled = true
+# max_bytes = 4194304 # Rotated when exceeded (one old generation is kept) / 超えたらローテーション（1世代を保持）
+
+# [message]
+# # Cleanup and checks applied to generated messages / 生成されたメッセージの整形と検証
+# enabled = true # Strip code fences and preambles, wrap the body / コードフェンスや前置きを除き、本文を折り返す
+# subject_max = 72
+# body_width = 72 # 0 = no wrapping / 0 で折り返さない
+# conventional = false # Validate `type(scope): description` / Conventional Commits 形式を検証する
+# types = ["feat", "fix", "docs", "style", "refactor", "perf", "test", "build", "ci", "chore", "revert"]
+# scopes = [] # Allowed scopes (empty = any) / 許可する scope（空なら制限なし）
+# require_scope = false
+# repair = true # On a rule violation, send a short repair request instead of regenerating / 違反時は再生成せず短い修正依頼を送る
+
+# [monorepo]
+# # Summarize each touched package separately, then write one message with a section per package
+# # 変更のあったパッケージごとに要約し、パッケージ別のセクションを持つメッセージを生成する
+# enabled = true
+# packages = ["apps/web", "services/api"] # Path prefixes; if empty, the nearest marker file decides / 空なら最も近いマーカーファイルで判定
+# markers = ["pyproject.toml", "package.json"]
+# split_commits = false # One commit per package (same as --split-packages) / パッケージごとに別々のコミットにする
+
+# [hook]
+# # Settings for the hook installed by `komitto hook install` / `komitto hook install` で入れるフックの設定
+# budget = 2.0 # Never delay `git commit` longer than this (seconds) / git commit を待たせる最大秒数
+# speculate = true # Keep generating in the background after the budget / 予算切れ後もバックグラウンドで生成を続ける
+# model = "fast" # Model profile from [models] / [models] のモデル設定名
 
 # --- Advanced Settings (Templates & Contexts) ---
 # You can define reusable templates and contexts for different workflows.
@@ -242,6 +404,12 @@ exclude = [
 # [models.gpt4]
 # provider = "openai"
 # model = "gpt-4o"
+# timeout = 60 # Timeouts and retries can be set per model / タイムアウトと再試行はモデルごとにも設定可能
+
+# [pricing."gpt-4o"]
+# # USD per 1M tokens, used by --dry-run and max_cost / 100万トークンあたりの単価（USD）。--dry-run と max_cost で使用
+# input = 2.5
+# output = 10.0
 
 # [contexts.release]
 # template = "simple"
@@ -304,10 +472,13 @@ def _build_toml_content(config: dict, new_system_prompt: str) -> str:
                 lines.append(f'    "{pattern}",')
             lines.append("]")
     
-    for section_name in ["templates", "models", "contexts"]:
+    for section_name in ["templates", "models", "contexts", "pricing"]:
         if section_name in config:
             lines.append("")
             for subsection_name, subsection_data in config[section_name].items():
+                # "gpt-4.1" のようにドットを含む名前はクォートする
+                if not re.fullmatch(r"[A-Za-z0-9_-]+", subsection_name):
+                    subsection_name = f'"{subsection_name}"'
                 lines.append(f"[{section_name}.{subsection_name}]")
                 for key, value in subsection_data.items():
                     lines.append(f"{key} = {repr(value)}")
@@ -0,0 +1,232 @@
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .git_utils import read_blobs
+from .heuristic import definition_name
+from .prompt import FileDiff, split_diff
+from .tokens import estimate_tokens
+
+# [git] context: "auto"（ファイルごとに選ぶ）か "none"（-U0 のまま）
+CONTEXT_AUTO = "auto"
+CONTEXT_NONE = "none"
+
+LEVEL_FUNCTION = "function"
+LEVEL_LINES = "lines"
+
+# changeset 全体でコンテキストに使ってよいトークン数（[git] context_budget）
+DEFAULT_BUDGET = 2000
+# 関数を特定できないときの前後の行数（[git] context_lines）
+DEFAULT_LINES = 3
+# 関数コンテキストとして前後それぞれに含める最大行数（[git] function_context_lines）
+DEFAULT_FUNCTION_LINES = 60
+# 変更行数がこれを超えるファイルは -U0 のまま（[git] context_max_changed）
+DEFAULT_MAX_CHANGED = 80
+
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@(.*)$")
+_CLOSING = ("}", ")", "]", "end")
+
+@dataclass
+class Hunk:
+    """-U0 の hunk 1つ（変更行だけを含む）"""
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    scope: str
+    lines: List[str] = field(default_factory=list)
+
+    @property
+    def start(self) -> int:
+        """新しいファイルでの変更位置（0始まり）。追加行がない場合は削除位置の直後の行"""
+        return self.new_start - 1 if self.new_count else self.new_start
+
+    @property
+    def end(self) -> int:
+        return self.start + self.new_count
+
+@dataclass
+class FileContext:
+    """ファイルごとに選んだコンテキストの種類と、それで増えるトークン数"""
+    path: str
+    level: str
+    tokens: int
+    changed: int
+
+def parse_hunks(fd: FileDiff) -> Tuple[List[str], List[Hunk]]:
+    """diff のヘッダー行と hunk に分ける"""
+    header: List[str] = []
+    hunks: List[Hunk] = []
+    for line in fd.lines:
+        match = _HUNK_RE.match(line)
+        if match:
+            old_start, old_count, new_start, new_count, scope = match.groups()
+            hunks.append(Hunk(
+                int(old_start), 1 if old_count is None else int(old_count),
+                int(new_start), 1 if new_count is None else int(new_count),
+                scope
+            ))
+        elif hunks:
+            hunks[-1].lines.append(line)
+        else:
+            header.append(line)
+    # 末尾の空行（diff 全体の最後の改行）は hunk の一部ではない
+    if hunks and hunks[-1].lines and hunks[-1].lines[-1] == "":
+        hunks[-1].lines.pop()
+    return header, hunks
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+def _function_window(lines: List[str], hunk: Hunk, max_lines: int) -> Optional[Tuple[int, int]]:
+    """hunk を囲む関数（定義行から、同じ深さに戻るまで）の範囲。見つからなければ None"""
+    changed = [line for line in lines[hunk.start:hunk.end] if line.strip()]
+    reference = changed[0] if changed else (lines[hunk.start] if hunk.start < len(lines) else "")
+    ref_indent = _indent(reference) if reference.strip() else 10 ** 6
+
+    start = None
+    for i in range(hunk.start - 1, max(-1, hunk.start - 1 - max_lines), -1):
+        if lines[i].strip() and _indent(lines[i]) <= ref_indent and definition_name(lines[i]):
+            start = i
+            break
+    if start is None:
+        return None
+
+    def_indent = _indent(lines[start])
+    end = min(len(lines), hunk.end + max_lines)
+    for i in range(hunk.end, end):
+        line = lines[i]
+        if line.strip() and _indent(line) <= def_indent:
+            end = i + 1 if line.strip().startswith(_CLOSING) else i
+            break
+    # 関数の後ろの空行は含めない
+    while end > hunk.end and not lines[end - 1].strip():
+        end -= 1
+    return start, end
+
+def context_windows(lines: List[str], hunks: List[Hunk], level: str, context_lines: int = DEFAULT_LINES,
+                    function_lines: int = DEFAULT_FUNCTION_LINES) -> List[Tuple[int, int]]:
+    """
+    各 hunk の前後に付けるコンテキストの範囲 [開始, 終了)（新しいファイルの行番号、0始まり）。
+    隣り合う hunk のコンテキストは重ならないように切り詰める。
+    """
+    windows = []
+    previous_end = 0
+    for i, hunk in enumerate(hunks):
+        window = None
+        if level == LEVEL_FUNCTION:
+            window = _function_window(lines, hunk, function_lines)
+        if window is None:
+            window = (hunk.start - context_lines, hunk.end + context_lines)
+        next_start = hunks[i + 1].start if i + 1 < len(hunks) else len(lines)
+        begin = min(max(window[0], previous_end, 0), hunk.start)
+        end = max(min(window[1], next_start, len(lines)), hunk.end)
+        windows.append((begin, end))
+        previous_end = end
+    return windows
+
+def render_hunks(lines: List[str], hunks: List[Hunk], windows: List[Tuple[int, int]]) -> List[str]:
+    """コンテキスト行（" " 始まり）を加えた hunk を、行番号を合わせたヘッダー付きで出力する"""
+    output = []
+    offset = 0  # 変更のない行の (旧ファイルの行番号 - 新ファイルの行番号)
+    for hunk, (begin, end) in zip(hunks, windows):
+        before = lines[begin:hunk.start]
+        after = lines[hunk.end:end]
+        if not before and not after:
+            output.append(f"@@ -{hunk.old_start},{hunk.old_count} +{hunk.new_start},{hunk.new_count} @@{hunk.scope}")
+        else:
+            old_count = len(before) + hunk.old_count + len(after)
+            new_count = len(before) + hunk.new_count + len(after)
+            output.append(f"@@ -{begin + offset + 1},{old_count} +{begin + 1},{new_count} @@{hunk.scope}")
+        output.extend(" " + line for line in before)
+        output.extend(hunk.lines)
+        output.extend(" " + line for line in after)
+        offset += hunk.old_count - hunk.new_count
+    return output
+
+def _is_null(sha: Optional[str]) -> bool:
+    return not sha or not sha.strip("0")
+
+def _expandable(fd: FileDiff) -> bool:
+    """追加・削除されたファイル、サブモジュール、バイナリにはコンテキストを付けない"""
+    if _is_null(fd.old_sha) or _is_null(fd.new_sha):
+        return False
+    return not fd.is_submodule
+
+def _changed_lines(hunks: List[Hunk]) -> int:
+    return sum(hunk.old_count + hunk.new_count for hunk in hunks)
+
+def plan_context(files: List[FileDiff], git_config: Optional[dict] = None, family: str = "openai",
+                 read: Callable[[Iterable[str]], Dict[str, bytes]] = read_blobs) -> Tuple[Dict[str, List[str]], List[FileContext]]:
+    """
+    ファイルごとにコンテキストの種類を選ぶ。変更の小さいファイルから順に、予算内なら関数コンテキスト、
+    次に前後数行を割り当て、大きな変更や予算を超える分は -U0 のままにする。
+    新しい blob は共有の `git cat-file --batch` ワーカーへの1回の要求でまとめて読む。
+    Returns: (コンテキストを加えたファイルの diff 行, ファイルごとの選択結果)
+    """
+    git_config = git_config or {}
+    budget = int(git_config.get("context_budget", DEFAULT_BUDGET))
+    context_lines = int(git_config.get("context_lines", DEFAULT_LINES))
+    function_lines = int(git_config.get("function_context_lines", DEFAULT_FUNCTION_LINES))
+    max_changed = int(git_config.get("context_max_changed", DEFAULT_MAX_CHANGED))
+
+    parsed = {}
+    for fd in files:
+        if not _expandable(fd):
+            continue
+        header, hunks = parse_hunks(fd)
+        if hunks and _changed_lines(hunks) <= max_changed:
+            parsed[fd.path] = (fd, header, hunks)
+
+    blobs = read(fd.new_sha for fd, _, _ in parsed.values()) if parsed and budget > 0 else {}
+
+    expanded: Dict[str, List[str]] = {}
+    report: List[FileContext] = []
+    for path, (fd, header, hunks) in sorted(parsed.items(), key=lambda item: _changed_lines(item[1][2])):
+        blob = blobs.get(fd.new_sha)
+        if blob is None:
+            continue
+        lines = blob.decode("utf-8", errors="replace").split("\n")
+        if lines and lines[-1] == "":
+            lines.pop()
+
+        for level in (LEVEL_FUNCTION, LEVEL_LINES):
+            windows = context_windows(lines, hunks, level, context_lines, function_lines)
+            context = [line for (begin, end), hunk in zip(windows, hunks)
+                       for line in lines[begin:hunk.start] + lines[hunk.end:end]]
+            tokens = estimate_tokens("\n".join(context), family) + len(context)
+            if tokens <= budget:
+                if context:
+                    expanded[path] = header + render_hunks(lines, hunks, windows)
+                    budget -= tokens
+                    report.append(FileContext(path, level, tokens, _changed_lines(hunks)))
+                break
+    return expanded, report
+
+def expand_diff_context(diff_content: str, git_config: Optional[dict] = None, family: str = "openai",
+                        read: Callable[[Iterable[str]], Dict[str, bytes]] = read_blobs) -> str:
+    """-U0 の diff に、[git] context の設定に従ってファイルごとのコンテキストを加える"""
+    git_config = git_config or {}
+    if str(git_config.get("context", CONTEXT_AUTO)).lower() == CONTEXT_NONE:
+        return diff_content
+    files = split_diff(diff_content)
+    expanded, _ = plan_context(files, git_config, family, read)
+    if not expanded:
+        return diff_content
+
+    output: List[str] = []
+    index = -1
+    for line in diff_content.split("\n"):
+        if line.startswith("diff --git"):
+            index += 1
+            output.append(line)
+            fd = files[index]
+            if fd.path in expanded:
+                output.extend(expanded[fd.path])
+                # 最後のファイルなら diff 末尾の改行を保つ
+                if fd.lines and fd.lines[-1] == "":
+                    output.append("")
+            continue
+        if index < 0 or files[index].path not in expanded:
+            output.append(line)
+    return "\n".join(output)
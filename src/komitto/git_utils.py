@@ -1,16 +1,28 @@
+import atexit
+import os
+import queue
+import signal
 import subprocess
 import sys
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
 from .i18n import t
 
-def get_git_diff(exclude_patterns=None):
-    """ステージングされた変更を取得する"""
+def get_git_diff(exclude_patterns=None, context_config=None):
+    """
+    ステージングされた変更を取得する。
+    context_config（[git] の設定）を渡すと、小さな変更には周辺のコンテキストを加える（diff_context を参照）
+    """
     try:
         subprocess.run(["git", "rev-parse", "--is-inside-work-tree"], check=True, capture_output=True)
     except subprocess.CalledProcessError:
         print(t("git_utils.not_a_repo"), file=sys.stderr)
         sys.exit(1)
 
-    cmd = ["git", "diff", "--staged", "--no-prefix", "-U0"]
+    # --full-index: index 行に完全な blob SHA を出力させ、ファイル単位キャッシュのキーに使う
+    cmd = ["git", "diff", "--staged", "--no-prefix", "-U0", "--full-index"]
     
     # 除外パターンの追加
     if exclude_patterns:
@@ -24,33 +36,283 @@ def get_git_diff(exclude_patterns=None):
     if not result.stdout:
         print(t("git_utils.no_staged_changes"), file=sys.stderr)
         sys.exit(1)
-        
+
+    if context_config is not None:
+        from .diff_context import expand_diff_context
+        return expand_diff_context(result.stdout, context_config)
     return result.stdout
 
-def get_git_log(limit=5):
-    """直近のコミットメッセージと変更ファイルを取得する"""
-    cmd = [
-        "git", "log", 
-        f"-n {limit}", 
-        "--date=iso", 
-        "--pretty=format:Commit: %h%nDate: %ad%nMessage:%n%B%n[Files]", 
-        "--name-status"
-    ]
-    
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8')
-        if result.returncode == 0 and result.stdout:
-            logs = result.stdout.strip()
-            formatted_logs = []
-            for block in logs.split("Commit: "):
-                if not block.strip():
-                    continue
-                formatted_logs.append(f"Commit: {block.strip()}")
-            
-            return "\n\n----------------------------------------\n\n".join(formatted_logs)
-    except Exception:
-        pass
-    return None
+# CatFile の blob キャッシュの上限（バイト）
+DEFAULT_BLOB_CACHE_BYTES = 64 * 1024 * 1024
+
+_FULL_SHA_LENGTHS = (40, 64)
+
+class ObjectInfo(NamedTuple):
+    sha: str
+    type: str
+    size: int
+
+class _Request:
+    """1回の read()/info() の要求。応答は名前の順に results へ入る"""
+    def __init__(self, names):
+        self.names = names
+        self.results = [None] * len(names)
+        self.error = None
+        self.done = threading.Event()
+
+class _BatchChannel:
+    """
+    `git cat-file --batch`（または --batch-check）の1プロセス。
+    書き込みスレッドが要求キューから名前をまとめて送り、読み取りスレッドが送った順に応答を読む。
+    前の要求の応答を待たずに次の要求を送れる（パイプライン化）ので、複数スレッドからの要求が直列に待たない。
+    """
+    def __init__(self, option, cwd=None):
+        self.with_contents = option == "--batch"
+        self.proc = subprocess.Popen(
+            ["git", "cat-file", option], cwd=cwd,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        self.requests = queue.Queue()
+        self.inflight = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.writer = threading.Thread(target=self._write_loop, name="komitto-cat-file-writer", daemon=True)
+        self.reader = threading.Thread(target=self._read_loop, name="komitto-cat-file-reader", daemon=True)
+        self.writer.start()
+        self.reader.start()
+
+    def submit(self, names):
+        request = _Request(names)
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("git cat-file channel is closed")
+            self.requests.put(request)
+        return request
+
+    def alive(self):
+        return self.proc.poll() is None and self.reader.is_alive()
+
+    def _write_loop(self):
+        stdin = self.proc.stdin
+        broken = False
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            # 書き込みに失敗した後の要求も読み取り側へ回し、EOF のエラーとして返させる
+            self.inflight.put(request)
+            if broken:
+                continue
+            try:
+                stdin.write("".join(f"{name}\n" for name in request.names).encode("utf-8"))
+                stdin.flush()
+            except OSError:
+                broken = True
+        self.inflight.put(None)
+        try:
+            stdin.close()
+        except OSError:
+            pass
+
+    def _read_loop(self):
+        stdout = self.proc.stdout
+        error = None
+        while True:
+            request = self.inflight.get()
+            if request is None:
+                break
+            if error is None:
+                try:
+                    for i in range(len(request.names)):
+                        request.results[i] = self._read_one(stdout)
+                except Exception as e:
+                    error = e
+            request.error = error
+            request.done.set()
+
+    def _read_one(self, stdout):
+        header = stdout.readline()
+        if not header:
+            raise EOFError("git cat-file has exited")
+        header = header.rstrip(b"\n")
+        # "<name> missing" / "<name> ambiguous" は要求した名前（空白を含みうる）をそのまま返すので、末尾で判定する
+        if header.endswith((b" missing", b" ambiguous")):
+            return None
+        oid, kind, size = header.rsplit(b" ", 2)
+        info = ObjectInfo(oid.decode("ascii"), kind.decode("ascii"), int(size))
+        if not self.with_contents:
+            return info
+        content = stdout.read(info.size)
+        stdout.read(1)  # 内容の後の改行
+        return info, content
+
+    def close(self, timeout=5):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.requests.put(None)
+        self.writer.join(timeout)
+        self.reader.join(timeout)
+        try:
+            self.proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stdout.close()
+
+class CatFile:
+    """
+    長寿命の `git cat-file --batch` / `--batch-check` ワーカー。
+    オブジェクトごとに git を起動せずに blob の内容やメタデータを読む。
+    blob は SHA をキーに LRU キャッシュ（合計バイト数で上限）に残す。
+    スレッドセーフで、TUI のワーカースレッドから同時に使ってよい。
+    """
+    def __init__(self, cwd=None, cache_bytes=DEFAULT_BLOB_CACHE_BYTES):
+        self.cwd = cwd
+        self.cache_bytes = cache_bytes
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _channel(self, option):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("CatFile is closed")
+            channel = self._channels.get(option)
+            if channel is None or not channel.alive():
+                # 初回、または git が異常終了していたら起動し直す
+                if channel is not None:
+                    channel.close()
+                channel = self._channels[option] = _BatchChannel(option, self.cwd)
+            return channel
+
+    def _cache_get(self, sha):
+        with self._lock:
+            content = self._cache.get(sha)
+            if content is not None:
+                self._cache.move_to_end(sha)
+            return content
+
+    def _cache_put(self, sha, content):
+        if len(sha) not in _FULL_SHA_LENGTHS or len(content) > self.cache_bytes:
+            # "HEAD:path" のような名前は指す内容が変わりうるのでキャッシュしない
+            return
+        with self._lock:
+            if sha in self._cache:
+                return
+            self._cache[sha] = content
+            self._cached_bytes += len(content)
+            while self._cached_bytes > self.cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted)
+
+    def read(self, names):
+        """
+        オブジェクトの内容をまとめて読む（キャッシュにないものだけを1回の要求で送る）。
+        Returns: {名前: bytes}（見つからないオブジェクトは含まない）
+        """
+        names = list(dict.fromkeys(names))
+        found = {}
+        missing = []
+        for name in names:
+            content = self._cache_get(name)
+            if content is None:
+                missing.append(name)
+            else:
+                found[name] = content
+        if not missing:
+            return found
+
+        request = self._channel("--batch").submit(missing)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        for name, result in zip(missing, request.results):
+            if result is None:
+                continue
+            info, content = result
+            found[name] = content
+            if info.type == "blob":
+                self._cache_put(name, content)
+        return found
+
+    def read_one(self, name):
+        return self.read([name]).get(name)
+
+    def info(self, names):
+        """
+        オブジェクトの種類とサイズを `--batch-check` で読む（内容は転送しない）。
+        Returns: {名前: ObjectInfo}（見つからないオブジェクトは含まない）
+        """
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {}
+        request = self._channel("--batch-check").submit(names)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return {name: result for name, result in zip(names, request.results) if result is not None}
+
+    def cache_stats(self):
+        with self._lock:
+            return len(self._cache), self._cached_bytes
+
+    def close(self):
+        """git プロセスを終了させる。処理中の要求は応答を読み終えてから閉じる"""
+        with self._lock:
+            self._closed = True
+            channels = list(self._channels.values())
+            self._channels.clear()
+            self._cache.clear()
+            self._cached_bytes = 0
+        for channel in channels:
+            channel.close()
+
+_shared_cat_file = None
+_shared_lock = threading.Lock()
+
+def get_cat_file():
+    """
+    カレントディレクトリのリポジトリ用に共有する CatFile。
+    ディレクトリが変わっていたら前のワーカーを閉じて作り直す。プロセス終了時に閉じる。
+    """
+    global _shared_cat_file
+    cwd = os.getcwd()
+    with _shared_lock:
+        if _shared_cat_file is not None and _shared_cat_file.cwd != cwd:
+            _shared_cat_file.close()
+            _shared_cat_file = None
+        if _shared_cat_file is None:
+            _shared_cat_file = CatFile(cwd)
+        return _shared_cat_file
+
+def close_cat_file():
+    global _shared_cat_file
+    with _shared_lock:
+        if _shared_cat_file is not None:
+            _shared_cat_file.close()
+            _shared_cat_file = None
+
+atexit.register(close_cat_file)
+
+def read_blobs(shas):
+    """
+    blob の内容を共有の `git cat-file --batch` ワーカーでまとめて読む（オブジェクトごとにプロセスを起動しない）。
+    Returns: {sha: bytes}（見つからないオブジェクトは含まない）
+    """
+    shas = list(shas)
+    if not shas:
+        return {}
+    return get_cat_file().read(shas)
 
 def get_commit_messages(limit=20):
     """分析用にコミットメッセージのみを取得する"""
@@ -74,16 +336,135 @@ def get_commit_messages(limit=20):
         pass
     return []
 
+def get_repo_root():
+    """リポジトリのルートディレクトリ（取得できない場合は None）"""
+    result = subprocess.run(["git", "rev-parse", "--show-toplevel"], capture_output=True, text=True, encoding='utf-8')
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip()
+
+def get_staged_paths():
+    """ステージされたパスの一覧（リネームは削除と追加の2つのパスとして返す）"""
+    result = subprocess.run(
+        ["git", "diff", "--staged", "--name-only", "--no-renames", "-z"],
+        capture_output=True, text=True, encoding='utf-8'
+    )
+    return [path for path in result.stdout.split("\0") if path]
+
+def write_tree():
+    """現在のインデックスをツリーオブジェクトとして保存し、その SHA を返す"""
+    result = subprocess.run(["git", "write-tree"], capture_output=True, text=True, encoding='utf-8', check=True)
+    return result.stdout.strip()
+
+def read_tree(tree):
+    """インデックスを tree の内容に戻す（作業ツリーには触れない）"""
+    subprocess.run(["git", "read-tree", tree], capture_output=True, check=True)
+
+def unstage_paths(paths):
+    """paths のステージを HEAD の状態に戻す（作業ツリーには触れない）"""
+    paths = list(paths)
+    if not paths:
+        # 空の pathspec はインデックス全体のリセットになるので何もしない
+        return
+    # 引数長の上限を避けるため、パスは標準入力で渡す
+    subprocess.run(
+        ["git", "reset", "-q", "--pathspec-from-file=-", "--pathspec-file-nul"],
+        input="\0".join(paths), capture_output=True, text=True, encoding='utf-8', check=True
+    )
+
+# メッセージは引数ではなく標準入力で渡す（巨大なメッセージでも引数長の上限に当たらない）
+COMMIT_CMD = ["git", "commit", "-F", "-"]
+
 def git_commit(message):
     """メッセージを指定してコミットを実行する"""
     if not message.strip():
         print(t("git_utils.commit_message_empty"), file=sys.stderr)
         return False
 
-    cmd = ["git", "commit", "-m", message]
     try:
         # ユーザーにgitの出力を直接見せるため、capture_outputはしない
-        subprocess.run(cmd, check=True)
+        subprocess.run(COMMIT_CMD, input=message, text=True, encoding='utf-8', check=True)
         return True
     except subprocess.CalledProcessError:
         return False
+
+def git_commit_captured(message):
+    """
+    git_commit() と同じだが、git（とフック）の出力を端末に流さずに返す。
+    Returns: (成功したか, stdout と stderr をまとめた出力)
+    """
+    if not message.strip():
+        return False, t("git_utils.commit_message_empty")
+    result = subprocess.run(
+        COMMIT_CMD, input=message, capture_output=True, text=True, encoding='utf-8', errors='replace'
+    )
+    return result.returncode == 0, (result.stdout + result.stderr).strip()
+
+async def git_commit_async(message, on_output=None):
+    """
+    コミットを非同期に実行し、フック（pre-commit 等）の stdout/stderr を1行ずつ on_output に渡す。
+    タスクがキャンセルされた場合は git プロセスを終了させてから CancelledError を送出する。
+    Returns: git commit の終了コード
+    """
+    import asyncio
+
+    def emit(line):
+        if on_output:
+            on_output(line)
+
+    if not message.strip():
+        emit(t("git_utils.commit_message_empty"))
+        return 1
+
+    # フックが起動した子プロセスもまとめて止められるよう、独立したプロセスグループで起動する
+    if os.name == 'nt':
+        group_kwargs = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    else:
+        group_kwargs = {"start_new_session": True}
+
+    proc = await asyncio.create_subprocess_exec(
+        *COMMIT_CMD,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        **group_kwargs
+    )
+    async def feed_stdin():
+        # git は pre-commit フックの後でメッセージを読むため、出力の読み取りと並行して書き込む。
+        # フックが失敗した場合 git は標準入力を読まずに終了するので、書き込みエラーは無視する
+        try:
+            proc.stdin.write(message.encode("utf-8"))
+            await proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            proc.stdin.close()
+
+    writer = asyncio.ensure_future(feed_stdin())
+    try:
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                break
+            emit(line.decode("utf-8", errors="replace").rstrip("\r\n"))
+        await writer
+        return await proc.wait()
+    except asyncio.CancelledError:
+        writer.cancel()
+        _terminate_process_group(proc, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            _terminate_process_group(proc, getattr(signal, "SIGKILL", signal.SIGTERM))
+            await proc.wait()
+        raise
+
+def _terminate_process_group(proc, sig):
+    """git とフックが起動した子プロセスをまとめて終了させる"""
+    try:
+        if os.name == 'nt':
+            proc.terminate()
+        else:
+            os.killpg(proc.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
@@ -0,0 +1,287 @@
+import json
+import queue
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, TextIO
+
+from .cache import open_cache
+from .config import load_config, resolve_config
+from .git_utils import get_git_diff, get_repo_root, git_commit_captured
+from .heuristic import heuristic_message
+from .history import build_history_context
+from .i18n import t
+from .llm import create_llm_client
+from .llm.base import CancellationToken, LLMCancelledError
+from .llm.events import FirstToken, StreamMetrics, TextDelta, Usage
+from .postprocess import MessageRules, StreamCleaner, clean_events, postprocess, record_avoided
+from .pipeline import make_plan
+from .prompt import build_prompt_sections, split_diff
+from .summarize import load_file_summaries
+from .tokens import compaction_summaries, estimate_prompt
+
+# イベントの形式を変えたら上げる（ready イベントで通知する）
+PROTOCOL_VERSION = 1
+
+class EventWriter:
+    """イベントを1行1 JSON（NDJSON）で書き出す。複数スレッドから呼んでも行が混ざらない"""
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, **fields) -> None:
+        line = json.dumps({"event": event, **fields}, ensure_ascii=False, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+@dataclass
+class Request:
+    """1回分の生成リクエスト（--json では CLI 引数、--stdio では1行の JSON から作る）"""
+    id: Optional[Any] = None
+    context: str = ""
+    context_name: Optional[str] = None
+    template: Optional[str] = None
+    model: Optional[str] = None
+    dry_run: bool = False
+    commit: bool = False
+    offline: bool = False
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Request":
+        return cls(
+            id=data.get("id"),
+            context=str(data.get("context", "")),
+            context_name=data.get("context_name"),
+            template=data.get("template"),
+            model=data.get("model"),
+            dry_run=bool(data.get("dry_run", False)),
+            commit=bool(data.get("commit", False)),
+            offline=bool(data.get("offline", False)),
+        )
+
+class RequestError(Exception):
+    """リクエストを続けられない理由（error イベントの code と message になる）"""
+
+    def __init__(self, code: str, message: str):
+        super().__init__(message)
+        self.code = code
+
+class HeadlessSession:
+    """
+    Rich の描画もクリップボードも使わずに生成を行い、経過をイベントとして書き出す。
+    キャッシュと LLM クライアント（HTTP 接続）はリクエストをまたいで使い回す。
+    """
+
+    def __init__(self, writer: EventWriter):
+        self.writer = writer
+        self._clients: Dict[str, Any] = {}
+        self._cache = None
+        self._cache_opened = False
+        self._lock = threading.Lock()
+        self._cancel_token: Optional[CancellationToken] = None
+
+    def cancel(self) -> None:
+        """実行中のリクエストを取り消す（なければ何もしない）"""
+        with self._lock:
+            token = self._cancel_token
+        if token is not None:
+            token.cancel()
+
+    def _client(self, llm_config: dict):
+        key = json.dumps(llm_config, sort_keys=True, default=str)
+        if key not in self._clients:
+            self._clients[key] = create_llm_client(llm_config)
+        return self._clients[key]
+
+    def _open_cache(self, config: dict):
+        if not self._cache_opened:
+            self._cache = open_cache(config)
+            self._cache_opened = True
+        return self._cache
+
+    def run(self, request: Request) -> bool:
+        """リクエストを1件処理する。最後に done か error のどちらかを必ず書き出す"""
+        token = CancellationToken()
+        with self._lock:
+            self._cancel_token = token
+        try:
+            self._run(request, token)
+            return True
+        except RequestError as e:
+            self.writer.emit("error", id=request.id, code=e.code, message=str(e))
+        except LLMCancelledError:
+            self.writer.emit("error", id=request.id, code="cancelled", message=t("main.action_canceled"))
+        except Exception as e:
+            self.writer.emit("error", id=request.id, code="exception", message=f"{type(e).__name__}: {e}")
+        finally:
+            with self._lock:
+                self._cancel_token = None
+        return False
+
+    def _run(self, request: Request, token: CancellationToken) -> None:
+        emit = self.writer.emit
+        started = time.perf_counter()
+        config = resolve_config(load_config(), context_name=request.context_name,
+                                template_name=request.template, model_name=request.model)
+        llm_config = config.get("llm", {})
+
+        if get_repo_root() is None:
+            raise RequestError("not_a_repo", t("git_utils.not_a_repo"))
+        try:
+            diff_content = get_git_diff(exclude_patterns=config.get("git", {}).get("exclude", []),
+                                        context_config=config.get("git", {}))
+        except SystemExit:
+            raise RequestError("no_staged_changes", t("git_utils.no_staged_changes"))
+
+        draft = heuristic_message(diff_content)
+        if request.offline or llm_config.get("offline"):
+            emit("done", id=request.id, message=draft, offline=True,
+                 timings={"prepare_s": time.perf_counter() - started})
+            return
+
+        cache = self._open_cache(config)
+        history = build_history_context(config, cache)
+        recent_logs = history.text if history else None
+        system_prompt = config["prompt"]["system"]
+        summaries = load_file_summaries(split_diff(diff_content), config, cache)
+        sections = build_prompt_sections(system_prompt, recent_logs, request.context, diff_content,
+                                         cache=cache, summaries=summaries)
+        estimate = estimate_prompt(sections, config)
+
+        max_cost = llm_config.get("max_cost")
+        if max_cost and llm_config.get("provider") and estimate.cost is not None and estimate.cost > float(max_cost):
+            compacted = None
+            if llm_config.get("cost_guard", "stop") == "compact":
+                compacted = compaction_summaries(split_diff(diff_content), estimate, float(max_cost), summaries)
+            if compacted is not None:
+                sections = build_prompt_sections(system_prompt, recent_logs, request.context, diff_content,
+                                                 cache=cache, summaries=compacted)
+                estimate = estimate_prompt(sections, config)
+            if compacted is None or estimate.cost > float(max_cost):
+                raise RequestError("cost_exceeded", t("main.cost_exceeded", estimate.cost, float(max_cost)))
+
+        final_text = "\n".join(section.text for section in sections)
+        prepare_s = time.perf_counter() - started
+        emit(
+            "prompt",
+            id=request.id,
+            chars=len(final_text),
+            tokens=estimate.input_tokens,
+            expected_output_tokens=estimate.output_tokens,
+            cost=estimate.cost,
+            family=estimate.family,
+            sections=[{"kind": s.kind, "label": s.label, "chars": s.chars, "tokens": s.tokens} for s in estimate.sections],
+            history={"commits": history.commits, "raw_tokens": history.raw_tokens, "tokens": history.tokens} if history else None,
+            prepare_s=prepare_s,
+        )
+        # LLM の応答を待つ間に表示できる下書き（エディタ側で仮の文面として使える）
+        emit("draft", id=request.id, message=draft)
+
+        if request.dry_run or not llm_config.get("provider"):
+            # プロバイダー未設定時は、通常モードでクリップボードに入れるプロンプトをそのまま返す
+            emit("done", id=request.id, message=None, prompt=None if request.dry_run else final_text,
+                 timings={"prepare_s": prepare_s})
+            return
+
+        map_s = None
+        plan = make_plan(config, system_prompt, recent_logs, request.context, diff_content, final_text, cache=cache)
+        if plan is not None:
+            map_started = time.perf_counter()
+            plan.cancel_token = token
+            plan.run_map(lambda done, total: emit("map_progress", id=request.id, done=done, total=total))
+            final_text = plan.reduce_prompt()
+            map_s = time.perf_counter() - map_started
+
+        metrics = StreamMetrics()
+        message = ""
+        client = self._client(llm_config)
+        client.on_quota_wait = lambda wait: emit("queued", id=request.id, wait_s=wait)
+        rules = MessageRules.from_config(config)
+        cleaner = StreamCleaner()
+        for event in clean_events(client.events(final_text, token, metrics), rules, cleaner):
+            if isinstance(event, TextDelta):
+                message += event.text
+                emit("delta", id=request.id, text=event.text)
+            elif isinstance(event, FirstToken):
+                emit("first_token", id=request.id, ttft_s=event.ttft)
+            elif isinstance(event, Usage):
+                emit("usage", id=request.id, **event.as_dict())
+
+        result = postprocess(message, rules, client, token, cleaned=cleaner.removed)
+        message = result.text
+        if result.raw_problems:
+            total = record_avoided(cache) if result.regeneration_avoided else None
+            emit("postprocess", id=request.id, problems=result.problems, fixed=result.raw_problems,
+                 repaired=result.repaired, regenerations_avoided=total)
+
+        timings = {"prepare_s": prepare_s, "map_s": map_s, **metrics.as_dict()}
+        if request.commit:
+            ok, output = git_commit_captured(message)
+            emit("commit", id=request.id, ok=ok, output=output)
+        emit("done", id=request.id, message=message, timings=timings)
+
+def run_json(args) -> int:
+    """--json: CLI 引数の1リクエストを処理してイベントを書き出す。終了コードを返す"""
+    request = Request(
+        context=" ".join(args.context),
+        context_name=args.context_name,
+        template=args.template,
+        model=args.model,
+        dry_run=args.dry_run,
+        offline=args.offline,
+    )
+    return 0 if HeadlessSession(EventWriter()).run(request) else 1
+
+def serve(stdin: TextIO, writer: EventWriter) -> None:
+    """
+    --stdio: 標準入力から1行1 JSON のリクエストを読み、順に処理する。
+    {"type": "generate", "id": ..., "context": "...", ...} で生成、{"type": "cancel"} で実行中の生成を取り消し、
+    {"type": "shutdown"} か EOF で（実行中のリクエストを終えてから）終了する。
+    """
+    session = HeadlessSession(writer)
+    requests: "queue.Queue[Optional[Request]]" = queue.Queue()
+
+    def worker():
+        while True:
+            request = requests.get()
+            if request is None:
+                return
+            session.run(request)
+
+    thread = threading.Thread(target=worker, name="komitto-stdio", daemon=True)
+    thread.start()
+    writer.emit("ready", protocol=PROTOCOL_VERSION)
+
+    try:
+        for line in stdin:
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                if not isinstance(data, dict):
+                    raise ValueError("request must be a JSON object")
+            except ValueError as e:
+                writer.emit("error", id=None, code="bad_request", message=str(e))
+                continue
+
+            kind = data.get("type", "generate")
+            if kind == "generate":
+                requests.put(Request.from_dict(data))
+            elif kind == "cancel":
+                session.cancel()
+            elif kind == "shutdown":
+                break
+            else:
+                writer.emit("error", id=data.get("id"), code="bad_request", message=f"unknown request type: {kind}")
+    except KeyboardInterrupt:
+        session.cancel()
+    finally:
+        requests.put(None)
+        thread.join()
+
+def run_stdio() -> int:
+    serve(sys.stdin, EventWriter())
+    return 0
@@ -0,0 +1,205 @@
+import posixpath
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Set
+
+from .prompt import FileDiff, split_diff
+
+STATUS_ADDED = "added"
+STATUS_DELETED = "deleted"
+STATUS_MODIFIED = "modified"
+
+# 本文に列挙するファイル数の上限
+MAX_LISTED_FILES = 10
+# 件名に並べるシンボル数の上限
+MAX_SUBJECT_SYMBOLS = 2
+
+# 関数・クラスなどの定義行（Python, JS/TS, Go, Rust, Java/Kotlin/C# など）
+_DEFINITION_RE = re.compile(
+    r"^\s*(?:export\s+)?(?:default\s+)?(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?"
+    r"(?:def|class|function\*?|func(?:\s*\([^)]*\))?|fn|interface|struct|enum|trait|type)\s+(\w+)"
+    r"|^\s*(?:export\s+)?(?:const|let|var)\s+(\w+)\s*=\s*(?:async\s*)?(?:\([^)]*\)|\w+)\s*=>"
+)
+
+# スコープに使わない汎用のディレクトリ名
+_GENERIC_DIRS = {"src", "lib", "libs", "app", "apps", "pkg", "packages", "internal", "source", "main", "java", "python"}
+
+_DOC_EXTENSIONS = {".md", ".rst", ".txt", ".adoc"}
+_BUILD_FILES = {
+    "pyproject.toml", "setup.py", "setup.cfg", "requirements.txt", "package.json", "package-lock.json",
+    "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "uv.lock", "Cargo.toml", "Cargo.lock", "go.mod", "go.sum",
+    "Makefile", "Dockerfile",
+}
+
+@dataclass
+class FileStat:
+    path: str
+    status: str
+    added: int
+    removed: int
+    # 追加・削除された定義の名前と、変更のあった chunk のスコープ（@@ 行の関数名）
+    added_symbols: List[str] = field(default_factory=list)
+    removed_symbols: List[str] = field(default_factory=list)
+    changed_scopes: List[str] = field(default_factory=list)
+    # インデントなしで定義されたもの（メソッドや内部関数より件名に優先して使う）
+    top_level: Set[str] = field(default_factory=set)
+
+# 定義行の先頭に来うる語。これ以外で始まる行は正規表現を試さずに除外する（大きな diff でも数十ミリ秒で済ませるため）
+_DEFINITION_WORDS = frozenset({
+    "def", "class", "async", "function", "function*", "func", "fn", "interface", "struct", "enum", "trait", "type",
+    "export", "default", "const", "let", "var",
+})
+
+def definition_name(line: str) -> Optional[str]:
+    words = line.split(None, 1)
+    if not words or (words[0] not in _DEFINITION_WORDS and not words[0].startswith("pub")):
+        return None
+    match = _DEFINITION_RE.match(line)
+    if not match:
+        return None
+    return match.group(1) or match.group(2)
+
+def _append_unique(items: List[str], item: Optional[str]) -> None:
+    if item and item not in items:
+        items.append(item)
+
+def _collect(line: str, names: List[str], top_level: Set[str]) -> None:
+    name = definition_name(line)
+    if name:
+        _append_unique(names, name)
+        if not line[:1].isspace():
+            top_level.add(name)
+
+def _symbols(stats: List[FileStat], attr: str) -> List[str]:
+    """全ファイルの attr のシンボルを、トップレベルの定義を先にして並べる"""
+    names = [(name, name in s.top_level) for s in stats for name in getattr(s, attr)]
+    return [n for n, top in names if top] + [n for n, top in names if not top]
+
+def file_stats(files: List[FileDiff]) -> List[FileStat]:
+    stats = []
+    for fd in files:
+        stat = FileStat(fd.path, STATUS_MODIFIED, 0, 0)
+        defined: List[str] = []
+        undefined: List[str] = []
+        for line in fd.lines:
+            if line.startswith("new file mode"):
+                stat.status = STATUS_ADDED
+            elif line.startswith("deleted file mode"):
+                stat.status = STATUS_DELETED
+            elif line.startswith("@@"):
+                scope = line.split("@@", 2)[-1].strip()
+                _append_unique(stat.changed_scopes, definition_name(scope))
+            elif line.startswith("+") and not line.startswith("+++"):
+                stat.added += 1
+                _collect(line[1:], defined, stat.top_level)
+            elif line.startswith("-") and not line.startswith("---"):
+                stat.removed += 1
+                _collect(line[1:], undefined, stat.top_level)
+        # 両側に現れる定義はシグネチャの変更なので、変更されたスコープとして扱う
+        stat.added_symbols = [name for name in defined if name not in undefined]
+        stat.removed_symbols = [name for name in undefined if name not in defined]
+        for name in defined:
+            if name in undefined:
+                _append_unique(stat.changed_scopes, name)
+        stats.append(stat)
+    return stats
+
+def path_category(path: str) -> str:
+    """パスから推定する変更の種類（Conventional Commits の type）"""
+    name = posixpath.basename(path)
+    parts = path.split("/")
+    if parts[0] in (".github", ".gitlab", ".circleci") or name in (".gitlab-ci.yml", ".travis.yml"):
+        return "ci"
+    if any(p in ("test", "tests", "__tests__", "spec") for p in parts[:-1]) or name.startswith("test_") \
+            or name.endswith(("_test.py", "_test.go", ".test.ts", ".test.js", ".spec.ts", ".spec.js")):
+        return "test"
+    if parts[0] in ("docs", "doc") or posixpath.splitext(name)[1].lower() in _DOC_EXTENSIONS:
+        return "docs"
+    if name in _BUILD_FILES:
+        return "build"
+    return "code"
+
+def infer_type(stats: List[FileStat]) -> str:
+    categories = {path_category(s.path) for s in stats}
+    if len(categories) == 1 and "code" not in categories:
+        return categories.pop()
+    code = [s for s in stats if path_category(s.path) == "code"]
+    if not code:
+        return "chore"
+    if all(s.status == STATUS_ADDED for s in code) or (
+        any(s.added_symbols for s in code) and not any(s.removed_symbols for s in code)
+    ):
+        return "feat"
+    return "refactor"
+
+def infer_scope(stats: List[FileStat]) -> Optional[str]:
+    """変更ファイルに共通するディレクトリのうち、最も深い汎用的でない名前（1ファイルならファイル名）"""
+    if len(stats) == 1:
+        directory, name = posixpath.split(stats[0].path)
+        stem = posixpath.splitext(name)[0]
+        if directory and stem and not stem.startswith("."):
+            return stem
+        return None
+    common = posixpath.commonpath([posixpath.dirname(s.path) or "." for s in stats])
+    for part in reversed(common.split("/")):
+        if part and part != "." and part not in _GENERIC_DIRS:
+            return part
+    return None
+
+def _join_names(names: List[str]) -> str:
+    shown = names[:MAX_SUBJECT_SYMBOLS]
+    rest = len(names) - len(shown)
+    if rest:
+        return f"{', '.join(shown)} and {rest} more"
+    if len(shown) == 2:
+        return f"{shown[0]} and {shown[1]}"
+    return shown[0]
+
+def _subject(stats: List[FileStat]) -> str:
+    added = _symbols(stats, "added_symbols")
+    removed = _symbols(stats, "removed_symbols")
+    changed = [n for s in stats for n in s.changed_scopes if n not in added and n not in removed]
+
+    if all(s.status == STATUS_ADDED for s in stats):
+        verb = "add"
+    elif all(s.status == STATUS_DELETED for s in stats):
+        verb = "remove"
+    elif added and not removed:
+        return f"add {_join_names(added)}"
+    elif removed and not added:
+        return f"remove {_join_names(removed)}"
+    elif added:
+        return f"add {_join_names(added)} and remove {_join_names(removed)}"
+    elif changed:
+        return f"update {_join_names(changed)}"
+    else:
+        verb = "update"
+
+    if len(stats) == 1:
+        return f"{verb} {posixpath.basename(stats[0].path)}"
+    return f"{verb} {len(stats)} files"
+
+def draft_message(files: List[FileDiff]) -> str:
+    """
+    LLM を使わずに、changeset から Conventional Commits 形式の下書きを作る。
+    type はパスと変更の種類、scope は共通のディレクトリ、件名は追加・削除された定義と
+    chunk のスコープから決める。決定的で、ネットワークも使わない（数ミリ秒で終わる）。
+    """
+    stats = file_stats(files)
+    if not stats:
+        return ""
+    subject = _subject(stats)
+    # 件名がファイル名そのものなら、同じ名前の scope は付けない
+    scope = None if subject.endswith(posixpath.basename(stats[0].path)) else infer_scope(stats)
+    header = infer_type(stats) + (f"({scope})" if scope else "")
+    lines = [f"{header}: {subject}"]
+    if len(stats) > 1:
+        lines.append("")
+        for s in stats[:MAX_LISTED_FILES]:
+            lines.append(f"- {s.path} (+{s.added} -{s.removed})")
+        if len(stats) > MAX_LISTED_FILES:
+            lines.append(f"- ... and {len(stats) - MAX_LISTED_FILES} more files")
+    return "\n".join(lines)
+
+def heuristic_message(diff_content: str) -> str:
+    return draft_message(split_diff(diff_content))
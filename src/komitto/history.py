@@ -0,0 +1,183 @@
+import posixpath
+import subprocess
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from .i18n import t
+from .tokens import estimate_tokens, tokenizer_family
+
+# 解析済みのログエントリ（コミット SHA がキー）。形式を変えたら末尾の番号を上げる
+CACHE_NAMESPACE = "log_entry:1"
+
+LOG_SEPARATOR = "\n\n----------------------------------------\n\n"
+
+# 1コミットあたりに載せるファイル行数の上限（[llm] history_max_files、0 で無制限）
+DEFAULT_MAX_FILES = 10
+# 同じディレクトリのファイルがこの数以上あれば1行にまとめる（[llm] history_collapse、0 で無効）
+DEFAULT_COLLAPSE = 4
+
+# %x1e でコミット、%x1f でフィールドを区切る（メッセージやパスに現れない制御文字）
+_LOG_FORMAT = "--format=%x1e%H%x1f%h%x1f%ad%x1f%B%x1f"
+
+@dataclass
+class LogEntry:
+    sha: str
+    short: str
+    date: str
+    message: str
+    # name-status の各行をタブで分けたもの（例: ["M", "a.py"], ["R100", "old.py", "new.py"]）
+    files: List[List[str]] = field(default_factory=list)
+
+    def as_dict(self) -> dict:
+        return {"sha": self.sha, "short": self.short, "date": self.date, "message": self.message, "files": self.files}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LogEntry":
+        return cls(data["sha"], data["short"], data["date"], data["message"], [list(f) for f in data["files"]])
+
+@dataclass
+class HistoryContext:
+    """プロンプトに含める過去のコミット（圧縮後のテキストと、圧縮前後の概算トークン数）"""
+    text: str
+    commits: int
+    raw_tokens: int
+    tokens: int
+    parsed: int
+
+def list_commits(limit: int) -> List[str]:
+    """HEAD から直近 limit 件のコミット SHA（git log -n と同じ順序）"""
+    result = subprocess.run(
+        ["git", "rev-list", f"--max-count={int(limit)}", "HEAD"],
+        capture_output=True, text=True, encoding='utf-8'
+    )
+    if result.returncode != 0:
+        return []
+    return result.stdout.split()
+
+def parse_log(output: str) -> List[LogEntry]:
+    entries = []
+    for record in output.split("\x1e"):
+        fields = record.split("\x1f")
+        if len(fields) != 5:
+            continue
+        sha, short, date, message, name_status = fields
+        files = [line.split("\t") for line in name_status.splitlines() if "\t" in line]
+        entries.append(LogEntry(sha.strip(), short, date, message.strip(), files))
+    return entries
+
+def read_log_entries(shas: List[str]) -> List[LogEntry]:
+    """shas のコミットだけを1回の git log で読む（SHA は引数長の上限を避けるため標準入力で渡す）"""
+    if not shas:
+        return []
+    result = subprocess.run(
+        ["git", "log", "--no-walk=unsorted", "--stdin", "--date=iso", _LOG_FORMAT, "--name-status"],
+        input="\n".join(shas) + "\n", capture_output=True, text=True, encoding='utf-8'
+    )
+    if result.returncode != 0:
+        return []
+    return parse_log(result.stdout)
+
+def load_log_entries(shas: List[str], cache=None) -> Tuple[List[LogEntry], int]:
+    """
+    shas のログエントリを順序どおりに返す。キャッシュにないコミットだけを git から読んで保存する。
+    戻り値は (エントリ, 新たに解析したコミット数)。
+    """
+    cached: Dict[str, LogEntry] = {}
+    if cache is not None:
+        cached = {sha: LogEntry.from_dict(data) for sha, data in cache.get_many(CACHE_NAMESPACE, shas).items()}
+
+    missing = [sha for sha in shas if sha not in cached]
+    parsed = read_log_entries(missing)
+    if cache is not None and parsed:
+        cache.put_many(CACHE_NAMESPACE, [(entry.sha, entry.as_dict()) for entry in parsed])
+    cached.update((entry.sha, entry) for entry in parsed)
+    return [cached[sha] for sha in shas if sha in cached], len(parsed)
+
+def _format_entry(entry: LogEntry, file_lines: List[str]) -> str:
+    block = f"Commit: {entry.short}\nDate: {entry.date}\nMessage:\n{entry.message}\n\n[Files]"
+    if file_lines:
+        block += "\n" + "\n".join(file_lines)
+    return block
+
+def format_raw(entries: List[LogEntry]) -> str:
+    """圧縮しない形式（各コミットの全ファイルを並べる）。圧縮前のトークン数の見積もりに使う"""
+    return LOG_SEPARATOR.join(_format_entry(entry, ["\t".join(f) for f in entry.files]) for entry in entries)
+
+def compact_file_lines(files: List[List[str]], seen: Set[str], max_files: int = DEFAULT_MAX_FILES,
+                       collapse: int = DEFAULT_COLLAPSE) -> List[str]:
+    """
+    1コミット分のファイル一覧を圧縮する（新しいコミットから順に呼び、seen を引き継ぐ）。
+    - より新しいコミットに載せたパスは省き、件数だけ示す
+    - 同じディレクトリに collapse 件以上あれば `dir/ (N files)` の1行にまとめる
+    - max_files 行を超えた分は件数だけ示す
+    """
+    fresh = [f for f in files if f[-1] not in seen]
+    repeated = len(files) - len(fresh)
+
+    by_dir: Dict[str, List[List[str]]] = {}
+    for f in fresh:
+        by_dir.setdefault(posixpath.dirname(f[-1]), []).append(f)
+
+    # (行, その行が表すパス)
+    rows: List[Tuple[str, List[str]]] = []
+    emitted_dirs: Set[str] = set()
+    for f in fresh:
+        directory = posixpath.dirname(f[-1])
+        group = by_dir[directory]
+        if collapse and directory and len(group) >= collapse:
+            if directory in emitted_dirs:
+                continue
+            emitted_dirs.add(directory)
+            statuses = "".join(dict.fromkeys(g[0][0] for g in group))
+            rows.append((f"{statuses}\t{t('prompt.history_collapsed_dir', directory + '/', len(group))}", [g[-1] for g in group]))
+        else:
+            rows.append(("\t".join(f), [f[-1]]))
+
+    truncated = 0
+    if max_files and len(rows) > max_files:
+        truncated = len(rows) - max_files
+        rows = rows[:max_files]
+    # 載せなかったパスは古いコミットで改めて載せられるよう seen に加えない
+    for _, paths in rows:
+        seen.update(paths)
+
+    lines = [line for line, _ in rows]
+    if truncated:
+        lines.append(t("prompt.history_more_files", truncated))
+    if repeated:
+        lines.append(t("prompt.history_repeated_files", repeated))
+    return lines
+
+def format_compact(entries: List[LogEntry], max_files: int = DEFAULT_MAX_FILES, collapse: int = DEFAULT_COLLAPSE) -> str:
+    seen: Set[str] = set()
+    return LOG_SEPARATOR.join(
+        _format_entry(entry, compact_file_lines(entry.files, seen, max_files, collapse))
+        for entry in entries
+    )
+
+def build_history_context(config: dict, cache=None) -> Optional[HistoryContext]:
+    """
+    [llm] history_limit 件の過去のコミットを、重複パスの省略・ディレクトリの集約・
+    ファイル数の上限を適用した形で返す。コミットがなければ None。
+    """
+    llm_config = config.get("llm", {})
+    shas = list_commits(llm_config.get("history_limit", 5))
+    if not shas:
+        return None
+    entries, parsed = load_log_entries(shas, cache)
+    if not entries:
+        return None
+
+    family = tokenizer_family(llm_config)
+    text = format_compact(
+        entries,
+        int(llm_config.get("history_max_files", DEFAULT_MAX_FILES)),
+        int(llm_config.get("history_collapse", DEFAULT_COLLAPSE)),
+    )
+    return HistoryContext(
+        text=text,
+        commits=len(entries),
+        raw_tokens=estimate_tokens(format_raw(entries), family),
+        tokens=estimate_tokens(text, family),
+        parsed=parsed,
+    )
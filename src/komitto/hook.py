@@ -0,0 +1,272 @@
+import hashlib
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+# フックの起動から数えた時間予算の起点（import にかかった時間も予算に含める）
+_STARTED = time.perf_counter()
+
+from .cache import default_cache_dir, open_cache
+from .config import load_config, resolve_config
+from .git_utils import get_git_diff
+from .heuristic import heuristic_message
+from .history import build_history_context
+from .i18n import t
+from .llm.base import CancellationToken
+from .postprocess import MessageRules, postprocess
+from .prompt import build_prompt
+
+HOOK_NAME = "prepare-commit-msg"
+HOOK_MARKER = "# komitto prepare-commit-msg hook"
+
+# git commit を待たせる最大時間（秒）。[hook] budget で変更できる
+DEFAULT_BUDGET = 2.0
+
+# 生成済みメッセージ（設定と diff がキー）
+MESSAGE_NAMESPACE = "hook_message"
+
+SOURCE_LLM = "llm"
+SOURCE_CACHE = "cache"
+SOURCE_HEURISTIC = "heuristic"
+
+# -m / -F、マージ、squash、--amend などで git がメッセージを用意している場合は何もしない
+_SKIP_SOURCES = {"message", "merge", "squash", "commit"}
+
+def hooks_dir() -> Path:
+    """core.hooksPath を考慮したフックのディレクトリ"""
+    result = subprocess.run(
+        ["git", "rev-parse", "--git-path", "hooks"],
+        capture_output=True, text=True, encoding='utf-8', check=True
+    )
+    return Path(result.stdout.strip()).resolve()
+
+def hook_script(python: Optional[str] = None) -> str:
+    python = shlex.quote(python or sys.executable)
+    # komitto が失敗してもコミットは止めない
+    return (
+        "#!/bin/sh\n"
+        f"{HOOK_MARKER}\n"
+        "# Installed by `komitto hook install`; remove with `komitto hook uninstall`.\n"
+        f"{python} -m komitto.hook run \"$@\" || true\n"
+    )
+
+def install_hook(force: bool = False) -> Path:
+    """prepare-commit-msg フックを書き込む。komitto 以外のフックがある場合は force でなければ FileExistsError"""
+    path = hooks_dir() / HOOK_NAME
+    if path.exists() and not force and HOOK_MARKER not in path.read_text(encoding="utf-8", errors="replace"):
+        raise FileExistsError(str(path))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(hook_script(), encoding="utf-8")
+    path.chmod(0o755)
+    return path
+
+def uninstall_hook() -> Optional[Path]:
+    """komitto が書いたフックを削除する。該当するフックがなければ None"""
+    path = hooks_dir() / HOOK_NAME
+    if not path.exists() or HOOK_MARKER not in path.read_text(encoding="utf-8", errors="replace"):
+        return None
+    path.unlink()
+    return path
+
+def hook_config() -> dict:
+    """[hook] の context / model を反映した設定"""
+    base_config = load_config()
+    hook = base_config.get("hook", {})
+    return resolve_config(base_config, context_name=hook.get("context"), model_name=hook.get("model"))
+
+def message_key(config: dict, diff_content: str) -> str:
+    llm_config = config.get("llm", {})
+    raw = "\0".join([
+        str(llm_config.get("provider", "")),
+        str(llm_config.get("model", "")),
+        config.get("prompt", {}).get("system", ""),
+        diff_content,
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def generate_message(config: dict, diff_content: str, cache=None, cancel_token: Optional[CancellationToken] = None) -> str:
+    """通常のプロンプト（履歴・changeset）で1回生成し、結果をキャッシュに保存する"""
+    from .llm import create_llm_client
+
+    history = build_history_context(config, cache)
+    prompt = build_prompt(config["prompt"]["system"], history.text if history else None, "", diff_content, cache=cache)
+    client = create_llm_client(config["llm"])
+    message, _ = client.generate(prompt, cancel_token)
+    if message:
+        message = postprocess(message, MessageRules.from_config(config), client, cancel_token).text
+    if message and cache is not None:
+        cache.put(MESSAGE_NAMESPACE, message_key(config, diff_content), message)
+    return message
+
+def cached_or_generated(config: dict, diff_content: str, cache, cancel_token: Optional[CancellationToken] = None) -> Tuple[Optional[str], Optional[str]]:
+    """キャッシュ済みのメッセージ、なければ LLM で生成したメッセージと出所を返す。どちらもなければ (None, None)"""
+    if cache is not None:
+        cached = cache.get(MESSAGE_NAMESPACE, message_key(config, diff_content))
+        if cached:
+            return cached, SOURCE_CACHE
+    if config.get("llm", {}).get("provider"):
+        message = generate_message(config, diff_content, cache, cancel_token)
+        if message:
+            return message, SOURCE_LLM
+    return None, None
+
+def run_in_budget(work, budget: float, started: float):
+    """
+    work(token) を別スレッドで実行し、started から数えて budget 秒まで待つ。
+    Returns: (work の戻り値。失敗や予算切れのときは None, 予算切れか)
+    """
+    result = {}
+    done = threading.Event()
+    token = CancellationToken()
+
+    def run():
+        try:
+            result["value"] = work(token)
+        except Exception:
+            pass
+        finally:
+            done.set()
+
+    threading.Thread(target=run, name="komitto-hook", daemon=True).start()
+    if done.wait(max(0.0, budget - (time.perf_counter() - started))):
+        return result.get("value"), False
+    # 作業スレッドは待たずに見捨てる（HTTP ストリームだけは閉じておく）
+    token.cancel()
+    return None, True
+
+def resolve_message(config: dict, diff_content: str, cache, budget: float, started: float) -> Tuple[str, str, bool]:
+    """
+    予算内に用意できるメッセージを返す: キャッシュ済み → LLM（残り時間まで待つ） → ヒューリスティック。
+    Returns: (メッセージ, 出所, LLM が予算内に終わらなかったか)
+    """
+    result, timed_out = run_in_budget(lambda token: cached_or_generated(config, diff_content, cache, token), budget, started)
+    if result and result[0]:
+        return result[0], result[1], False
+    return heuristic_message(diff_content), SOURCE_HEURISTIC, timed_out
+
+def start_speculation(diff_content: Optional[str]) -> None:
+    """
+    予算切れの生成をバックグラウンドの別プロセスで最後まで行い、キャッシュに入れておく。
+    同じ変更で再びコミットした（コミットを中断してやり直した）ときに即座に使われる。
+    diff が予算内に用意できなかった場合（None）は別プロセスで取り直す。
+    """
+    args = ["speculate"]
+    if diff_content is not None:
+        directory = default_cache_dir() / "speculative"
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=".diff", dir=str(directory))
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(diff_content)
+        args.append(path)
+
+    if os.name == 'nt':
+        group_kwargs = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS}
+    else:
+        group_kwargs = {"start_new_session": True}
+    subprocess.Popen(
+        [sys.executable, "-m", "komitto.hook", *args],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        **group_kwargs
+    )
+
+def staged_diff(config: dict, expand: bool = True) -> Optional[str]:
+    """フックで使う staged diff。expand=False ならコンテキストを加えない。空のコミットなどでは None"""
+    git_config = config.get("git", {})
+    try:
+        return get_git_diff(exclude_patterns=git_config.get("exclude", []), context_config=git_config if expand else None)
+    except SystemExit:
+        # 空のコミット（--allow-empty）など
+        return None
+
+def speculate(diff_path: Optional[str] = None) -> int:
+    config = hook_config()
+    if diff_path is None:
+        diff_content = staged_diff(config)
+        if diff_content is None:
+            return 0
+    else:
+        try:
+            diff_content = Path(diff_path).read_text(encoding="utf-8")
+        finally:
+            Path(diff_path).unlink(missing_ok=True)
+    if config.get("llm", {}).get("provider"):
+        generate_message(config, diff_content, open_cache(config))
+    return 0
+
+def run_hook(message_file: str, source: Optional[str] = None, sha: Optional[str] = None,
+             started: Optional[float] = None) -> int:
+    """
+    prepare-commit-msg フックの本体。どの場合も終了コード 0 を返し、コミットを止めない。
+    メッセージは git が用意した内容（コメント行など）の前に挿入する。
+    """
+    started = time.perf_counter() if started is None else started
+    if source in _SKIP_SOURCES or os.environ.get("KOMITTO_SKIP_HOOK"):
+        return 0
+
+    config = hook_config()
+    hook = config.get("hook", {})
+    if not hook.get("enabled", True):
+        return 0
+
+    # diff の取得とコンテキスト拡張、キャッシュ、履歴の準備も生成と一緒に予算内で行う
+    prepared = {}
+
+    def prepare_and_generate(token):
+        prepared["diff"] = staged_diff(config)
+        if prepared["diff"] is None:
+            return None
+        return cached_or_generated(config, prepared["diff"], open_cache(config), token)
+
+    budget = float(hook.get("budget", DEFAULT_BUDGET))
+    result, timed_out = run_in_budget(prepare_and_generate, budget, started)
+    diff_content = prepared.get("diff")
+    if result and result[0]:
+        message, origin = result
+    else:
+        # 予算切れで diff の準備が終わっていなければ、コンテキストを加えない diff から作る
+        fallback_diff = diff_content if diff_content is not None else staged_diff(config, expand=False)
+        if not fallback_diff:
+            return 0
+        message, origin = heuristic_message(fallback_diff), SOURCE_HEURISTIC
+
+    path = Path(message_file)
+    existing = path.read_text(encoding="utf-8") if path.exists() else ""
+    path.write_text(f"{message}\n{existing}", encoding="utf-8")
+
+    elapsed = time.perf_counter() - started
+    if origin == SOURCE_LLM:
+        print(t("hook.inserted_llm", elapsed), file=sys.stderr)
+    elif origin == SOURCE_CACHE:
+        print(t("hook.inserted_cached"), file=sys.stderr)
+    elif timed_out:
+        print(t("hook.inserted_heuristic_timeout", budget), file=sys.stderr)
+    else:
+        print(t("hook.inserted_heuristic"), file=sys.stderr)
+
+    if timed_out and hook.get("speculate", True):
+        start_speculation(diff_content)
+    return 0
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    try:
+        if len(argv) >= 2 and argv[0] == "run":
+            return run_hook(*argv[1:4], started=_STARTED)
+        if 1 <= len(argv) <= 2 and argv[0] == "speculate":
+            return speculate(*argv[1:])
+    except Exception as e:
+        print(f"komitto: {e}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    code = main()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    # 予算切れで見捨てた生成スレッド（や SDK の import）の終了を待たずに抜ける
+    os._exit(code)
@@ -4,10 +4,16 @@ import os
 import sys
 from pathlib import Path
 from functools import lru_cache
+from string import Formatter
+from typing import Callable, Dict, Optional, Tuple
 
 LangCode = str
 
+# コンパイル済みカタログの値: (生テキスト, フォーマット関数 or None)
+CatalogEntry = Tuple[str, Optional[Callable[..., str]]]
+
 _CURRENT_LANG: LangCode = None
+_FALLBACK_LANG: LangCode = "en"
 
 @lru_cache(maxsize=None)
 def _load_translations(lang: str) -> dict:
@@ -26,6 +32,39 @@ def _load_translations(lang: str) -> dict:
         print(f"Error loading translations for {lang}: {e}", file=sys.stderr)
         return {}
 
+def _flatten(tree: dict, prefix: str, out: Dict[str, str]) -> None:
+    """ネストされた翻訳辞書を 'category.name' 形式のフラットな辞書へ展開する"""
+    for k, v in tree.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            _flatten(v, f"{key}.", out)
+        elif isinstance(v, str):
+            out[key] = v
+
+def _has_fields(text: str) -> bool:
+    """フォーマット用のプレースホルダを含むかどうか"""
+    try:
+        return any(field is not None for _, field, _, _ in Formatter().parse(text))
+    except ValueError:
+        # 不正な波括弧は format() できないのでリテラル扱いにする
+        return False
+
+@lru_cache(maxsize=None)
+def compile_catalog(lang: str) -> Dict[str, CatalogEntry]:
+    """
+    指定言語のフラットなカタログを構築する（キャッシュ付き）。
+    フォールバック言語（英語）はこの時点でマージ済みなので、t() は辞書を1回引くだけで済む。
+    """
+    flat: Dict[str, str] = {}
+    if lang != _FALLBACK_LANG:
+        _flatten(_load_translations(_FALLBACK_LANG), "", flat)
+    _flatten(_load_translations(lang), "", flat)
+
+    return {
+        key: (text, text.format if _has_fields(text) else None)
+        for key, text in flat.items()
+    }
+
 def detect_language() -> str:
     """環境から最適な言語を検出する"""
     # 1. 環境変数 KOMITTO_LANG を最優先
@@ -62,37 +101,17 @@ def t(key: str, *args) -> str:
     指定されたキーに対応する翻訳テキストを取得し、フォーマットする。
     キーは 'category.name' の形式（例: 'main.generating'）
     """
-    lang = get_current_language()
-    translations = _load_translations(lang)
-    
-    # ドット区切りのキーを探索
-    keys = key.split('.')
-    value = translations
-    
-    for k in keys:
-        if isinstance(value, dict) and k in value:
-            value = value[k]
-        else:
-            if lang != "en":
-                 en_trans = _load_translations("en")
-                 value = en_trans
-                 for k_en in keys:
-                     if isinstance(value, dict) and k_en in value:
-                         value = value[k_en]
-                     else:
-                         return key
-                 break
-            else:
-                return key
-
-    if not isinstance(value, str):
+    entry = compile_catalog(get_current_language()).get(key)
+    if entry is None:
         return key
 
+    text, formatter = entry
+
     # 文字列フォーマット
-    if args:
+    if args and formatter is not None:
         try:
-            return value.format(*args)
+            return formatter(*args)
         except IndexError:
-            return value
+            return text
     
-    return value
+    return text
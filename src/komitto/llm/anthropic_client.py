@@ -4,11 +4,17 @@ from .base import LLMClient
 
 class AnthropicClient(LLMClient):
     def __init__(self, config: dict):
+        super().__init__(config)
         api_key = config.get("api_key") or os.environ.get("ANTHROPIC_API_KEY")
         if not api_key:
             raise ValueError("Anthropic API key is missing. Set it in komitto.toml or environment variable 'ANTHROPIC_API_KEY'.")
         
-        self.client = anthropic.Anthropic(api_key=api_key)
+        kwargs = {}
+        if self.timeouts.connect or self.timeouts.overall:
+            kwargs["timeout"] = anthropic.Timeout(self.timeouts.overall, connect=self.timeouts.connect or self.timeouts.overall)
+
+        # Retries are handled by LLMClient.stream() so they can be cancelled
+        self.client = anthropic.Anthropic(api_key=api_key, max_retries=0, **kwargs)
         self.model = config.get("model", "claude-3-opus-20240229")
 
     def generate_commit_message(self, prompt: str):
@@ -31,23 +37,30 @@ class AnthropicClient(LLMClient):
         return message.content[0].text.strip(), usage
 
     def stream_commit_message(self, prompt: str):
+        yield from self.stream_chat([{"role": "user", "content": prompt}])
+
+    def stream_chat(self, messages):
         with self.client.messages.stream(
             max_tokens=1024,
-            messages=[{"role": "user", "content": prompt}],
+            messages=messages,
             model=self.model,
         ) as stream:
-            for text in stream.text_stream:
-                # Anthropic stream helper doesn't easily give usage per chunk yet in this simple iteration, 
-                # but we can get it from stream.get_final_message() at the end.
-                # For now, we yield text.
-                yield text, None
-            
-            # After stream, try to get usage
-            final_msg = stream.get_final_message()
-            if final_msg.usage:
-                usage = {
-                    "prompt_tokens": final_msg.usage.input_tokens,
-                    "completion_tokens": final_msg.usage.output_tokens,
-                    "total_tokens": final_msg.usage.input_tokens + final_msg.usage.output_tokens
-                }
-                yield "", usage
+            self._track_stream(stream)
+            try:
+                yield from self._iter_stream(stream)
+            finally:
+                self._untrack_stream(stream)
+
+    def _iter_stream(self, stream):
+        for text in stream.text_stream:
+            # Usage is only known once the message is complete (see get_final_message() below)
+            yield text, None
+
+        final_msg = stream.get_final_message()
+        if getattr(final_msg, "usage", None):
+            usage = {
+                "prompt_tokens": final_msg.usage.input_tokens,
+                "completion_tokens": final_msg.usage.output_tokens,
+                "total_tokens": final_msg.usage.input_tokens + final_msg.usage.output_tokens
+            }
+            yield "", usage
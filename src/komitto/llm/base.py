@@ -1,7 +1,222 @@
+import queue
+import random
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Generator, Tuple, Optional, Dict, Any
+from dataclasses import dataclass
+from typing import Callable, Generator, Iterable, Iterator, Tuple, Optional, Dict, Any, List, Union
+
+from .events import StreamEvent, StreamMetrics, to_events
+from .quota import QuotaManager, estimate_request_tokens
+
+Message = Dict[str, str]
+
+class LLMCancelledError(Exception):
+    """Raised when a request is cancelled through its CancellationToken."""
+
+class LLMTimeoutError(Exception):
+    """Raised when a request exceeds its connect, first-token or overall timeout."""
+
+    def __init__(self, message: str, first_token: bool = False):
+        super().__init__(message)
+        self.first_token = first_token
+
+class LLMHTTPError(Exception):
+    """HTTP error from a provider without its own SDK exception type."""
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class CancellationToken:
+    """
+    Thread-safe cancellation flag shared between a front-end and a running request.
+    Callbacks registered by clients (e.g. closing the HTTP stream) run when cancel() is called.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def add_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Sleep up to timeout seconds; returns True if cancelled in the meantime."""
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise LLMCancelledError("Request cancelled")
+
+def _optional_float(value) -> Optional[float]:
+    if value is None or value is False:
+        return None
+    value = float(value)
+    return value if value > 0 else None
+
+@dataclass
+class Timeouts:
+    """Per-request time limits in seconds (None = no limit)."""
+    connect: Optional[float] = None
+    first_token: Optional[float] = None
+    overall: Optional[float] = None
+
+    @classmethod
+    def from_config(cls, config: dict) -> "Timeouts":
+        return cls(
+            connect=_optional_float(config.get("connect_timeout")),
+            first_token=_optional_float(config.get("first_token_timeout")),
+            overall=_optional_float(config.get("timeout")),
+        )
+
+@dataclass
+class RetryPolicy:
+    """Jittered exponential backoff for rate limits (429), overload and 5xx responses."""
+    max_retries: int = 2
+    backoff: float = 1.0
+    backoff_max: float = 30.0
+
+    RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504, 529)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "RetryPolicy":
+        return cls(
+            max_retries=int(config.get("max_retries", cls.max_retries)),
+            backoff=float(config.get("retry_backoff", cls.backoff)),
+            backoff_max=float(config.get("retry_backoff_max", cls.backoff_max)),
+        )
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before retry number attempt + 1 (full jitter, Retry-After wins)."""
+        if retry_after is not None:
+            return max(0.0, retry_after)
+        return random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+
+    def is_retryable(self, exc: BaseException) -> bool:
+        if isinstance(exc, LLMCancelledError):
+            return False
+        if isinstance(exc, LLMTimeoutError):
+            # 最初のトークンが来ないまま固まったリクエストはやり直す価値がある
+            return exc.first_token
+        status = status_code_of(exc)
+        if status is not None:
+            return status in self.RETRYABLE_STATUS
+        return isinstance(exc, (ConnectionError, TimeoutError)) or type(exc).__name__ in (
+            "APIConnectionError", "APITimeoutError", "RemoteDisconnected"
+        )
+
+def status_code_of(exc: BaseException) -> Optional[int]:
+    """HTTP status from SDK exceptions (openai/anthropic: status_code, google-genai: code)."""
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+def retry_after_of(exc: BaseException) -> Optional[float]:
+    """Retry-After (seconds) from the exception or its HTTP response, if the provider sent one."""
+    value = getattr(exc, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(exc, "response", None), "headers", None)
+        if headers is not None:
+            try:
+                value = headers.get("retry-after")
+            except Exception:
+                value = None
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        # HTTP-date 形式は扱わず、通常のバックオフに任せる
+        return None
+
+_END = object()
+
+def flatten_messages(messages: List[Message]) -> str:
+    """
+    Render a multi-turn conversation as a single prompt for backends
+    that only accept one user message.
+    """
+    if len(messages) == 1:
+        return messages[0]["content"]
+
+    parts = []
+    for msg in messages:
+        parts.append(f"[{msg['role']}]\n{msg['content']}")
+    return "\n\n".join(parts)
+
+def _total_tokens(usage: Optional[Dict[str, Any]]) -> Optional[int]:
+    if not usage:
+        return None
+    total = usage.get("total_tokens")
+    if isinstance(total, int):
+        return total
+    parts = [usage.get("prompt_tokens"), usage.get("completion_tokens")]
+    return sum(p for p in parts if isinstance(p, int)) if any(isinstance(p, int) for p in parts) else None
+
+def combine_usage(usages: Iterable[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Sums the token counts of several requests (None when none was reported)."""
+    combined: Dict[str, Any] = {}
+    for usage in usages:
+        for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            if isinstance(usage.get(key), int):
+                combined[key] = combined.get(key, 0) + usage[key]
+    return combined or None
+
+# stream_choices() の usage がリクエスト全体（全候補）のものであることを示す index
+ALL_CHOICES = -1
 
 class LLMClient(ABC):
+    # Subclasses call super().__init__(config) to pick these up from the [llm] / [models.*] entry
+    timeouts = Timeouts()
+    retry_policy = RetryPolicy()
+    # 1回のリクエストで複数の候補を返せるプロバイダー（stream_choices() を実装する）
+    supports_choices = False
+    # プロセス間で共有する rpm / tpm の枠（[llm] rpm, tpm）。None なら制限しない
+    quota: Optional[QuotaManager] = None
+    # 枠が空くのを待つ前に、待ち時間（秒）を渡して呼ばれる。フロントエンドが表示に使う
+    on_quota_wait: Optional[Callable[[float], None]] = None
+
+    def __init__(self, config: Optional[dict] = None):
+        config = config or {}
+        self.timeouts = Timeouts.from_config(config)
+        self.retry_policy = RetryPolicy.from_config(config)
+        self.quota = QuotaManager.from_config(config)
+        self._stream_lock = threading.Lock()
+        # (stream, owner): owner は開いた _guarded_stream() の呼び出し（候補ごとに別）
+        self._open_streams: List[Tuple[Any, Any]] = []
+        # producer スレッドごとの現在の owner
+        self._stream_owner = threading.local()
+
     @abstractmethod
     def generate_commit_message(self, prompt: str) -> Tuple[str, Optional[Dict[str, int]]]:
         """
@@ -16,4 +231,315 @@ class LLMClient(ABC):
         Default implementation wraps generate_commit_message for non-streaming clients.
         """
         msg, usage = self.generate_commit_message(prompt)
-        yield msg, usage
\ No newline at end of file
+        yield msg, usage
+
+    def stream_chat(self, messages: List[Message]) -> Generator[Tuple[str, Optional[Dict[str, Any]]], None, None]:
+        """
+        Yields (chunk_text, metadata) tuples for a conversation.
+        messages: [{"role": "user" | "assistant", "content": "..."}, ...]
+        Default implementation flattens the conversation into a single prompt.
+        """
+        yield from self.stream_commit_message(flatten_messages(messages))
+
+    def warmup(self) -> Optional[Dict[str, Any]]:
+        """
+        Preload the model so the first real request doesn't pay the cold-start cost.
+        Returns timing metadata, or None when the provider has nothing to warm up.
+        """
+        return None
+
+    def _track_stream(self, stream: Any) -> Any:
+        """Remember a provider stream (anything with close()) so cancellation can close it."""
+        lock = getattr(self, "_stream_lock", None)
+        if lock is None:
+            return stream
+        owner_local = getattr(self, "_stream_owner", None)
+        owner = getattr(owner_local, "value", None) if owner_local is not None else None
+        with lock:
+            self._open_streams.append((stream, owner))
+        return stream
+
+    def _untrack_stream(self, stream: Any) -> None:
+        lock = getattr(self, "_stream_lock", None)
+        if lock is None:
+            return
+        with lock:
+            self._open_streams = [entry for entry in self._open_streams if entry[0] is not stream]
+
+    def close_streams(self, owner: Any = None) -> None:
+        """
+        Close the provider streams opened by this client (called on cancel/timeout).
+        With owner, only the streams opened by that _guarded_stream() call are closed, so one candidate
+        timing out does not cut off the others running on the same client.
+        """
+        lock = getattr(self, "_stream_lock", None)
+        if lock is None:
+            return
+        with lock:
+            streams = [stream for stream, o in self._open_streams if owner is None or o is owner]
+            self._open_streams = [entry for entry in self._open_streams if owner is not None and entry[1] is not owner]
+        for stream in streams:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def stream(self, prompt: Union[str, List[Message]], cancel_token: Optional[CancellationToken] = None) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        """
+        stream_chat() with this client's timeouts, retry policy and cancellation applied.
+        Front-ends should call this instead of stream_commit_message()/stream_chat().
+
+        Retries only happen before the first chunk has been yielded, so callers never
+        see duplicated text.
+        """
+        messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+        yield from self._retrying(lambda: self.stream_chat(messages), cancel_token or CancellationToken(),
+                                  self._request_tokens(messages))
+
+    def _request_tokens(self, messages: List[Message], choices: int = 1) -> int:
+        """Tokens to reserve from the quota for one request (prompt once, the expected output per choice)."""
+        if self.quota is None:
+            return 0
+        chars = sum(len(m["content"]) for m in messages)
+        return estimate_request_tokens(chars, self.quota.output_tokens * choices)
+
+    def _reserve(self, cost: int, token: CancellationToken):
+        """Takes capacity from the shared quota and waits (cancellably) until it is available."""
+        if self.quota is None:
+            return None
+        reservation = self.quota.reserve(cost)
+        if reservation.wait > 0:
+            if self.on_quota_wait is not None:
+                self.on_quota_wait(reservation.wait)
+            if token.wait(reservation.wait):
+                self.quota.release(reservation)
+                raise LLMCancelledError("Request cancelled")
+        return reservation
+
+    def _retrying(self, source: Callable[[], Iterator[tuple]], token: CancellationToken, cost: int = 0) -> Iterator[tuple]:
+        """
+        Runs source() under _guarded_stream(), retrying (with backoff) until its first chunk.
+        Every attempt first reserves cost tokens (and one request) from the shared quota, if configured.
+        """
+        attempt = 0
+
+        while True:
+            token.raise_if_cancelled()
+            reservation = self._reserve(cost, token)
+            produced = False
+            usage = None
+            try:
+                for item in self._guarded_stream(source, token):
+                    produced = True
+                    usage = item[1] or usage
+                    yield item
+                if reservation is not None:
+                    self.quota.settle(reservation, _total_tokens(usage))
+                return
+            except Exception as e:
+                retryable = not produced and self.retry_policy.is_retryable(e)
+                delay = self.retry_policy.delay(attempt, retry_after_of(e)) if retryable else 0.0
+                if reservation is not None and status_code_of(e) == 429:
+                    # 同じキーを使う他のプロセスも、プロバイダーが指定した時間は送らないようにする
+                    self.quota.block(delay)
+                if not retryable or attempt >= self.retry_policy.max_retries:
+                    raise
+                attempt += 1
+                if token.wait(delay):
+                    raise LLMCancelledError("Request cancelled") from e
+
+    def events(self, prompt: Union[str, List[Message]], cancel_token: Optional[CancellationToken] = None,
+               metrics: Optional[StreamMetrics] = None) -> Iterator[StreamEvent]:
+        """
+        stream() as normalized events (FirstToken, TextDelta, Usage, Done).
+        Pass metrics to read live TTFT/throughput while streaming; the Done event carries it as well.
+        """
+        messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+        if metrics is None:
+            metrics = StreamMetrics()
+        metrics.input_chars = sum(len(m["content"]) for m in messages)
+        yield from to_events(self.stream(messages, cancel_token), metrics)
+
+    def generate(self, prompt: Union[str, List[Message]], cancel_token: Optional[CancellationToken] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Non-streaming counterpart of stream(): returns (text, usage)."""
+        text = ""
+        usage = None
+        for chunk, meta in self.stream(prompt, cancel_token):
+            if chunk:
+                text += chunk
+            usage = meta or usage
+        return text.strip(), usage
+
+    def stream_choices(self, messages: List[Message], n: int, temperature: Optional[float]) -> Iterator[Tuple[str, Optional[Dict[str, Any]], int]]:
+        """
+        n choices from a single request as (chunk_text, usage, index) tuples (index ALL_CHOICES for
+        usage covering the whole request). Only called when supports_choices is True.
+        """
+        raise NotImplementedError
+
+    def stream_candidates(self, prompt: Union[str, List[Message]], n: int, temperature: Optional[float] = None,
+                          cancel_token: Optional[CancellationToken] = None) -> Iterator[Tuple[str, Optional[Dict[str, Any]], int]]:
+        """
+        n alternative messages for one prompt, streamed as interleaved (chunk_text, usage, index) tuples.
+
+        Providers with native multi-choice support answer all n in one request, so the prompt is billed
+        once. Otherwise (or for choices a compatible backend ignored) the requests run concurrently;
+        the first one is started alone and the rest follow its first token, so they hit the provider's
+        prefix cache for the shared prompt. temperature only applies to native multi-choice requests.
+        A chunk text of None marks a candidate that failed after streaming part of its text; discard that index.
+        """
+        messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+        token = cancel_token or CancellationToken()
+        if n <= 1 or not self.supports_choices:
+            yield from self._fan_out(messages, list(range(max(n, 1))), token)
+            return
+
+        seen = set()
+        for text, usage, index in self._retrying(lambda: self.stream_choices(messages, n, temperature), token,
+                                                 self._request_tokens(messages, n)):
+            if text:
+                seen.add(index)
+            yield text, usage, index
+        missing = [i for i in range(n) if i not in seen]
+        if missing:
+            # n を無視する OpenAI 互換サーバーなど。足りない分だけ個別に生成する（プレフィックスはもう温まっている）
+            yield from self._fan_out(messages, missing, token, warm=True)
+
+    def _fan_out(self, messages: List[Message], indices: List[int], token: CancellationToken,
+                 warm: bool = False) -> Iterator[Tuple[str, Optional[Dict[str, Any]], int]]:
+        """
+        Runs one stream() per index in threads. A candidate that fails is dropped (a None chunk for its index)
+        unless all of them fail.
+        """
+        items: "queue.Queue" = queue.Queue()
+        # 呼び出し元がジェネレーターを途中で閉じた場合も、まだ動いているリクエストを止められるようにする
+        child = CancellationToken()
+        token.add_callback(child.cancel)
+
+        def run(index: int) -> None:
+            try:
+                for text, usage in self.stream(messages, child):
+                    items.put((text, usage, index))
+                items.put((_END, None, index))
+            except BaseException as e:
+                items.put((e, None, index))
+
+        def start(batch: List[int]) -> None:
+            for index in batch:
+                threading.Thread(target=run, args=(index,), name="komitto-llm-candidate", daemon=True).start()
+
+        waiting = indices[1:] if not warm else []
+        start(indices[:1] if not warm else indices)
+        running = len(indices) - len(waiting)
+        errors: List[BaseException] = []
+        try:
+            while running:
+                try:
+                    text, usage, index = items.get(timeout=0.1)
+                except queue.Empty:
+                    token.raise_if_cancelled()
+                    continue
+                if text is _END or isinstance(text, BaseException):
+                    running -= 1
+                    if isinstance(text, BaseException):
+                        errors.append(text)
+                        # 途中まで届いたテキストを候補として使わせない
+                        yield None, None, index
+                else:
+                    yield text, usage, index
+                if waiting and (text or text is _END or isinstance(text, BaseException)):
+                    # 最初のリクエストのプロンプトが処理された（キャッシュに載った）ので残りを送る
+                    start(waiting)
+                    running += len(waiting)
+                    waiting = []
+        finally:
+            token.remove_callback(child.cancel)
+            child.cancel()
+
+        token.raise_if_cancelled()
+        if errors and len(errors) == len(indices):
+            raise errors[0]
+
+    def generate_candidates(self, prompt: Union[str, List[Message]], n: int, temperature: Optional[float] = None,
+                            cancel_token: Optional[CancellationToken] = None) -> Tuple[List[str], Optional[Dict[str, Any]]]:
+        """Non-streaming counterpart of stream_candidates(): returns (texts, combined usage)."""
+        texts = [""] * n
+        usages: Dict[int, Dict[str, Any]] = {}
+        for chunk, meta, index in self.stream_candidates(prompt, n, temperature, cancel_token):
+            if chunk is None:
+                texts[index] = ""
+            elif chunk:
+                texts[index] += chunk
+            if meta:
+                usages[index] = meta
+        return [text.strip() for text in texts if text.strip()], combine_usage(usages.values())
+
+    def _guarded_stream(self, source: Callable[[], Iterator[tuple]], token: CancellationToken) -> Iterator[tuple]:
+        """
+        Runs source() (stream_chat() or stream_choices()) in a producer thread so that first-token/overall timeouts and
+        cancellation can interrupt a provider that is blocked inside a network read.
+        """
+        items: "queue.Queue" = queue.Queue()
+        stop = threading.Event()
+        # この呼び出しが開いたストリームだけを閉じる（同じクライアントで並行する候補には触れない）
+        owner = object()
+
+        def close_own() -> None:
+            self.close_streams(owner)
+
+        def produce():
+            owner_local = getattr(self, "_stream_owner", None)
+            if owner_local is not None:
+                owner_local.value = owner
+            try:
+                for item in source():
+                    if stop.is_set():
+                        break
+                    items.put(item)
+                items.put(_END)
+            except BaseException as e:
+                items.put(e)
+
+        producer = threading.Thread(target=produce, name="komitto-llm-stream", daemon=True)
+        token.add_callback(close_own)
+        producer.start()
+
+        start = time.monotonic()
+        first = True
+        try:
+            while True:
+                now = time.monotonic()
+                limits = []
+                if self.timeouts.overall is not None:
+                    limits.append((start + self.timeouts.overall, False))
+                if first and self.timeouts.first_token is not None:
+                    limits.append((start + self.timeouts.first_token, True))
+                deadline, is_first_token = min(limits, key=lambda l: l[0]) if limits else (None, False)
+
+                # キャンセルに素早く反応できるよう、短い間隔で待つ
+                wait = 0.1 if deadline is None else max(0.0, min(0.1, deadline - now))
+                try:
+                    item = items.get(timeout=wait)
+                except queue.Empty:
+                    token.raise_if_cancelled()
+                    if deadline is not None and time.monotonic() >= deadline:
+                        kind = "first token" if is_first_token else "overall"
+                        limit = self.timeouts.first_token if is_first_token else self.timeouts.overall
+                        raise LLMTimeoutError(f"No response within {limit:g}s ({kind} timeout)", first_token=is_first_token)
+                    continue
+
+                if item is _END:
+                    return
+                if isinstance(item, BaseException):
+                    token.raise_if_cancelled()
+                    raise item
+                token.raise_if_cancelled()
+                if item[0]:
+                    first = False
+                yield item
+        finally:
+            token.remove_callback(close_own)
+            stop.set()
+            if producer.is_alive():
+                # 途中で打ち切った場合は HTTP ストリームを閉じて producer スレッドを終わらせる
+                close_own()
@@ -0,0 +1,190 @@
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+# 使用量が返らないプロバイダーでの出力トークン数の概算（1トークン ≒ 4文字）
+CHARS_PER_TOKEN = 4
+
+@dataclass
+class TextDelta:
+    """A piece of generated text."""
+    text: str
+    timestamp: float
+
+@dataclass
+class FirstToken:
+    """Emitted once, right before the first TextDelta."""
+    timestamp: float
+    ttft: float
+
+@dataclass
+class Usage:
+    """Token counts reported by the provider (normalized across SDKs)."""
+    prompt_tokens: Optional[int]
+    completion_tokens: Optional[int]
+    total_tokens: Optional[int]
+    timestamp: float
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = dict(self.extra)
+        data.update({
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+        })
+        return data
+
+@dataclass
+class Done:
+    """End of the stream; carries the final metrics."""
+    timestamp: float
+    metrics: "StreamMetrics"
+
+StreamEvent = Union[TextDelta, FirstToken, Usage, Done]
+
+def _as_int(value) -> Optional[int]:
+    return value if isinstance(value, int) and not isinstance(value, bool) else None
+
+def normalize_usage(raw: Optional[Dict[str, Any]], timestamp: float) -> Optional[Usage]:
+    """Turns a client usage dict (missing/None counts allowed) into a Usage event."""
+    if not raw:
+        return None
+    prompt = _as_int(raw.get("prompt_tokens"))
+    completion = _as_int(raw.get("completion_tokens"))
+    total = _as_int(raw.get("total_tokens"))
+    if total is None and (prompt is not None or completion is not None):
+        total = (prompt or 0) + (completion or 0)
+    if prompt is None and completion is None and total is None:
+        return None
+    extra = {k: v for k, v in raw.items() if k not in ("prompt_tokens", "completion_tokens", "total_tokens") and v is not None}
+    return Usage(prompt, completion, total, timestamp, extra)
+
+class StreamMetrics:
+    """
+    Timing and token metrics for one generation, built from stream events.
+    The Rich front-end, the TUI and exported telemetry all read from this.
+    """
+
+    def __init__(self, input_chars: int = 0, start: Optional[float] = None):
+        self.input_chars = input_chars
+        self.start = time.perf_counter() if start is None else start
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.end: Optional[float] = None
+        self.output_chars = 0
+        self.usage: Optional[Usage] = None
+
+    def observe(self, event: StreamEvent) -> None:
+        if isinstance(event, TextDelta):
+            self.output_chars += len(event.text)
+            self.last_token_at = event.timestamp
+        elif isinstance(event, FirstToken):
+            self.first_token_at = event.timestamp
+        elif isinstance(event, Usage):
+            self.usage = event
+        elif isinstance(event, Done):
+            self.end = event.timestamp
+
+    @property
+    def ttft(self) -> Optional[float]:
+        """Time to first token in seconds."""
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.start
+
+    @property
+    def elapsed(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+    @property
+    def usage_dict(self) -> Optional[Dict[str, Any]]:
+        return self.usage.as_dict() if self.usage else None
+
+    @property
+    def output_tokens(self) -> Tuple[int, bool]:
+        """(completion tokens, estimated?) — falls back to chars/4 when the provider reports nothing."""
+        if self.usage and self.usage.completion_tokens is not None:
+            return self.usage.completion_tokens, False
+        return self.output_chars // CHARS_PER_TOKEN, True
+
+    @property
+    def decode_seconds(self) -> Optional[float]:
+        """Time spent generating after the first token (server-reported eval time when available)."""
+        if self.usage and isinstance(self.usage.extra.get("eval_ms"), (int, float)):
+            return self.usage.extra["eval_ms"] / 1000
+        if self.first_token_at is None:
+            return None
+        end = self.end if self.end is not None else (self.last_token_at or self.first_token_at)
+        return end - self.first_token_at
+
+    @property
+    def decode_tps(self) -> Optional[float]:
+        """Decode throughput in tokens/s, excluding the time to first token."""
+        seconds = self.decode_seconds
+        tokens, _ = self.output_tokens
+        if not seconds or seconds <= 0 or tokens <= 1:
+            return None
+        return tokens / seconds
+
+    def describe(self) -> str:
+        """One-line summary shared by the CLI panel and the TUI stats label."""
+        parts = []
+        prompt_tokens = self.usage.prompt_tokens if self.usage else None
+        if prompt_tokens is not None:
+            parts.append(f"Input: {self.input_chars} chars ({prompt_tokens} toks)")
+        else:
+            parts.append(f"Input: {self.input_chars} chars")
+
+        tokens, estimated = self.output_tokens
+        parts.append(f"Est. Output: ~{tokens} toks" if estimated else f"Output: {tokens} toks")
+        if self.usage and self.usage.total_tokens is not None:
+            parts.append(f"Total: {self.usage.total_tokens} toks")
+        if self.ttft is not None:
+            parts.append(f"TTFT: {self.ttft:.2f}s")
+        if self.decode_tps is not None:
+            parts.append(f"Decode: {self.decode_tps:.1f} tok/s")
+        return " / ".join(parts)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Flat metrics for telemetry export."""
+        tokens, estimated = self.output_tokens
+        return {
+            "input_chars": self.input_chars,
+            "output_chars": self.output_chars,
+            "ttft_s": self.ttft,
+            "decode_s": self.decode_seconds,
+            "decode_tps": self.decode_tps,
+            "elapsed_s": self.elapsed,
+            "completion_tokens": tokens,
+            "completion_tokens_estimated": estimated,
+            "usage": self.usage_dict,
+        }
+
+def to_events(stream: Iterable[Tuple[Optional[str], Optional[Dict[str, Any]]]], metrics: StreamMetrics) -> Iterator[StreamEvent]:
+    """
+    Normalizes a client's (text, usage) stream into events.
+    Empty/None text is dropped, and only the last usage report is emitted (some SDKs repeat it per chunk).
+    """
+    usage = None
+    for text, raw_usage in stream:
+        now = time.perf_counter()
+        if raw_usage:
+            usage = normalize_usage(raw_usage, now) or usage
+        if not text:
+            continue
+        if metrics.first_token_at is None:
+            event = FirstToken(now, now - metrics.start)
+            metrics.observe(event)
+            yield event
+        event = TextDelta(text, now)
+        metrics.observe(event)
+        yield event
+
+    if usage is not None:
+        metrics.observe(usage)
+        yield usage
+    done = Done(time.perf_counter(), metrics)
+    metrics.observe(done)
+    yield done
@@ -10,5 +10,11 @@ def create_llm_client(config: dict):
     elif provider == "anthropic":
         from .anthropic_client import AnthropicClient
         return AnthropicClient(config)
+    elif provider == "ollama":
+        from .local_client import OllamaClient
+        return OllamaClient(config)
+    elif provider in ("llamacpp", "llama.cpp"):
+        from .local_client import LlamaCppClient
+        return LlamaCppClient(config)
     else:
         raise ValueError(f"Unknown LLM provider: {provider}")
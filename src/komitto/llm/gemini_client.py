@@ -1,14 +1,23 @@
 import os
 from google import genai
-from .base import LLMClient
+from google.genai import types
+from .base import ALL_CHOICES, LLMClient
 
 class GeminiClient(LLMClient):
+    supports_choices = True
+
     def __init__(self, config: dict):
+        super().__init__(config)
         api_key = config.get("api_key") or os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
         if not api_key:
             raise ValueError("Gemini API key is missing. Set it in komitto.toml or environment variable 'GEMINI_API_KEY'.")
         
-        self.client = genai.Client(api_key=api_key)
+        kwargs = {}
+        if self.timeouts.overall:
+            # HttpOptions.timeout is in milliseconds
+            kwargs["http_options"] = types.HttpOptions(timeout=int(self.timeouts.overall * 1000))
+
+        self.client = genai.Client(api_key=api_key, **kwargs)
         self.model_name = config.get("model", "gemini-pro")
 
     def generate_commit_message(self, prompt: str):
@@ -28,17 +37,72 @@ class GeminiClient(LLMClient):
         return response.text.strip(), usage
 
     def stream_commit_message(self, prompt: str):
+        yield from self._stream(prompt)
+
+    @staticmethod
+    def _contents(messages):
+        # Gemini uses "model" instead of "assistant" and a parts list per turn
+        return [
+            {
+                "role": "model" if msg["role"] == "assistant" else "user",
+                "parts": [{"text": msg["content"]}]
+            }
+            for msg in messages
+        ]
+
+    def stream_chat(self, messages):
+        yield from self._stream(self._contents(messages))
+
+    def stream_choices(self, messages, n, temperature):
+        # candidate_count 個の候補を1回のリクエストで生成する（入力トークンの課金は1回分）
+        config = types.GenerateContentConfig(candidate_count=n, temperature=temperature)
         response = self.client.models.generate_content_stream(
             model=self.model_name,
-            contents=prompt
+            contents=self._contents(messages),
+            config=config
         )
-        
+        self._track_stream(response)
+        try:
+            for chunk in response:
+                for candidate in getattr(chunk, "candidates", None) or []:
+                    parts = candidate.content.parts if candidate.content and candidate.content.parts else []
+                    text = "".join(part.text for part in parts if part.text)
+                    if text:
+                        yield text, None, candidate.index or 0
+                usage = self._usage(chunk)
+                if usage:
+                    yield "", usage, ALL_CHOICES
+        finally:
+            self._untrack_stream(response)
+
+    def _stream(self, contents):
+        response = self.client.models.generate_content_stream(
+            model=self.model_name,
+            contents=contents
+        )
+        # Closing the generator from another thread may fail while it is blocked in a read;
+        # LLMClient.stream() then abandons the producer thread instead.
+        self._track_stream(response)
+        try:
+            yield from self._iter_chunks(response)
+        finally:
+            self._untrack_stream(response)
+
+    def _iter_chunks(self, response):
         for chunk in response:
-            usage = None
-            if hasattr(chunk, 'usage_metadata'):
-                 usage = {
-                    "prompt_tokens": chunk.usage_metadata.prompt_token_count,
-                    "completion_tokens": chunk.usage_metadata.candidates_token_count,
-                    "total_tokens": chunk.usage_metadata.total_token_count
-                }
-            yield chunk.text, usage
+            # chunk.text is None for chunks that only carry metadata (e.g. the final usage report)
+            text = chunk.text or ""
+            usage = self._usage(chunk)
+            if text or usage:
+                yield text, usage
+
+    @staticmethod
+    def _usage(chunk):
+        metadata = getattr(chunk, 'usage_metadata', None)
+        if metadata is not None and metadata.candidates_token_count is not None:
+            return {
+                "prompt_tokens": metadata.prompt_token_count,
+                "completion_tokens": metadata.candidates_token_count,
+                "total_tokens": metadata.total_token_count
+            }
+        return None
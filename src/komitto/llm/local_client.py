@@ -0,0 +1,237 @@
+import http.client
+import json
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .base import LLMClient, LLMHTTPError, flatten_messages
+
+class ConnectionPool:
+    """Idle HTTP connections per (scheme, host, port), shared by all local clients in the process."""
+
+    def __init__(self, max_idle: int = 4):
+        self.max_idle = max_idle
+        self._idle: Dict[Tuple[str, str, int], List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, scheme: str, host: str, port: int, timeout: Optional[float]) -> http.client.HTTPConnection:
+        with self._lock:
+            idle = self._idle.get((scheme, host, port))
+            if idle:
+                conn = idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn
+        conn_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return conn_class(host, port, timeout=timeout)
+
+    def release(self, scheme: str, host: str, port: int, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault((scheme, host, port), [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def clear(self) -> None:
+        with self._lock:
+            conns = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for conn in conns:
+            conn.close()
+
+_POOL = ConnectionPool()
+
+def _ns_to_ms(value) -> Optional[float]:
+    return value / 1e6 if isinstance(value, (int, float)) else None
+
+class LocalHTTPClient(LLMClient):
+    """Shared HTTP plumbing for local providers."""
+
+    default_base_url = "http://localhost:11434"
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        base_url = (config.get("base_url") or self.default_base_url).rstrip("/")
+        # OpenAI 互換エンドポイント用の設定 (".../v1") がそのまま使われた場合はネイティブ API のルートに戻す
+        if base_url.endswith("/v1"):
+            base_url = base_url[:-3]
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or "http"
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or (443 if self.scheme == "https" else 80)
+        self.path_prefix = parts.path.rstrip("/")
+        # connect_timeout は接続にだけ使う。接続後の読み取りはコールドスタートのモデル読み込みを待てるよう
+        # 全体の上限だけをソケットに設定し、最初のトークンと全体の期限は LLMClient.stream() が担当する
+        self.connect_timeout = self.timeouts.connect or self.timeouts.overall
+        self.read_timeout = self.timeouts.overall
+        self.model = config.get("model", "")
+
+    def _stream_lines(self, path: str, payload: dict) -> Iterator[bytes]:
+        """POST payload as JSON and yield the response body line by line."""
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Accept": "application/x-ndjson, text/event-stream"}
+
+        for attempt in range(2):
+            conn = _POOL.acquire(self.scheme, self.host, self.port, self.connect_timeout)
+            reused = conn.sock is not None
+            try:
+                if not reused:
+                    conn.connect()
+                conn.sock.settimeout(self.read_timeout)
+                conn.request("POST", self.path_prefix + path, body=body, headers=headers)
+                resp = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                # プール済みの接続がサーバー側で閉じられていた場合は新しい接続で1回だけやり直す
+                if reused and attempt == 0:
+                    continue
+                raise
+            break
+
+        finished = False
+        # キャンセル時は接続ごと閉じ、readline() でブロックしているスレッドを解放する
+        self._track_stream(conn)
+        try:
+            if resp.status >= 400:
+                detail = resp.read().decode("utf-8", errors="replace").strip()
+                finished = True
+                retry_after = resp.getheader("Retry-After")
+                raise LLMHTTPError(
+                    f"{self.host}:{self.port}{path} returned HTTP {resp.status}: {detail}",
+                    resp.status,
+                    float(retry_after) if retry_after and retry_after.strip().isdigit() else None
+                )
+
+            while True:
+                line = resp.readline()
+                if not line:
+                    break
+                line = line.strip()
+                if line:
+                    yield line
+            # Content-Length の応答は readline() だけでは閉じた扱いにならず、プールから再利用できない
+            resp.read()
+            finished = True
+        finally:
+            self._untrack_stream(conn)
+            if finished and not resp.will_close:
+                _POOL.release(self.scheme, self.host, self.port, conn)
+            else:
+                # 途中で打ち切られたストリームの接続は再利用できない
+                conn.close()
+
+    def generate_commit_message(self, prompt: str):
+        text = ""
+        usage = None
+        for chunk, meta in self.stream_commit_message(prompt):
+            text += chunk
+            usage = meta or usage
+        return text.strip(), usage
+
+class OllamaClient(LocalHTTPClient):
+    """Ollama native API (/api/chat) with keep_alive control."""
+
+    default_base_url = "http://localhost:11434"
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.model = config.get("model", "llama3")
+        self.keep_alive = config.get("keep_alive", "30m")
+        self.options = config.get("options")
+
+    def _payload(self, **extra) -> dict:
+        payload = {"model": self.model, "keep_alive": self.keep_alive}
+        if self.options:
+            payload["options"] = self.options
+        payload.update(extra)
+        return payload
+
+    @staticmethod
+    def _usage(final: Dict[str, Any]) -> Dict[str, Any]:
+        prompt_tokens = final.get("prompt_eval_count", 0) or 0
+        completion_tokens = final.get("eval_count", 0) or 0
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "load_ms": _ns_to_ms(final.get("load_duration")),
+            "prompt_eval_ms": _ns_to_ms(final.get("prompt_eval_duration")),
+            "eval_ms": _ns_to_ms(final.get("eval_duration")),
+            "total_ms": _ns_to_ms(final.get("total_duration")),
+        }
+
+    def stream_commit_message(self, prompt: str):
+        yield from self.stream_chat([{"role": "user", "content": prompt}])
+
+    def stream_chat(self, messages):
+        for line in self._stream_lines("/api/chat", self._payload(messages=messages, stream=True)):
+            data = json.loads(line)
+            if data.get("error"):
+                raise RuntimeError(f"Ollama error: {data['error']}")
+            content = (data.get("message") or {}).get("content") or ""
+            if data.get("done"):
+                yield content, self._usage(data)
+            elif content:
+                yield content, None
+
+    def warmup(self) -> Dict[str, Any]:
+        """Load the model into memory (an empty generate request) and keep it resident for keep_alive."""
+        usage = None
+        for line in self._stream_lines("/api/generate", self._payload(prompt="", stream=False)):
+            data = json.loads(line)
+            if data.get("error"):
+                raise RuntimeError(f"Ollama error: {data['error']}")
+            usage = self._usage(data)
+        return usage or {}
+
+class LlamaCppClient(LocalHTTPClient):
+    """llama.cpp server native API (/completion, server-sent events)."""
+
+    default_base_url = "http://localhost:8080"
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.n_predict = config.get("max_tokens", 1024)
+
+    @staticmethod
+    def _usage(final: Dict[str, Any]) -> Dict[str, Any]:
+        timings = final.get("timings") or {}
+        prompt_tokens = timings.get("prompt_n", final.get("tokens_evaluated", 0)) or 0
+        completion_tokens = timings.get("predicted_n", final.get("tokens_predicted", 0)) or 0
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_eval_ms": timings.get("prompt_ms"),
+            "eval_ms": timings.get("predicted_ms"),
+        }
+
+    def _events(self, payload: dict) -> Iterator[Dict[str, Any]]:
+        for line in self._stream_lines("/completion", payload):
+            if line.startswith(b"data:"):
+                line = line[5:].strip()
+            if not line or line == b"[DONE]":
+                continue
+            yield json.loads(line)
+
+    def stream_commit_message(self, prompt: str):
+        # cache_prompt: 同じプレフィックスの再送（refine 等）ではサーバー側の KV キャッシュを再利用する
+        payload = {"prompt": prompt, "stream": True, "n_predict": self.n_predict, "cache_prompt": True}
+        for data in self._events(payload):
+            content = data.get("content") or ""
+            if data.get("stop"):
+                yield content, self._usage(data)
+            elif content:
+                yield content, None
+
+    def stream_chat(self, messages):
+        yield from self.stream_commit_message(flatten_messages(messages))
+
+    def warmup(self) -> Dict[str, Any]:
+        """Evaluate an empty prompt so the first real request doesn't pay for cold caches."""
+        usage = None
+        for data in self._events({"prompt": "", "n_predict": 0, "stream": False}):
+            usage = self._usage(data)
+        return usage or {}
@@ -1,9 +1,13 @@
 import os
+import openai
 from openai import OpenAI
-from .base import LLMClient
+from .base import ALL_CHOICES, LLMClient
 
 class OpenAIClient(LLMClient):
+    supports_choices = True
+
     def __init__(self, config: dict):
+        super().__init__(config)
         api_key = config.get("api_key") or os.environ.get("OPENAI_API_KEY")
         base_url = config.get("base_url")
         
@@ -12,9 +16,15 @@ class OpenAIClient(LLMClient):
             # but standard OpenAI does. We'll warn or let the SDK handle the error if missing.
             pass
 
+        kwargs = {}
+        if self.timeouts.connect or self.timeouts.overall:
+            kwargs["timeout"] = openai.Timeout(self.timeouts.overall, connect=self.timeouts.connect or self.timeouts.overall)
+
         self.client = OpenAI(
             api_key=api_key or "dummy", # Some local servers need a dummy key
-            base_url=base_url
+            base_url=base_url,
+            max_retries=0, # Retries are handled by LLMClient.stream() so they can be cancelled
+            **kwargs
         )
         self.model = config.get("model", "gpt-4o")
 
@@ -38,32 +48,67 @@ class OpenAIClient(LLMClient):
         return content, usage
 
     def stream_commit_message(self, prompt: str):
+        yield from self.stream_chat([{"role": "user", "content": prompt}])
+
+    def stream_chat(self, messages):
+        stream = self._create_stream(messages)
+        self._track_stream(stream)
+        try:
+            yield from self._iter_chunks(stream)
+        finally:
+            self._untrack_stream(stream)
+
+    def stream_choices(self, messages, n, temperature):
+        # n 個の候補を1回のリクエストで生成する（入力トークンの課金は1回分）
+        extra = {"n": n}
+        if temperature is not None:
+            extra["temperature"] = temperature
+        stream = self._create_stream(messages, **extra)
+        self._track_stream(stream)
+        try:
+            for chunk in stream:
+                for choice in chunk.choices or []:
+                    if choice.delta.content:
+                        yield choice.delta.content, None, choice.index
+                usage = self._usage(chunk)
+                if usage:
+                    yield "", usage, ALL_CHOICES
+        finally:
+            self._untrack_stream(stream)
+
+    def _create_stream(self, messages, **extra):
         try:
-            stream = self.client.chat.completions.create(
+            return self.client.chat.completions.create(
                 model=self.model,
-                messages=[{"role": "user", "content": prompt}],
+                messages=messages,
                 stream=True,
-                stream_options={"include_usage": True}
+                stream_options={"include_usage": True},
+                **extra
             )
         except TypeError:
             # Fallback for older SDKs or backends that don't support stream_options
-            stream = self.client.chat.completions.create(
+            return self.client.chat.completions.create(
                 model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                stream=True
+                messages=messages,
+                stream=True,
+                **extra
             )
 
+    @staticmethod
+    def _usage(chunk):
+        if hasattr(chunk, "usage") and chunk.usage:
+            return {
+                "prompt_tokens": chunk.usage.prompt_tokens,
+                "completion_tokens": chunk.usage.completion_tokens,
+                "total_tokens": chunk.usage.total_tokens
+            }
+        return None
+
+    def _iter_chunks(self, stream):
         for chunk in stream:
             content = chunk.choices[0].delta.content if chunk.choices else None
-            
-            usage = None
-            if hasattr(chunk, "usage") and chunk.usage:
-                usage = {
-                    "prompt_tokens": chunk.usage.prompt_tokens,
-                    "completion_tokens": chunk.usage.completion_tokens,
-                    "total_tokens": chunk.usage.total_tokens
-                }
-            
+            usage = self._usage(chunk)
+
             if content:
                 yield content, usage
             elif usage:
@@ -0,0 +1,174 @@
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from ..cache import default_cache_dir
+from .events import CHARS_PER_TOKEN
+
+# プロバイダーごとの API キーの環境変数（クライアントが読むものと同じ）
+API_KEY_ENV = {
+    "openai": ("OPENAI_API_KEY",),
+    "gemini": ("GEMINI_API_KEY", "GOOGLE_API_KEY"),
+    "anthropic": ("ANTHROPIC_API_KEY",),
+}
+
+# バケットに貯められる量（何秒分の補充か）。プロバイダーは分単位の上限を秒単位に均して適用することが多い
+DEFAULT_BURST_SECONDS = 10.0
+# 予約時に見込む出力トークン数（実際の使用量が分かったら差分を戻す）
+DEFAULT_OUTPUT_TOKENS = 512
+
+_BUSY_TIMEOUT = 30
+
+@dataclass
+class Reservation:
+    """Capacity taken from a shared bucket; wait is how long to hold the request back (seconds)."""
+    key: str
+    tokens: int
+    wait: float
+
+def bucket_key(config: dict) -> str:
+    """
+    Bucket identity shared by every process using the same provider account: provider, endpoint and a hash
+    of the API key (the key itself is never stored). [llm] quota_key overrides it.
+    """
+    if config.get("quota_key"):
+        return str(config["quota_key"])
+    provider = str(config.get("provider", "openai")).lower()
+    api_key = config.get("api_key") or next(
+        (os.environ[name] for name in API_KEY_ENV.get(provider, ()) if os.environ.get(name)), "")
+    raw = "\0".join([provider, str(config.get("base_url") or ""), api_key])
+    return f"{provider}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]}"
+
+def estimate_request_tokens(chars: int, output_tokens: int = DEFAULT_OUTPUT_TOKENS) -> int:
+    return chars // CHARS_PER_TOKEN + output_tokens
+
+class QuotaManager:
+    """
+    Token buckets for requests and tokens per minute, shared through SQLite by all komitto processes
+    (CI jobs, hooks, editors) that use the same provider account.
+
+    reserve() takes capacity immediately, even if that puts the bucket into debt, and returns how long
+    the caller has to wait until the debt is paid back. Callers are therefore served in the order they
+    reserved, without polling. A 429 seen by any process blocks the bucket for everyone until the
+    provider's Retry-After has passed.
+    """
+
+    def __init__(self, key: str, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 path: Optional[Path] = None, burst: float = DEFAULT_BURST_SECONDS,
+                 output_tokens: int = DEFAULT_OUTPUT_TOKENS):
+        if path is None:
+            path = default_cache_dir() / "quota.sqlite3"
+        self.key = key
+        self.rpm = rpm
+        self.tpm = tpm
+        self.burst = burst
+        self.output_tokens = output_tokens
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " key TEXT PRIMARY KEY,"
+                " requests REAL NOT NULL,"
+                " tokens REAL NOT NULL,"
+                " updated REAL NOT NULL,"
+                " blocked_until REAL NOT NULL DEFAULT 0)"
+            )
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["QuotaManager"]:
+        """[llm] rpm / tpm (0 or unset = no limit). None when neither is set."""
+        rpm = _positive(config.get("rpm"))
+        tpm = _positive(config.get("tpm"))
+        if rpm is None and tpm is None:
+            return None
+        path = config.get("quota_path")
+        return cls(
+            bucket_key(config), rpm, tpm,
+            path=Path(path) if path else None,
+            burst=float(config.get("quota_burst", DEFAULT_BURST_SECONDS)),
+            output_tokens=int(config.get("quota_output_tokens", DEFAULT_OUTPUT_TOKENS)),
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # 操作ごとに開いて閉じる（クライアントを作り続ける --stdio のセッションでも接続が溜まらない）。
+        # 自動コミットにして、BEGIN IMMEDIATE で他のプロセスやスレッドと排他する
+        return sqlite3.connect(str(self.path), timeout=_BUSY_TIMEOUT, isolation_level=None)
+
+    def _capacity(self, per_minute: Optional[float]) -> float:
+        # 1リクエスト分（または1回の見込み分）より小さいと永久に待つので、最低でも1は貯められるようにする
+        return max(1.0, per_minute / 60 * self.burst) if per_minute else 0.0
+
+    def _update(self, change):
+        """Runs change(requests, tokens, blocked_until, now) on the refilled bucket inside one write transaction."""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = conn.execute("SELECT requests, tokens, updated, blocked_until FROM buckets WHERE key = ?",
+                                   (self.key,)).fetchone()
+                cap_requests, cap_tokens = self._capacity(self.rpm), self._capacity(self.tpm)
+                if row is None:
+                    requests, tokens, blocked_until = cap_requests, cap_tokens, 0.0
+                else:
+                    requests, tokens, updated, blocked_until = row
+                    elapsed = max(0.0, now - updated)
+                    if self.rpm:
+                        requests = min(cap_requests, requests + elapsed * self.rpm / 60)
+                    if self.tpm:
+                        tokens = min(cap_tokens, tokens + elapsed * self.tpm / 60)
+                requests, tokens, blocked_until, result = change(requests, tokens, blocked_until, now)
+                conn.execute("INSERT OR REPLACE INTO buckets (key, requests, tokens, updated, blocked_until) "
+                             "VALUES (?, ?, ?, ?, ?)", (self.key, requests, tokens, now, blocked_until))
+                conn.execute("COMMIT")
+                return result
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def reserve(self, tokens: int) -> Reservation:
+        """Takes one request and tokens from the bucket; the returned wait is 0 when there is capacity now."""
+        def change(requests, available, blocked_until, now):
+            waits = [blocked_until - now]
+            if self.rpm:
+                requests -= 1
+                waits.append(-requests * 60 / self.rpm)
+            if self.tpm:
+                available -= tokens
+                waits.append(-available * 60 / self.tpm)
+            return requests, available, blocked_until, max(0.0, *waits)
+
+        return Reservation(self.key, tokens, self._update(change))
+
+    def settle(self, reservation: Reservation, used: Optional[int]) -> None:
+        """Corrects the token bucket once the provider reported the real usage."""
+        if not self.tpm or used is None:
+            return
+        self._update(lambda requests, tokens, blocked, now: (requests, tokens + reservation.tokens - used, blocked, None))
+
+    def release(self, reservation: Reservation) -> None:
+        """Gives back a reservation whose request was never sent (cancelled while queued)."""
+        def change(requests, tokens, blocked_until, now):
+            if self.rpm:
+                requests += 1
+            if self.tpm:
+                tokens += reservation.tokens
+            return requests, tokens, blocked_until, None
+
+        self._update(change)
+
+    def block(self, seconds: float) -> None:
+        """Holds every process back for seconds (after a 429 from the provider)."""
+        self._update(lambda requests, tokens, blocked_until, now:
+                     (requests, tokens, max(blocked_until, now + seconds), None))
+
+def _positive(value) -> Optional[float]:
+    if value is None or value is False:
+        return None
+    value = float(value)
+    return value if value > 0 else None
@@ -1,6 +1,6 @@
 import sys
 import os
-import argparse
+import atexit
 import pyperclip
 import time
 
@@ -15,11 +15,26 @@ from rich.panel import Panel
 from rich.markdown import Markdown
 from rich.markup import escape
 
+from .cli import build_parser
 from .config import load_config, init_config, resolve_config
 from .llm import create_llm_client
-from .git_utils import get_git_diff, get_git_log, git_commit
+from .llm.base import CancellationToken, LLMCancelledError
+from .llm.events import StreamMetrics, TextDelta, Usage
+from .git_utils import get_git_diff, git_commit, get_repo_root, get_staged_paths, write_tree, read_tree, unstage_paths
 from .editor import launch_editor
-from .prompt import build_prompt
+from .prompt import build_prompt_sections, split_diff
+from .tokens import estimate_prompt, compaction_summaries, tokenizer_family
+from .cache import open_cache
+from .history import build_history_context
+from .session import SESSION_COMPARE, SESSION_SINGLE, STREAM_MAIN, begin_session, load_last_session, open_journal, session_dir
+from .output import DELIVERED_CLIPBOARD, DELIVERED_FILE, deliver_prompt, write_output
+from .heuristic import heuristic_message
+from .summarize import load_file_summaries
+from .monorepo import partition_paths
+from .pipeline import make_plan, run_map_phase
+from .refine import Candidate, CandidateHistory, MODE_FULL, MODE_REFINE
+from .postprocess import MessageRules, StreamCleaner, clean_events, postprocess, result_notes
+from .profiling import finish_profiling, iterate, stage, start_profiling
 from .i18n import t
 
 console = Console()
@@ -47,10 +62,209 @@ from rich.live import Live
 from rich.console import Group
 from rich.text import Text
 
-def generate_and_review(config, args, system_prompt, final_text, title_suffix=""):
+def stream_with_live(events, metrics, title_suffix=""):
+    """
+    Renders a client event stream (see LLMClient.events) in a Rich Live panel.
+    Returns the generated text; timings and token counts are in metrics.
+    """
+    commit_message = ""
+
+    with Live(
+        Panel(
+            Markdown(""), 
+            title=f"⏳ Generating {title_suffix}...", 
+            border_style="#e5c07b",
+            title_align="left"
+        ), 
+        console=console, 
+        refresh_per_second=10
+    ) as live:
+        for event in iterate("stream", events):
+            if isinstance(event, TextDelta):
+                commit_message += event.text
+            elif not isinstance(event, Usage):
+                continue
+
+            with stage("render"):
+                live.update(Panel(
+                    Group(
+                        Markdown(commit_message),
+                        Text(f"\n{metrics.describe()}", style="dim")
+                    ),
+                    title=f"Generating {title_suffix}...", 
+                    border_style="blue"
+                ))
+
+    return commit_message
+
+def commit_per_package(config, args, recent_logs, user_context, diff_content, exclude_patterns, cache=None):
+    """
+    Splits the staged changes into one commit per package ([monorepo] packages/markers).
+    The index is narrowed to one package at a time (the working tree is never touched) and
+    restored afterwards, so anything not committed stays staged.
+    Returns False when fewer than two packages are staged.
+    """
+    monorepo_config = config.get("monorepo", {})
+    diff_paths = {fd.path for fd in split_diff(diff_content)}
+    partitions = partition_paths(get_staged_paths(), monorepo_config, get_repo_root())
+
+    # 除外パターンに当たるファイルしかないパッケージは、単独ではプロンプトが作れないので最初のパッケージと一緒にコミットする
+    names = [name for name, paths in partitions.items() if any(p in diff_paths for p in paths)]
+    if len(names) < 2:
+        return False
+    for name, paths in list(partitions.items()):
+        if name not in names:
+            partitions[names[0]].extend(paths)
+
+    system_prompt = config["prompt"]["system"]
+    staged_tree = write_tree()
+    try:
+        for n, name in enumerate(names, 1):
+            read_tree(staged_tree)
+            unstage_paths(p for other in names if other != name for p in partitions[other])
+            console.rule(escape(t("main.split_package", name, n, len(names))))
+
+            diff_content = get_git_diff(exclude_patterns=exclude_patterns, context_config=config.get("git", {}))
+            final_text = preflight(config, args, system_prompt, recent_logs, user_context, diff_content,
+                                   cache=cache, title_suffix=f"({name})")
+            if args.dry_run:
+                continue
+            if final_text is None:
+                console.print(f"[#e5c07b]⚠️  {escape(t('main.split_stopped', name))}[/#e5c07b]")
+                return True
+
+            plan = make_plan(config, system_prompt, recent_logs, user_context, diff_content, final_text,
+                             cache=cache, monorepo=False)
+            if args.interactive:
+                from .tui.app import KomittoApp
+                message = KomittoApp(config=config, prompt=final_text, map_reduce=plan,
+                                     draft=heuristic_message(diff_content), options=session_options(args),
+                                     journal=open_journal(config), cache=cache).run()
+            else:
+                if plan is not None:
+                    final_text = run_map_phase(plan, console)
+                message = generate_and_review(config, args, system_prompt, final_text, title_suffix=f"({name})",
+                                              draft=heuristic_message(diff_content), cache=cache)
+                if message and not git_commit(message):
+                    console.print(f"[#e06c75]❌ {t('main.action_commit_failed')}[/#e06c75]")
+                    message = None
+
+            if not message:
+                console.print(f"[#e5c07b]⚠️  {escape(t('main.split_stopped', name))}[/#e5c07b]")
+                return True
+    finally:
+        read_tree(staged_tree)
+    return True
+
+def print_estimate(estimate, config, title_suffix=""):
+    """Prints the per-section token/cost table for --dry-run."""
+    from rich.table import Table
+
+    table = Table(title=f"{t('main.dry_run_title', estimate.family)} {title_suffix}".strip(), title_justify="left")
+    table.add_column("Section")
+    table.add_column("Chars", justify="right")
+    table.add_column("Tokens", justify="right")
+    if estimate.price is not None:
+        table.add_column("Cost (USD)", justify="right")
+
+    for section in estimate.sections:
+        row = [escape(section.label), f"{section.chars:,}", f"{section.tokens:,}"]
+        if estimate.price is not None:
+            row.append(f"{estimate.section_cost(section):.5f}")
+        table.add_row(*row)
+
+    total = [t("main.dry_run_total"), f"{sum(s.chars for s in estimate.sections):,}", f"{estimate.input_tokens:,}"]
+    output = [t("main.dry_run_output"), "", f"~{estimate.output_tokens:,}"]
+    if estimate.price is not None:
+        total.append(f"{estimate.input_tokens * estimate.price[0] / 1_000_000:.5f}")
+        output.append(f"{estimate.output_tokens * estimate.price[1] / 1_000_000:.5f}")
+    table.add_section()
+    table.add_row(*total, style="bold")
+    table.add_row(*output, style="dim")
+    console.print(table)
+
+    if estimate.cost is not None:
+        console.print(t("main.dry_run_cost", estimate.cost), style="bold")
+    elif config.get("llm", {}).get("provider"):
+        console.print(t("main.price_unknown", config["llm"].get("model", "")), style="yellow")
+
+def preflight(config, args, system_prompt, recent_logs, user_context, diff_content, cache=None, summaries=None, title_suffix=""):
+    """
+    Builds the prompt and estimates its tokens/cost locally before anything is sent.
+    Prints the estimate for --dry-run, and enforces [llm] max_cost (cost_guard = "stop" | "compact").
+    Returns the prompt text, or None when nothing should be sent.
+    """
+    sections = build_prompt_sections(system_prompt, recent_logs, user_context, diff_content, cache=cache, summaries=summaries)
+    llm_config = config.get("llm", {})
+    max_cost = llm_config.get("max_cost")
+
+    if not args.dry_run and not (max_cost and llm_config.get("provider")):
+        return "\n".join(section.text for section in sections)
+
+    estimate = estimate_prompt(sections, config)
+    if args.dry_run:
+        print_estimate(estimate, config, title_suffix)
+        return None
+
+    if estimate.cost is None:
+        console.print(t("main.price_unknown", llm_config.get("model", "")), style="yellow")
+    elif estimate.cost > float(max_cost):
+        compacted = None
+        if llm_config.get("cost_guard", "stop") == "compact":
+            compacted = compaction_summaries(split_diff(diff_content), estimate, float(max_cost), summaries)
+        if compacted is not None:
+            sections = build_prompt_sections(system_prompt, recent_logs, user_context, diff_content, cache=cache, summaries=compacted)
+            estimate = estimate_prompt(sections, config)
+        if compacted is None or estimate.cost > float(max_cost):
+            console.print(f"[#e06c75]❌ {escape(t('main.cost_exceeded', estimate.cost, float(max_cost)))}[/#e06c75]")
+            return None
+        console.print(f"[#e5c07b]⚠️  {escape(t('main.cost_compacted', len(compacted) - len(summaries or {}), estimate.cost))}[/#e5c07b]")
+
+    return "\n".join(section.text for section in sections)
+
+def review_draft(args, draft, title_suffix=""):
+    """
+    Shows a heuristic draft (offline mode, or after the provider failed) and copies it to the clipboard.
+    In interactive mode, offers to commit or edit it. Returns the committed message or None.
+    """
+    console.print(Panel(
+        Markdown(draft),
+        title=f"📝 {t('main.draft_title')} {title_suffix}".rstrip(),
+        border_style="#e5c07b",
+        title_align="left"
+    ))
+    try:
+        pyperclip.copy(draft)
+        console.print(f"[#98c379]📋 {t('main.copied_to_clipboard')}[/#98c379]")
+    except Exception:
+        pass
+    if not args.interactive:
+        return None
+
+    while True:
+        console.print(escape(t("main.draft_prompt")), end=" ", style="bold")
+        sys.stdout.flush()
+        choice = get_key().lower()
+        console.print(choice)
+        if choice == 'y':
+            if git_commit(draft):
+                console.print(f"[#98c379]✅ {t('main.action_commit_success')}[/#98c379]")
+                return draft
+            console.print(f"[#e06c75]❌ {t('main.action_commit_failed')}[/#e06c75]")
+            return None
+        elif choice == 'e':
+            draft = launch_editor(draft)
+            console.print(Panel(Markdown(draft), border_style="#e5c07b"))
+        elif choice in ('n', 'q', '\x03'):
+            console.print(f"[#e5c07b]⚠️  {t('main.action_canceled')}[/#e5c07b]")
+            return None
+
+def generate_and_review(config, args, system_prompt, final_text, title_suffix="", draft=None, cache=None):
     """
     Generates a commit message and handles the review loop.
     Extracts the main generation and interaction logic for reuse in single and compare modes.
+    If the provider fails (e.g. times out), the heuristic draft is shown and copied instead.
+    The caller's cache (if any) records how many regenerations post-processing avoided.
     """
     llm_config = config.get("llm", {})
     if not llm_config or not llm_config.get("provider"):
@@ -58,72 +272,56 @@ def generate_and_review(config, args, system_prompt, final_text, title_suffix=""
         return None
 
     try:
-        client = create_llm_client(llm_config)
+        with stage("create_client"):
+            client = create_llm_client(llm_config)
+        client.on_quota_wait = lambda wait: console.print(f"[#e5c07b]⏳ {t('main.quota_wait', wait)}[/#e5c07b]")
+        history = CandidateHistory(final_text)
+        rules = MessageRules.from_config(config)
+        next_request = (MODE_FULL, "")
+        journal = begin_session(open_journal(config), SESSION_SINGLE,
+                                [(STREAM_MAIN, final_text, session_options(args), config)])
         
         while True:
-            commit_message = ""
-            usage_stats = None
-            start_time = time.time()
-            input_chars = len(final_text)
-            
-            with Live(
-                Panel(
-                    Markdown(""), 
-                    title=f"⏳ Generating {title_suffix}...", 
-                    border_style="#e5c07b",
-                    title_align="left"
-                ), 
-                console=console, 
-                refresh_per_second=10
-            ) as live:
-                for chunk, usage in client.stream_commit_message(final_text):
-                    if chunk:
-                        commit_message += chunk
-                    
-                    if usage:
-                        usage_stats = usage
-                    
-                    elapsed = time.time() - start_time
-                    speed_info = ""
-                    if elapsed > 0:
-                        if usage_stats and usage_stats.get('completion_tokens'):
-                            speed = usage_stats['completion_tokens'] / elapsed
-                            speed_info = f" / {speed:.1f} tok/s"
-                        else:
-                            speed = len(commit_message) / elapsed
-                            speed_info = f" / {speed:.1f} char/s"
-
-                    token_info = ""
-                    if usage_stats:
-                        p_tok = usage_stats.get('prompt_tokens', '?')
-                        c_tok = usage_stats.get('completion_tokens', '?')
-                        token_info = f"\nInput: {input_chars} chars ({p_tok} toks) / Output: {c_tok} toks{speed_info}"
-                    elif commit_message:
-                         est_out_tok = len(commit_message) // 4
-                         token_info = f"\nInput: {input_chars} chars / Est. Output: {est_out_tok} toks{speed_info}"
-
-                    live.update(Panel(
-                        Group(
-                            Markdown(commit_message),
-                            Text.from_markup(token_info, style="dim")
-                        ),
-                        title=f"Generating {title_suffix}...", 
-                        border_style="blue"
-                    ))
+            mode, instruction = next_request
+            if mode == MODE_REFINE:
+                messages = history.refine_messages(instruction)
+            else:
+                messages = history.full_messages()
+            cancel_token = CancellationToken()
+            metrics = StreamMetrics()
+            cleaner = StreamCleaner()
+            events = clean_events(client.events(messages, cancel_token, metrics), rules, cleaner)
+            if journal is not None:
+                events = journal.tap(events, STREAM_MAIN, mode, instruction)
+            try:
+                commit_message = stream_with_live(events, metrics, title_suffix)
+                # フェンスや前置きの除去・折り返し。形式のルールに合わなければ短い修正依頼を送る
+                with stage("postprocess"):
+                    result = postprocess(commit_message, rules, client, cancel_token, cleaned=cleaner.removed)
+            except KeyboardInterrupt:
+                # Close the HTTP stream right away instead of leaving it to the interpreter shutdown
+                cancel_token.cancel()
+                console.print(f"[#e5c07b]⚠️  {t('main.action_canceled')}[/#e5c07b]")
+                return None
+            commit_message = result.text
+            if journal is not None:
+                journal.revise(STREAM_MAIN, commit_message)
+            notes = result_notes(result, cache)
+            candidate = history.add(Candidate(
+                text=commit_message,
+                mode=mode,
+                instruction=instruction,
+                usage=metrics.usage_dict,
+                elapsed=metrics.elapsed,
+                messages=messages,
+                metrics=metrics
+            ))
 
             console.clear()
             final_panel_title = f"Generated Commit Message {title_suffix}"
-            if usage_stats:
-                elapsed = time.time() - start_time
-                speed_str = ""
-                if elapsed > 0 and usage_stats.get('completion_tokens'):
-                     speed_str = f" ({usage_stats['completion_tokens'] / elapsed:.1f} tok/s)"
-                
-                p_tok = usage_stats.get('prompt_tokens', '?')
-                c_tok = usage_stats.get('completion_tokens', '?')
-                t_tok = usage_stats.get('total_tokens', '?')
-                usage_str = f"[dim]Input: {input_chars} chars ({p_tok} toks) / Output: {c_tok} toks / Total: {t_tok} toks{speed_str}[/dim]"
-                console.print(usage_str, justify="right")
+            console.print(Text(metrics.describe(), style="dim"), justify="right")
+            for note in notes:
+                console.print(Text(note, style="#e5c07b"))
             
             if not args.interactive and not args.compare:
                 pyperclip.copy(commit_message)
@@ -141,13 +339,25 @@ def generate_and_review(config, args, system_prompt, final_text, title_suffix=""
                 return commit_message
 
             while True:
+                candidate = history.current
+                commit_message = candidate.text
+
                 console.clear() 
-                if usage_stats:
-                     console.print(f"[dim]Tokens: Prompt {usage_stats.get('prompt_tokens', '?')}, Completion {usage_stats.get('completion_tokens', '?')}, Total {usage_stats.get('total_tokens', '?')}[/dim]", justify="right")
+                if candidate.metrics:
+                    console.print(Text(candidate.metrics.describe(), style="dim"), justify="right")
+                comparison = history.compare_to_full(candidate)
+                if comparison:
+                    console.print(f"[dim]{comparison}[/dim]", justify="right")
+                if candidate is history.candidates[-1]:
+                    for note in notes:
+                        console.print(Text(note, style="#e5c07b"))
 
+                panel_title = f"✅ {final_panel_title}"
+                if len(history) > 1:
+                    panel_title += f" ({t('main.candidate_position', history.position())})"
                 console.print(Panel(
                     Markdown(commit_message), 
-                    title=f"✅ {final_panel_title}", 
+                    title=panel_title, 
                     border_style="#98c379",
                     title_align="left"
                 ))
@@ -168,34 +378,110 @@ def generate_and_review(config, args, system_prompt, final_text, title_suffix=""
                     console.print(f"[#e5c07b]📤 {t('main.action_commit_running')}[/#e5c07b]")
                     if git_commit(commit_message):
                         console.print(f"[#98c379]✅ {t('main.action_commit_success')}[/#98c379]")
+                        if journal is not None:
+                            journal.committed()
                         return commit_message
                     else:
                         console.print(f"[#e06c75]❌ {t('main.action_commit_failed')}[/#e06c75]")
                         return None
                 
                 elif choice == 'e':
-                    commit_message = launch_editor(commit_message)
+                    history.update_current_text(launch_editor(commit_message))
                     continue 
                     
                 elif choice == 'r':
+                    next_request = (MODE_FULL, "")
                     break # Break inner loop to regenerate
+
+                elif choice == 'f':
+                    instruction = console.input(escape(t("main.refine_input"))).strip()
+                    if not instruction:
+                        continue
+                    next_request = (MODE_REFINE, instruction)
+                    break
+
+                elif choice == '[':
+                    history.previous()
+                    continue
+
+                elif choice == ']':
+                    history.next()
+                    continue
                     
                 elif choice == 'n' or choice == '\x03' or choice == 'q':
                     console.print(f"[#e5c07b]⚠️  {t('main.action_canceled')}[/#e5c07b]")
-                    os._exit(0)
+                    return None
+    except LLMCancelledError:
+        console.print(f"[#e5c07b]⚠️  {t('main.action_canceled')}[/#e5c07b]")
+        return None
     except Exception as e:
         console.print(f"[#e06c75]❌ Error calling LLM API {title_suffix}: {e}[/#e06c75]")
+        if draft:
+            review_draft(args, draft, title_suffix)
         return None
 
-def main():
-    parser = argparse.ArgumentParser(description="Generate semantic commit prompt for LLMs from git diff.")
-    parser.add_argument('context', nargs='*', help='Optional context or comments about the changes')
-    parser.add_argument('-i', '--interactive', action='store_true', help='Enable interactive mode to review/edit the message')
-    parser.add_argument('-c', '--context-name', dest='context_name', help='Specify a context profile from config')
-    parser.add_argument('-t', '--template', help='Specify a prompt template from config')
-    parser.add_argument('-m', '--model', help='Specify a model config from config')
-    parser.add_argument('--compare', nargs=2, metavar=('CTX1', 'CTX2'), help='Compare two contexts (by name)')
-    args = parser.parse_args()
+def session_options(args):
+    """ジャーナルに記録する設定の選び方（--resume で resolve_config に渡し直す）"""
+    options = {"context_name": args.context_name, "template_name": args.template, "model_name": args.model}
+    return {key: value for key, value in options.items() if value}
+
+def resume_session(base_config):
+    """
+    Restores the last session of this repository from the journal (candidates, compare
+    candidates and any interrupted stream) in the TUI, without calling the provider again.
+    """
+    config = resolve_config(base_config)
+    directory = session_dir(config)
+    session = load_last_session(directory, get_repo_root())
+    if session is None:
+        console.print(t("session.none"), style="yellow")
+        sys.exit(1)
+    try:
+        if session.tree and session.tree != write_tree():
+            console.print(f"[#e5c07b]⚠️  {escape(t('session.stale'))}[/#e5c07b]")
+    except Exception:
+        pass
+
+    from .tui.app import KomittoApp
+    journal = open_journal(config)
+    cache = open_cache(config)
+    if session.mode == SESSION_COMPARE and not session.selected:
+        compare_configs = []
+        for key in ("a", "b"):
+            state = session.streams[key]
+            prompt = session.load_prompt(directory, key)
+            compare_configs.append((state.options.get("context_name") or key,
+                                    resolve_config(base_config, **state.options), prompt or ""))
+        missing = any(not prompt for _, _, prompt in compare_configs)
+        app = KomittoApp(compare_configs=compare_configs, journal=journal, resume=session, cache=cache)
+    else:
+        state = session.streams[session.selected or STREAM_MAIN]
+        prompt = session.load_prompt(directory, state.name)
+        missing = prompt is None
+        app = KomittoApp(config=resolve_config(base_config, **state.options), prompt=prompt or "",
+                         options=state.options, journal=journal, resume=session, cache=cache)
+    if missing:
+        console.print(f"[#e5c07b]⚠️  {escape(t('session.prompt_missing'))}[/#e5c07b]")
+    app.run()
+
+def write_profile():
+    """Writes the --profile report at exit (also after sys.exit) and tells the user where it is."""
+    path = finish_profiling()
+    if path is not None:
+        console.print(t("main.profile_written", str(path)), style="dim")
+
+def main(args=None):
+    """Interactive CLI. The console script enters through komitto.cli, which dispatches --json/--stdio first."""
+    if args is None:
+        args = build_parser().parse_args()
+
+    if args.profile is not None:
+        start_profiling(args.profile or None)
+        atexit.register(write_profile)
+
+    if args.output == "-":
+        # 標準出力はプロンプト専用にする
+        console.file = sys.stderr
 
     if len(args.context) == 1 and args.context[0] == "init":
         init_config()
@@ -208,55 +494,172 @@ def main():
         learn_style_from_history(config)
         return
 
-    base_config = load_config()
+    if len(args.context) == 1 and args.context[0] == "warmup":
+        config = resolve_config(load_config(), context_name=args.context_name, model_name=args.model)
+        llm_config = config.get("llm", {})
+        if not llm_config.get("provider"):
+            console.print(t("main.api_error"), style="yellow")
+            sys.exit(1)
+        try:
+            start_time = time.time()
+            timings = create_llm_client(llm_config).warmup()
+        except Exception as e:
+            console.print(f"[#e06c75]❌ {t('main.warmup_failed', e)}[/#e06c75]")
+            sys.exit(1)
+        if timings is None:
+            console.print(t("main.warmup_unsupported", llm_config.get("provider")), style="yellow")
+            return
+        load_ms = timings.get("load_ms")
+        load_info = f" (load: {load_ms:.0f} ms)" if isinstance(load_ms, (int, float)) else ""
+        console.print(f"[#98c379]🔥 {t('main.warmup_done', llm_config.get('model', ''), time.time() - start_time)}{load_info}[/#98c379]")
+        return
+
+    if len(args.context) in (1, 2) and args.context[0] == "changelog":
+        base_config = load_config()
+        config = resolve_config(base_config, context_name=args.context_name, model_name=args.model)
+        from .changelog import generate_changelog
+        rev_range = args.context[1] if len(args.context) == 2 else ""
+        if generate_changelog(config, rev_range, cache=open_cache(config)) is None:
+            sys.exit(1)
+        return
 
-    if args.compare:
-        config1 = resolve_config(base_config, context_name=args.compare[0])
-        config2 = resolve_config(base_config, context_name=args.compare[1])
-        configs = [(args.compare[0], config1), (args.compare[1], config2)]
-    else:
-        config = resolve_config(base_config, context_name=args.context_name, template_name=args.template, model_name=args.model)
-        configs = [("Default", config)]
+    if len(args.context) in (1, 2) and args.context[0] == "hook":
+        from .hook import install_hook, uninstall_hook
+        action = args.context[1] if len(args.context) == 2 else None
+        if action == "install":
+            try:
+                console.print(f"[#98c379]✅ {escape(t('hook.installed', install_hook(force=args.force)))}[/#98c379]")
+            except FileExistsError as e:
+                console.print(f"[#e06c75]❌ {escape(t('hook.exists', e))}[/#e06c75]")
+                sys.exit(1)
+        elif action == "uninstall":
+            path = uninstall_hook()
+            console.print(escape(t("hook.uninstalled", path) if path else t("hook.not_installed")))
+        else:
+            console.print(t("hook.usage"), style="yellow")
+            sys.exit(1)
+        return
+
+    if args.stdio or args.json:
+        from .headless import run_json, run_stdio
+        sys.exit(run_stdio() if args.stdio else run_json(args))
+
+    with stage("load_config"):
+        base_config = load_config()
+
+    if args.resume:
+        resume_session(base_config)
+        return
+
+    with stage("resolve_config"):
+        if args.compare:
+            config1 = resolve_config(base_config, context_name=args.compare[0])
+            config2 = resolve_config(base_config, context_name=args.compare[1])
+            configs = [(args.compare[0], config1), (args.compare[1], config2)]
+        else:
+            config = resolve_config(base_config, context_name=args.context_name, template_name=args.template, model_name=args.model)
+            configs = [("Default", config)]
 
     git_config = configs[0][1].get("git", {}) 
     exclude_patterns = git_config.get("exclude", [])
     
-    llm_config = configs[0][1].get("llm", {})
-    history_limit = llm_config.get("history_limit", 5)
+    with stage("get_git_diff"):
+        diff_content = get_git_diff(exclude_patterns=exclude_patterns, context_config=git_config)
+    if args.offline or configs[0][1].get("llm", {}).get("offline"):
+        review_draft(args, heuristic_message(diff_content))
+        return
 
-    recent_logs = get_git_log(limit=history_limit)
-    diff_content = get_git_diff(exclude_patterns=exclude_patterns)
+    cache = open_cache(configs[0][1])
+    with stage("get_git_log"):
+        history = build_history_context(configs[0][1], cache)
+    recent_logs = history.text if history else None
     user_context = " ".join(args.context)
+    if args.dry_run and history:
+        console.print(t("main.history_tokens", history.commits, history.raw_tokens, history.tokens, history.parsed), style="dim")
+
+    with stage("summaries"):
+        summaries = load_file_summaries(split_diff(diff_content), configs[0][1], cache)
 
     if args.compare:
         compare_configs = []
         for name, cfg in configs:
             system_prompt = cfg["prompt"]["system"]
-            final_text = build_prompt(system_prompt, recent_logs, user_context, diff_content)
+            with stage("build_prompt"):
+                final_text = preflight(cfg, args, system_prompt, recent_logs, user_context, diff_content,
+                                       cache=cache, summaries=summaries, title_suffix=f"({name})")
+            if final_text is None:
+                continue
+            plan = make_plan(cfg, system_prompt, recent_logs, user_context, diff_content, final_text, cache=cache)
+            if plan is not None:
+                final_text = run_map_phase(plan, console)
             compare_configs.append((name, cfg, final_text))
-        
+
+        if len(compare_configs) < len(configs):
+            if not args.dry_run:
+                sys.exit(1)
+            return
+
         from .tui.app import KomittoApp
-        app = KomittoApp(compare_configs=compare_configs)
-        app.run()
+        app = KomittoApp(compare_configs=compare_configs, journal=open_journal(configs[0][1]), cache=cache)
+        with stage("tui"):
+            app.run()
 
     else:
         cfg = configs[0][1]
+        split = args.split_packages or cfg.get("monorepo", {}).get("split_commits", False)
+        if split and cfg.get("llm", {}).get("provider"):
+            if commit_per_package(cfg, args, recent_logs, user_context, diff_content, exclude_patterns, cache=cache):
+                return
+
         system_prompt = cfg["prompt"]["system"]
-        final_text = build_prompt(system_prompt, recent_logs, user_context, diff_content)
-        
-        if cfg.get("llm", {}).get("provider"):
-            if args.interactive:
+        with stage("build_prompt"):
+            final_text = preflight(cfg, args, system_prompt, recent_logs, user_context, diff_content, cache=cache, summaries=summaries)
+        if final_text is None:
+            if not args.dry_run:
+                sys.exit(1)
+            return
+
+        if args.output:
+            with stage("output"):
+                write_output(final_text, args.output)
+            if args.output != "-":
+                console.print(t("main.prompt_written", args.output), style="green")
+        elif cfg.get("llm", {}).get("provider"):
+            if args.preview:
+                # 外すファイルやハンクを選んだ結果をそのまま1回のリクエストで送る（map-reduce は行わない）
+                from .preview import PromptPreview
+                preview = PromptPreview(system_prompt, recent_logs, user_context, diff_content,
+                                        family=tokenizer_family(cfg["llm"]), cache=cache, summaries=summaries)
+                plan = None
+            else:
+                preview = None
+                plan = make_plan(cfg, system_prompt, recent_logs, user_context, diff_content, final_text, cache=cache)
+
+            if args.interactive or args.preview:
                 from .tui.app import KomittoApp
-                app = KomittoApp(config=cfg, prompt=final_text)
-                app.run()
+                app = KomittoApp(config=cfg, prompt=final_text, map_reduce=plan, draft=heuristic_message(diff_content),
+                                 options=session_options(args), journal=open_journal(cfg), preview=preview, cache=cache)
+                with stage("tui"):
+                    app.run()
             else:
-                generate_and_review(cfg, args, system_prompt, final_text)
+                if plan is not None:
+                    try:
+                        final_text = run_map_phase(plan, console)
+                    except Exception as e:
+                        console.print(f"[#e06c75]❌ Error calling LLM API: {e}[/#e06c75]")
+                        sys.exit(1)
+                generate_and_review(cfg, args, system_prompt, final_text, draft=heuristic_message(diff_content),
+                                    cache=cache)
         else:
-            try:
-                pyperclip.copy(final_text)
+            with stage("output"):
+                delivery = deliver_prompt(final_text, cfg.get("output", {}))
+            if delivery.method == DELIVERED_CLIPBOARD:
                 console.print(t("main.prompt_copied"), style="green")
-            except:
-                console.print(final_text)
+            elif delivery.method == DELIVERED_FILE:
+                key = "main.prompt_saved_copied" if delivery.reference_copied else "main.prompt_saved"
+                console.print(t(key, delivery.size / (1024 * 1024), str(delivery.path)), style="green")
+            else:
+                console.print(final_text, markup=False, highlight=False)
 
 if __name__ == "__main__":
     main()
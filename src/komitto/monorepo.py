@@ -0,0 +1,125 @@
+import os
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from .i18n import t
+from .prompt import FileDiff, render_files_xml
+from .summarize import MapReducePlan, group_fragments
+
+# どのパッケージにも属さないファイル
+ROOT_PACKAGE = "."
+
+DEFAULT_MARKERS = ["pyproject.toml", "package.json"]
+
+def _normalize_prefix(prefix: str) -> str:
+    return prefix.strip().strip("/")
+
+def package_for_prefix(path: str, prefixes: List[str]) -> str:
+    """path を含む最も長いパスプレフィックス（なければ ROOT_PACKAGE）"""
+    best = ROOT_PACKAGE
+    for prefix in prefixes:
+        if (path == prefix or path.startswith(prefix + "/")) and (best == ROOT_PACKAGE or len(prefix) > len(best)):
+            best = prefix
+    return best
+
+class MarkerResolver:
+    """path から最も近い（pyproject.toml などの）マーカーファイルを持つディレクトリを探す。結果はディレクトリ単位でメモ化する"""
+
+    def __init__(self, root: str, markers: Iterable[str]):
+        self.root = root
+        self.markers = list(markers)
+        self._memo: Dict[str, str] = {}
+
+    def package_for(self, path: str) -> str:
+        return self._resolve(os.path.dirname(path))
+
+    def _resolve(self, directory: str) -> str:
+        if directory in self._memo:
+            return self._memo[directory]
+        if not directory:
+            package = ROOT_PACKAGE
+        elif any(os.path.isfile(os.path.join(self.root, directory, marker)) for marker in self.markers):
+            package = directory
+        else:
+            package = self._resolve(os.path.dirname(directory))
+        self._memo[directory] = package
+        return package
+
+def partition_paths(paths: Iterable[str], monorepo_config: dict, root: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    パスをパッケージごとに分ける（パッケージ名順、どこにも属さないものは最後に ROOT_PACKAGE）。
+    [monorepo] packages にプレフィックスがあればそれを、なければ markers を持つ最も近いディレクトリを使う。
+    """
+    prefixes = [_normalize_prefix(p) for p in monorepo_config.get("packages", []) if _normalize_prefix(p)]
+    resolver = None
+    if not prefixes:
+        resolver = MarkerResolver(root or os.getcwd(), monorepo_config.get("markers", DEFAULT_MARKERS))
+
+    partitions: Dict[str, List[str]] = {}
+    for path in paths:
+        package = package_for_prefix(path, prefixes) if prefixes else resolver.package_for(path)
+        partitions.setdefault(package, []).append(path)
+
+    ordered = OrderedDict((name, partitions[name]) for name in sorted(partitions) if name != ROOT_PACKAGE)
+    if ROOT_PACKAGE in partitions:
+        ordered[ROOT_PACKAGE] = partitions[ROOT_PACKAGE]
+    return ordered
+
+def partition_files(files: List[FileDiff], monorepo_config: dict, root: Optional[str] = None) -> Dict[str, List[FileDiff]]:
+    by_path = {fd.path: fd for fd in files}
+    return OrderedDict(
+        (name, [by_path[p] for p in paths])
+        for name, paths in partition_paths([fd.path for fd in files], monorepo_config, root).items()
+    )
+
+class MonorepoPlan(MapReducePlan):
+    """
+    パッケージごとに changeset を要約（共有スケジューラー上で並列）し、
+    パッケージ別のセクションを持つコミットメッセージを1つ生成するための計画。
+    要約のキャッシュは MapReducePlan と共通（プロンプトの内容がキー）。
+    """
+
+    def __init__(self, llm_config: dict, system_prompt: str, recent_logs, user_context: str,
+                 partitions: Dict[str, List[FileDiff]], cache=None, client_factory=None):
+        self.partitions = partitions
+        self.group_packages: List[str] = []
+        files = [fd for package_files in partitions.values() for fd in package_files]
+        super().__init__(llm_config, system_prompt, recent_logs, user_context, files, cache=cache, client_factory=client_factory)
+
+    def _build_groups(self, files: List[FileDiff], budget: int) -> List[str]:
+        # 大きなパッケージは map_group_chars ごとに分割し、要約は reduce 時にパッケージ単位でまとめる
+        groups = []
+        for package, package_files in self.partitions.items():
+            for group in group_fragments(render_files_xml(package_files, cache=self.cache), budget, package_files):
+                groups.append(group)
+                self.group_packages.append(package)
+        return groups
+
+    def progress_title(self) -> str:
+        return t("main.package_progress", len(self.partitions))
+
+    def map_prompt(self, index: int) -> str:
+        package = self.group_packages[index]
+        return t("prompt.package_instruction", package, f"<changeset>\n{self.groups[index]}\n</changeset>")
+
+    def package_latencies(self) -> Dict[str, float]:
+        """パッケージごとの要約時間（パッケージ内のグループは並列に走るので最大値）"""
+        latencies: Dict[str, float] = {}
+        for index, seconds in self.latencies.items():
+            package = self.group_packages[index]
+            latencies[package] = max(latencies.get(package, 0.0), seconds)
+        return latencies
+
+    def latency_report(self) -> List[str]:
+        latencies = self.package_latencies()
+        return [
+            f"{package}: {latencies[package]:.1f}s" if package in latencies else f"{package}: cached"
+            for package in self.partitions
+        ]
+
+    def _summary_sections(self) -> List[str]:
+        sections = [t("prompt.packages_title")]
+        for package in self.partitions:
+            summary = "\n".join(s for s, p in zip(self.summaries, self.group_packages) if p == package and s)
+            sections.append(f'<package name="{package}">\n{summary}\n</package>\n')
+        return sections
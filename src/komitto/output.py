@@ -0,0 +1,180 @@
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import pyperclip
+
+from .cache import default_cache_dir
+
+# これより大きいプロンプトはクリップボードに入れず、ファイルに保存してパスだけをコピーする（[output] clipboard_max_bytes）
+DEFAULT_CLIPBOARD_MAX_BYTES = 1024 * 1024
+# クリップボードのツールを待つ最大時間（秒）（[output] clipboard_timeout）
+DEFAULT_CLIPBOARD_TIMEOUT = 5.0
+# クリップボードが使えないときに端末へそのまま表示してよい大きさ
+PRINT_MAX_BYTES = 64 * 1024
+# 保存したプロンプトファイルを残す数
+KEEP_PROMPT_FILES = 5
+
+# パイプやツールの標準入力へ書き込む単位
+CHUNK_SIZE = 1024 * 1024
+
+DELIVERED_CLIPBOARD = "clipboard"
+DELIVERED_FILE = "file"
+DELIVERED_PRINT = "print"
+
+class ClipboardError(Exception):
+    """クリップボードのツールがない、失敗した、または時間内に終わらなかった"""
+    pass
+
+@dataclass
+class Delivery:
+    method: str
+    size: int
+    path: Optional[Path] = None
+    # ファイルに保存した場合、そのパスをクリップボードにコピーできたか
+    reference_copied: bool = False
+
+def clipboard_command() -> Optional[List[str]]:
+    """標準入力から読むクリップボードのツール。見つからない（Windows を含む）場合は None で、pyperclip を使う"""
+    if sys.platform == "darwin":
+        return ["pbcopy"] if shutil.which("pbcopy") else None
+    if os.name == "nt":
+        return None
+    if os.environ.get("WAYLAND_DISPLAY") and shutil.which("wl-copy"):
+        return ["wl-copy"]
+    if os.environ.get("DISPLAY"):
+        if shutil.which("xclip"):
+            return ["xclip", "-selection", "clipboard"]
+        if shutil.which("xsel"):
+            return ["xsel", "--clipboard", "--input"]
+    return None
+
+def _write_chunks(stream, data: bytes) -> None:
+    view = memoryview(data)
+    for start in range(0, len(view), CHUNK_SIZE):
+        stream.write(view[start:start + CHUNK_SIZE])
+
+def copy_to_clipboard(text: str, timeout: float = DEFAULT_CLIPBOARD_TIMEOUT) -> None:
+    """
+    ツールの標準入力へ分割して書き込み、timeout 秒で打ち切る（ツールが止まっても komitto は止まらない）。
+    失敗したら ClipboardError
+    """
+    command = clipboard_command()
+    if command is None:
+        _copy_with_pyperclip(text, timeout)
+        return
+
+    env = dict(os.environ, LC_CTYPE="UTF-8") if sys.platform == "darwin" else None
+    try:
+        proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL, env=env)
+    except OSError as e:
+        raise ClipboardError(str(e)) from e
+
+    def feed():
+        try:
+            _write_chunks(proc.stdin, text.encode("utf-8"))
+        except OSError:
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    writer = threading.Thread(target=feed, daemon=True)
+    writer.start()
+    try:
+        code = proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        raise ClipboardError(f"{command[0]} did not finish within {timeout:g}s")
+    finally:
+        writer.join(1)
+    if code != 0:
+        raise ClipboardError(f"{command[0]} exited with {code}")
+
+def _copy_with_pyperclip(text: str, timeout: float) -> None:
+    error = []
+
+    def work():
+        try:
+            pyperclip.copy(text)
+        except Exception as e:
+            error.append(e)
+
+    thread = threading.Thread(target=work, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise ClipboardError(f"clipboard did not respond within {timeout:g}s")
+    if error:
+        raise ClipboardError(str(error[0]))
+
+def prompt_dir() -> Path:
+    return default_cache_dir() / "prompts"
+
+def save_prompt(text: str, directory: Optional[Path] = None) -> Path:
+    """プロンプトをファイルに保存する。古いものは KEEP_PROMPT_FILES 個を残して消す"""
+    directory = directory or prompt_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"prompt-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.txt"
+    with open(path, "wb") as f:
+        _write_chunks(f, text.encode("utf-8"))
+
+    old = sorted(directory.glob("prompt-*.txt"), key=lambda p: p.stat().st_mtime, reverse=True)[KEEP_PROMPT_FILES:]
+    for p in old:
+        p.unlink(missing_ok=True)
+    return path
+
+def write_output(text: str, destination: str) -> None:
+    """--output: "-" なら標準出力、それ以外はファイルに書く。パイプの相手が先に閉じても例外にしない"""
+    data = text.encode("utf-8")
+    if destination != "-":
+        with open(destination, "wb") as f:
+            _write_chunks(f, data)
+        return
+
+    sys.stdout.flush()
+    try:
+        _write_chunks(sys.stdout.buffer, data)
+        sys.stdout.buffer.flush()
+    except BrokenPipeError:
+        # `komitto --output - | head` など。終了時の flush で再び失敗しないよう stdout を捨て先につなぎ替える
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+
+def deliver_prompt(text: str, output_config: Optional[dict] = None) -> Delivery:
+    """
+    プロンプトモードの出力先を決める。小さなプロンプトはクリップボードへ。
+    大きなもの、またはクリップボードが失敗したものはファイルに保存してパスだけをコピーする
+    （クリップボードが使えない環境で小さなものは、従来どおり端末に表示する）。
+    """
+    output_config = output_config or {}
+    max_bytes = int(output_config.get("clipboard_max_bytes", DEFAULT_CLIPBOARD_MAX_BYTES))
+    timeout = float(output_config.get("clipboard_timeout", DEFAULT_CLIPBOARD_TIMEOUT))
+    # UTF-8 のバイト数は文字数の4倍を超えないので、小さい場合はエンコードせずに判定できる
+    size = len(text) if len(text) * 4 <= max_bytes else len(text.encode("utf-8"))
+
+    if size <= max_bytes:
+        try:
+            copy_to_clipboard(text, timeout)
+            return Delivery(DELIVERED_CLIPBOARD, size)
+        except ClipboardError:
+            if size <= PRINT_MAX_BYTES:
+                return Delivery(DELIVERED_PRINT, size)
+
+    path = save_prompt(text)
+    try:
+        copy_to_clipboard(str(path), timeout)
+        copied = True
+    except ClipboardError:
+        copied = False
+    return Delivery(DELIVERED_FILE, size, path, copied)
@@ -0,0 +1,45 @@
+from .git_utils import get_repo_root
+from .i18n import t
+from .monorepo import MonorepoPlan, partition_files
+from .prompt import split_diff
+from .summarize import MapReducePlan, needs_map_reduce
+
+def make_plan(config, system_prompt, recent_logs, user_context, diff_content, final_text, cache=None, monorepo=True):
+    """
+    Returns the plan to summarize the changeset before generating, or None to send the prompt as is:
+    a MonorepoPlan when [monorepo] is enabled and several packages are touched, otherwise a
+    MapReducePlan when the prompt is too large.
+    """
+    llm_config = config.get("llm", {})
+    if not llm_config.get("provider"):
+        return None
+    files = split_diff(diff_content)
+    monorepo_config = config.get("monorepo", {})
+    if monorepo and monorepo_config.get("enabled"):
+        partitions = partition_files(files, monorepo_config, get_repo_root())
+        if len(partitions) > 1:
+            return MonorepoPlan(llm_config, system_prompt, recent_logs, user_context, partitions, cache=cache)
+    if needs_map_reduce(final_text, llm_config):
+        return MapReducePlan(llm_config, system_prompt, recent_logs, user_context, files, cache=cache)
+    return None
+
+def run_map_phase(plan, console):
+    """Summarizes the changeset groups with a Rich progress bar and returns the reduce prompt."""
+    # headless（--json/--stdio）は make_plan だけを使うので、Rich はここで読み込む
+    from rich.progress import BarColumn, MofNCompleteColumn, Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
+
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TimeElapsedColumn(),
+        console=console,
+        transient=True
+    ) as progress:
+        task = progress.add_task(plan.progress_title(), total=len(plan))
+        plan.run_map(lambda done, total: progress.update(task, completed=done))
+    report = plan.latency_report()
+    if len(report) > 1:
+        console.print(f"{t('main.partition_latency')}: {', '.join(report)}", style="dim", markup=False)
+    return plan.reduce_prompt()
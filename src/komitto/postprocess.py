@@ -0,0 +1,316 @@
+import re
+import textwrap
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional
+
+from .i18n import t
+from .llm.events import Done, TextDelta, Usage
+
+# [message] の既定値
+DEFAULT_SUBJECT_MAX = 72
+DEFAULT_BODY_WIDTH = 72
+DEFAULT_TYPES = ["feat", "fix", "docs", "style", "refactor", "perf", "test", "build", "ci", "chore", "revert"]
+
+# 回避できた再生成の回数を保存するキャッシュの名前空間とキー
+STATS_NAMESPACE = "stats"
+AVOIDED_KEY = "regenerations_avoided"
+
+_FENCE_RE = re.compile(r"^(```|~~~)[\w+-]*$")
+# 前置き（「Here is the commit message:」など）の書き出し。小文字で比較する
+_PREAMBLE_STARTS = ("here is", "here's", "sure", "certainly", "okay", "ok,", "ok!", "below is", "the following",
+                    "commit message", "以下", "コミットメッセージ", "はい")
+_CONVENTIONAL_RE = re.compile(r"^(?P<type>[A-Za-z]+)(?:\((?P<scope>[^()]+)\))?(?P<breaking>!)?: (?P<description>\S.*)$")
+# 折り返さない行: トレーラー（Signed-off-by: など）、URL を含む行
+_TRAILER_RE = re.compile(r"^[A-Za-z][\w-]*: \S")
+_BULLET_RE = re.compile(r"^(\s*(?:[-*+]|\d+[.)])\s+)")
+
+@dataclass
+class MessageRules:
+    """生成されたメッセージの整形と検証のルール（[message]）"""
+    enabled: bool = True
+    subject_max: int = DEFAULT_SUBJECT_MAX
+    body_width: int = DEFAULT_BODY_WIDTH
+    conventional: bool = False
+    types: List[str] = field(default_factory=lambda: list(DEFAULT_TYPES))
+    scopes: List[str] = field(default_factory=list)
+    require_scope: bool = False
+    repair: bool = True
+
+    @classmethod
+    def from_config(cls, config: dict) -> "MessageRules":
+        message = config.get("message", {})
+        return cls(
+            enabled=bool(message.get("enabled", True)),
+            subject_max=int(message.get("subject_max", DEFAULT_SUBJECT_MAX)),
+            body_width=int(message.get("body_width", DEFAULT_BODY_WIDTH)),
+            conventional=bool(message.get("conventional", False)),
+            types=list(message.get("types", DEFAULT_TYPES)),
+            scopes=list(message.get("scopes", [])),
+            require_scope=bool(message.get("require_scope", False)),
+            repair=bool(message.get("repair", True)),
+        )
+
+def _is_preamble(line: str) -> bool:
+    """前置きの候補（書き出しが一致し、コロンで終わる行）。空行かフェンスが続いたときだけ前置きとして捨てる"""
+    return line.lower().startswith(_PREAMBLE_STARTS) and line.endswith((":", "："))
+
+def _names_message(line: str) -> bool:
+    """「コミットメッセージ」に言及する前置き。空行を挟まずに件名が続いても前置きとして捨てる"""
+    return "commit message" in line.lower() or "コミットメッセージ" in line
+
+def _could_be_preamble(partial: str) -> bool:
+    """行の途中までで、まだ前置きになりうるか"""
+    lower = partial.lower()
+    return any(start.startswith(lower) or lower.startswith(start) for start in _PREAMBLE_STARTS)
+
+class StreamCleaner:
+    """
+    ストリームの差分から、コードフェンスと前置き・後書きを取り除く。
+    判定に必要な分（行頭の数文字、フェンスになりうる行）だけを保留し、それ以外はすぐに返す。
+    何かを取り除いた場合は removed が True になる（postprocess() の cleaned に渡す）。
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        # 現在の行のうち、すでに返した文字数
+        self._sent = 0
+        self._started = False
+        self._fenced = False
+        self._closed = False
+        # 前置きかもしれない先頭行（と続く空行）。次の空でない行を見るまで保留する
+        self._pending = ""
+        self._pending_blank = False
+        self._pending_named = False
+        self.removed = False
+
+    def feed(self, text: str) -> str:
+        self._buffer += text
+        out = []
+        while True:
+            newline = self._buffer.find("\n")
+            if newline < 0:
+                break
+            line, self._buffer = self._buffer[:newline], self._buffer[newline + 1:]
+            out.append(self._line(line, "\n"))
+        out.append(self._partial())
+        return "".join(out)
+
+    def finish(self) -> str:
+        line, self._buffer = self._buffer, ""
+        out = self._line(line, "")
+        # 後に何も続かなければ前置きではなく件名として残す
+        pending, self._pending = self._pending, ""
+        return pending + out
+
+    def _line(self, line: str, end: str) -> str:
+        sent, self._sent = self._sent, 0
+        if sent:
+            return line[sent:] + end
+        if self._closed:
+            return ""
+        stripped = line.strip()
+        if not self._started:
+            if self._pending:
+                if not stripped:
+                    self._pending += line + end
+                    self._pending_blank = True
+                    return ""
+                if self._pending_blank or self._pending_named or _FENCE_RE.match(stripped):
+                    self._drop_pending()
+                else:
+                    pending, self._pending = self._pending, ""
+                    self._started = True
+                    return pending + line + end
+            if not stripped:
+                return ""
+            if _is_preamble(stripped):
+                self._pending = line + end
+                self._pending_named = _names_message(stripped)
+                return ""
+            if _FENCE_RE.match(stripped):
+                self._fenced = self.removed = True
+                return ""
+            self._started = True
+        elif self._fenced and _FENCE_RE.match(stripped):
+            # 閉じるフェンス。その後の「ご希望があれば…」などの後書きも捨てる
+            self._closed = True
+            return ""
+        return line + end
+
+    def _partial(self) -> str:
+        if self._closed or not self._buffer:
+            return ""
+        head = self._buffer.lstrip()
+        if not head or head.startswith(("`", "~")):
+            return ""
+        pending = ""
+        if not self._started:
+            if self._pending_blank or self._pending_named:
+                self._drop_pending()
+            pending, self._pending = self._pending, ""
+            if not pending and _could_be_preamble(head):
+                return ""
+            self._started = True
+        out = pending + self._buffer[self._sent:]
+        self._sent = len(self._buffer)
+        return out
+
+    def _drop_pending(self) -> None:
+        self._pending = ""
+        self._pending_blank = self._pending_named = False
+        self.removed = True
+
+def clean_text(text: str) -> str:
+    cleaner = StreamCleaner()
+    return cleaner.feed(text) + cleaner.finish()
+
+def clean_events(events: Iterable, rules: MessageRules, cleaner: Optional[StreamCleaner] = None) -> Iterator:
+    """
+    LLMClient.events() の TextDelta を StreamCleaner に通す（表示中の文面からもフェンスや前置きが消える）。
+    cleaner を渡すと、何かを取り除いたかを後から cleaner.removed で確認できる
+    """
+    if not rules.enabled:
+        yield from events
+        return
+    cleaner = cleaner or StreamCleaner()
+    finished = False
+    for event in events:
+        if isinstance(event, TextDelta):
+            text = cleaner.feed(event.text)
+            if text:
+                yield TextDelta(text, event.timestamp)
+            continue
+        if not finished and isinstance(event, (Usage, Done)):
+            finished = True
+            tail = cleaner.finish()
+            if tail:
+                yield TextDelta(tail, event.timestamp)
+        yield event
+    if not finished:
+        tail = cleaner.finish()
+        if tail:
+            yield TextDelta(tail, 0.0)
+
+def _wrap_line(line: str, width: int) -> List[str]:
+    if len(line) <= width or line.startswith(("    ", "\t")) or "://" in line or _TRAILER_RE.match(line):
+        return [line]
+    bullet = _BULLET_RE.match(line)
+    indent = " " * len(bullet.group(1)) if bullet else ""
+    # 空白のない長い語（CJK の文や識別子）は途中で切らない
+    return textwrap.wrap(line, width, subsequent_indent=indent, break_long_words=False, break_on_hyphens=False) or [line]
+
+def format_message(text: str, rules: MessageRules) -> str:
+    """フェンス・前置きの除去、件名と本文の間の空行、本文の折り返しを行う"""
+    if not rules.enabled:
+        return text.strip()
+    lines = clean_text(text).strip().split("\n")
+    subject = lines[0].strip()
+    if len(subject) > 1 and subject[0] == subject[-1] and subject[0] in "`\"'":
+        subject = subject[1:-1].strip()
+    if rules.conventional:
+        subject = subject.rstrip(".。")
+
+    body = lines[1:]
+    while body and not body[0].strip():
+        body.pop(0)
+    if not body:
+        return subject
+
+    wrapped = []
+    in_code = False
+    for line in body:
+        line = line.rstrip()
+        if line.lstrip().startswith(("```", "~~~")):
+            in_code = not in_code
+        if in_code or not rules.body_width:
+            wrapped.append(line)
+        else:
+            wrapped.extend(_wrap_line(line, rules.body_width))
+    return "\n".join([subject, "", *wrapped])
+
+def validate(text: str, rules: MessageRules) -> List[str]:
+    """ルールに合わない点（修正依頼にそのまま使う英語の説明）。問題がなければ空"""
+    if not rules.enabled:
+        return []
+    subject = text.strip().split("\n", 1)[0].strip() if text.strip() else ""
+    if not subject:
+        return ["the message is empty"]
+
+    problems = []
+    if rules.subject_max and len(subject) > rules.subject_max:
+        problems.append(f"the subject line is {len(subject)} characters long; it must be at most {rules.subject_max}")
+    if rules.conventional:
+        match = _CONVENTIONAL_RE.match(subject)
+        if not match:
+            problems.append("the subject line must follow the Conventional Commits format `type(scope): description`")
+        else:
+            if rules.types and match.group("type") not in rules.types:
+                problems.append(f"the type `{match.group('type')}` must be one of: {', '.join(rules.types)}")
+            scope = match.group("scope")
+            if scope is None and rules.require_scope:
+                problems.append("the subject line must include a scope, e.g. `type(scope): description`")
+            elif scope is not None and rules.scopes and scope not in rules.scopes:
+                problems.append(f"the scope `{scope}` must be one of: {', '.join(rules.scopes)}")
+    return problems
+
+@dataclass
+class PostResult:
+    text: str
+    # 修正後も残っている問題
+    problems: List[str]
+    # 生の出力にあった問題
+    raw_problems: List[str]
+    repaired: bool = False
+
+    @property
+    def regeneration_avoided(self) -> bool:
+        """ルールに合わなかった出力を、作り直さずに使える形にできたか"""
+        return bool(self.raw_problems) and not self.problems
+
+def repair_messages(text: str, problems: List[str]) -> List[dict]:
+    """問題のあるメッセージと問題点だけを送る小さな修正依頼（changeset は送らない）"""
+    issues = "\n".join(f"- {problem}" for problem in problems)
+    return [{"role": "user", "content": t("prompt.repair_instruction", issues, text)}]
+
+def postprocess(raw: str, rules: MessageRules, client=None, cancel_token=None, cleaned: bool = False) -> PostResult:
+    """
+    生成されたメッセージを整形して検証する。ルールに合わず client が渡された場合は、
+    全体の再生成ではなく短い修正依頼を1回だけ送る。
+    cleaned: ストリームの段階ですでにフェンスや前置きを取り除いた（StreamCleaner.removed）
+    """
+    raw = raw.strip()
+    raw_problems = validate(raw, rules)
+    if rules.enabled and (cleaned or clean_text(raw).strip() != raw):
+        raw_problems.append("the message is wrapped in code fences or a preamble")
+    text = format_message(raw, rules)
+    problems = validate(text, rules)
+    result = PostResult(text, problems, raw_problems)
+    if not problems or client is None or not rules.repair:
+        return result
+
+    repaired, _ = client.generate(repair_messages(text, problems), cancel_token)
+    repaired = format_message(repaired, rules)
+    remaining = validate(repaired, rules)
+    if repaired and len(remaining) < len(problems):
+        result.text, result.problems, result.repaired = repaired, remaining, True
+    return result
+
+def record_avoided(cache) -> Optional[int]:
+    """回避できた再生成を1回記録し、これまでの合計を返す（キャッシュが無効なら None）"""
+    if cache is None:
+        return None
+    total = int(cache.get(STATS_NAMESPACE, AVOIDED_KEY) or 0) + 1
+    cache.put(STATS_NAMESPACE, AVOIDED_KEY, total)
+    return total
+
+def result_notes(result: PostResult, cache=None) -> List[str]:
+    """利用者への通知（修正依頼の結果、回避できた再生成の回数、残った問題）。回避できた場合は回数を記録する"""
+    notes = []
+    if result.repaired:
+        notes.append(t("main.message_repaired", "; ".join(result.raw_problems)))
+    if result.regeneration_avoided:
+        total = record_avoided(cache)
+        notes.append(t("main.regeneration_avoided") if total is None else t("main.regenerations_avoided", total))
+    if result.problems:
+        notes.append(t("main.message_problems", "; ".join(result.problems)))
+    return notes
@@ -0,0 +1,121 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from xml.sax.saxutils import unescape
+
+from .history import LOG_SEPARATOR
+from .prompt import (FILE_CLOSE_TAG, SECTION_FILE, SECTION_HISTORY, build_prompt_sections, file_open_tag,
+                     render_chunks_xml, render_history_section, split_diff)
+from .tokens import estimate_tokens
+
+_SCOPE_RE = re.compile(r'<chunk scope="(.*?)">')
+
+@dataclass
+class PreviewPart:
+    """セクション内で個別に外せる単位（履歴のコミット、ファイルのハンク）"""
+    label: str
+    text: str
+    tokens: int
+    included: bool = True
+
+@dataclass
+class PreviewSection:
+    kind: str
+    label: str
+    # 現在の選択で描画した text（送信しない場合は None）
+    text: Optional[str]
+    tokens: int
+    # 何も外していないときのテキスト
+    original: str = ""
+    parts: List[PreviewPart] = field(default_factory=list)
+    # ファイル・履歴ごと外せるか（システムプロンプトや <changeset> の枠は外せない）
+    toggleable: bool = False
+    included: bool = True
+    # ハンクの外側（<file> の開始・終了タグ）
+    head: str = ""
+    tail: str = ""
+
+    @property
+    def sent(self) -> bool:
+        return self.text is not None
+
+class PromptPreview:
+    """
+    プロンプトをセクション（システム、履歴のコミット、ファイルとハンク）ごとに保持し、
+    ファイルやハンクを外したときは変更のあったセクションだけを描画し直す。
+    何も外していなければ assemble() は build_prompt() と同じテキストを返す。
+    """
+
+    def __init__(self, system_prompt: str, recent_logs: Optional[str], user_context: str, diff_content: str,
+                 family: str = "openai", cache=None, summaries: Optional[Dict[str, str]] = None):
+        self.family = family
+        self.sections: List[PreviewSection] = []
+        summaries = summaries or {}
+        files = iter(split_diff(diff_content))
+
+        for section in build_prompt_sections(system_prompt, recent_logs, user_context, diff_content,
+                                             cache=cache, summaries=summaries):
+            preview = PreviewSection(section.kind, section.label, section.text, self._estimate(section.text),
+                                     section.text)
+            if section.kind == SECTION_HISTORY:
+                preview.toggleable = True
+                preview.parts = [self._part(block.split("\n", 1)[0], block) for block in recent_logs.split(LOG_SEPARATOR)]
+            elif section.kind == SECTION_FILE:
+                fd = next(files)
+                preview.toggleable = True
+                # 要約とサブモジュールはファイルごとにしか外せない
+                if fd.path not in summaries and not fd.is_submodule:
+                    preview.head, preview.tail = file_open_tag(fd), FILE_CLOSE_TAG
+                    preview.parts = [self._part(self._chunk_label(chunk, n), chunk)
+                                     for n, chunk in enumerate(render_chunks_xml(fd), 1)]
+            self.sections.append(preview)
+
+        self.total_tokens = sum(s.tokens for s in self.sections)
+
+    def _estimate(self, text: Optional[str]) -> int:
+        # セクションの区切りの改行は1トークンとして各セクションに含める（estimate_prompt と同じ）
+        return 0 if text is None else estimate_tokens(text, self.family) + 1
+
+    def _part(self, label: str, text: str) -> PreviewPart:
+        return PreviewPart(label, text, estimate_tokens(text, self.family))
+
+    @staticmethod
+    def _chunk_label(chunk: str, n: int) -> str:
+        match = _SCOPE_RE.search(chunk)
+        scope = unescape(match.group(1), {"&quot;": '"'}) if match else ""
+        return f"@@ {scope}" if scope else f"chunk {n}"
+
+    def toggle(self, index: int, part: Optional[int] = None) -> None:
+        """セクション（part が None）またはその中の1つを入れ替え、そのセクションだけを描画し直す"""
+        section = self.sections[index]
+        if part is None:
+            if not section.toggleable:
+                return
+            section.included = not section.included
+        else:
+            section.parts[part].included = not section.parts[part].included
+        self._render(section)
+
+    def _render(self, section: PreviewSection) -> None:
+        parts = [p.text for p in section.parts if p.included]
+        if not section.included or (section.parts and not parts):
+            text = None
+        elif len(parts) == len(section.parts):
+            text = section.original
+        elif section.kind == SECTION_HISTORY:
+            text = render_history_section(LOG_SEPARATOR.join(parts))
+        else:
+            text = "\n".join([section.head, *parts, section.tail])
+
+        if text != section.text:
+            tokens = self._estimate(text)
+            self.total_tokens += tokens - section.tokens
+            section.text, section.tokens = text, tokens
+
+    @property
+    def excluded(self) -> int:
+        """外したファイル・コミット・ハンクの数"""
+        return sum((not s.included) + sum(not p.included for p in s.parts) for s in self.sections)
+
+    def assemble(self) -> str:
+        return "\n".join(s.text for s in self.sections if s.text is not None)
@@ -0,0 +1,195 @@
+import cProfile
+import io
+import platform
+import pstats
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .cache import default_cache_dir
+
+# レポートに載せる関数・モジュール・割り当て箇所の数
+TOP_FUNCTIONS = 15
+TOP_IMPORTS = 15
+TOP_ALLOCATIONS = 10
+IMPORT_TIMEOUT = 30
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+# --profile のときだけ Profiler が入る。None の間は stage() / iterate() は何もしない
+_profiler: Optional["Profiler"] = None
+_NULL_STAGE = nullcontext()
+
+@dataclass
+class StageStats:
+    """ステージごとの集計。同じ名前のステージに複数回入った場合は足し合わせる"""
+    name: str
+    calls: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    # ステージ中に増えたメモリの最大値（入った時点の使用量との差、バイト）
+    peak: int = 0
+    profile: cProfile.Profile = field(default_factory=cProfile.Profile)
+
+class Profiler:
+    """
+    パイプラインのステージごとに cProfile と tracemalloc で計測する。
+    cProfile は同時に1つしか有効にできないため、入れ子のステージでは外側の計測を止めて内側だけを数える
+    （経過時間とメモリは外側にも含まれる）。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.started = datetime.now()
+        self.stages: Dict[str, StageStats] = {}
+        # [StageStats, 入った時点の使用量, これまでの最大使用量]
+        self._stack: List[list] = []
+        tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str):
+        stats = self.stages.setdefault(name, StageStats(name))
+        # 内側のステージで reset_peak() する前に、それまでの最大値を外側のステージに渡しておく
+        self._lift_peak()
+        if self._stack:
+            self._stack[-1][0].profile.disable()
+        frame = [stats, tracemalloc.get_traced_memory()[0], 0]
+        self._stack.append(frame)
+        tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        stats.profile.enable()
+        try:
+            yield
+        finally:
+            stats.profile.disable()
+            stats.calls += 1
+            stats.wall += time.perf_counter() - wall
+            stats.cpu += time.process_time() - cpu
+            self._lift_peak()
+            stats.peak = max(stats.peak, frame[2] - frame[1])
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1][0].profile.enable()
+
+    def _lift_peak(self) -> None:
+        peak = tracemalloc.get_traced_memory()[1]
+        for frame in self._stack:
+            frame[2] = max(frame[2], peak)
+
+    def iterate(self, name: str, iterable: Iterable) -> Iterator:
+        """イテレータの next() にかかった分だけを name のステージとして数える（ストリーミングと描画を分けるため）"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def report(self, argv: Optional[List[str]] = None) -> str:
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        lines = [
+            f"komitto profile  {self.started:%Y-%m-%d %H:%M:%S}",
+            f"python {platform.python_version()} ({platform.platform()})",
+            f"argv: {' '.join(argv if argv is not None else sys.argv)}",
+            "",
+            "== Stages (wall/cpu seconds, peak = memory allocated above the stage's start) ==",
+            f"{'stage':<20} {'calls':>6} {'wall s':>9} {'cpu s':>9} {'peak MiB':>9}",
+        ]
+        for stats in self.stages.values():
+            lines.append(f"{stats.name:<20} {stats.calls:>6} {stats.wall:>9.3f} {stats.cpu:>9.3f} "
+                         f"{stats.peak / (1024 * 1024):>9.2f}")
+
+        lines += ["", "== Import time (python -X importtime -c 'import komitto.main') =="]
+        imports = measure_import_time()
+        if imports is None:
+            lines.append("unavailable")
+        else:
+            total, modules = imports
+            lines.append(f"total: {total / 1000:.1f} ms")
+            lines.append(f"{'cumulative ms':>13} {'self ms':>9}  module")
+            for name, cumulative, own in modules[:TOP_IMPORTS]:
+                lines.append(f"{cumulative / 1000:>13.1f} {own / 1000:>9.1f}  {name}")
+
+        if snapshot is not None:
+            lines += ["", "== Top allocations (still held at exit) =="]
+            for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+                frame = stat.traceback[0]
+                lines.append(f"{stat.size / 1024:>10.1f} KiB {stat.count:>7}  {frame.filename}:{frame.lineno}")
+
+        for stats in self.stages.values():
+            lines += ["", f"== Top functions: {stats.name} =="]
+            out = io.StringIO()
+            try:
+                pstats.Stats(stats.profile, stream=out).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            except TypeError:
+                # 一度も関数が呼ばれなかったステージ
+                out.write("no calls recorded\n")
+            lines.append(out.getvalue().strip())
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> Path:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(self.report(), encoding="utf-8")
+        return self.path
+
+def measure_import_time() -> Optional[Tuple[int, List[Tuple[str, int, int]]]]:
+    """
+    起動時の import にかかった時間（マイクロ秒）を別プロセスで測る。
+    戻り値は（合計, [(モジュール, 累計, 自身)] を累計の降順）。測れなければ None
+    """
+    try:
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import komitto.main"],
+                                capture_output=True, text=True, timeout=IMPORT_TIMEOUT)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    modules = []
+    total = 0
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        own, cumulative, indent, name = int(match.group(1)), int(match.group(2)), match.group(3), match.group(4)
+        modules.append((name, cumulative, own))
+        # 最上位（インデントが1つだけ）の import の累計を足すと全体になる
+        if len(indent) == 1:
+            total += cumulative
+    if not modules:
+        return None
+    modules.sort(key=lambda m: m[1], reverse=True)
+    return total, modules
+
+def default_profile_path() -> Path:
+    return default_cache_dir() / "profiles" / f"komitto-profile-{datetime.now():%Y%m%d-%H%M%S}.txt"
+
+def start_profiling(path: Optional[str] = None) -> Profiler:
+    global _profiler
+    _profiler = Profiler(Path(path) if path else default_profile_path())
+    return _profiler
+
+def finish_profiling() -> Optional[Path]:
+    """レポートを書き出して計測をやめる。--profile でなければ何もしない"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is None:
+        return None
+    try:
+        return profiler.write()
+    finally:
+        tracemalloc.stop()
+
+def stage(name: str):
+    """パイプラインのステージを囲む。--profile でなければ共有の nullcontext を返すだけ"""
+    return _NULL_STAGE if _profiler is None else _profiler.stage(name)
+
+def iterate(name: str, iterable: Iterable) -> Iterable:
+    """--profile でなければ iterable をそのまま返す（要素ごとの負担はない）"""
+    return iterable if _profiler is None else _profiler.iterate(name, iterable)
@@ -1,27 +1,94 @@
 import re
+import hashlib
+from dataclasses import dataclass, field
 from xml.sax.saxutils import escape
-from typing import Optional
+from typing import Dict, List, Optional
 from .i18n import t
+from .git_utils import get_repo_root
+from .submodule import SubmoduleChange, describe_submodules
+
+# <file> 断片の出力形式を変えたら上げる（キャッシュ済みの断片を無効化するため）
+XML_FORMAT_VERSION = "1"
+
+FILE_XML_NAMESPACE = "file_xml"
+
+_INDEX_RE = re.compile(r"^index ([0-9a-f]+)\.\.([0-9a-f]+)")
+# サブモジュールのポインタ（gitlink）のモード
+GITLINK_MODE = "160000"
+# <submodule> に載せる SHA の長さ
+SHORT_SHA = 12
+
+@dataclass
+class FileDiff:
+    """1ファイル分の diff"""
+    path: str
+    lines: List[str] = field(default_factory=list)
+    old_sha: Optional[str] = None
+    new_sha: Optional[str] = None
+
+    def cache_key(self, options: str = "") -> Optional[str]:
+        """(旧blob, 新blob, 出力形式) から決まるキャッシュキー。blob が特定できない場合は None"""
+        if not self.old_sha or not self.new_sha:
+            return None
+        # 周辺コンテキスト（" " 行）の量は実行ごとに変わりうるので、その内容もキーに含める
+        context = [line for line in self.lines if line.startswith(" ")]
+        if context:
+            options += "\0context:" + hashlib.sha256("\n".join(context).encode("utf-8")).hexdigest()
+        raw = "\0".join([XML_FORMAT_VERSION, options, self.path, self.old_sha, self.new_sha])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @property
+    def is_submodule(self) -> bool:
+        """サブモジュールのポインタの変更（"index a..b 160000" や "new file mode 160000"）か"""
+        return any(line.startswith(("index ", "new file mode ", "deleted file mode ")) and line.endswith(" " + GITLINK_MODE)
+                   for line in self.lines[:4])
+
+def split_diff(diff_content: str) -> List[FileDiff]:
+    """Git Diff をファイル単位に分割する"""
+    files: List[FileDiff] = []
+    current: Optional[FileDiff] = None
+
+    for line in diff_content.split('\n'):
+        if line.startswith("diff --git"):
+            match = re.search(r"diff --git (.*?) (.*)", line)
+            current = FileDiff(path=match.group(2) if match else "unknown")
+            files.append(current)
+            continue
+
+        if current is None:
+            continue
+
+        if current.old_sha is None and line.startswith("index "):
+            index_match = _INDEX_RE.match(line)
+            if index_match:
+                current.old_sha, current.new_sha = index_match.groups()
+        current.lines.append(line)
+
+    return files
+
+def file_open_tag(file_diff: FileDiff) -> str:
+    return f'  <file path="{file_diff.path}">'
+
+FILE_CLOSE_TAG = "  </file>"
+
+def render_chunks_xml(file_diff: FileDiff) -> List[str]:
+    """1ファイル分の diff をハンクごとの <chunk> 要素に変換する"""
+    chunks: List[str] = []
+    output: List[str] = []
 
-def parse_diff_to_xml(diff_content):
-    """Git DiffをXML形式に変換する"""
-    diff_lines = diff_content.split('\n')
-    output = []
-    
-    output.append("以下より<changeset>")
-    output.append("<changeset>")
-    
-    current_file = None
     current_scope = ""
     in_chunk = False
     added_lines = []
     removed_lines = []
-    
+    # 周辺コンテキスト（[git] context）。変更行より前と後に分けて出力する
+    before_lines = []
+    after_lines = []
+
     def flush_chunk():
         nonlocal in_chunk, added_lines, removed_lines
         if not in_chunk:
             return
-            
+
         if added_lines and removed_lines:
             c_type = "modification"
         elif added_lines:
@@ -31,68 +98,231 @@ def parse_diff_to_xml(diff_content):
 
         output.append(f'    <chunk scope="{escape(current_scope)}">')
         output.append(f'      <type>{c_type}</type>')
-        
+
+        if before_lines:
+            content = "\n".join(before_lines)
+            output.append(f'      <context position="before">\n{escape(content)}\n      </context>')
+
         if removed_lines:
             content = "\n".join(removed_lines)
             output.append(f'      <original>\n{escape(content)}\n      </original>')
-        
+
         if added_lines:
             content = "\n".join(added_lines)
             output.append(f'      <modified>\n{escape(content)}\n      </modified>')
-            
+
+        if after_lines:
+            content = "\n".join(after_lines)
+            output.append(f'      <context position="after">\n{escape(content)}\n      </context>')
+
         output.append('    </chunk>')
-        
+        chunks.append("\n".join(output))
+        output.clear()
+
         added_lines.clear()
         removed_lines.clear()
+        before_lines.clear()
+        after_lines.clear()
         in_chunk = False
 
-    for line in diff_lines:
-        if line.startswith("diff --git"):
-            flush_chunk()
-            if current_file:
-                output.append("  </file>")
-            
-            match = re.search(r"diff --git (.*?) (.*)", line)
-            file_path = match.group(2) if match else "unknown"
-            current_file = file_path
-            output.append(f'  <file path="{file_path}">')
-            continue
-
+    for line in file_diff.lines:
         if line.startswith("@@"):
             flush_chunk()
             scope_match = re.search(r"@@.*?@@\s*(.*)", line)
             current_scope = scope_match.group(1).strip() if scope_match else "global"
             in_chunk = True
             continue
-            
+
         if in_chunk:
             if line.startswith("-") and not line.startswith("---"):
                 removed_lines.append(line[1:])
             elif line.startswith("+") and not line.startswith("+++"):
                 added_lines.append(line[1:])
+            elif line.startswith(" "):
+                (after_lines if added_lines or removed_lines else before_lines).append(line[1:])
 
     flush_chunk()
-    if current_file:
-        output.append("  </file>")
+    return chunks
+
+# <chunk> 内のテキストを持つ要素（切り詰めの対象）
+_CHUNK_TEXT_RE = re.compile(r"(<(original|modified|context)[^>]*>\n)(.*?)(\n *</\2>)", re.S)
+TRUNCATED_MARK = "... (truncated)"
+
+def truncate_chunk_xml(chunk: str, budget: int) -> str:
+    """<chunk> 要素のテキストだけを先頭から順に切り詰めて budget 文字以内にする（タグはすべて残す）"""
+    excess = len(chunk) - budget
+
+    def shrink(match):
+        nonlocal excess
+        text = match.group(3)
+        if excess <= 0:
+            return match.group(0)
+        # 実体参照（&amp; など）の途中では切らない
+        kept = re.sub(r"&[^;]*$", "", text[:max(0, len(text) - excess - len(TRUNCATED_MARK) - 1)])
+        shortened = f"{kept}\n{TRUNCATED_MARK}" if kept else TRUNCATED_MARK
+        excess -= len(text) - len(shortened)
+        return match.group(1) + shortened + match.group(4)
+
+    return _CHUNK_TEXT_RE.sub(shrink, chunk) if excess > 0 else chunk
+
+def split_file_xml(file_diff: FileDiff, budget: int) -> List[str]:
+    """
+    budget 文字を超える1ファイル分の diff を、チャンクの境界で複数の <file> 要素に分ける。
+    1つのチャンクだけで budget を超える場合は、そのチャンクのテキストを切り詰める。
+    """
+    open_tag = file_open_tag(file_diff)
+    room = budget - len(open_tag) - len(FILE_CLOSE_TAG) - 2
+    parts: List[List[str]] = []
+    size = room
+    for chunk in render_chunks_xml(file_diff):
+        chunk = truncate_chunk_xml(chunk, room)
+        if size + len(chunk) + 1 > room:
+            parts.append([])
+            size = 0
+        parts[-1].append(chunk)
+        size += len(chunk) + 1
+    return ["\n".join([open_tag, *chunks, FILE_CLOSE_TAG]) for chunks in parts] or [render_file_xml(file_diff)]
+
+def render_file_xml(file_diff: FileDiff) -> str:
+    """1ファイル分の diff を <file> 要素に変換する"""
+    return "\n".join([file_open_tag(file_diff), *render_chunks_xml(file_diff), FILE_CLOSE_TAG])
+
+def render_file_summary_xml(file_diff: FileDiff, summary: str) -> str:
+    """前回までの実行で要約済みのファイルを1行の要約として出力する"""
+    return f'  <file path="{file_diff.path}" detail="summary">\n    <summary>{escape(summary)}</summary>\n  </file>'
+
+def _is_null(sha: Optional[str]) -> bool:
+    return not sha or not sha.strip("0")
+
+def render_submodule_xml(file_diff: FileDiff, change: Optional[SubmoduleChange]) -> str:
+    """サブモジュールのポインタの変更を、old..new のログと diffstat をまとめた <submodule> 要素にする"""
+    old, new = file_diff.old_sha or "", file_diff.new_sha or ""
+    attrs = f'path="{file_diff.path}"'
+    if _is_null(old):
+        return f'  <submodule {attrs} status="added" new="{new[:SHORT_SHA]}" />'
+    if _is_null(new):
+        return f'  <submodule {attrs} status="removed" old="{old[:SHORT_SHA]}" />'
+    attrs += f' old="{old[:SHORT_SHA]}" new="{new[:SHORT_SHA]}"'
+    if change is None or not change.available:
+        return f'  <submodule {attrs} available="false" />'
+
+    output = [f'  <submodule {attrs} ahead="{change.ahead}" behind="{change.behind}">']
+    for tag, lines, count in (("log", change.log, change.ahead), ("removed", change.removed, change.behind)):
+        if lines:
+            more = [f"... and {count - len(lines)} more commits"] if count > len(lines) else []
+            output.append(f'    <{tag}>\n{escape(chr(10).join(lines + more))}\n    </{tag}>')
+    if change.files:
+        more = [f"... and {change.files - len(change.stat)} more files"] if change.files > len(change.stat) else []
+        output.append(f'    <diffstat files="{change.files}" insertions="{change.insertions}" deletions="{change.deletions}">'
+                      f'\n{escape(chr(10).join(change.stat + more))}\n    </diffstat>')
+    output.append('  </submodule>')
+    return "\n".join(output)
+
+def render_files_xml(files: List[FileDiff], cache=None, summaries: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    ファイルごとの <file> 断片を返す。
+    cache が渡された場合は blob SHA をキーに描画済みの断片を再利用し、
+    summaries にパスが含まれるファイルは要約のみを出力する。
+    サブモジュールのポインタの変更は、サブモジュール側のログと diffstat を並列に集めて <submodule> 要素にする。
+    """
+    summaries = summaries or {}
+    fragments: List[Optional[str]] = [None] * len(files)
+
+    pointers = [(fd.path, fd.old_sha, fd.new_sha) for fd in files
+                if fd.is_submodule and not _is_null(fd.old_sha) and not _is_null(fd.new_sha)]
+    submodules = describe_submodules(pointers, get_repo_root(), cache) if pointers else {}
+
+    keys = {i: fd.cache_key() for i, fd in enumerate(files) if fd.path not in summaries and not fd.is_submodule}
+    cached = cache.get_many(FILE_XML_NAMESPACE, [k for k in keys.values() if k]) if cache else {}
+
+    to_store = []
+    for i, fd in enumerate(files):
+        if fd.is_submodule:
+            fragments[i] = render_submodule_xml(fd, submodules.get(fd.path))
+            continue
+        if fd.path in summaries:
+            fragments[i] = render_file_summary_xml(fd, summaries[fd.path])
+            continue
+
+        key = keys[i]
+        if key and key in cached:
+            fragments[i] = cached[key]
+            continue
+
+        fragments[i] = render_file_xml(fd)
+        if key:
+            to_store.append((key, fragments[i]))
+
+    if cache and to_store:
+        cache.put_many(FILE_XML_NAMESPACE, to_store)
+
+    return fragments
+
+def parse_diff_to_xml(diff_content, cache=None, summaries=None):
+    """Git DiffをXML形式に変換する"""
+    output = []
+
+    output.append("以下より<changeset>")
+    output.append("<changeset>")
+    output.extend(render_files_xml(split_diff(diff_content), cache=cache, summaries=summaries))
     output.append("</changeset>")
-    
+
     return "\n".join(output)
 
-def build_prompt(system_prompt: str, recent_logs: Optional[str], user_context: str, diff_content: str) -> str:
-    """最終的なプロンプトを構築する"""
-    full_payload = [system_prompt, "\n---\n"]
-    
+SECTION_SYSTEM = "system"
+SECTION_HISTORY = "history"
+SECTION_CONTEXT = "context"
+SECTION_CHANGESET = "changeset"
+SECTION_FILE = "file"
+
+@dataclass
+class PromptSection:
+    """プロンプトの構成要素。"\n".join(各 text) が build_prompt() の出力と一致する"""
+    kind: str
+    label: str
+    text: str
+
+def render_history_section(recent_logs: str) -> str:
+    return "\n".join([
+        t("prompt.recent_logs_title"),
+        t("prompt.recent_logs_instruction", recent_logs),
+        "\n---\n"
+    ])
+
+def build_header_sections(system_prompt: str, recent_logs: Optional[str], user_context: str) -> List[PromptSection]:
+    """changeset より前のセクション（システム、履歴、追加コンテキスト）。map-reduce の reduce でも使う"""
+    sections = [PromptSection(SECTION_SYSTEM, SECTION_SYSTEM, "\n".join([system_prompt, "\n---\n"]))]
+
     if recent_logs:
-        full_payload.append(t("prompt.recent_logs_title"))
-        full_payload.append(t("prompt.recent_logs_instruction", recent_logs))
-        full_payload.append("\n---\n")
-    
+        sections.append(PromptSection(SECTION_HISTORY, SECTION_HISTORY, render_history_section(recent_logs)))
+
     if user_context:
-        full_payload.append(t("prompt.user_context_title"))
-        full_payload.append(t("prompt.user_context_instruction", user_context))
-        full_payload.append("\n---\n")
+        sections.append(PromptSection(SECTION_CONTEXT, SECTION_CONTEXT, "\n".join([
+            t("prompt.user_context_title"),
+            t("prompt.user_context_instruction", user_context),
+            "\n---\n"
+        ])))
+    return sections
 
-    xml_output = parse_diff_to_xml(diff_content)
-    full_payload.append(xml_output)
+def build_prompt_sections(system_prompt: str, recent_logs: Optional[str], user_context: str, diff_content: str,
+                          cache=None, summaries: Optional[Dict[str, str]] = None) -> List[PromptSection]:
+    """プロンプトをセクション（システム、履歴、追加コンテキスト、ファイルごと）に分けて構築する"""
+    sections = build_header_sections(system_prompt, recent_logs, user_context)
 
-    return "\n".join(full_payload)
+    header = ["以下より<changeset>", "<changeset>"]
+    if summaries:
+        header.insert(0, t("prompt.file_summary_note"))
+    sections.append(PromptSection(SECTION_CHANGESET, SECTION_CHANGESET, "\n".join(header)))
+
+    files = split_diff(diff_content)
+    for fd, fragment in zip(files, render_files_xml(files, cache=cache, summaries=summaries)):
+        sections.append(PromptSection(SECTION_FILE, fd.path, fragment))
+
+    sections.append(PromptSection(SECTION_CHANGESET, SECTION_CHANGESET, "</changeset>"))
+    return sections
+
+def build_prompt(system_prompt: str, recent_logs: Optional[str], user_context: str, diff_content: str,
+                 cache=None, summaries: Optional[Dict[str, str]] = None) -> str:
+    """最終的なプロンプトを構築する"""
+    sections = build_prompt_sections(system_prompt, recent_logs, user_context, diff_content, cache=cache, summaries=summaries)
+    return "\n".join(section.text for section in sections)
@@ -0,0 +1,101 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .i18n import t
+
+MODE_FULL = "full"
+MODE_REFINE = "refine"
+
+@dataclass
+class Candidate:
+    """1回分の生成結果"""
+    text: str
+    mode: str = MODE_FULL
+    instruction: str = ""
+    usage: Optional[Dict[str, Any]] = None
+    elapsed: float = 0.0
+    # この候補を生成したときの会話（refine の起点になる）
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    # TTFT やデコード速度など（StreamMetrics）。エディタで編集した候補などでは None
+    metrics: Optional[Any] = None
+
+class CandidateHistory:
+    """
+    セッション内で生成した候補の履歴。
+    候補間の移動はネットワークを使わずに行え、refine 時は現在の候補を起点に会話を続ける。
+    """
+
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+        self.candidates: List[Candidate] = []
+        self.index = -1
+
+    def __len__(self) -> int:
+        return len(self.candidates)
+
+    @property
+    def current(self) -> Optional[Candidate]:
+        if self.index < 0:
+            return None
+        return self.candidates[self.index]
+
+    def add(self, candidate: Candidate) -> Candidate:
+        self.candidates.append(candidate)
+        self.index = len(self.candidates) - 1
+        return candidate
+
+    def previous(self) -> Optional[Candidate]:
+        if self.index > 0:
+            self.index -= 1
+        return self.current
+
+    def next(self) -> Optional[Candidate]:
+        if self.index < len(self.candidates) - 1:
+            self.index += 1
+        return self.current
+
+    def update_current_text(self, text: str) -> None:
+        """エディタでの編集結果を現在の候補に反映する（refine の起点も編集後の文面になる）"""
+        if self.current:
+            self.current.text = text
+
+    def position(self) -> str:
+        return f"{self.index + 1}/{len(self.candidates)}"
+
+    def full_messages(self) -> List[Dict[str, str]]:
+        return [{"role": "user", "content": self.prompt}]
+
+    def refine_messages(self, instruction: str) -> List[Dict[str, str]]:
+        """
+        現在の候補を assistant の発話として残し、短い追加指示だけを送る会話を組み立てる。
+        プロンプト部分は前回と同一なので、プロバイダのプレフィックスキャッシュが効く。
+        """
+        base = self.current
+        if base is None:
+            return self.full_messages()
+
+        messages = list(base.messages or self.full_messages())
+        messages.append({"role": "assistant", "content": base.text})
+        messages.append({"role": "user", "content": t("prompt.refine_instruction", instruction)})
+        return messages
+
+    def last_full(self) -> Optional[Candidate]:
+        for candidate in reversed(self.candidates):
+            if candidate.mode == MODE_FULL:
+                return candidate
+        return None
+
+    def compare_to_full(self, candidate: Candidate) -> str:
+        """refine の候補について、直近のフル再送と比べた入力トークン数・所要時間を要約する"""
+        full = self.last_full()
+        if candidate.mode != MODE_REFINE or full is None or full is candidate:
+            return ""
+
+        parts = []
+        full_in = (full.usage or {}).get("prompt_tokens")
+        refine_in = (candidate.usage or {}).get("prompt_tokens")
+        if isinstance(full_in, int) and isinstance(refine_in, int) and full_in > 0:
+            parts.append(f"input {refine_in} vs {full_in} toks")
+        if full.elapsed > 0:
+            parts.append(f"time {candidate.elapsed:.1f}s vs {full.elapsed:.1f}s")
+        return "Refine vs full resend: " + ", ".join(parts) if parts else ""
@@ -0,0 +1,53 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# プロセス全体で共有するスレッド数の上限。呼び出し側ごとの並列数は run_bounded() の concurrency で絞る
+DEFAULT_MAX_WORKERS = 16
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+def shared_executor() -> ThreadPoolExecutor:
+    """
+    map-reduce、パッケージごとの要約、changelog などが共有するスレッドプール。
+    機能ごとにプールを作ると同時実行数が掛け算で増えるため、1つにまとめる。
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DEFAULT_MAX_WORKERS, thread_name_prefix="komitto")
+        return _executor
+
+def run_bounded(fn: Callable[[T], object], items: Iterable[T], concurrency: int) -> Iterator[Tuple[T, Future]]:
+    """
+    items の各要素に fn を共有プールで適用し、完了順に (item, future) を返す。
+    同時に実行中の要素は concurrency 個までで、items は必要になった分だけ読み進める
+    （ジェネレーターを渡せば全件をメモリに載せずに済む）。
+    途中で打ち切られた場合は、まだ開始していない要素をキャンセルする。
+    """
+    executor = shared_executor()
+    source = iter(items)
+    in_flight: Dict[Future, T] = {}
+    concurrency = max(1, concurrency)
+
+    def fill():
+        while len(in_flight) < concurrency:
+            try:
+                item = next(source)
+            except StopIteration:
+                return
+            in_flight[executor.submit(fn, item)] = item
+
+    try:
+        fill()
+        while in_flight:
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                yield in_flight.pop(future), future
+            fill()
+    finally:
+        for future in in_flight:
+            future.cancel()
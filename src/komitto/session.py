@@ -0,0 +1,370 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .cache import default_cache_dir
+from .git_utils import get_repo_root, write_tree
+from .llm.events import TextDelta
+from .refine import MODE_FULL
+
+JOURNAL_NAME = "journal.ndjson"
+ROTATED_NAME = "journal.1.ndjson"
+
+# ジャーナルの上限（バイト）。超えたら1世代だけ残してローテーションする（[session] max_bytes）
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+# 書き込みをまとめる間隔。プロセスが落ちても OS のページキャッシュに残るのは最大でこの時間分まで
+FLUSH_INTERVAL = 0.2
+FLUSH_BYTES = 64 * 1024
+# fsync（OS ごと落ちた場合への備え）はさらに間引く
+FSYNC_INTERVAL = 1.0
+# 保存しておくプロンプトの数（sessions/prompts/<sha256>.txt）
+KEEP_PROMPTS = 10
+
+SESSION_SINGLE = "single"
+SESSION_COMPARE = "compare"
+# シングルモードのストリーム名
+STREAM_MAIN = "main"
+
+def session_dir(config: dict) -> Path:
+    path = config.get("session", {}).get("path")
+    return Path(path) if path else default_cache_dir() / "sessions"
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+@dataclass
+class StreamState:
+    """ストリーム（シングルモードの main、比較モードの各設定）ごとの状態"""
+    name: str
+    prompt_sha: str
+    # 設定の選び方（context_name / template / model）。再開時にこれで設定を解決し直す
+    options: Dict[str, Any] = field(default_factory=dict)
+    # 表示用の provider / model（API キーなどは記録しない）
+    provider: str = ""
+    model: str = ""
+    # 完了した候補（text, mode, instruction）
+    candidates: List[Dict[str, Any]] = field(default_factory=list)
+    # 生成中のテキスト（差分のリスト）。generating が True のまま終わっていれば中断された生成
+    parts: List[str] = field(default_factory=list)
+    generating: bool = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    @property
+    def latest(self) -> str:
+        if self.generating and self.text:
+            return self.text
+        return self.candidates[-1]["text"] if self.candidates else self.text
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "prompt_sha": self.prompt_sha, "options": self.options,
+                "provider": self.provider, "model": self.model}
+
+@dataclass
+class Session:
+    id: str
+    mode: str
+    repo: str
+    # ステージ内容（git write-tree）。再開時に変わっていれば警告する
+    tree: str
+    created: float
+    streams: Dict[str, StreamState] = field(default_factory=dict)
+    selected: Optional[str] = None
+    committed: bool = False
+
+    def load_prompt(self, directory: Path, stream: str) -> Optional[str]:
+        path = Path(directory) / "prompts" / f"{self.streams[stream].prompt_sha}.txt"
+        try:
+            return path.read_text(encoding="utf-8")
+        except OSError:
+            return None
+
+class SessionJournal:
+    """
+    生成中のセッションを追記専用の NDJSON に記録する。
+    ストリームの差分は1トークンごとにメモリ上のバッファへ積むだけで、書き込みは FLUSH_INTERVAL ごと、
+    fsync は FSYNC_INTERVAL ごとにまとめて行う（トークンあたりのコストは JSON 1行分の組み立てのみ）。
+    複数スレッド（比較モード）から使ってよい。
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / JOURNAL_NAME
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._file = open(self.path, "ab", buffering=0)
+        self._size = self._file.tell()
+        self._buffer: List[bytes] = []
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._last_fsync = self._last_flush
+        self.session: Optional[Session] = None
+
+    def begin(self, mode: str, repo: str, tree: str, streams: Iterable[Tuple[str, str, dict, dict]]) -> Session:
+        """
+        新しいセッションを始める。streams は (名前, プロンプト, 設定の選び方, 解決済みの設定)。
+        プロンプト本体はハッシュ名のファイルに1度だけ保存し、ジャーナルにはハッシュだけを書く。
+        """
+        session = Session(uuid.uuid4().hex[:12], mode, repo or "", tree or "", time.time())
+        for name, prompt, options, config in streams:
+            sha = prompt_hash(prompt)
+            self._save_prompt(sha, prompt)
+            llm_config = config.get("llm", {})
+            session.streams[name] = StreamState(name, sha, dict(options or {}),
+                                                str(llm_config.get("provider", "")), str(llm_config.get("model", "")))
+        with self._lock:
+            self.session = session
+            self._write_header()
+        self.flush(sync=True)
+        return session
+
+    def restore(self, session: Session) -> Session:
+        """再開したセッションを、次の再開に備えて新しいセッションとして書き直す"""
+        with self._lock:
+            self.session = session
+            self._write_header()
+        self.flush(sync=True)
+        return session
+
+    def _save_prompt(self, sha: str, prompt: str) -> None:
+        directory = self.directory / "prompts"
+        directory.mkdir(exist_ok=True)
+        path = directory / f"{sha}.txt"
+        if path.exists():
+            os.utime(path)
+        else:
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(prompt, encoding="utf-8")
+            tmp.replace(path)
+        old = sorted(directory.glob("*.txt"), key=lambda p: p.stat().st_mtime, reverse=True)[KEEP_PROMPTS:]
+        for p in old:
+            p.unlink(missing_ok=True)
+
+    def _record(self, record: Dict[str, Any]) -> None:
+        """ロックを持った状態で呼ぶ"""
+        line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        self._buffer.append(line)
+        self._pending += len(line)
+
+    def _write_header(self) -> None:
+        """セッションの開始レコードと各ストリームの現状。ローテーション後もこれだけで復元できる"""
+        s = self.session
+        self._record({"type": "session", "id": s.id, "mode": s.mode, "repo": s.repo, "tree": s.tree,
+                      "created": s.created, "streams": [st.as_dict() for st in s.streams.values()]})
+        for st in s.streams.values():
+            if st.candidates or st.parts:
+                self._record({"type": "snapshot", "id": s.id, "stream": st.name, "candidates": st.candidates,
+                              "text": st.text, "generating": st.generating})
+        if s.selected:
+            self._record({"type": "selected", "id": s.id, "stream": s.selected})
+
+    def _append(self, record: Dict[str, Any], sync: bool = False) -> None:
+        if self.session is None:
+            return
+        with self._lock:
+            record["id"] = self.session.id
+            self._record(record)
+            due = self._pending >= FLUSH_BYTES or time.monotonic() - self._last_flush >= FLUSH_INTERVAL
+        if due or sync:
+            self.flush(sync)
+
+    def start(self, stream: str, mode: str = MODE_FULL, instruction: str = "") -> None:
+        with self._lock:
+            state = self.session.streams.get(stream) if self.session else None
+            if state is not None:
+                state.parts = []
+                state.generating = True
+        self._append({"type": "start", "stream": stream, "mode": mode, "instruction": instruction})
+
+    def delta(self, stream: str, text: str) -> None:
+        """1トークンごとに呼ばれる。JSON の組み立ては差分の文字列だけにして、残りは固定の接頭辞を使う"""
+        if self.session is None:
+            return
+        with self._lock:
+            state = self.session.streams.get(stream)
+            if state is not None:
+                state.parts.append(text)
+            line = (f'{{"type": "delta", "id": "{self.session.id}", "stream": {json.dumps(stream)}, '
+                    f'"text": {json.dumps(text, ensure_ascii=False)}}}\n').encode("utf-8")
+            self._buffer.append(line)
+            self._pending += len(line)
+            due = self._pending >= FLUSH_BYTES or time.monotonic() - self._last_flush >= FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def candidate(self, stream: str, text: str, mode: str = MODE_FULL, instruction: str = "") -> None:
+        candidate = {"text": text, "mode": mode, "instruction": instruction}
+        with self._lock:
+            state = self.session.streams.get(stream) if self.session else None
+            if state is not None:
+                state.candidates.append(candidate)
+                state.parts = []
+                state.generating = False
+        self._append({"type": "candidate", "stream": stream, **candidate}, sync=True)
+
+    def revise(self, stream: str, text: str) -> None:
+        """最後の候補を後処理（整形・修正依頼）後の文面に置き換える。同じ生成の候補を増やさない"""
+        with self._lock:
+            state = self.session.streams.get(stream) if self.session else None
+            if state is None or not state.candidates or state.candidates[-1]["text"] == text:
+                return
+            state.candidates[-1]["text"] = text
+        self._append({"type": "revise", "stream": stream, "text": text}, sync=True)
+
+    def selected(self, stream: str) -> None:
+        if self.session is not None:
+            self.session.selected = stream
+        self._append({"type": "selected", "stream": stream}, sync=True)
+
+    def committed(self) -> None:
+        if self.session is not None:
+            self.session.committed = True
+        self._append({"type": "committed"}, sync=True)
+
+    def tap(self, events: Iterable, stream: str, mode: str = MODE_FULL, instruction: str = "") -> Iterator:
+        """LLM のイベント列をそのまま流しつつ、テキストの差分を記録する。最後まで流れたら候補として確定する"""
+        self.start(stream, mode, instruction)
+        parts = []
+        for event in events:
+            if isinstance(event, TextDelta):
+                parts.append(event.text)
+                self.delta(stream, event.text)
+            yield event
+        self.candidate(stream, "".join(parts), mode, instruction)
+
+    def flush(self, sync: bool = False) -> None:
+        with self._lock:
+            if self._buffer:
+                data = b"".join(self._buffer)
+                self._buffer.clear()
+                self._pending = 0
+                if self._size and self._size + len(data) > self.max_bytes:
+                    data = self._rotate(data)
+                self._file.write(data)
+                self._size += len(data)
+            now = time.monotonic()
+            self._last_flush = now
+            if sync or now - self._last_fsync >= FSYNC_INTERVAL:
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+
+    def _rotate(self, data: bytes) -> bytes:
+        """
+        現在のジャーナルを1世代前として残し、新しいファイルを現在のセッションの状態から始める。
+        Returns: 新しいファイルに書くデータ（ヘッダーに未書き込み分の状態が含まれるので、差分は捨てる）
+        """
+        self._file.close()
+        os.replace(self.path, self.directory / ROTATED_NAME)
+        self._file = open(self.path, "ab", buffering=0)
+        self._size = 0
+        if self.session is None:
+            return data
+        self._write_header()
+        header = b"".join(self._buffer)
+        self._buffer.clear()
+        self._pending = 0
+        return header
+
+    def close(self) -> None:
+        self.flush(sync=True)
+        with self._lock:
+            self._file.close()
+
+def open_journal(config: dict) -> Optional[SessionJournal]:
+    """[session] で無効にされている場合や、書き込めない環境では None（記録なしで動作させる）"""
+    session_config = config.get("session", {})
+    if not session_config.get("enabled", True):
+        return None
+    try:
+        return SessionJournal(session_dir(config), int(session_config.get("max_bytes", DEFAULT_MAX_BYTES)))
+    except OSError:
+        return None
+
+def begin_session(journal: Optional[SessionJournal], mode: str,
+                  streams: Iterable[Tuple[str, str, dict, dict]]) -> Optional[SessionJournal]:
+    """リポジトリとステージ内容を添えてセッションを始める。記録できなければ None（生成はそのまま続ける）"""
+    if journal is None:
+        return None
+    try:
+        journal.begin(mode, get_repo_root() or "", write_tree(), streams)
+        return journal
+    except Exception:
+        return None
+
+def _apply(sessions: Dict[str, Session], record: Dict[str, Any]) -> None:
+    kind = record.get("type")
+    if kind == "session":
+        session = Session(record["id"], record.get("mode", SESSION_SINGLE), record.get("repo", ""),
+                          record.get("tree", ""), record.get("created", 0.0))
+        for st in record.get("streams", []):
+            session.streams[st["name"]] = StreamState(st["name"], st.get("prompt_sha", ""), st.get("options", {}),
+                                                      st.get("provider", ""), st.get("model", ""))
+        # 同じ id のセッションは（ローテーション後のヘッダーも含めて）書き直されたものとして置き換える
+        sessions.pop(session.id, None)
+        sessions[session.id] = session
+        return
+
+    session = sessions.get(record.get("id"))
+    if session is None:
+        return
+    if kind == "selected":
+        session.selected = record.get("stream")
+        return
+    if kind == "committed":
+        session.committed = True
+        return
+    state = session.streams.get(record.get("stream"))
+    if state is None:
+        return
+    if kind == "start":
+        state.parts = []
+        state.generating = True
+    elif kind == "delta":
+        state.parts.append(record.get("text", ""))
+    elif kind == "candidate":
+        state.candidates.append({k: record.get(k, "") for k in ("text", "mode", "instruction")})
+        state.parts = []
+        state.generating = False
+    elif kind == "revise":
+        if state.candidates:
+            state.candidates[-1]["text"] = record.get("text", "")
+    elif kind == "snapshot":
+        state.candidates = list(record.get("candidates", []))
+        state.parts = [record.get("text", "")]
+        state.generating = bool(record.get("generating"))
+
+def load_sessions(directory: Path) -> List[Session]:
+    """ジャーナル（1世代前を含む）を読み、古い順のセッションを返す。途中で切れた最後の行は無視する"""
+    sessions: Dict[str, Session] = {}
+    for name in (ROTATED_NAME, JOURNAL_NAME):
+        try:
+            with open(Path(directory) / name, "rb") as f:
+                for line in f:
+                    try:
+                        _apply(sessions, json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except OSError:
+            continue
+    return list(sessions.values())
+
+def load_last_session(directory: Path, repo: Optional[str] = None) -> Optional[Session]:
+    """
+    最後のセッション（repo を指定した場合はそのリポジトリのもの）。
+    何も生成されていないセッションは飛ばし、最後のセッションがコミット済みなら None
+    """
+    for session in reversed(load_sessions(directory)):
+        if repo is not None and session.repo != repo:
+            continue
+        if any(st.candidates or st.text for st in session.streams.values()):
+            return None if session.committed else session
+    return None
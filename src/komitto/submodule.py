@@ -0,0 +1,122 @@
+import subprocess
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .scheduler import run_bounded
+
+# (旧コミット, 新コミット) ごとのログと diffstat。形式を変えたら末尾の番号を上げる
+CACHE_NAMESPACE = "submodule:1"
+
+# 同時に調べるサブモジュールの数（共有プールの上で絞る）
+DEFAULT_CONCURRENCY = 4
+# 載せるコミット数とファイル数の上限
+DEFAULT_LOG_LIMIT = 20
+DEFAULT_STAT_LIMIT = 20
+
+@dataclass
+class SubmoduleChange:
+    """サブモジュールのポインタ（gitlink）の変更を old..new のログと diffstat にまとめたもの"""
+    # old から new へ進んだコミット数と、new に含まれない old 側のコミット数（巻き戻し）
+    ahead: int = 0
+    behind: int = 0
+    # "短縮SHA 件名" の行
+    log: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    # "+追加 -削除 パス" の行
+    stat: List[str] = field(default_factory=list)
+    files: int = 0
+    insertions: int = 0
+    deletions: int = 0
+    # サブモジュールがチェックアウトされていない、またはコミットが取得されていない
+    available: bool = True
+
+    def as_dict(self) -> dict:
+        return {"ahead": self.ahead, "behind": self.behind, "log": self.log, "removed": self.removed,
+                "stat": self.stat, "files": self.files, "insertions": self.insertions, "deletions": self.deletions}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SubmoduleChange":
+        return cls(**data)
+
+def cache_key(old: str, new: str) -> str:
+    return f"{old}..{new}"
+
+def _git_prefix(root: str, path: str) -> Optional[List[str]]:
+    """
+    サブモジュールのリポジトリで git を実行するための引数。
+    チェックアウト済みならそのディレクトリ、なければ（ワークツリーごとの）.git/modules/<path> を使う
+    """
+    workdir = Path(root, path)
+    if (workdir / ".git").exists():
+        return ["git", "-C", str(workdir)]
+    result = subprocess.run(["git", "-C", root, "rev-parse", "--path-format=absolute", "--git-path", f"modules/{path}"],
+                            capture_output=True, text=True, encoding='utf-8')
+    git_dir = result.stdout.strip()
+    if result.returncode != 0 or not Path(git_dir).is_dir():
+        return None
+    return ["git", f"--git-dir={git_dir}"]
+
+def _run(prefix: List[str], *args: str) -> Optional[str]:
+    result = subprocess.run([*prefix, *args], capture_output=True, text=True, encoding='utf-8', errors='replace')
+    return result.stdout if result.returncode == 0 else None
+
+def collect_change(root: str, path: str, old: str, new: str,
+                   log_limit: int = DEFAULT_LOG_LIMIT, stat_limit: int = DEFAULT_STAT_LIMIT) -> SubmoduleChange:
+    """サブモジュールの old..new のログと diffstat を集める（old と new はどちらもコミット SHA）"""
+    prefix = _git_prefix(root, path)
+    counts = _run(prefix, "rev-list", "--left-right", "--count", f"{old}...{new}") if prefix else None
+    if counts is None:
+        return SubmoduleChange(available=False)
+
+    behind, ahead = (int(n) for n in counts.split())
+    change = SubmoduleChange(ahead=ahead, behind=behind)
+    log_format = "--format=%h %s"
+    if ahead:
+        change.log = (_run(prefix, "log", log_format, f"--max-count={log_limit}", f"{old}..{new}") or "").splitlines()
+    if behind:
+        change.removed = (_run(prefix, "log", log_format, f"--max-count={log_limit}", f"{new}..{old}") or "").splitlines()
+
+    for line in (_run(prefix, "diff", "--numstat", "--no-renames", old, new) or "").splitlines():
+        added, deleted, file_path = line.split("\t", 2)
+        change.files += 1
+        # バイナリは "-" になる
+        change.insertions += int(added) if added.isdigit() else 0
+        change.deletions += int(deleted) if deleted.isdigit() else 0
+        if len(change.stat) < stat_limit:
+            change.stat.append(f"+{added} -{deleted} {file_path}")
+    return change
+
+def describe_submodules(pointers: Iterable[Tuple[str, str, str]], root: Optional[str], cache=None,
+                        concurrency: int = DEFAULT_CONCURRENCY) -> Dict[str, SubmoduleChange]:
+    """
+    ステージされたポインタの変更 (パス, 旧SHA, 新SHA) ごとにログと diffstat を集める。
+    キャッシュにない組だけを共有プールで並列に調べ、取得できたものは (旧, 新) をキーに保存する。
+    """
+    pointers = list(pointers)
+    keys = {path: cache_key(old, new) for path, old, new in pointers}
+    cached = cache.get_many(CACHE_NAMESPACE, list(keys.values())) if cache and pointers else {}
+
+    changes: Dict[str, SubmoduleChange] = {}
+    missing = []
+    for path, old, new in pointers:
+        if keys[path] in cached:
+            changes[path] = SubmoduleChange.from_dict(cached[keys[path]])
+        elif root is None:
+            changes[path] = SubmoduleChange(available=False)
+        else:
+            missing.append((path, old, new))
+
+    to_store = []
+    for (path, old, new), future in run_bounded(lambda item: collect_change(root, *item), missing, concurrency):
+        try:
+            change = future.result()
+        except (OSError, ValueError):
+            change = SubmoduleChange(available=False)
+        changes[path] = change
+        if change.available:
+            to_store.append((keys[path], change.as_dict()))
+
+    if cache and to_store:
+        cache.put_many(CACHE_NAMESPACE, to_store)
+    return changes
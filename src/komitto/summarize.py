@@ -0,0 +1,242 @@
+import hashlib
+import time
+from typing import Dict, List, Optional
+
+from .i18n import t
+from .llm import create_llm_client
+from .llm.base import CancellationToken
+from .scheduler import run_bounded
+from .prompt import (FileDiff, FILE_XML_NAMESPACE, build_header_sections, render_file_xml, render_files_xml,
+                     split_file_xml)
+
+FILE_SUMMARY_NAMESPACE = "file_summary"
+
+DEFAULT_SUMMARY_THRESHOLD = 30000
+
+def _summary_key(file_diff: FileDiff):
+    return file_diff.cache_key("summary")
+
+def _parse_summary_lines(text: str, paths: List[str]) -> Dict[str, str]:
+    """'path: summary' 形式の応答を辞書に変換する（知らないパスの行は無視する）"""
+    known = set(paths)
+    summaries = {}
+    for line in text.splitlines():
+        line = line.strip().lstrip("-*").strip().strip("`")
+        path, sep, summary = line.partition(": ")
+        path = path.strip("`")
+        if sep and path in known and summary.strip():
+            summaries[path] = summary.strip()
+    return summaries
+
+def summarize_files(client, files: List[FileDiff]) -> Dict[str, str]:
+    """複数ファイルの1行要約を1回のリクエストでまとめて生成する"""
+    if not files:
+        return {}
+    body = "\n".join(render_file_xml(fd) for fd in files)
+    prompt = t("prompt.file_summary_instruction", f"<changeset>\n{body}\n</changeset>")
+    text, _ = client.generate(prompt)
+    return _parse_summary_lines(text, [fd.path for fd in files])
+
+def load_file_summaries(files: List[FileDiff], config: dict, cache, client_factory=None) -> Dict[str, str]:
+    """
+    大きな changeset を繰り返し生成する場合に、前回の実行から変わっていないファイルの要約を返す。
+
+    - 描画済みの <file> 断片がキャッシュにある = 前回の実行でも同じ blob の組み合わせだったファイル
+    - 新しくステージされたファイルが1つもない場合は、全ファイルを詳細のまま送る
+    - 要約が未生成のファイルは1回のリクエストでまとめて要約し、キャッシュに保存する
+    """
+    cache_config = config.get("cache", {})
+    if cache is None or not cache_config.get("file_summaries", False):
+        return {}
+
+    threshold = cache_config.get("summary_threshold", DEFAULT_SUMMARY_THRESHOLD)
+    if sum(len(line) for fd in files for line in fd.lines) < threshold:
+        return {}
+
+    keyed = [fd for fd in files if fd.cache_key()]
+    seen_keys = cache.get_many(FILE_XML_NAMESPACE, [fd.cache_key() for fd in keyed])
+    unchanged = [fd for fd in keyed if fd.cache_key() in seen_keys]
+    if not unchanged or len(unchanged) == len(files):
+        return {}
+
+    stored = cache.get_many(FILE_SUMMARY_NAMESPACE, [_summary_key(fd) for fd in unchanged])
+    summaries = {fd.path: stored[_summary_key(fd)] for fd in unchanged if _summary_key(fd) in stored}
+
+    missing = [fd for fd in unchanged if fd.path not in summaries]
+    if missing:
+        llm_config = config.get("llm", {})
+        if not llm_config.get("provider"):
+            return summaries
+        if client_factory is None:
+            client_factory = create_llm_client
+        try:
+            generated = summarize_files(client_factory(llm_config), missing)
+        except Exception:
+            # 要約は最適化にすぎないので、失敗しても詳細な diff で続行する
+            return summaries
+        by_path = {fd.path: fd for fd in missing}
+        cache.put_many(FILE_SUMMARY_NAMESPACE, [(_summary_key(by_path[p]), s) for p, s in generated.items()])
+        summaries.update(generated)
+
+    return summaries
+
+MAP_SUMMARY_NAMESPACE = "map_summary"
+
+DEFAULT_MAX_INPUT_CHARS = 300000
+DEFAULT_MAP_GROUP_CHARS = 60000
+DEFAULT_MAP_CONCURRENCY = 4
+
+def needs_map_reduce(prompt: str, llm_config: dict) -> bool:
+    """プロンプトが1回のリクエストに収まらない場合（または常時有効の場合）に True"""
+    mode = llm_config.get("map_reduce", "auto")
+    if mode is True or mode == "always":
+        return True
+    if mode is False or mode == "never":
+        return False
+    return len(prompt) > llm_config.get("max_input_chars", DEFAULT_MAX_INPUT_CHARS)
+
+def group_fragments(fragments: List[str], budget: int, files: Optional[List[FileDiff]] = None) -> List[str]:
+    """
+    <file> 断片を budget 文字以内のグループにまとめる。
+    1ファイルだけで budget を超える断片は、files（fragments と同じ順の FileDiff）があればチャンクの境界で
+    分割する（XML のタグの途中では切らない）。分割できない断片はそのまま1つのグループにする。
+    """
+    groups: List[str] = []
+    current: List[str] = []
+    size = 0
+
+    def flush():
+        nonlocal current, size
+        if current:
+            groups.append("\n".join(current))
+        current, size = [], 0
+
+    for i, fragment in enumerate(fragments):
+        if len(fragment) > budget:
+            flush()
+            fd = files[i] if files else None
+            groups.extend(split_file_xml(fd, budget) if fd is not None and not fd.is_submodule else [fragment])
+            continue
+        if size + len(fragment) > budget:
+            flush()
+        current.append(fragment)
+        size += len(fragment) + 1
+
+    flush()
+    return groups
+
+class MapReducePlan:
+    """
+    changeset をグループに分けて並列に要約（map）し、要約からコミットメッセージを生成する（reduce）ための計画。
+    各グループの要約はキャッシュされるので、途中で失敗しても再実行時は未完了のグループだけを処理する。
+    """
+
+    def __init__(self, llm_config: dict, system_prompt: str, recent_logs, user_context: str,
+                 files: List[FileDiff], cache=None, client_factory=None):
+        self.llm_config = llm_config
+        self.system_prompt = system_prompt
+        self.recent_logs = recent_logs
+        self.user_context = user_context
+        self.cache = cache
+        self.client_factory = client_factory or create_llm_client
+        self.concurrency = max(1, int(llm_config.get("map_concurrency", DEFAULT_MAP_CONCURRENCY)))
+
+        budget = int(llm_config.get("map_group_chars", DEFAULT_MAP_GROUP_CHARS))
+        self.groups = self._build_groups(files, budget)
+        self.summaries: List[str] = [""] * len(self.groups)
+        # グループごとの要約にかかった時間（秒）。キャッシュ済みのグループは含まない
+        self.latencies: Dict[int, float] = {}
+        # 呼び出し側（TUI の q など）が cancel() するとすべてのグループのリクエストを打ち切る
+        self.cancel_token = CancellationToken()
+
+    def _build_groups(self, files: List[FileDiff], budget: int) -> List[str]:
+        return group_fragments(render_files_xml(files, cache=self.cache), budget, files)
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def progress_title(self) -> str:
+        return t("main.map_progress", len(self.groups))
+
+    def map_prompt(self, index: int) -> str:
+        return t("prompt.map_instruction", index + 1, len(self.groups), f"<changeset>\n{self.groups[index]}\n</changeset>")
+
+    def _cache_key(self, index: int) -> str:
+        raw = "\0".join([
+            str(self.llm_config.get("provider", "")),
+            str(self.llm_config.get("model", "")),
+            self.map_prompt(index)
+        ])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _summarize_group(self, index: int) -> str:
+        start = time.perf_counter()
+        client = self.client_factory(self.llm_config)
+        text = ""
+        for chunk, _ in client.stream(self.map_prompt(index), self.cancel_token):
+            if chunk:
+                text += chunk
+        self.latencies[index] = time.perf_counter() - start
+        return text.strip()
+
+    def latency_report(self) -> List[str]:
+        """要約にかかった時間（遅い順）"""
+        return [
+            f"Part {i + 1}/{len(self.groups)}: {seconds:.1f}s"
+            for i, seconds in sorted(self.latencies.items(), key=lambda item: item[1], reverse=True)
+        ]
+
+    def run_map(self, on_progress=None) -> List[str]:
+        """
+        全グループを要約する。on_progress(done, total) は各グループの完了時に呼ばれる。
+        失敗したグループがあれば、他のグループの完了（とキャッシュ保存）を待ってから最初の例外を送出する。
+        """
+        total = len(self.groups)
+        keys = [self._cache_key(i) for i in range(total)]
+        cached = self.cache.get_many(MAP_SUMMARY_NAMESPACE, keys) if self.cache else {}
+
+        pending = []
+        for i, key in enumerate(keys):
+            if key in cached:
+                self.summaries[i] = cached[key]
+            elif not self.summaries[i]:
+                pending.append(i)
+
+        done = total - len(pending)
+        if on_progress:
+            on_progress(done, total)
+
+        errors = []
+        try:
+            for i, future in run_bounded(self._summarize_group, pending, self.concurrency):
+                try:
+                    self.summaries[i] = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if self.cache:
+                    self.cache.put(MAP_SUMMARY_NAMESPACE, keys[i], self.summaries[i])
+                done += 1
+                if on_progress:
+                    on_progress(done, total)
+        except BaseException:
+            # Ctrl-C など: 実行中のリクエストを打ち切る（未開始のグループは run_bounded がキャンセルする）
+            self.cancel_token.cancel()
+            raise
+
+        if errors:
+            raise errors[0]
+        return self.summaries
+
+    def reduce_prompt(self) -> str:
+        """map の結果から最終的なプロンプトを組み立てる"""
+        return "\n".join(self._prompt_header() + self._summary_sections())
+
+    def _summary_sections(self) -> List[str]:
+        sections = [t("prompt.reduce_title")]
+        for i, summary in enumerate(self.summaries):
+            sections.append(f"### Part {i + 1}/{len(self.summaries)}\n{summary}\n")
+        return sections
+
+    def _prompt_header(self) -> List[str]:
+        return [section.text for section in build_header_sections(self.system_prompt, self.recent_logs, self.user_context)]
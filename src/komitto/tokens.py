@@ -0,0 +1,176 @@
+import string
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .i18n import t
+from .prompt import PromptSection, SECTION_FILE, FileDiff
+
+# プロバイダー → トークナイザーの系統
+FAMILY_BY_PROVIDER = {
+    "openai": "openai",
+    "anthropic": "anthropic",
+    "gemini": "gemini",
+    "ollama": "llama",
+    "llamacpp": "llama",
+    "llama.cpp": "llama",
+}
+
+# cl100k/o200k 系を基準にした系統ごとの補正係数（同じテキストでの概算トークン数の比）
+_FAMILY_SCALE = {
+    "openai": 1.0,
+    "anthropic": 1.1,
+    "gemini": 0.95,
+    "llama": 1.1,
+}
+
+# ローカル実行のプロバイダーは費用がかからない
+_FREE_PROVIDERS = {"ollama", "llamacpp", "llama.cpp"}
+
+# 出力トークン数の見込み（コミットメッセージ1件分）。[llm] expected_output_tokens で上書きできる
+DEFAULT_OUTPUT_TOKENS = 256
+
+def _class_table(chars: bytes) -> bytes:
+    table = bytearray(b" " * 256)
+    for c in chars:
+        table[c] = ord("a")
+    return bytes(table)
+
+_LETTERS = _class_table(string.ascii_letters.encode("ascii"))
+_DIGITS = string.digits.encode("ascii")
+_PUNCT = string.punctuation.encode("ascii")
+_ASCII = bytes(range(128))
+_UTF8_LEADING = bytes(range(0xC0, 0x100))
+
+def estimate_tokens(text: str, family: str = "openai") -> int:
+    """
+    BPE トークナイザー（cl100k 系）の挙動に合わせた概算トークン数。
+    語彙ファイルもネットワークも使わず、バイト単位の C 実装の操作（translate/count/split）だけで
+    数えるので、MB 単位のテキストでも数十ミリ秒で終わる。
+
+    - 英字の連続（単語）は1トークン、長い単語は約5文字ごとに1トークン追加
+    - 数字は最大3桁ごとに1トークン
+    - 記号は隣接する記号と結合することが多いので 0.7 トークン
+    - 改行（とそれに続くインデント）は1トークン
+    - 非 ASCII 文字（CJK など）は1文字1トークン
+    """
+    if not text:
+        return 0
+    data = text.encode("utf-8", errors="replace")
+
+    letters_map = data.translate(_LETTERS)
+    letters = letters_map.count(b"a")
+    words = len(letters_map.split())
+    long_word_extra = max(0, letters - words * 6) / 5
+
+    digits = len(data) - len(data.translate(None, _DIGITS))
+    punct = len(data) - len(data.translate(None, _PUNCT))
+    newlines = data.count(b"\n")
+
+    non_ascii = data.translate(None, _ASCII)
+    # UTF-8 の先頭バイト（0xC0 以上）の数 = 非 ASCII の文字数
+    wide_chars = len(non_ascii) - len(non_ascii.translate(None, _UTF8_LEADING))
+
+    tokens = words + long_word_extra + digits / 3 + punct * 0.7 + newlines + wide_chars
+    return int(round(tokens * _FAMILY_SCALE.get(family, 1.0)))
+
+def tokenizer_family(llm_config: dict) -> str:
+    """[llm] の tokenizer で明示されていなければ provider から系統を決める"""
+    family = llm_config.get("tokenizer")
+    if family:
+        return family
+    return FAMILY_BY_PROVIDER.get(str(llm_config.get("provider", "")).lower(), "openai")
+
+def model_price(config: dict) -> Optional[Tuple[float, float]]:
+    """
+    [pricing."<model>"] の (入力, 出力) 単価（USD / 100万トークン）。
+    ローカルのプロバイダーは (0, 0)、単価が設定されていなければ None。
+    """
+    llm_config = config.get("llm", {})
+    if str(llm_config.get("provider", "")).lower() in _FREE_PROVIDERS:
+        return 0.0, 0.0
+    price = config.get("pricing", {}).get(str(llm_config.get("model", "")))
+    if not isinstance(price, dict):
+        return None
+    return float(price.get("input", 0.0)), float(price.get("output", 0.0))
+
+@dataclass
+class SectionEstimate:
+    kind: str
+    label: str
+    chars: int
+    tokens: int
+
+@dataclass
+class PromptEstimate:
+    """送信前のトークン数・費用の見積もり"""
+    family: str
+    sections: List[SectionEstimate]
+    output_tokens: int
+    price: Optional[Tuple[float, float]]
+
+    @property
+    def input_tokens(self) -> int:
+        return sum(s.tokens for s in self.sections)
+
+    def section_cost(self, section: SectionEstimate) -> Optional[float]:
+        if self.price is None:
+            return None
+        return section.tokens * self.price[0] / 1_000_000
+
+    @property
+    def cost(self) -> Optional[float]:
+        """入力と見込み出力を合わせた費用（USD）。単価不明なら None"""
+        if self.price is None:
+            return None
+        return (self.input_tokens * self.price[0] + self.output_tokens * self.price[1]) / 1_000_000
+
+def estimate_prompt(sections: List[PromptSection], config: dict) -> PromptEstimate:
+    llm_config = config.get("llm", {})
+    family = tokenizer_family(llm_config)
+    # セクションの区切りの改行は1トークンとして各セクションに含める
+    estimates = [
+        SectionEstimate(s.kind, s.label, len(s.text) + 1, estimate_tokens(s.text, family) + 1)
+        for s in sections
+    ]
+    output_tokens = int(llm_config.get("expected_output_tokens", DEFAULT_OUTPUT_TOKENS))
+    return PromptEstimate(family, estimates, output_tokens, model_price(config))
+
+def compaction_summaries(files: List[FileDiff], estimate: PromptEstimate, max_cost: float,
+                         summaries: Optional[Dict[str, str]] = None) -> Optional[Dict[str, str]]:
+    """
+    費用が max_cost に収まるまで、大きいファイルから順に diff を変更行数の要約に置き換える。
+    収まらない場合や単価が不明な場合は None。
+    """
+    if estimate.price is None or estimate.price[0] <= 0:
+        return None
+    summaries = dict(summaries or {})
+    budget = max_cost * 1_000_000 - estimate.output_tokens * estimate.price[1]
+    budget_tokens = budget / estimate.price[0]
+
+    by_path = {fd.path: fd for fd in files}
+    total = estimate.input_tokens
+    file_sections = sorted(
+        (s for s in estimate.sections if s.kind == SECTION_FILE and s.label not in summaries),
+        key=lambda s: s.tokens,
+        reverse=True
+    )
+    for section in file_sections:
+        if total <= budget_tokens:
+            break
+        fd = by_path.get(section.label)
+        if fd is None:
+            continue
+        summary = _stat_summary(fd)
+        summaries[fd.path] = summary
+        # 要約後の <file> 要素はおおよそ要約文＋タグ分
+        total -= section.tokens - (estimate_tokens(summary, estimate.family) + 20)
+
+    if total > budget_tokens:
+        return None
+    return summaries
+
+def _stat_summary(fd: FileDiff) -> str:
+    added = sum(1 for line in fd.lines if line.startswith("+") and not line.startswith("+++"))
+    removed = sum(1 for line in fd.lines if line.startswith("-") and not line.startswith("---"))
+    hunks = sum(1 for line in fd.lines if line.startswith("@@"))
+    return t("prompt.compacted_summary", added, removed, hunks)
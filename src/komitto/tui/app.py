@@ -1,14 +1,24 @@
 from textual.app import App, ComposeResult
-from textual.widgets import Footer, Static, Markdown, Label
+from textual.widgets import Footer, Static, Markdown, Label, Input, Log
 from textual.containers import Container, Vertical, Horizontal
 from textual.binding import Binding
 from textual import work
 from textual.reactive import reactive
 import pyperclip
+import time
 
 from komitto.llm import create_llm_client
-from komitto.git_utils import git_commit
+from komitto.llm.base import CancellationToken, LLMCancelledError, combine_usage
+from komitto.llm.events import StreamMetrics, TextDelta, Usage
+from komitto.git_utils import git_commit_async
 from komitto.editor import launch_editor
+from komitto.refine import Candidate, CandidateHistory, MODE_FULL, MODE_REFINE
+from komitto.postprocess import MessageRules, StreamCleaner, clean_events, format_message, postprocess, result_notes
+from komitto.session import SESSION_COMPARE, SESSION_SINGLE, STREAM_MAIN, begin_session
+
+# n で一度に生成する候補の数（[llm] candidates、1〜9 キーで選ぶので最大 9）
+DEFAULT_CANDIDATES = 3
+MAX_CANDIDATES = 9
 
 
 class CustomHeader(Static):
@@ -25,6 +35,8 @@ class KomittoApp(App):
     """A TUI for generating and reviewing commit messages."""
 
     CSS_PATH = "styles.tcss"
+    # 非表示の修正指示入力欄にフォーカスが移ってキー操作を奪わないようにする
+    AUTO_FOCUS = None
     
     BINDINGS = [
         Binding("q", "quit", "Quit"),
@@ -32,6 +44,14 @@ class KomittoApp(App):
         Binding("e", "edit", "Edit"),
         Binding("c", "copy", "Copy"),
         Binding("r", "regenerate", "Regenerate"),
+        Binding("f", "refine", "Refine"),
+        Binding("p", "preview", "Preview"),
+        Binding("n", "candidates", "Candidates"),
+        *[Binding(str(i), f"pick_candidate({i - 1})", f"Pick {i}", show=False) for i in range(1, MAX_CANDIDATES + 1)],
+        Binding("left_square_bracket", "prev_candidate", "Prev", show=False),
+        Binding("right_square_bracket", "next_candidate", "Next", show=False),
+        Binding("escape", "cancel_refine", "Cancel refine", show=False),
+        Binding("x", "cancel_commit", "Cancel commit", show=False),
         Binding("a", "select_a", "Select A", show=False),
         Binding("b", "select_b", "Select B", show=False),
     ]
@@ -40,6 +60,8 @@ class KomittoApp(App):
     STATE_GENERATING = "generating"
     STATE_REVIEW = "review"
     STATE_COMPARE = "compare" # 比較選択待ち
+    STATE_COMMITTING = "committing" # git commit（フック）実行中
+    STATE_CANDIDATES = "candidates" # 複数候補の生成・選択待ち
 
     current_state = reactive(STATE_GENERATING)
     generated_text = reactive("") # シングルモード用、または選択後のテキスト
@@ -48,10 +70,19 @@ class KomittoApp(App):
     generated_text_a = reactive("")
     generated_text_b = reactive("")
 
-    def __init__(self, config: dict | None = None, prompt: str = "", compare_configs: list[tuple[str, dict]] | None = None, **kwargs):
+    def __init__(self, config: dict | None = None, prompt: str = "", compare_configs: list[tuple[str, dict]] | None = None, map_reduce=None, draft: str = "",
+                 options: dict | None = None, journal=None, resume=None, preview=None, cache=None, **kwargs):
         super().__init__(**kwargs)
         self.prompt_text = prompt
+        # LLM の最初のトークンが届くまで表示し、生成に失敗したときは候補として残すヒューリスティックな下書き
+        self.draft = draft
         self.compare_configs = compare_configs
+        # 巨大な changeset の場合、最初の生成前に map フェーズを実行する
+        self.map_reduce = map_reduce
+        # 送信前にセクションごとのトークン数を確認し、ファイルやハンクを外す（PromptPreview）
+        self.preview = preview
+        # 後処理で回避できた再生成の回数を記録する呼び出し元のキャッシュ（無効なら None）
+        self.cache = cache
         
         if self.compare_configs:
             self.is_compare_mode = True
@@ -71,6 +102,20 @@ class KomittoApp(App):
             self.is_compare_mode = False
             self.config = config
 
+        # セッション内の候補履歴（ネットワークなしで前後に切り替えられる）
+        self.history = CandidateHistory(self.prompt_text)
+        # n で生成した候補（生成が終わるまでは None）
+        self.choices: list[str] | None = None
+        # 実行中の生成リクエスト。q で終了するときに HTTP ストリームを閉じる
+        self.cancel_token = CancellationToken()
+
+        # 生成の記録（SessionJournal、--resume 用）。options は設定の選び方、resume は再開するセッション
+        self.journal = journal
+        self.options = options or {}
+        self.resume = resume
+        # 比較モードで選んだ後は、選んだ側のストリームに記録を続ける
+        self.journal_stream = (resume.selected if resume is not None else None) or STREAM_MAIN
+
     def compose(self) -> ComposeResult:
         """Create child widgets for the app."""
         yield CustomHeader("Komitto - AI Commit Message Generator", id="custom-header")
@@ -88,14 +133,26 @@ class KomittoApp(App):
                 with Vertical(id="content-area"):
                     yield Label("⏳ Generating commit message...", id="status-label", classes="status-generating")
                     yield Markdown("", id="markdown-view")
-                    yield Label("", id="stats-label", classes="stats-label")
+                    yield from self._single_view_extras()
 
         yield Footer()
 
+    def _single_view_extras(self) -> list:
+        """Widgets shared by the initial single view and the view mounted after a compare selection."""
+        return [
+            Input(placeholder="Refine instruction (e.g. shorter, more detail on X) - Enter to send, Esc to cancel", id="refine-input", classes="hidden"),
+            Log(id="commit-log", classes="hidden"),
+            Label("", id="stats-label", classes="stats-label"),
+        ]
+
     def on_mount(self) -> None:
         """Called when app starts."""
         self.title = "Komitto"
-        if self.is_compare_mode:
+        if self.resume is not None:
+            self._restore_session()
+        elif self.preview is not None and not self.is_compare_mode:
+            self._show_preview()
+        elif self.is_compare_mode:
             self.generate_compare()
         else:
             self.generate_message()
@@ -128,6 +185,17 @@ class KomittoApp(App):
             
         elif state == self.STATE_COMPARE:
             pass  # Footer will display key bindings
+
+        elif state == self.STATE_CANDIDATES:
+            status_label = self.query_one("#status-label")
+            status_label.remove_class("status-ready")
+            status_label.add_class("status-generating")
+
+        elif state == self.STATE_COMMITTING:
+            status_label = self.query_one("#status-label")
+            status_label.update("📤 Committing... running hooks (x: cancel)")
+            status_label.remove_class("status-ready")
+            status_label.add_class("status-generating")
             
         elif state == self.STATE_REVIEW:
             # 比較モードから遷移してきた場合、レイアウトを切り替える必要があるが
@@ -150,6 +218,7 @@ class KomittoApp(App):
                     Vertical(
                         Label("✅ Review selected message", id="status-label", classes="status-ready"),
                         Markdown(self.generated_text, id="markdown-view"),
+                        *self._single_view_extras(),
                         id="content-area"
                     )
                 )
@@ -157,17 +226,29 @@ class KomittoApp(App):
             # シングルモードの場合の更新
             try:
                 status_label = self.query_one("#status-label")
-                status_label.update("✅ Review generated message")
+                position = f" ({self.history.position()})" if len(self.history) > 1 else ""
+                status_label.update(f"✅ Review generated message{position}")
                 status_label.remove_class("status-generating")
                 status_label.add_class("status-ready")
             except: pass
 
+    def _watch_quota(self, client):
+        """Shows the expected wait when the shared rate limit ([llm] rpm/tpm) queues a request."""
+        def notify(wait: float) -> None:
+            self.app.call_from_thread(self.notify, f"⏳ Queued by the shared rate limit: ~{wait:.0f}s",
+                                      timeout=max(3.0, wait))
+        client.on_quota_wait = notify
+        return client
+
     @work(exclusive=True, thread=True)
-    def generate_message(self) -> None:
+    def generate_message(self, mode: str = MODE_FULL, instruction: str = "") -> None:
         """Generate commit message in background (Single mode)."""
-        import time
         self.app.call_from_thread(setattr, self, "current_state", self.STATE_GENERATING)
-        self.app.call_from_thread(setattr, self, "generated_text", "")
+        draft = self.draft if mode == MODE_FULL and not len(self.history) else ""
+        self.app.call_from_thread(setattr, self, "generated_text", draft)
+        stats_label = self.query_one("#stats-label")
+        if draft:
+            self.app.call_from_thread(stats_label.update, "📝 Heuristic draft - waiting for the LLM...")
 
         llm_config = self.config.get("llm", {})
         if not llm_config or not llm_config.get("provider"):
@@ -175,47 +256,212 @@ class KomittoApp(App):
             return
 
         try:
-            client = create_llm_client(llm_config)
+            if self.map_reduce is not None:
+                self._run_map_phase()
+            self._begin_session()
+
+            cancel_token = self.cancel_token
+            client = self._watch_quota(create_llm_client(llm_config))
+            if mode == MODE_REFINE:
+                messages = self.history.refine_messages(instruction)
+            else:
+                messages = self.history.full_messages()
             full_text = ""
-            usage_stats = None
-            start_time = time.time()
-            input_chars = len(self.prompt_text)
-            
-            for chunk, usage in client.stream_commit_message(self.prompt_text):
-                if chunk:
-                    full_text += chunk
+            metrics = StreamMetrics()
+            rules = MessageRules.from_config(self.config)
+
+            cleaner = StreamCleaner()
+            events = clean_events(client.events(messages, cancel_token, metrics), rules, cleaner)
+            if self.journal is not None:
+                events = self.journal.tap(events, self.journal_stream, mode, instruction)
+            for event in events:
+                if isinstance(event, TextDelta):
+                    full_text += event.text
                     self.app.call_from_thread(setattr, self, "generated_text", full_text)
-                
-                if usage:
-                    usage_stats = usage
-                
-                # Update statistics
-                elapsed = time.time() - start_time
-                if elapsed > 0:
-                    stats_text = ""
-                    if usage_stats:
-                        p_tok = usage_stats.get('prompt_tokens', '?')
-                        c_tok = usage_stats.get('completion_tokens', '?')
-                        t_tok = usage_stats.get('total_tokens', '?')
-                        speed = c_tok / elapsed if isinstance(c_tok, int) else 0
-                        stats_text = f"📊 Input: {input_chars} chars ({p_tok} tok) | Output: {c_tok} tok | Total: {t_tok} tok | Speed: {speed:.1f} tok/s"
-                    else:
-                        est_tok = len(full_text) // 4
-                        speed = len(full_text) / elapsed
-                        stats_text = f"📊 Input: {input_chars} chars | Est. Output: ~{est_tok} tok | Speed: {speed:.1f} char/s"
-                    
-                    try:
-                        stats_label = self.query_one("#stats-label")
-                        self.app.call_from_thread(stats_label.update, stats_text)
-                    except:
-                        pass
-            
+                elif not isinstance(event, Usage):
+                    continue
+                self.app.call_from_thread(stats_label.update, f"📊 {metrics.describe()}")
+
+            result = postprocess(full_text, rules, client, cancel_token, cleaned=cleaner.removed)
+            full_text = result.text
+            self.app.call_from_thread(setattr, self, "generated_text", full_text)
+            if self.journal is not None:
+                self.journal.revise(self.journal_stream, full_text)
+            for note in result_notes(result, self.cache):
+                self.app.call_from_thread(self.notify, note, severity="warning" if result.problems else "information")
+
+            candidate = Candidate(
+                text=full_text,
+                mode=mode,
+                instruction=instruction,
+                usage=metrics.usage_dict,
+                elapsed=metrics.elapsed,
+                messages=messages,
+                metrics=metrics
+            )
+            self.app.call_from_thread(self.history.add, candidate)
+            comparison = self.history.compare_to_full(candidate)
+            if comparison:
+                self.app.call_from_thread(self.notify, comparison, severity="information")
             self.app.call_from_thread(setattr, self, "current_state", self.STATE_REVIEW)
-            
+
+        except LLMCancelledError:
+            pass
         except Exception as e:
             self.app.call_from_thread(self.notify, f"Error: {e}", severity="error")
+            if draft and not len(self.history):
+                # プロバイダーが失敗・タイムアウトした場合は下書きを候補にして、編集やコミットができるようにする
+                self.app.call_from_thread(self.history.add, Candidate(text=draft, mode=mode))
+                self.app.call_from_thread(setattr, self, "generated_text", draft)
+                self.app.call_from_thread(stats_label.update, "📝 Heuristic draft (the LLM request failed)")
             self.app.call_from_thread(setattr, self, "current_state", self.STATE_REVIEW)
 
+    @work(exclusive=True, thread=True)
+    def generate_candidates(self) -> None:
+        """Generate several alternatives at once and let the user pick one with a number key."""
+        self.app.call_from_thread(setattr, self, "current_state", self.STATE_CANDIDATES)
+        llm_config = self.config.get("llm", {})
+        n = max(2, min(MAX_CANDIDATES, int(llm_config.get("candidates", DEFAULT_CANDIDATES))))
+        temperature = llm_config.get("candidate_temperature")
+        status_label = self.query_one("#status-label")
+        stats_label = self.query_one("#stats-label")
+        self.app.call_from_thread(status_label.update, f"⏳ Generating {n} candidates...")
+        self.choices = None
+
+        texts = [""] * n
+        usages = {}
+        start = time.perf_counter()
+        try:
+            client = self._watch_quota(create_llm_client(llm_config))
+            stream = client.stream_candidates(self.history.full_messages(), n, temperature, self.cancel_token)
+            for text, usage, index in stream:
+                if usage:
+                    usages[index] = usage
+                if text is None:
+                    # 途中で失敗した候補は選べないようにする
+                    texts[index] = ""
+                    self.app.call_from_thread(setattr, self, "generated_text", self._render_choices(texts))
+                elif text:
+                    texts[index] += text
+                    self.app.call_from_thread(setattr, self, "generated_text", self._render_choices(texts))
+        except LLMCancelledError:
+            return
+        except Exception as e:
+            self._candidates_failed(f"Error: {e}")
+            return
+
+        rules = MessageRules.from_config(self.config)
+        self.choices = [choice for choice in (format_message(text, rules) for text in texts if text.strip()) if choice]
+        if not self.choices:
+            self._candidates_failed("Error: every candidate came back empty")
+            return
+        self.app.call_from_thread(setattr, self, "generated_text", self._render_choices(self.choices))
+        self.app.call_from_thread(status_label.update, f"🔢 Press 1-{len(self.choices)} to pick a candidate")
+        usage = combine_usage(usages.values())
+        if usage:
+            self.app.call_from_thread(stats_label.update, f"📊 {len(self.choices)} candidates / Input: {usage.get('prompt_tokens')} toks / "
+                                                          f"Output: {usage.get('completion_tokens')} toks / {time.perf_counter() - start:.2f}s")
+
+    def _candidates_failed(self, message: str) -> None:
+        """候補が1つも得られなかった場合は、現在の候補（なければヒューリスティックな下書き）のレビューに戻す（worker スレッド）"""
+        self.choices = None
+        self.app.call_from_thread(self.notify, message, severity="error")
+        if not len(self.history) and self.draft:
+            self.app.call_from_thread(self.history.add, Candidate(text=self.draft, mode=MODE_FULL))
+        self.app.call_from_thread(setattr, self, "generated_text", self.history.current.text if self.history.current else "")
+        self.app.call_from_thread(setattr, self, "current_state", self.STATE_REVIEW)
+
+    @staticmethod
+    def _render_choices(texts: list[str]) -> str:
+        return "\n\n---\n\n".join(f"**{i}.**\n\n{text}" for i, text in enumerate(texts, 1) if text)
+
+    def action_candidates(self) -> None:
+        if self.current_state == self.STATE_REVIEW and not self.is_compare_mode:
+            self.generate_candidates()
+
+    def action_pick_candidate(self, index: int) -> None:
+        if self.current_state != self.STATE_CANDIDATES or not self.choices or index >= len(self.choices):
+            return
+        # どの候補も [ ] で行き来できるよう履歴に入れ、選んだものを現在の候補にする
+        position = len(self.history) + index
+        for text in self.choices:
+            self.history.add(Candidate(text=text, messages=self.history.full_messages()))
+        self.history.index = position
+        text = self.choices[index]
+        if self.journal is not None:
+            self.journal.candidate(self.journal_stream, text)
+        self.choices = None
+        self.generated_text = text
+        self.current_state = self.STATE_REVIEW
+
+    def _begin_session(self) -> None:
+        """最初の生成の前に、プロンプトと設定をジャーナルに記録する（worker スレッド）"""
+        if self.journal is None or self.journal.session is not None:
+            return
+        if self.is_compare_mode:
+            streams = [(key, prompt, {"context_name": name}, cfg)
+                       for key, (name, cfg, prompt) in zip("ab", self.compare_configs)]
+            self.journal = begin_session(self.journal, SESSION_COMPARE, streams)
+        else:
+            self.journal = begin_session(self.journal, SESSION_SINGLE,
+                                         [(STREAM_MAIN, self.prompt_text, self.options, self.config)])
+
+    def _restore_session(self) -> None:
+        """--resume: 記録された候補（と中断された生成の途中まで）をプロバイダーを呼ばずに表示する"""
+        session = self.resume
+        if self.journal is not None:
+            self.journal.restore(session)
+        if self.is_compare_mode:
+            self.generated_text_a = session.streams["a"].latest
+            self.generated_text_b = session.streams["b"].latest
+            self.current_state = self.STATE_COMPARE
+            return
+
+        state = session.streams[self.journal_stream]
+        for candidate in state.candidates:
+            self.history.add(Candidate(text=candidate["text"], mode=candidate.get("mode", MODE_FULL),
+                                       instruction=candidate.get("instruction", ""),
+                                       messages=self.history.full_messages()))
+        if state.generating and state.text:
+            self.history.add(Candidate(text=state.text, messages=self.history.full_messages()))
+            self.notify("⚠️ The last generation was interrupted; showing the text received so far.", severity="warning")
+        self.generated_text = self.history.current.text if self.history.current else ""
+        self.current_state = self.STATE_REVIEW
+        self.query_one("#stats-label").update("♻️ Restored from the session journal (no new request)")
+
+    def _show_preview(self) -> None:
+        from komitto.tui.preview import PromptPreviewScreen
+
+        def on_close(send: bool | None) -> None:
+            if send:
+                # 外した部分を除いたプロンプトで生成する（それまでの候補は自分の会話を保持しているので残す）
+                self.prompt_text = self.preview.assemble()
+                self.history.prompt = self.prompt_text
+                self.generate_message()
+            elif not len(self.history):
+                self.exit()
+
+        self.push_screen(PromptPreviewScreen(self.preview, self.config), on_close)
+
+    def action_preview(self) -> None:
+        if self.current_state == self.STATE_REVIEW and self.preview is not None:
+            self._show_preview()
+
+    def _run_map_phase(self) -> None:
+        """Summarize changeset groups (worker thread) and switch to the reduce prompt."""
+        plan = self.map_reduce
+        plan.cancel_token = self.cancel_token
+        status_label = self.query_one("#status-label")
+
+        def on_progress(done: int, total: int) -> None:
+            self.app.call_from_thread(status_label.update, f"{plan.progress_title()}... {done}/{total}")
+
+        plan.run_map(on_progress)
+        self.prompt_text = plan.reduce_prompt()
+        self.history = CandidateHistory(self.prompt_text)
+        self.map_reduce = None
+        self.app.call_from_thread(status_label.update, "⏳ Generating commit message...")
+
     @work(exclusive=True, thread=True)
     def generate_compare(self) -> None:
         """Generate two messages in parallel."""
@@ -227,16 +473,23 @@ class KomittoApp(App):
         prompt_a = self.compare_configs[0][2]
         prompt_b = self.compare_configs[1][2]
 
+        self._begin_session()
+
         # 並列実行用のヘルパー
         def run_gen(cfg, prompt, target_attr):
             try:
                 llm_config = cfg.get("llm", {})
-                client = create_llm_client(llm_config)
+                client = self._watch_quota(create_llm_client(llm_config))
                 full_text = ""
-                for chunk, _ in client.stream_commit_message(prompt):
-                    if chunk:
-                        full_text += chunk
+                events = client.events(prompt, self.cancel_token)
+                if self.journal is not None:
+                    events = self.journal.tap(events, target_attr[-1])
+                for event in events:
+                    if isinstance(event, TextDelta):
+                        full_text += event.text
                         self.app.call_from_thread(setattr, self, target_attr, full_text)
+            except LLMCancelledError:
+                pass
             except Exception as e:
                 self.app.call_from_thread(self.notify, f"Error generating {target_attr}: {e}", severity="error")
 
@@ -253,25 +506,47 @@ class KomittoApp(App):
 
     def action_select_a(self) -> None:
         if self.current_state == self.STATE_COMPARE:
-            self.generated_text = self.generated_text_a
-            self.config = self.config_a # 選択した設定を現在の設定にする（再生成時などに使用）
-            self.prompt_text = self.compare_configs[0][2]
-            self.current_state = self.STATE_REVIEW
+            self._select_compare(self.generated_text_a, self.config_a, self.compare_configs[0][2], "a")
 
     def action_select_b(self) -> None:
         if self.current_state == self.STATE_COMPARE:
-            self.generated_text = self.generated_text_b
-            self.config = self.config_b
-            self.prompt_text = self.compare_configs[1][2]
-            self.current_state = self.STATE_REVIEW
+            self._select_compare(self.generated_text_b, self.config_b, self.compare_configs[1][2], "b")
+
+    def _select_compare(self, text: str, config: dict, prompt: str, stream: str) -> None:
+        self.generated_text = text
+        self.journal_stream = stream
+        if self.journal is not None:
+            self.journal.selected(stream)
+        self.config = config # 選択した設定を現在の設定にする（再生成時などに使用）
+        self.prompt_text = prompt
+        # 選択した候補を起点に refine できるよう履歴を作り直す
+        self.history = CandidateHistory(prompt)
+        self.history.add(Candidate(text=text, messages=self.history.full_messages()))
+        self.current_state = self.STATE_REVIEW
 
     def action_commit(self) -> None:
         if self.current_state != self.STATE_REVIEW:
             return
         
-        self.notify("📤 Committing...", severity="information")
+        commit_log = self.query_one("#commit-log", Log)
+        commit_log.clear()
+        commit_log.remove_class("hidden")
+        self.current_state = self.STATE_COMMITTING
         self.do_commit(self.generated_text)
 
+    async def action_quit(self) -> None:
+        # 生成中に終了する場合も、ストリームを閉じてからアプリを終了する
+        self.cancel_token.cancel()
+        if self.journal is not None:
+            # 途中までの生成を --resume で復元できるよう、バッファに残った差分を書き出す
+            self.journal.flush(sync=True)
+        self.exit()
+
+    def action_cancel_commit(self) -> None:
+        if self.current_state != self.STATE_COMMITTING:
+            return
+        self.workers.cancel_group(self, "commit")
+
     def action_edit(self) -> None:
         if self.current_state != self.STATE_REVIEW:
             return
@@ -282,6 +557,7 @@ class KomittoApp(App):
         
         if new_text != self.generated_text:
             self.generated_text = new_text
+            self.history.update_current_text(new_text)
             self.notify("✏️ Message updated from editor", severity="information")
 
     def action_copy(self) -> None:
@@ -295,16 +571,77 @@ class KomittoApp(App):
             return
         self.generate_message()
 
-    @work(thread=True)
-    def do_commit(self, message: str) -> None:
+    def action_refine(self) -> None:
+        if self.current_state != self.STATE_REVIEW:
+            return
+        refine_input = self.query_one("#refine-input", Input)
+        refine_input.remove_class("hidden")
+        refine_input.value = ""
+        refine_input.focus()
+
+    def action_cancel_refine(self) -> None:
         try:
-            success = git_commit(message)
-            if success:
-                self.app.call_from_thread(self.notify, "✅ Commit successful!", severity="information")
-                import time
-                time.sleep(1)
-                self.app.call_from_thread(self.exit)
-            else:
-                self.app.call_from_thread(self.notify, "❌ Commit failed.", severity="error")
+            refine_input = self.query_one("#refine-input", Input)
+        except Exception:
+            return
+        refine_input.add_class("hidden")
+        self.set_focus(None)
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        if event.input.id != "refine-input":
+            return
+        instruction = event.value.strip()
+        self.action_cancel_refine()
+        if instruction and self.current_state == self.STATE_REVIEW:
+            self.generate_message(MODE_REFINE, instruction)
+
+    def action_prev_candidate(self) -> None:
+        if self.current_state == self.STATE_REVIEW and len(self.history) > 1:
+            self._show_candidate(self.history.previous())
+
+    def action_next_candidate(self) -> None:
+        if self.current_state == self.STATE_REVIEW and len(self.history) > 1:
+            self._show_candidate(self.history.next())
+
+    def _show_candidate(self, candidate: Candidate | None) -> None:
+        if candidate is None:
+            return
+        self.generated_text = candidate.text
+        label = f"✅ Review generated message ({self.history.position()})"
+        if candidate.mode == MODE_REFINE:
+            label += f" - refined: {candidate.instruction}"
+        try:
+            self.query_one("#status-label").update(label)
+            usage = candidate.usage or {}
+            self.query_one("#stats-label").update(
+                f"📊 Input: {usage.get('prompt_tokens', '?')} tok | Output: {usage.get('completion_tokens', '?')} tok | Time: {candidate.elapsed:.1f}s"
+            )
+        except Exception:
+            pass
+
+    @work(exclusive=True, group="commit")
+    async def do_commit(self, message: str) -> None:
+        """Run git commit on the event loop, streaming hook output into the log panel."""
+        import asyncio
+        commit_log = self.query_one("#commit-log", Log)
+        try:
+            return_code = await git_commit_async(message, commit_log.write_line)
+        except asyncio.CancelledError:
+            commit_log.write_line("⚠️ Commit canceled.")
+            self.notify("⚠️ Commit canceled. Press y to retry.", severity="warning")
+            self.current_state = self.STATE_REVIEW
+            raise
         except Exception as e:
-            self.app.call_from_thread(self.notify, f"⚠️ Commit error: {e}", severity="error")
\ No newline at end of file
+            self.notify(f"⚠️ Commit error: {e}", severity="error")
+            self.current_state = self.STATE_REVIEW
+            return
+
+        if return_code == 0:
+            if self.journal is not None:
+                self.journal.committed()
+            self.exit(result=message, message="✅ Commit successful!")
+        else:
+            # メッセージは保持したままなので、フックの指摘を直して y で再実行できる（再生成は不要）
+            commit_log.write_line(f"❌ git commit exited with status {return_code}")
+            self.notify("❌ Commit failed. Fix the issue and press y to retry.", severity="error")
+            self.current_state = self.STATE_REVIEW
\ No newline at end of file
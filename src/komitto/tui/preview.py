@@ -0,0 +1,109 @@
+from rich.text import Text
+from textual.app import ComposeResult
+from textual.binding import Binding
+from textual.containers import Vertical
+from textual.screen import Screen
+from textual.widgets import DataTable, Footer, Label
+
+from komitto.preview import PromptPreview
+from komitto.prompt import SECTION_FILE
+from komitto.tokens import model_price
+
+# トークンの割合に応じた色（以上, 色）。大きいものから判定する
+HEAT_COLORS = [(0.25, "#e06c75"), (0.10, "#e5c07b"), (0.0, "#98c379")]
+HEAT_BAR_WIDTH = 20
+
+
+def heat_bar(tokens: int, total: int) -> Text:
+    share = tokens / total if total else 0.0
+    color = next(c for threshold, c in HEAT_COLORS if share >= threshold)
+    return Text(f"{'█' * round(share * HEAT_BAR_WIDTH):<{HEAT_BAR_WIDTH}} {share:4.0%}", style=color)
+
+
+class PromptPreviewScreen(Screen):
+    """Shows the prompt by section with estimated tokens, and lets files, chunks and history commits be left out."""
+
+    BINDINGS = [
+        Binding("space", "toggle", "Include/Exclude"),
+        Binding("enter", "send", "Send"),
+        Binding("escape", "cancel", "Cancel"),
+    ]
+
+    def __init__(self, preview: PromptPreview, config: dict | None = None, **kwargs):
+        super().__init__(**kwargs)
+        self.preview = preview
+        self.price = model_price(config or {})
+
+    def compose(self) -> ComposeResult:
+        with Vertical(id="preview-area"):
+            yield Label("", id="preview-summary")
+            yield DataTable(id="preview-table", cursor_type="row", zebra_stripes=True)
+        yield Footer()
+
+    def on_mount(self) -> None:
+        table = self.query_one(DataTable)
+        table.add_column("", key="mark", width=1)
+        table.add_column("Section", key="label")
+        table.add_column("Tokens", key="tokens")
+        table.add_column("Share", key="share")
+        for i, section in enumerate(self.preview.sections):
+            table.add_row(*self._section_cells(section), key=f"{i}")
+            for j, part in enumerate(section.parts):
+                table.add_row(*self._part_cells(section, part), key=f"{i}:{j}")
+        self._update_summary()
+        table.focus()
+
+    def _section_cells(self, section) -> list:
+        label = Text(f"📄 {section.label}" if section.kind == SECTION_FILE else section.label, style="bold")
+        mark = "✓" if section.sent else " "
+        if not section.sent:
+            label.stylize("dim strike")
+        return [mark, label, Text(f"{section.tokens:,}", justify="right"),
+                heat_bar(section.tokens, self.preview.total_tokens)]
+
+    def _part_cells(self, section, part) -> list:
+        label = Text(f"    {part.label}")
+        sent = section.included and part.included
+        if not sent:
+            label.stylize("dim strike")
+        return ["✓" if sent else " ", label, Text(f"{part.tokens:,}", style="dim", justify="right"), ""]
+
+    def _update_summary(self) -> None:
+        total = self.preview.total_tokens
+        summary = f"📊 ~{total:,} tokens ({self.preview.family})"
+        if self.price is not None:
+            summary += f" · ${total * self.price[0] / 1_000_000:.5f}"
+        if self.preview.excluded:
+            summary += f" · {self.preview.excluded} excluded"
+        self.query_one("#preview-summary").update(f"{summary}   (space: include/exclude, enter: send, esc: cancel)")
+
+    def action_toggle(self) -> None:
+        table = self.query_one(DataTable)
+        if not table.row_count:
+            return
+        key = table.coordinate_to_cell_key(table.cursor_coordinate).row_key.value
+        index, _, part = key.partition(":")
+        index = int(index)
+        self.preview.toggle(index, int(part) if part else None)
+
+        # 変わるのはこのセクションの行と、合計に対する割合の列だけ
+        section = self.preview.sections[index]
+        for column, value in zip(("mark", "label", "tokens"), self._section_cells(section)):
+            table.update_cell(f"{index}", column, value)
+        for j, p in enumerate(section.parts):
+            mark, label = self._part_cells(section, p)[:2]
+            table.update_cell(f"{index}:{j}", "mark", mark)
+            table.update_cell(f"{index}:{j}", "label", label)
+        for i, s in enumerate(self.preview.sections):
+            table.update_cell(f"{i}", "share", heat_bar(s.tokens, self.preview.total_tokens))
+        self._update_summary()
+
+    def action_send(self) -> None:
+        self.dismiss(True)
+
+    def on_data_table_row_selected(self, event: DataTable.RowSelected) -> None:
+        # フォーカスのある DataTable が enter を先に受け取る
+        self.dismiss(True)
+
+    def action_cancel(self) -> None:
+        self.dismiss(False)
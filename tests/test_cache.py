@@ -0,0 +1,151 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from komitto import cache as cache_module
+from komitto.cache import Cache, open_cache
+from komitto.llm.base import LLMClient
+from komitto.prompt import FILE_XML_NAMESPACE, parse_diff_to_xml, split_diff
+from komitto.summarize import load_file_summaries
+
+DIFF = """diff --git a.py a.py
+index 1111111111111111111111111111111111111111..2222222222222222222222222222222222222222 100644
+--- a.py
++++ a.py
+@@ -1 +1 @@ def foo():
+-    return 1
++    return 2
+diff --git b.py b.py
+index 3333333333333333333333333333333333333333..4444444444444444444444444444444444444444 100644
+--- b.py
++++ b.py
+@@ -0,0 +1 @@
++print("hi")
+"""
+
+
+class FakeClient(LLMClient):
+    def __init__(self, config):
+        self.prompts = []
+
+    def generate_commit_message(self, prompt):
+        self.prompts.append(prompt)
+        return "a.py: change foo return value", None
+
+
+class TestFileCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = Cache(Path(self.tmp.name) / "cache.sqlite3")
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_roundtrip(self):
+        self.cache.put("ns", "k", {"a": 1})
+        self.assertEqual(self.cache.get("ns", "k"), {"a": 1})
+        self.assertIsNone(self.cache.get("other", "k"))
+        self.assertEqual(self.cache.get_many("ns", ["k", "missing"]), {"k": {"a": 1}})
+
+    def test_split_diff_reads_blob_shas(self):
+        files = split_diff(DIFF)
+        self.assertEqual([f.path for f in files], ["a.py", "b.py"])
+        self.assertEqual(files[0].old_sha, "1" * 40)
+        self.assertEqual(files[1].new_sha, "4" * 40)
+
+    def test_fragments_are_cached_and_reused(self):
+        expected = parse_diff_to_xml(DIFF)
+        self.assertEqual(parse_diff_to_xml(DIFF, cache=self.cache), expected)
+
+        key = split_diff(DIFF)[0].cache_key()
+        self.assertIn("return 2", self.cache.get(FILE_XML_NAMESPACE, key))
+        self.assertEqual(parse_diff_to_xml(DIFF, cache=self.cache), expected)
+
+    def test_summaries_only_for_unchanged_files(self):
+        config = {"llm": {"provider": "fake"}, "cache": {"file_summaries": True, "summary_threshold": 0}}
+        first, second = split_diff(DIFF)
+
+        # 前回の実行では a.py のみステージされていた
+        parse_diff_to_xml("\n".join(["diff --git a.py a.py"] + first.lines), cache=self.cache)
+
+        clients = []
+        def factory(cfg):
+            clients.append(FakeClient(cfg))
+            return clients[-1]
+
+        summaries = load_file_summaries([first, second], config, self.cache, client_factory=factory)
+        self.assertEqual(summaries, {"a.py": "change foo return value"})
+        self.assertEqual(len(clients), 1)
+
+        # 2回目以降はキャッシュ済みの要約を使い、LLM を呼ばない
+        summaries = load_file_summaries([first, second], config, self.cache, client_factory=factory)
+        self.assertEqual(summaries, {"a.py": "change foo return value"})
+        self.assertEqual(len(clients), 1)
+
+        xml = parse_diff_to_xml(DIFF, cache=self.cache, summaries=summaries)
+        self.assertIn('<file path="a.py" detail="summary">', xml)
+        self.assertIn('print("hi")', xml)
+
+
+class TestPruning(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "cache.sqlite3"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def at(self, days_ago):
+        return mock.patch.object(cache_module.time, "time", return_value=time.time() - days_ago * 86400)
+
+    def test_unused_entries_expire_and_reads_keep_them(self):
+        with self.at(40):
+            cache = Cache(self.path)
+            cache.put_many("ns", [("old", 1), ("used", 2)])
+        with self.at(20):
+            self.assertEqual(cache.get("ns", "used"), 2)
+        cache.close()
+
+        # 開いたときに掃除する（前回の掃除から PRUNE_INTERVAL 以上経っている）
+        cache = Cache(self.path, max_age_days=30)
+        self.assertEqual(cache.get_many("ns", ["old", "used"]), {"used": 2})
+        cache.put("ns", "new", 3)
+        with self.at(-40):
+            self.assertEqual(cache.prune(), 2)
+        cache.close()
+
+    def test_oldest_entries_go_first_when_over_the_size_limit(self):
+        cache = Cache(self.path)
+        for day in range(20, 0, -1):
+            with self.at(day):
+                cache.put("ns", str(day), "x" * 100_000)
+        cache.close()
+
+        cache = Cache(self.path, max_bytes=500_000)
+        remaining = cache.get_many("ns", [str(day) for day in range(1, 21)])
+        self.assertTrue(0 < len(remaining) <= 5)
+        self.assertEqual(sorted(remaining, key=int), [str(day) for day in range(1, len(remaining) + 1)])
+        # 次に開いたときは PRUNE_INTERVAL が過ぎるまで掃除しない
+        with mock.patch.object(Cache, "prune") as prune:
+            Cache(self.path, max_bytes=500_000).close()
+        prune.assert_not_called()
+        cache.close()
+
+    def test_pruning_every_n_writes_and_config(self):
+        with mock.patch.object(cache_module, "PRUNE_EVERY", 3):
+            cache = Cache(self.path, max_age_days=1)
+            with self.at(10):
+                cache.put_many("ns", [("a", 1), ("b", 2)])
+            cache.put_many("ns", [("c", 3)])
+            self.assertEqual(cache.get_many("ns", ["a", "b", "c"]), {"c": 3})
+            cache.close()
+
+        cache = open_cache({"cache": {"path": str(self.path), "max_age_days": 0}})
+        self.assertEqual((cache.max_age_days, cache.max_bytes), (None, cache_module.DEFAULT_MAX_BYTES))
+        cache.close()
+
+if __name__ == '__main__':
+    unittest.main()
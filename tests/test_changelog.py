@@ -0,0 +1,99 @@
+import os
+import re
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+from komitto.cache import Cache
+from komitto.changelog import ChangelogBuilder, iter_commits, parse_subject
+from komitto.llm.base import LLMClient
+
+SUBJECTS = [
+    "feat(api): add endpoint",
+    "fix: handle empty input",
+    "update readme",
+    "perf(core)!: drop legacy path",
+    "deps: bump library",
+]
+
+
+class FakeClient(LLMClient):
+    calls = []
+
+    def __init__(self, config):
+        pass
+
+    def generate_commit_message(self, prompt):
+        shas = re.findall(r'<commit sha="([0-9a-f]+)">', prompt)
+        FakeClient.calls.append(shas)
+        return "\n".join(f"{sha}: summary {sha[:4]}" for sha in shas), None
+
+
+class TestChangelog(unittest.TestCase):
+    def setUp(self):
+        FakeClient.calls = []
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        repo = Path(self.tmp.name) / "repo"
+        repo.mkdir()
+        os.chdir(repo)
+        self.env = env = dict(os.environ, GIT_AUTHOR_NAME="a", GIT_AUTHOR_EMAIL="a@example.com",
+                              GIT_COMMITTER_NAME="a", GIT_COMMITTER_EMAIL="a@example.com")
+        subprocess.run(["git", "init", "-q"], check=True)
+        for i, subject in enumerate(SUBJECTS):
+            Path(f"f{i}").write_text(str(i))
+            subprocess.run(["git", "add", f"f{i}"], check=True)
+            subprocess.run(["git", "commit", "-q", "-m", subject], check=True, env=env)
+        self.cache = Cache(Path(self.tmp.name) / "cache.sqlite3")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_parse_subject(self):
+        self.assertEqual(parse_subject("feat(api)!: add x"), ("feat", "api", "add x", True))
+        self.assertEqual(parse_subject("just words"), ("other", "", "just words", False))
+
+    def test_iter_commits_can_stop_early(self):
+        # パイプが一杯になって git log が書き込み待ちのまま閉じる
+        tree = subprocess.run(["git", "rev-parse", "HEAD^{tree}"], capture_output=True, text=True, check=True).stdout.strip()
+        parent = "HEAD"
+        for i in range(8):
+            parent = subprocess.run(["git", "commit-tree", tree, "-p", parent], input=f"feat: big {i}\n\n" + "x" * 100_000,
+                                    capture_output=True, text=True, check=True, env=self.env).stdout.strip()
+        commits = iter_commits(parent)
+        self.assertEqual(next(commits).subject, "big 7")
+        commits.close()
+        self.assertEqual(len(list(iter_commits("HEAD~2..HEAD"))), 2)
+        with self.assertRaises(RuntimeError):
+            list(iter_commits("no-such-ref"))
+
+    def test_groups_without_llm(self):
+        builder = ChangelogBuilder({})
+        self.assertEqual(builder.collect("HEAD~4..HEAD"), 4)
+        markdown = builder.render_markdown("HEAD~4..HEAD")
+
+        self.assertIn("**core:** drop legacy path", markdown)
+        self.assertIn("## deps", markdown)
+        self.assertLess(markdown.index("## deps"), markdown.index("update readme"))
+        self.assertNotIn("add endpoint", markdown)
+
+    def test_summaries_reused_across_overlapping_ranges(self):
+        config = {"llm": {"provider": "fake", "changelog_batch_size": 2}}
+
+        progress = []
+        builder = ChangelogBuilder(config, cache=self.cache, client_factory=FakeClient)
+        builder.collect("HEAD~3..HEAD", progress.append)
+        self.assertEqual(sum(progress), 3)
+        self.assertEqual(sum(len(c) for c in FakeClient.calls), 3)
+        self.assertIn("summary", builder.render_markdown("HEAD~3..HEAD"))
+
+        FakeClient.calls = []
+        builder = ChangelogBuilder(config, cache=self.cache, client_factory=FakeClient)
+        builder.collect("HEAD~4..HEAD")
+        self.assertEqual(sum(len(c) for c in FakeClient.calls), 1)
+
+if __name__ == '__main__':
+    unittest.main()
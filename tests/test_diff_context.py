@@ -0,0 +1,91 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from komitto.diff_context import LEVEL_FUNCTION, LEVEL_LINES, expand_diff_context, plan_context
+from komitto.git_utils import get_git_diff, read_blobs
+from komitto.prompt import render_file_xml, split_diff
+
+IDENTITY = {"GIT_AUTHOR_NAME": "a", "GIT_AUTHOR_EMAIL": "a@example.com",
+            "GIT_COMMITTER_NAME": "a", "GIT_COMMITTER_EMAIL": "a@example.com"}
+
+SOURCE = "import os\n\n" + "".join(
+    f"def f{i}(x):\n    a = {i}\n    b = a + x\n    return b\n\n" for i in range(20)
+) + "class K:\n    def m(self):\n        return 1\n"
+
+
+def reverse_check(diff):
+    """diff が git apply で適用できる（行番号が正しい）か"""
+    patch = diff.replace("diff --git m.py m.py", "diff --git a/m.py b/m.py") \
+        .replace("--- m.py", "--- a/m.py").replace("+++ m.py", "+++ b/m.py")
+    return subprocess.run(["git", "apply", "--cached", "--check", "-R", "-"], input=patch, text=True,
+                          capture_output=True)
+
+
+class TestAdaptiveContext(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        subprocess.run(["git", "init", "-q"], check=True)
+        Path("m.py").write_text(SOURCE)
+        subprocess.run(["git", "add", "m.py"], check=True)
+        with mock.patch.dict(os.environ, IDENTITY):
+            subprocess.run(["git", "commit", "-q", "-m", "init"], check=True)
+        Path("m.py").write_text(
+            SOURCE.replace("a = 5\n", "a = 55\n").replace("    a = 10\n", "").replace("return 1", "return 2")
+        )
+        subprocess.run(["git", "add", "m.py"], check=True)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_function_context_with_valid_hunks(self):
+        diff = get_git_diff(context_config={})
+        self.assertIn("@@ -28,4 +28,4 @@ def f5(x):\n def f5(x):\n-    a = 5\n+    a = 55\n     b = a + x\n     return b\n@@", diff)
+        self.assertNotIn("def f4", diff)
+        self.assertEqual(reverse_check(diff).returncode, 0, reverse_check(diff).stderr)
+
+        xml = render_file_xml(split_diff(diff)[0])
+        self.assertIn('<context position="before">\ndef f5(x):\n      </context>', xml)
+
+    def test_budget_and_size_limits(self):
+        files = split_diff(get_git_diff())
+        _, report = plan_context(files, {})
+        self.assertEqual([r.level for r in report], [LEVEL_FUNCTION])
+
+        # 関数全体が入らない予算では前後数行にする
+        expanded, report = plan_context(files, {"context_budget": 40, "context_lines": 1})
+        self.assertEqual([r.level for r in report], [LEVEL_LINES])
+        self.assertIn(" def f5(x):\n-    a = 5", "\n".join(expanded["m.py"]))
+
+        self.assertEqual(plan_context(files, {"context_max_changed": 3})[1], [])
+        diff = get_git_diff()
+        self.assertEqual(expand_diff_context(diff, {"context": "none"}), diff)
+        self.assertEqual(expand_diff_context(diff, {"context_budget": 1}), diff)
+
+    def test_blobs_read_in_one_batch(self):
+        files = split_diff(get_git_diff())
+        calls = []
+
+        def read(shas):
+            shas = list(shas)
+            calls.append(shas)
+            return read_blobs(shas)
+
+        plan_context(files, {}, read=read)
+        self.assertEqual(calls, [[files[0].new_sha]])
+        self.assertEqual(read_blobs([files[0].new_sha, "0" * 40])[files[0].new_sha].decode(), Path("m.py").read_text())
+
+    def test_cache_key_depends_on_context(self):
+        plain = split_diff(get_git_diff())[0]
+        expanded = split_diff(get_git_diff(context_config={}))[0]
+        self.assertNotEqual(plain.cache_key(), expanded.cache_key())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import time
+import unittest
+
+from komitto.llm.base import LLMClient
+from komitto.llm.events import Done, FirstToken, StreamMetrics, TextDelta, Usage, normalize_usage
+
+
+class ScriptedClient(LLMClient):
+    """Yields (text, usage) pairs the way a provider SDK wrapper would, with optional delays."""
+
+    def __init__(self, chunks, first_delay=0.0, chunk_delay=0.0):
+        super().__init__({})
+        self.chunks = chunks
+        self.first_delay = first_delay
+        self.chunk_delay = chunk_delay
+
+    def generate_commit_message(self, prompt):
+        raise NotImplementedError
+
+    def stream_chat(self, messages):
+        time.sleep(self.first_delay)
+        for text, usage in self.chunks:
+            yield text, usage
+            time.sleep(self.chunk_delay)
+
+
+class TestStreamEvents(unittest.TestCase):
+    def test_event_order_and_single_usage(self):
+        # Gemini-style: usage on every chunk and a metadata-only chunk with text=None
+        client = ScriptedClient([
+            ("feat: ", {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11}),
+            (None, {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}),
+            ("add x", {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13}),
+        ])
+        events = list(client.events("prompt"))
+        kinds = [type(e) for e in events]
+        self.assertEqual(kinds, [FirstToken, TextDelta, TextDelta, Usage, Done])
+        self.assertEqual(events[3].total_tokens, 13)
+        self.assertEqual("".join(e.text for e in events if isinstance(e, TextDelta)), "feat: add x")
+
+    def test_trailing_usage_without_text(self):
+        # Anthropic/OpenAI-style: usage arrives after the last text chunk
+        client = ScriptedClient([("fix: y", None), ("", {"prompt_tokens": 5, "completion_tokens": 4})])
+        metrics = StreamMetrics()
+        events = list(client.events("prompt", metrics=metrics))
+        self.assertIs(events[-1].metrics, metrics)
+        self.assertEqual(metrics.usage.total_tokens, 9)
+        self.assertEqual(metrics.output_tokens, (4, False))
+        self.assertEqual(metrics.input_chars, len("prompt"))
+
+    def test_decode_speed_excludes_ttft(self):
+        client = ScriptedClient(
+            [("a", None), ("b", None), ("c", None), ("", {"completion_tokens": 30})],
+            first_delay=0.3,
+            chunk_delay=0.03,
+        )
+        metrics = StreamMetrics()
+        list(client.events("prompt", metrics=metrics))
+        self.assertGreaterEqual(metrics.ttft, 0.3)
+        self.assertLess(metrics.decode_seconds, metrics.elapsed - 0.25)
+        # 30 tokens over roughly 0.1s of decoding, not over the 0.4s total
+        self.assertGreater(metrics.decode_tps, 30 / metrics.elapsed)
+        self.assertIn("TTFT:", metrics.describe())
+        self.assertIn("Decode:", metrics.describe())
+
+    def test_estimates_without_usage(self):
+        metrics = StreamMetrics()
+        list(ScriptedClient([("x" * 40, None)]).events("prompt", metrics=metrics))
+        self.assertEqual(metrics.output_tokens, (10, True))
+        self.assertIn("Est. Output: ~10 toks", metrics.describe())
+
+    def test_normalize_usage(self):
+        self.assertIsNone(normalize_usage({"prompt_tokens": None, "completion_tokens": None}, 0))
+        usage = normalize_usage({"prompt_tokens": 3, "completion_tokens": 2, "eval_ms": 100.0, "load_ms": None}, 0)
+        self.assertEqual(usage.total_tokens, 5)
+        self.assertEqual(usage.extra, {"eval_ms": 100.0})
+
+    def test_server_eval_time_preferred(self):
+        metrics = StreamMetrics()
+        list(ScriptedClient([("hello", None), ("", {"completion_tokens": 50, "eval_ms": 500.0})]).events("p", metrics=metrics))
+        self.assertAlmostEqual(metrics.decode_tps, 100.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+import asyncio
+import os
+import stat
+import subprocess
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from komitto.git_utils import CatFile, close_cat_file, get_cat_file, git_commit, git_commit_async, read_blobs
+
+ENV = {
+    "GIT_AUTHOR_NAME": "a", "GIT_AUTHOR_EMAIL": "a@example.com",
+    "GIT_COMMITTER_NAME": "a", "GIT_COMMITTER_EMAIL": "a@example.com",
+}
+
+
+class GitRepoTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        self.old_env = {k: os.environ.get(k) for k in ENV}
+        os.environ.update(ENV)
+        os.chdir(self.tmp.name)
+        subprocess.run(["git", "init", "-q"], check=True)
+        Path("a.txt").write_text("a")
+        subprocess.run(["git", "add", "a.txt"], check=True)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        for k, v in self.old_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        self.tmp.cleanup()
+
+    def install_hook(self, body):
+        hook = Path(".git/hooks/pre-commit")
+        hook.write_text("#!/bin/sh\n" + body)
+        hook.chmod(hook.stat().st_mode | stat.S_IEXEC)
+
+    def last_message(self):
+        return subprocess.run(["git", "log", "-1", "--format=%B"], capture_output=True, text=True).stdout.strip()
+
+
+@unittest.skipIf(os.name == "nt", "uses a POSIX shell hook")
+class TestGitCommit(GitRepoTestCase):
+    def test_large_message_goes_through_stdin(self):
+        message = "feat: big\n\n" + ("x" * 100 + "\n") * 20000
+        self.assertTrue(git_commit(message))
+        self.assertEqual(len(self.last_message()), len(message.strip()))
+
+    def test_async_commit_streams_hook_output(self):
+        self.install_hook("echo lint: checking\necho lint: ok 1>&2\n")
+        lines = []
+        code = asyncio.run(git_commit_async("fix: streamed", lines.append))
+        self.assertEqual(code, 0)
+        self.assertIn("lint: checking", lines)
+        self.assertIn("lint: ok", lines)
+        self.assertEqual(self.last_message(), "fix: streamed")
+
+    def test_async_commit_hook_failure_returns_status(self):
+        self.install_hook("echo broken\nexit 3\n")
+        lines = []
+        code = asyncio.run(git_commit_async("fix: nope", lines.append))
+        self.assertNotEqual(code, 0)
+        self.assertIn("broken", lines)
+
+    def test_async_commit_cancel_terminates_hook(self):
+        self.install_hook("echo started\nsleep 30\n")
+        lines = []
+
+        async def run():
+            task = asyncio.ensure_future(git_commit_async("fix: slow", lines.append))
+            while "started" not in lines:
+                await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(asyncio.wait_for(run(), timeout=10))
+        self.assertNotEqual(self.last_message(), "fix: slow")
+
+
+class TestCatFile(GitRepoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.blobs = {}
+        for i in range(50):
+            content = f"file {i}\n".encode() * (i + 1)
+            sha = subprocess.run(["git", "hash-object", "-w", "--stdin"], input=content,
+                                 capture_output=True, check=True).stdout.decode().strip()
+            self.blobs[sha] = content
+        self.cat = CatFile()
+
+    def tearDown(self):
+        self.cat.close()
+        close_cat_file()
+        super().tearDown()
+
+    def test_read_and_info(self):
+        missing = "0" * 40
+        self.assertEqual(self.cat.read(list(self.blobs) + [missing]), self.blobs)
+        info = self.cat.info(list(self.blobs)[:3] + [missing])
+        self.assertEqual(len(info), 3)
+        sha = list(self.blobs)[2]
+        self.assertEqual((info[sha].type, info[sha].size), ("blob", len(self.blobs[sha])))
+        self.assertEqual(self.cat.info(["HEAD"]), {})
+
+    def test_missing_names_with_spaces(self):
+        sha = list(self.blobs)[0]
+        names = ["HEAD:a b", "HEAD:dir/my file.txt", sha]
+        self.assertEqual(self.cat.read(names), {sha: self.blobs[sha]})
+        self.assertEqual(list(self.cat.info(names)), [sha])
+        # 後続の要求も同じワーカーで読める
+        self.assertEqual(self.cat.read_one(list(self.blobs)[1]), self.blobs[list(self.blobs)[1]])
+
+    def test_cache_is_bounded_by_bytes(self):
+        cat = CatFile(cache_bytes=200)
+        try:
+            cat.read(self.blobs)
+            count, size = cat.cache_stats()
+            self.assertLessEqual(size, 200)
+            self.assertGreater(count, 0)
+            # 最近読んだものが残る
+            last = list(self.blobs)[-1]
+            if len(self.blobs[last]) <= 200:
+                self.assertIn(last, cat._cache)
+        finally:
+            cat.close()
+
+    def test_concurrent_readers(self):
+        shas = list(self.blobs)
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(20):
+                    part = shas[(n + i) % len(shas):][:7]
+                    result = self.cat.read(part) if i % 2 else self.cat.info(part)
+                    expected = {sha: self.blobs[sha] for sha in part}
+                    if i % 2:
+                        self.assertEqual(result, expected)
+                    else:
+                        self.assertEqual({sha: info.size for sha, info in result.items()},
+                                         {sha: len(content) for sha, content in expected.items()})
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+        self.assertEqual(errors, [])
+
+    def test_restarts_after_git_exits_and_closes_cleanly(self):
+        sha = list(self.blobs)[0]
+        self.assertEqual(self.cat.read_one(sha), self.blobs[sha])
+        channel = self.cat._channels["--batch"]
+        channel.proc.kill()
+        channel.proc.wait()
+        other = list(self.blobs)[1]
+        self.assertEqual(self.cat.read_one(other), self.blobs[other])
+
+        self.cat.close()
+        self.assertIsNotNone(channel.proc.returncode)
+        with self.assertRaises(RuntimeError):
+            self.cat.read_one(list(self.blobs)[2])
+
+    def test_shared_worker_follows_directory(self):
+        shared = get_cat_file()
+        self.assertIs(get_cat_file(), shared)
+        self.assertEqual(read_blobs(self.blobs), self.blobs)
+        os.chdir(self.cwd)
+        self.assertIsNot(get_cat_file(), shared)
+
+
+if __name__ == '__main__':
+    unittest.main()
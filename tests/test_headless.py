@@ -0,0 +1,131 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from komitto import headless
+from komitto.headless import EventWriter, HeadlessSession, Request, serve
+from komitto.llm.base import LLMClient
+
+IDENTITY = {"GIT_AUTHOR_NAME": "a", "GIT_AUTHOR_EMAIL": "a@example.com",
+            "GIT_COMMITTER_NAME": "a", "GIT_COMMITTER_EMAIL": "a@example.com"}
+
+
+class ChunkClient(LLMClient):
+    created = 0
+
+    def __init__(self, config):
+        ChunkClient.created += 1
+
+    def generate_commit_message(self, prompt):
+        return "feat: add app", None
+
+    def stream_commit_message(self, prompt):
+        yield "feat: ", None
+        yield "add app", {"prompt_tokens": 10, "completion_tokens": 3}
+
+
+class BlockingClient(LLMClient):
+    started = threading.Event()
+
+    def __init__(self, config):
+        pass
+
+    def generate_commit_message(self, prompt):
+        return "", None
+
+    def stream_commit_message(self, prompt):
+        yield "feat", None
+        BlockingClient.started.set()
+        time.sleep(30)
+        yield "never", None
+
+
+def parse(output):
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+@unittest.skipIf(os.name == "nt", "uses a POSIX git setup")
+class TestHeadless(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        subprocess.run(["git", "init", "-q"], check=True)
+        Path("komitto.toml").write_text(
+            '[llm]\nprovider = "fake"\n\n[cache]\npath = ".komitto-cache.sqlite3"\n'
+        )
+        Path(".git/info/exclude").write_text("komitto.toml\n.komitto-cache.sqlite3\n")
+        Path("app.py").write_text("def main():\n    return 1\n")
+        subprocess.run(["git", "add", "app.py"], check=True)
+        ChunkClient.created = 0
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_stdio_serves_many_requests(self):
+        stdin = io.StringIO(
+            '{"id": 1, "context": "first"}\n'
+            'not json\n'
+            '{"id": 2, "commit": true}\n'
+        )
+        output = io.StringIO()
+        with mock.patch.object(headless, "create_llm_client", ChunkClient), mock.patch.dict(os.environ, IDENTITY):
+            serve(stdin, EventWriter(output))
+        events = parse(output)
+
+        self.assertEqual(events[0], {"event": "ready", "protocol": headless.PROTOCOL_VERSION})
+        self.assertEqual([e["code"] for e in events if e["event"] == "error"], ["bad_request"])
+        first = [e for e in events if e.get("id") == 1]
+        self.assertEqual([e["event"] for e in first], ["prompt", "draft", "first_token", "delta", "delta", "usage", "done"])
+        self.assertIn("app.py", [s["label"] for s in first[0]["sections"]])
+        self.assertEqual(first[-1]["message"], "feat: add app")
+        self.assertEqual(first[-1]["timings"]["usage"]["completion_tokens"], 3)
+
+        second = [e for e in events if e.get("id") == 2]
+        self.assertTrue(second[-2]["event"] == "commit" and second[-2]["ok"])
+        self.assertEqual(subprocess.run(["git", "log", "-1", "--format=%s"], capture_output=True, text=True).stdout.strip(),
+                         "feat: add app")
+        # The client (and its HTTP connections) is reused across requests
+        self.assertEqual(ChunkClient.created, 1)
+
+    def test_no_staged_changes(self):
+        subprocess.run(["git", "reset", "-q"], check=True)
+        output = io.StringIO()
+        self.assertFalse(HeadlessSession(EventWriter(output)).run(Request(id="x")))
+        self.assertEqual(parse(output)[-1]["code"], "no_staged_changes")
+
+    def test_cancel(self):
+        output = io.StringIO()
+        session = HeadlessSession(EventWriter(output))
+        BlockingClient.started.clear()
+        with mock.patch.object(headless, "create_llm_client", BlockingClient):
+            thread = threading.Thread(target=session.run, args=(Request(id=7),))
+            thread.start()
+            self.assertTrue(BlockingClient.started.wait(5))
+            start = time.perf_counter()
+            session.cancel()
+            thread.join(5)
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertEqual(parse(output)[-1], {"event": "error", "id": 7, "code": "cancelled",
+                                             "message": parse(output)[-1]["message"]})
+
+
+class TestEntryPoint(unittest.TestCase):
+    def test_headless_path_does_not_load_the_interactive_cli(self):
+        code = ("import sys, komitto.cli, komitto.headless; "
+                "print(sorted(m for m in ('rich', 'pyperclip', 'komitto.main', 'komitto.editor') if m in sys.modules))")
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import time
+import unittest
+
+from komitto.heuristic import definition_name, heuristic_message, infer_scope, file_stats
+from komitto.prompt import split_diff
+
+
+def file_diff(path, hunks, status=None):
+    header = f"diff --git {path} {path}\n"
+    if status == "new":
+        header += "new file mode 100644\n"
+    elif status == "deleted":
+        header += "deleted file mode 100644\n"
+    header += f"index {'1' * 40}..{'2' * 40} 100644\n--- {path}\n+++ {path}\n"
+    return header + "".join(hunks)
+
+
+class TestDefinitions(unittest.TestCase):
+    def test_languages(self):
+        self.assertEqual(definition_name("async def fetch(url):"), "fetch")
+        self.assertEqual(definition_name("class Parser(Base):"), "Parser")
+        self.assertEqual(definition_name("export default function render() {"), "render")
+        self.assertEqual(definition_name("export const useCart = (id) => {"), "useCart")
+        self.assertEqual(definition_name("func (s *Server) Serve() error {"), "Serve")
+        self.assertEqual(definition_name("pub(crate) fn parse(input: &str) {"), "parse")
+        self.assertIsNone(definition_name("    return parse(x)"))
+
+
+class TestDraft(unittest.TestCase):
+    def test_added_symbols_with_scope(self):
+        diff = file_diff("src/komitto/llm/retry.py", ["@@ -0,0 +1,3 @@\n+def backoff(n):\n+    return n\n+class Policy:\n"], "new") \
+            + file_diff("src/komitto/llm/base.py", ["@@ -10,0 +11 @@ class LLMClient:\n+    retries = 2\n"])
+        message = heuristic_message(diff)
+        self.assertTrue(message.startswith("feat(llm): add backoff and Policy\n\n"))
+        self.assertIn("- src/komitto/llm/base.py (+1 -0)", message)
+
+    def test_changed_scope_and_removal(self):
+        diff = file_diff("app/cart.py", [
+            "@@ -3 +3 @@ def total(items):\n-    return 0\n+    return sum(items)\n",
+        ])
+        self.assertEqual(heuristic_message(diff), "refactor(cart): update total")
+
+        diff = file_diff("app/cart.py", ["@@ -9,2 +8,0 @@\n-def legacy_total(items):\n-    pass\n"])
+        self.assertEqual(heuristic_message(diff), "refactor(cart): remove legacy_total")
+
+    def test_type_from_paths(self):
+        self.assertTrue(heuristic_message(file_diff("docs/usage.md", ["@@ -1 +1 @@\n-a\n+b\n"])).startswith("docs"))
+        self.assertTrue(heuristic_message(file_diff("tests/test_cart.py", ["@@ -1 +1 @@\n-a\n+b\n"])).startswith("test"))
+        self.assertTrue(heuristic_message(file_diff(".github/workflows/ci.yml", ["@@ -1 +1 @@\n-a\n+b\n"])).startswith("ci"))
+
+    def test_scope_skips_generic_dirs(self):
+        stats = file_stats(split_diff(file_diff("src/a.py", []) + file_diff("src/b.py", [])))
+        self.assertIsNone(infer_scope(stats))
+
+    def test_fast_on_large_changesets(self):
+        hunk = "@@ -1,2 +1,2 @@ def handler():\n" + "-    x = 1\n+    x = 2\n" * 50
+        # about 1 MB of diff
+        diff = "".join(file_diff(f"pkg/mod{i}.py", [hunk] * 10) for i in range(100))
+        start = time.perf_counter()
+        heuristic_message(diff)
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
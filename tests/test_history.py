@@ -0,0 +1,85 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from komitto import history
+from komitto.cache import Cache
+from komitto.history import LogEntry, build_history_context, compact_file_lines, format_compact, load_log_entries
+
+ENV = dict(os.environ, GIT_AUTHOR_NAME="a", GIT_AUTHOR_EMAIL="a@example.com",
+           GIT_COMMITTER_NAME="a", GIT_COMMITTER_EMAIL="a@example.com")
+
+
+class TestCompaction(unittest.TestCase):
+    def test_collapse_and_truncate(self):
+        files = [["M", f"src/pkg/m{i}.py"] for i in range(5)] + [["A", f"docs/{i}.md"] for i in range(2)] + [["M", "README.md"]]
+        lines = compact_file_lines(files, set(), max_files=10, collapse=4)
+        self.assertEqual(lines[0], "M\tsrc/pkg/ (5 files)")
+        self.assertEqual(lines[1:], ["A\tdocs/0.md", "A\tdocs/1.md", "M\tREADME.md"])
+
+        lines = compact_file_lines(files, set(), max_files=2, collapse=0)
+        self.assertEqual(lines, ["M\tsrc/pkg/m0.py", "M\tsrc/pkg/m1.py", "... and 6 more files"])
+
+    def test_repeated_paths_are_listed_once(self):
+        entries = [
+            LogEntry("2" * 40, "2222222", "d", "second", [["M", "a.py"], ["R100", "old.py", "b.py"]]),
+            LogEntry("1" * 40, "1111111", "d", "first", [["M", "a.py"], ["A", "b.py"], ["A", "c.py"]]),
+        ]
+        text = format_compact(entries)
+        newest, oldest = text.split(history.LOG_SEPARATOR)
+        self.assertIn("R100\told.py\tb.py", newest)
+        self.assertIn("A\tc.py\n(+2 files already listed in newer commits)", oldest)
+        self.assertNotIn("a.py", oldest)
+
+
+@unittest.skipIf(os.name == "nt", "uses a POSIX git setup")
+class TestHistoryContext(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        subprocess.run(["git", "init", "-q"], check=True)
+        for i in range(3):
+            self.commit(i)
+        self.cache = Cache(Path(self.tmp.name) / ".cache.sqlite3")
+
+    def tearDown(self):
+        self.cache.close()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def commit(self, i):
+        for j in range(6):
+            Path("lib").mkdir(exist_ok=True)
+            Path("lib", f"m{j}.py").write_text(str(i))
+        subprocess.run(["git", "add", "lib"], check=True)
+        subprocess.run(["git", "commit", "-qm", f"change {i}"], check=True, env=ENV)
+
+    def test_only_new_commits_are_parsed(self):
+        config = {"llm": {"history_limit": 5}}
+        first = build_history_context(config, self.cache)
+        self.assertEqual((first.commits, first.parsed), (3, 3))
+        self.assertLess(first.tokens, first.raw_tokens)
+        self.assertIn("M\tlib/ (6 files)", first.text)
+        self.assertIn("(+6 files already listed in newer commits)", first.text)
+
+        self.commit(3)
+        with mock.patch.object(history, "read_log_entries", wraps=history.read_log_entries) as read:
+            second = build_history_context(config, self.cache)
+        self.assertEqual(len(read.call_args[0][0]), 1)
+        self.assertEqual((second.commits, second.parsed), (4, 1))
+        self.assertTrue(second.text.startswith("Commit: ") and "change 3" in second.text)
+
+    def test_matches_uncached_parse(self):
+        shas = history.list_commits(5)
+        load_log_entries(shas, self.cache)
+        cached, parsed = load_log_entries(shas, self.cache)
+        self.assertEqual(parsed, 0)
+        self.assertEqual(cached, load_log_entries(shas)[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+from komitto import llm
+from komitto.cache import Cache
+from komitto.git_utils import get_git_diff
+from komitto.heuristic import heuristic_message
+from komitto.hook import HOOK_MARKER, SOURCE_CACHE, SOURCE_HEURISTIC, SOURCE_LLM, install_hook, resolve_message, run_hook, uninstall_hook
+from komitto.llm.base import LLMClient
+
+IDENTITY = {"GIT_AUTHOR_NAME": "a", "GIT_AUTHOR_EMAIL": "a@example.com",
+            "GIT_COMMITTER_NAME": "a", "GIT_COMMITTER_EMAIL": "a@example.com"}
+
+DIFF = """diff --git src/app.py src/app.py
+new file mode 100644
+index 0000000000000000000000000000000000000000..1111111111111111111111111111111111111111
+--- /dev/null
++++ src/app.py
+@@ -0,0 +1 @@
++def main(): pass
+"""
+
+CONFIG = {"llm": {"provider": "fake", "model": "m", "history_limit": 0}, "prompt": {"system": "SYSTEM"}}
+
+
+class FastClient(LLMClient):
+    def __init__(self, config):
+        pass
+
+    def generate_commit_message(self, prompt):
+        return "feat: add the app", None
+
+
+class SlowClient(LLMClient):
+    def __init__(self, config):
+        pass
+
+    def generate_commit_message(self, prompt):
+        return "", None
+
+    def stream_commit_message(self, prompt):
+        time.sleep(5)
+        yield "too late", None
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        time.sleep(5)
+        self.send_response(500)
+        self.end_headers()
+
+
+class TestResolveMessage(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = Cache(Path(self.tmp.name) / "cache.sqlite3")
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def resolve(self, client, budget):
+        with mock.patch.object(llm, "create_llm_client", client):
+            start = time.perf_counter()
+            result = resolve_message(CONFIG, DIFF, self.cache, budget, start)
+            return result, time.perf_counter() - start
+
+    def test_slow_provider_falls_back_within_budget(self):
+        (message, source, timed_out), elapsed = self.resolve(SlowClient, 0.3)
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual((source, timed_out), (SOURCE_HEURISTIC, True))
+        self.assertEqual(message, heuristic_message(DIFF))
+        self.assertEqual(message, "feat: add app.py")
+
+    def test_generated_message_is_reused(self):
+        (message, source, _), _ = self.resolve(FastClient, 2.0)
+        self.assertEqual((message, source), ("feat: add the app", SOURCE_LLM))
+
+        (message, source, _), elapsed = self.resolve(SlowClient, 2.0)
+        self.assertEqual((message, source), ("feat: add the app", SOURCE_CACHE))
+        self.assertLess(elapsed, 0.2)
+
+
+@unittest.skipIf(os.name == "nt", "uses a POSIX git setup")
+class TestHookInGit(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        subprocess.run(["git", "init", "-q"], check=True)
+        Path(".git/info/exclude").write_text("komitto.toml\n.cache.sqlite3\n")
+        Path("app.py").write_text("def main():\n    return 1\n")
+        subprocess.run(["git", "add", "app.py"], check=True)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_install_refuses_foreign_hook(self):
+        path = install_hook()
+        self.assertIn(HOOK_MARKER, path.read_text())
+        self.assertTrue(os.access(path, os.X_OK))
+        self.assertEqual(install_hook(), path)
+
+        path.write_text("#!/bin/sh\necho mine\n")
+        with self.assertRaises(FileExistsError):
+            install_hook()
+        self.assertIsNone(uninstall_hook())
+        install_hook(force=True)
+        self.assertEqual(uninstall_hook(), path)
+        self.assertFalse(path.exists())
+
+    def test_message_inserted_before_git_comments(self):
+        Path("komitto.toml").write_text('[cache]\npath = ".cache.sqlite3"\n')
+        Path("MSG").write_text("\n# Please enter the commit message\n")
+        self.assertEqual(run_hook("MSG"), 0)
+        self.assertEqual(Path("MSG").read_text(), "feat: add app.py\n\n# Please enter the commit message\n")
+
+        Path("MSG").write_text("from -m\n")
+        run_hook("MSG", "message")
+        self.assertEqual(Path("MSG").read_text(), "from -m\n")
+
+    def test_slow_diff_preparation_falls_back_to_raw_diff(self):
+        Path("komitto.toml").write_text('[hook]\nbudget = 0.3\nspeculate = false\n')
+        Path("MSG").write_text("\n# Please enter the commit message\n")
+        release = threading.Event()
+
+        def slow_get_git_diff(exclude_patterns=None, context_config=None):
+            if context_config is None:
+                return get_git_diff(exclude_patterns)
+            # コンテキスト拡張（cat-file）が予算を超える
+            release.wait(5)
+            raise SystemExit(1)
+
+        try:
+            with mock.patch("komitto.hook.get_git_diff", slow_get_git_diff):
+                start = time.perf_counter()
+                self.assertEqual(run_hook("MSG", started=start), 0)
+                elapsed = time.perf_counter() - start
+        finally:
+            release.set()
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(Path("MSG").read_text(), "feat: add app.py\n\n# Please enter the commit message\n")
+
+    def test_commit_is_not_delayed_by_slow_provider(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            Path("komitto.toml").write_text(
+                '[llm]\nprovider = "ollama"\nmodel = "m"\nmax_retries = 0\n'
+                f'base_url = "http://127.0.0.1:{server.server_address[1]}"\n\n'
+                '[hook]\nbudget = 0.5\nspeculate = false\n\n'
+                '[cache]\npath = ".cache.sqlite3"\n'
+            )
+            install_hook()
+            env = dict(os.environ, GIT_EDITOR="true", **IDENTITY)
+            start = time.perf_counter()
+            result = subprocess.run(["git", "commit", "-q"], env=env, capture_output=True, text=True)
+            elapsed = time.perf_counter() - start
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        # budget + interpreter start-up, far below the provider's 5 s
+        self.assertLess(elapsed, 2.5)
+        subject = subprocess.run(["git", "log", "-1", "--format=%s"], capture_output=True, text=True).stdout.strip()
+        self.assertEqual(subject, "feat: add app.py")
+
+
+if __name__ == "__main__":
+    unittest.main()
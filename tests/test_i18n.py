@@ -0,0 +1,25 @@
+import unittest
+
+from komitto import i18n
+
+
+class TestI18n(unittest.TestCase):
+    def tearDown(self):
+        i18n.set_language(None)
+
+    def test_flat_lookup_and_format(self):
+        i18n.set_language("en")
+        self.assertEqual(i18n.t("config.init_created", "komitto.toml"), "✅ Created komitto.toml")
+        self.assertEqual(i18n.t("main.generating", "ignored"), i18n.t("main.generating"))
+
+    def test_missing_key_returns_key(self):
+        i18n.set_language("ja")
+        self.assertEqual(i18n.t("no.such.key"), "no.such.key")
+        self.assertEqual(i18n.t("main"), "main")
+
+    def test_fallback_merged_at_compile_time(self):
+        catalog = i18n.compile_catalog("xx")
+        self.assertEqual(catalog["main.generating"][0], i18n.compile_catalog("en")["main.generating"][0])
+
+if __name__ == '__main__':
+    unittest.main()
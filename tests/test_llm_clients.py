@@ -80,6 +80,32 @@ class TestLLMClients(unittest.TestCase):
             "total_tokens": 7
         })
 
+    @patch('komitto.llm.openai_client.OpenAI')
+    def test_openai_client_candidates(self, mock_openai):
+        mock_instance = MagicMock()
+        mock_openai.return_value = mock_instance
+
+        chunk1 = MagicMock()
+        chunk1.choices = [MagicMock(index=0, delta=MagicMock(content="feat: a")),
+                          MagicMock(index=1, delta=MagicMock(content="fix: b"))]
+        chunk1.usage = None
+        chunk2 = MagicMock()
+        chunk2.choices = []
+        chunk2.usage.prompt_tokens = 50
+        chunk2.usage.completion_tokens = 6
+        chunk2.usage.total_tokens = 56
+        mock_instance.chat.completions.create.return_value = iter([chunk1, chunk2])
+
+        client = OpenAIClient({"api_key": "test_key", "model": "gpt-4"})
+        texts, usage = client.generate_candidates("prompt", 2, temperature=0.8)
+
+        # One request with n, so the prompt tokens are billed once
+        mock_instance.chat.completions.create.assert_called_once()
+        kwargs = mock_instance.chat.completions.create.call_args.kwargs
+        self.assertEqual((kwargs["n"], kwargs["temperature"]), (2, 0.8))
+        self.assertEqual(texts, ["feat: a", "fix: b"])
+        self.assertEqual(usage["prompt_tokens"], 50)
+
     @patch('komitto.llm.gemini_client.genai')
     def test_gemini_client_generate(self, mock_genai):
         # Setup mock
@@ -0,0 +1,277 @@
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from komitto.llm.base import (
+    ALL_CHOICES,
+    CancellationToken,
+    LLMCancelledError,
+    LLMClient,
+    LLMHTTPError,
+    LLMTimeoutError,
+    RetryPolicy,
+    Timeouts,
+    retry_after_of,
+)
+
+
+class BlockingStream:
+    """Stands in for an SDK stream: blocks in a 'network read' until closed."""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+class FakeClient(LLMClient):
+    """Replays a script of attempts; each attempt is a list of chunks, an exception, or 'block'."""
+
+    def __init__(self, attempts, config=None, chunk_delay=0.0):
+        super().__init__(config or {"retry_backoff": 0.001})
+        self.attempts = list(attempts)
+        self.calls = 0
+        self.chunk_delay = chunk_delay
+        self.stream_obj = None
+
+    def generate_commit_message(self, prompt):
+        raise NotImplementedError
+
+    def stream_chat(self, messages):
+        attempt = self.attempts[min(self.calls, len(self.attempts) - 1)]
+        self.calls += 1
+        if isinstance(attempt, Exception):
+            raise attempt
+        if attempt == "block":
+            self.stream_obj = self._track_stream(BlockingStream())
+            self.stream_obj.closed.wait(10)
+            raise ConnectionError("stream closed")
+        for chunk in attempt:
+            time.sleep(self.chunk_delay)
+            yield chunk, None
+        yield "", {"completion_tokens": len(attempt)}
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_from_config(self):
+        policy = RetryPolicy.from_config({"max_retries": 5, "retry_backoff": 0.5, "retry_backoff_max": 4})
+        self.assertEqual((policy.max_retries, policy.backoff, policy.backoff_max), (5, 0.5, 4.0))
+        timeouts = Timeouts.from_config({"timeout": 30, "first_token_timeout": 10, "connect_timeout": 0})
+        self.assertEqual((timeouts.connect, timeouts.first_token, timeouts.overall), (None, 10.0, 30.0))
+
+    def test_delay_is_jittered_and_capped(self):
+        policy = RetryPolicy(backoff=1.0, backoff_max=3.0)
+        for attempt in range(6):
+            delay = policy.delay(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(3.0, 2 ** attempt))
+        self.assertEqual(policy.delay(0, retry_after=7), 7)
+
+    def test_retry_after_header(self):
+        exc = Exception("rate limited")
+        exc.response = SimpleNamespace(headers={"retry-after": "2"})
+        self.assertEqual(retry_after_of(exc), 2.0)
+        self.assertIsNone(retry_after_of(Exception("no response")))
+
+    def test_retryable_statuses(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.is_retryable(LLMHTTPError("busy", 503)))
+        self.assertTrue(policy.is_retryable(LLMHTTPError("slow down", 429)))
+        self.assertFalse(policy.is_retryable(LLMHTTPError("bad request", 400)))
+        self.assertFalse(policy.is_retryable(LLMTimeoutError("overall")))
+        self.assertTrue(policy.is_retryable(LLMTimeoutError("first", first_token=True)))
+
+
+class TestStreamPolicy(unittest.TestCase):
+    def test_retries_rate_limit_then_succeeds(self):
+        client = FakeClient([LLMHTTPError("slow down", 429, retry_after=0), ["feat: ", "x"]])
+        text, usage = client.generate("prompt")
+        self.assertEqual(text, "feat: x")
+        self.assertEqual(client.calls, 2)
+        self.assertEqual(usage, {"completion_tokens": 2})
+
+    def test_gives_up_after_max_retries(self):
+        client = FakeClient([LLMHTTPError("busy", 503)], {"max_retries": 2, "retry_backoff": 0.001})
+        with self.assertRaises(LLMHTTPError):
+            client.generate("prompt")
+        self.assertEqual(client.calls, 3)
+
+    def test_client_errors_are_not_retried(self):
+        client = FakeClient([LLMHTTPError("bad request", 400), ["unused"]])
+        with self.assertRaises(LLMHTTPError):
+            client.generate("prompt")
+        self.assertEqual(client.calls, 1)
+
+    def test_first_token_timeout_is_retried(self):
+        client = FakeClient([["late"]], {"first_token_timeout": 0.05, "retry_backoff": 0.001}, chunk_delay=0.2)
+        start = time.monotonic()
+        with self.assertRaises(LLMTimeoutError) as ctx:
+            client.generate("prompt")
+        self.assertTrue(ctx.exception.first_token)
+        self.assertEqual(client.calls, 3)
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_overall_timeout_after_first_token_is_not_retried(self):
+        client = FakeClient([["a", "b", "c", "d"]], {"timeout": 0.1}, chunk_delay=0.04)
+        with self.assertRaises(LLMTimeoutError):
+            client.generate("prompt")
+        self.assertEqual(client.calls, 1)
+
+    def test_cancel_closes_blocked_stream(self):
+        client = FakeClient(["block"])
+        token = CancellationToken()
+        threading.Timer(0.05, token.cancel).start()
+        start = time.monotonic()
+        with self.assertRaises(LLMCancelledError):
+            client.generate("prompt", token)
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertTrue(client.stream_obj.closed.wait(1))
+
+    def test_cancel_during_backoff(self):
+        client = FakeClient([LLMHTTPError("slow down", 429, retry_after=30)])
+        token = CancellationToken()
+        threading.Timer(0.05, token.cancel).start()
+        start = time.monotonic()
+        with self.assertRaises(LLMCancelledError):
+            client.generate("prompt", token)
+        self.assertLess(time.monotonic() - start, 1.0)
+
+
+class CandidateClient(LLMClient):
+    """Counts requests; stream_chat() answers "cand<request number>"."""
+
+    def __init__(self, choices=None, fail=(), fail_late=()):
+        super().__init__({"retry_backoff": 0.001, "max_retries": 0})
+        self.choices = choices
+        self.fail = set(fail)
+        self.fail_late = set(fail_late)
+        self.lock = threading.Lock()
+        self.started = []
+
+    @property
+    def supports_choices(self):
+        return self.choices is not None
+
+    def generate_commit_message(self, prompt):
+        raise NotImplementedError
+
+    def stream_chat(self, messages):
+        with self.lock:
+            number = len(self.started)
+            self.started.append(time.monotonic())
+        if number in self.fail:
+            raise ValueError("bad candidate")
+        time.sleep(0.05)
+        yield f"cand{number}", None
+        if number in self.fail_late:
+            raise ConnectionError("stream cut")
+        time.sleep(0.05)
+        yield "", {"prompt_tokens": 100, "completion_tokens": 2, "total_tokens": 102}
+
+    def stream_choices(self, messages, n, temperature):
+        self.started.append(time.monotonic())
+        self.temperature = temperature
+        for index in self.choices:
+            yield f"choice{index}", None, index
+        yield "", {"prompt_tokens": 100, "completion_tokens": 2 * len(self.choices), "total_tokens": 104}, ALL_CHOICES
+
+
+class ClosableStream:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class StallingCandidateClient(CandidateClient):
+    """Every candidate streams 20 chunks through a tracked stream; the requests in stall never send a token."""
+
+    def __init__(self, stall, first_token_timeout):
+        super().__init__()
+        self.timeouts = Timeouts(first_token=first_token_timeout)
+        self.stall = set(stall)
+
+    def stream_chat(self, messages):
+        with self.lock:
+            number = len(self.started)
+            self.started.append(time.monotonic())
+        stream = self._track_stream(ClosableStream())
+        try:
+            if number in self.stall:
+                while not stream.closed:
+                    time.sleep(0.01)
+                return
+            for _ in range(20):
+                time.sleep(0.02)
+                if stream.closed:
+                    raise ConnectionError("stream closed")
+                yield "x", None
+            yield "", {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120}
+        finally:
+            self._untrack_stream(stream)
+
+
+class TestCandidates(unittest.TestCase):
+    def test_native_choices_bill_the_prompt_once(self):
+        client = CandidateClient(choices=[0, 1])
+        texts, usage = client.generate_candidates("prompt", 2, temperature=0.9)
+        self.assertEqual((texts, client.temperature, len(client.started)), (["choice0", "choice1"], 0.9, 1))
+        self.assertEqual(usage["prompt_tokens"], 100)
+
+    def test_ignored_choices_are_topped_up(self):
+        # n を無視して1件しか返さない互換サーバー
+        client = CandidateClient(choices=[0])
+        texts, _ = client.generate_candidates("prompt", 3)
+        self.assertEqual(sorted(texts), ["cand1", "cand2", "choice0"])
+
+    def test_fallback_waits_for_the_first_token_then_fans_out(self):
+        client = CandidateClient()
+        texts, usage = client.generate_candidates("prompt", 3)
+        self.assertEqual(sorted(texts), ["cand0", "cand1", "cand2"])
+        first, *rest = client.started
+        self.assertTrue(all(t - first >= 0.04 for t in rest))
+        # 残りは並行に送られる
+        self.assertLess(max(rest) - min(rest), 0.04)
+        self.assertEqual(usage["prompt_tokens"], 300)
+
+    def test_failed_candidate_is_dropped_unless_all_fail(self):
+        texts, _ = CandidateClient(fail={1}).generate_candidates("prompt", 3)
+        self.assertEqual(len(texts), 2)
+        with self.assertRaises(ValueError):
+            CandidateClient(fail={0, 1, 2}).generate_candidates("prompt", 3)
+
+    def test_partly_streamed_failure_is_not_a_candidate(self):
+        texts, _ = CandidateClient(fail_late={1}).generate_candidates("prompt", 3)
+        self.assertEqual(sorted(texts), ["cand0", "cand2"])
+
+    def test_closing_the_stream_cancels_running_candidates(self):
+        client = StallingCandidateClient(stall={1, 2}, first_token_timeout=5)
+        stream = client.stream_candidates("prompt", 3)
+        # 2つ目のチャンクを受け取る時点で残りのリクエストは送られている
+        self.assertEqual([next(stream)[0] for _ in range(2)], ["x", "x"])
+        stream.close()
+        deadline = time.monotonic() + 1
+        while client._open_streams and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(client._open_streams, [])
+
+    def test_cancel(self):
+        token = CancellationToken()
+        token.cancel()
+        with self.assertRaises(LLMCancelledError):
+            CandidateClient().generate_candidates("prompt", 3, cancel_token=token)
+
+    def test_stalled_candidate_does_not_close_the_others(self):
+        # 1番目のリクエストが最初のトークンを返した後に送られる3件のうち1件が止まる
+        client = StallingCandidateClient(stall={2}, first_token_timeout=0.3)
+        texts, usage = client.generate_candidates("prompt", 4)
+        self.assertEqual(texts, ["x" * 20] * 3)
+        self.assertEqual(usage["prompt_tokens"], 300)
+        self.assertEqual(client._open_streams, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
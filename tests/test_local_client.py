@@ -0,0 +1,135 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from komitto.llm import create_llm_client
+from komitto.llm.base import LLMTimeoutError
+from komitto.llm.local_client import LlamaCppClient, OllamaClient, _POOL
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def _send_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path, body))
+        # コールドスタートのモデル読み込み
+        time.sleep(self.server.delay)
+
+        if self.path == "/api/generate":
+            data = json.dumps({"done": True, "load_duration": 2_500_000_000}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        if self.path == "/api/chat":
+            for word in ["feat: ", "add ", "stub"]:
+                self._send_chunk(json.dumps({"message": {"content": word}, "done": False}).encode() + b"\n")
+            final = {
+                "message": {"content": ""}, "done": True,
+                "prompt_eval_count": 12, "eval_count": 3,
+                "load_duration": 1_000_000, "prompt_eval_duration": 5_000_000,
+                "eval_duration": 30_000_000, "total_duration": 40_000_000,
+            }
+            self._send_chunk(json.dumps(final).encode() + b"\n")
+        elif self.path == "/completion":
+            self._send_chunk(b'data: {"content": "fix: ", "stop": false}\n\n')
+            self._send_chunk(b'data: {"content": "bug", "stop": false}\n\n')
+            final = {"content": "", "stop": True, "timings": {"prompt_n": 7, "prompt_ms": 3.5, "predicted_n": 2, "predicted_ms": 20.0}}
+            self._send_chunk(b"data: " + json.dumps(final).encode() + b"\n\n")
+        self._send_chunk(b"")
+
+
+class TestLocalClients(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        cls.server.daemon_threads = True
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        _POOL.clear()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _POOL.clear()
+        self.server.connections = 0
+        self.server.requests = []
+        self.server.delay = 0
+
+    def test_factory_registers_local_providers(self):
+        self.assertIsInstance(create_llm_client({"provider": "ollama"}), OllamaClient)
+        self.assertIsInstance(create_llm_client({"provider": "llamacpp"}), LlamaCppClient)
+
+    def test_ollama_stream_and_timings(self):
+        client = OllamaClient({"base_url": self.base_url + "/v1", "model": "qwen", "keep_alive": "1h"})
+        chunks = list(client.stream_commit_message("prompt"))
+
+        self.assertEqual("".join(c for c, _ in chunks), "feat: add stub")
+        usage = chunks[-1][1]
+        self.assertEqual(usage["prompt_tokens"], 12)
+        self.assertEqual(usage["completion_tokens"], 3)
+        self.assertAlmostEqual(usage["load_ms"], 1.0)
+        self.assertAlmostEqual(usage["eval_ms"], 30.0)
+
+        path, body = self.server.requests[0]
+        self.assertEqual(path, "/api/chat")
+        self.assertEqual(body["keep_alive"], "1h")
+        self.assertEqual(body["messages"], [{"role": "user", "content": "prompt"}])
+
+    def test_connection_is_pooled(self):
+        client = OllamaClient({"base_url": self.base_url, "model": "qwen"})
+        for _ in range(3):
+            self.assertEqual(client.generate_commit_message("p")[0], "feat: add stub")
+        self.assertEqual(self.server.connections, 1)
+
+    def test_ollama_warmup(self):
+        client = OllamaClient({"base_url": self.base_url, "model": "qwen"})
+        timings = client.warmup()
+        self.assertAlmostEqual(timings["load_ms"], 2500.0)
+        self.assertEqual(self.server.requests[0][1]["prompt"], "")
+
+    def test_connect_timeout_does_not_limit_the_first_byte(self):
+        self.server.delay = 0.4
+        client = OllamaClient({"base_url": self.base_url, "model": "qwen", "connect_timeout": 0.1, "max_retries": 0})
+        self.assertAlmostEqual(client.warmup()["load_ms"], 2500.0)
+        self.assertEqual(client.generate("p")[0], "feat: add stub")
+        # 全体のタイムアウトは引き続き効く
+        client = OllamaClient({"base_url": self.base_url, "model": "qwen", "timeout": 0.2, "max_retries": 0})
+        with self.assertRaises(LLMTimeoutError):
+            client.generate("p")
+
+    def test_llamacpp_stream_and_timings(self):
+        client = LlamaCppClient({"base_url": self.base_url})
+        chunks = list(client.stream_chat([{"role": "user", "content": "prompt"}]))
+
+        self.assertEqual("".join(c for c, _ in chunks), "fix: bug")
+        self.assertEqual(chunks[-1][1]["prompt_tokens"], 7)
+        self.assertEqual(chunks[-1][1]["eval_ms"], 20.0)
+        self.assertTrue(self.server.requests[0][1]["cache_prompt"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from xml.etree import ElementTree
+
+from komitto.cache import Cache
+from komitto.llm.base import LLMClient
+from komitto.prompt import TRUNCATED_MARK, build_prompt, render_files_xml, split_diff
+from komitto.summarize import MapReducePlan, group_fragments, needs_map_reduce
+
+
+def make_diff(n):
+    parts = []
+    for i in range(n):
+        parts.append(
+            f"diff --git f{i}.py f{i}.py\n"
+            f"index {i:040x}..{i + 1:040x} 100644\n"
+            f"--- f{i}.py\n+++ f{i}.py\n"
+            f"@@ -1 +1 @@\n-old {i}\n+new {i}"
+        )
+    return "\n".join(parts)
+
+
+class FakeClient(LLMClient):
+    lock = threading.Lock()
+    calls = 0
+    fail_on = set()
+
+    def __init__(self, config):
+        pass
+
+    def generate_commit_message(self, prompt):
+        with FakeClient.lock:
+            FakeClient.calls += 1
+        for marker in FakeClient.fail_on:
+            if marker in prompt:
+                raise RuntimeError("boom")
+        return f"summary of {prompt.count('<file ')} files", None
+
+
+class TestMapReduce(unittest.TestCase):
+    def setUp(self):
+        FakeClient.calls = 0
+        FakeClient.fail_on = set()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = Cache(Path(self.tmp.name) / "cache.sqlite3")
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def make_plan(self):
+        config = {"provider": "fake", "map_group_chars": 300, "map_concurrency": 2}
+        return MapReducePlan(config, "SYSTEM", None, "", split_diff(make_diff(10)),
+                             cache=self.cache, client_factory=FakeClient)
+
+    def test_group_fragments_respects_budget(self):
+        groups = group_fragments(["a" * 40, "b" * 40, "c" * 40, "d" * 90], 100)
+        self.assertEqual(len(groups), 3)
+        self.assertTrue(all(len(g) <= 100 for g in groups))
+
+    def test_oversized_file_is_split_on_chunk_boundaries(self):
+        hunks = "".join(f"@@ -{i} +{i} @@ def f{i}():\n-a & {i}\n+b < {i}\n" for i in range(6))
+        big = split_diff(f"diff --git big.py big.py\nindex 1..2 100644\n--- big.py\n+++ big.py\n{hunks}"
+                         f"@@ -9 +9 @@\n+{'x & y ' * 100}\n")[0]
+        small = split_diff(make_diff(1))[0]
+        fragments = render_files_xml([small, big])
+        groups = group_fragments(fragments, 500, [small, big])
+        self.assertEqual(groups[0], fragments[0])
+        self.assertGreater(len(groups), 2)
+        for group in groups[1:]:
+            self.assertLessEqual(len(group), 500)
+            # どのグループも完全な <file> 要素で、チャンクやエンティティの途中で切れていない
+            ElementTree.fromstring(group)
+        text = "".join(groups[1:])
+        self.assertEqual(text.count("<chunk "), 7)
+        self.assertIn("def f5()", text)
+        self.assertIn(TRUNCATED_MARK, text)
+
+    def test_needs_map_reduce(self):
+        self.assertTrue(needs_map_reduce("x" * 11, {"max_input_chars": 10}))
+        self.assertFalse(needs_map_reduce("x" * 11, {"max_input_chars": 10, "map_reduce": False}))
+        self.assertTrue(needs_map_reduce("x", {"map_reduce": "always"}))
+
+    def test_rerun_after_failure_only_redoes_missing_groups(self):
+        plan = self.make_plan()
+        total = len(plan)
+        self.assertGreater(total, 2)
+
+        FakeClient.fail_on = {"new 9"}
+        with self.assertRaises(RuntimeError):
+            plan.run_map()
+        self.assertEqual(FakeClient.calls, total)
+
+        FakeClient.calls = 0
+        FakeClient.fail_on = set()
+        progress = []
+        summaries = self.make_plan().run_map(lambda done, total: progress.append(done))
+
+        self.assertEqual(FakeClient.calls, 1)
+        self.assertEqual(progress[0], total - 1)
+        self.assertEqual(progress[-1], total)
+        self.assertTrue(all(summaries))
+
+    def test_reduce_prompt_contains_summaries(self):
+        plan = self.make_plan()
+        plan.run_map()
+        prompt = plan.reduce_prompt()
+        self.assertTrue(prompt.startswith("SYSTEM"))
+        self.assertIn(f"### Part {len(plan)}/{len(plan)}", prompt)
+
+        # システム・履歴・追加コンテキストは通常のプロンプトと同じセクションを使う
+        plan = MapReducePlan({"provider": "fake"}, "SYSTEM", "LOG", "CONTEXT", split_diff(make_diff(1)),
+                             client_factory=FakeClient)
+        header = build_prompt("SYSTEM", "LOG", "CONTEXT", make_diff(1)).split("以下より<changeset>")[0]
+        self.assertTrue(plan.reduce_prompt().startswith(header.rstrip("\n")))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from komitto.cache import Cache
+from komitto.git_utils import get_staged_paths, read_tree, unstage_paths, write_tree
+from komitto.llm.base import LLMClient
+from komitto.monorepo import ROOT_PACKAGE, MonorepoPlan, partition_files, partition_paths
+from komitto.prompt import split_diff
+from komitto.scheduler import run_bounded
+
+
+def make_diff(paths):
+    return "\n".join(
+        f"diff --git {p} {p}\nindex {i:040x}..{i + 1:040x} 100644\n--- {p}\n+++ {p}\n@@ -1 +1 @@\n-old\n+new {p}"
+        for i, p in enumerate(paths)
+    )
+
+
+class PackageClient(LLMClient):
+    lock = threading.Lock()
+    prompts = []
+
+    def __init__(self, config):
+        pass
+
+    def generate_commit_message(self, prompt):
+        with PackageClient.lock:
+            PackageClient.prompts.append(prompt)
+        package = prompt.split("`")[1]
+        return f"- updated {package}", None
+
+
+class TestPartition(unittest.TestCase):
+    def test_prefixes_use_longest_match(self):
+        partitions = partition_paths(
+            ["apps/web/src/a.ts", "apps/web-admin/b.ts", "libs/core/c.py", "README.md"],
+            {"packages": ["apps/web", "apps/web-admin/", "libs"]},
+        )
+        self.assertEqual(list(partitions), ["apps/web", "apps/web-admin", "libs", ROOT_PACKAGE])
+        self.assertEqual(partitions["libs"], ["libs/core/c.py"])
+
+    def test_nearest_marker(self):
+        with tempfile.TemporaryDirectory() as root:
+            for marker in ("services/api/pyproject.toml", "services/api/plugins/x/package.json"):
+                Path(root, marker).parent.mkdir(parents=True, exist_ok=True)
+                Path(root, marker).write_text("")
+            partitions = partition_paths(
+                ["services/api/src/app.py", "services/api/plugins/x/index.js", "services/other.txt"],
+                {},
+                root,
+            )
+        self.assertEqual(partitions, {
+            "services/api": ["services/api/src/app.py"],
+            "services/api/plugins/x": ["services/api/plugins/x/index.js"],
+            ROOT_PACKAGE: ["services/other.txt"],
+        })
+
+
+class TestMonorepoPlan(unittest.TestCase):
+    def setUp(self):
+        PackageClient.prompts = []
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = Cache(Path(self.tmp.name) / "cache.sqlite3")
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def make_plan(self):
+        files = split_diff(make_diff(["api/a.py", "api/b.py", "web/c.ts", "setup.cfg"]))
+        partitions = partition_files(files, {"packages": ["api", "web"]})
+        return MonorepoPlan({"provider": "fake", "map_concurrency": 3}, "SYSTEM", None, "", partitions,
+                            cache=self.cache, client_factory=PackageClient)
+
+    def test_one_summary_per_package_composed_into_sections(self):
+        plan = self.make_plan()
+        plan.run_map()
+        self.assertEqual(len(PackageClient.prompts), 3)
+        prompt = plan.reduce_prompt()
+        self.assertIn('<package name="api">\n- updated api\n</package>', prompt)
+        self.assertIn('<package name="web">', prompt)
+        self.assertLess(prompt.index('name="web"'), prompt.index(f'name="{ROOT_PACKAGE}"'))
+        self.assertEqual(set(plan.package_latencies()), {"api", "web", ROOT_PACKAGE})
+
+    def test_summaries_are_cached(self):
+        self.make_plan().run_map()
+        PackageClient.prompts = []
+        plan = self.make_plan()
+        plan.run_map()
+        self.assertEqual(PackageClient.prompts, [])
+        self.assertTrue(all(line.endswith("cached") for line in plan.latency_report()))
+
+
+class TestScheduler(unittest.TestCase):
+    def test_run_bounded_limits_concurrency(self):
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def work(i):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+            return i * 2
+
+        results = {i: f.result() for i, f in run_bounded(work, range(12), 3)}
+        self.assertEqual(results, {i: i * 2 for i in range(12)})
+        self.assertLessEqual(peak, 3)
+
+
+@unittest.skipIf(os.name == "nt", "uses a POSIX git setup")
+class TestIndexNarrowing(unittest.TestCase):
+    def test_unstage_and_restore(self):
+        with tempfile.TemporaryDirectory() as repo:
+            env = dict(os.environ, GIT_AUTHOR_NAME="a", GIT_AUTHOR_EMAIL="a@example.com",
+                       GIT_COMMITTER_NAME="a", GIT_COMMITTER_EMAIL="a@example.com")
+            cwd = os.getcwd()
+            os.chdir(repo)
+            try:
+                subprocess.run(["git", "init", "-q"], check=True)
+                Path("base").write_text("0")
+                subprocess.run(["git", "add", "base"], check=True)
+                subprocess.run(["git", "commit", "-qm", "init"], check=True, env=env)
+                for name in ("api.py", "web.ts"):
+                    Path(name).write_text(name)
+                subprocess.run(["git", "add", "."], check=True)
+
+                tree = write_tree()
+                unstage_paths(["web.ts"])
+                self.assertEqual(get_staged_paths(), ["api.py"])
+                read_tree(tree)
+                self.assertEqual(get_staged_paths(), ["api.py", "web.ts"])
+            finally:
+                os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    unittest.main()
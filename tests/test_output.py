@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from komitto import output
+from komitto.output import (DELIVERED_CLIPBOARD, DELIVERED_FILE, DELIVERED_PRINT, ClipboardError,
+                            copy_to_clipboard, deliver_prompt, save_prompt, write_output)
+
+
+@unittest.skipIf(os.name == "nt", "uses POSIX commands as the clipboard tool")
+class TestDeliverPrompt(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.clip = self.dir / "clipboard"
+        patches = [
+            mock.patch.object(output, "prompt_dir", lambda: self.dir / "prompts"),
+            mock.patch.object(output, "clipboard_command", lambda: ["sh", "-c", f"cat > {self.clip}"]),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_small_prompt_is_streamed_to_the_tool(self):
+        text = "<changeset>\n" + "あ" * 1000
+        delivery = deliver_prompt(text)
+        self.assertEqual(delivery.method, DELIVERED_CLIPBOARD)
+        self.assertEqual(self.clip.read_text(encoding="utf-8"), text)
+
+    def test_large_prompt_copies_only_the_path(self):
+        text = "x" * (2 * 1024 * 1024)
+        delivery = deliver_prompt(text, {"clipboard_max_bytes": 1024 * 1024})
+        self.assertEqual((delivery.method, delivery.reference_copied), (DELIVERED_FILE, True))
+        self.assertEqual(delivery.path.read_text(), text)
+        self.assertEqual(self.clip.read_text(), str(delivery.path))
+
+    def test_hanging_tool_times_out(self):
+        with mock.patch.object(output, "clipboard_command", lambda: ["sleep", "30"]):
+            start = time.perf_counter()
+            with self.assertRaises(ClipboardError):
+                copy_to_clipboard("x" * (4 * 1024 * 1024), timeout=0.3)
+            self.assertLess(time.perf_counter() - start, 2)
+
+            self.assertEqual(deliver_prompt("small", {"clipboard_timeout": 0.2}).method, DELIVERED_PRINT)
+            delivery = deliver_prompt("x" * 100_000, {"clipboard_timeout": 0.2})
+            self.assertEqual((delivery.method, delivery.reference_copied), (DELIVERED_FILE, False))
+
+    def test_old_prompt_files_are_pruned(self):
+        directory = self.dir / "prompts"
+        directory.mkdir()
+        for i in range(output.KEEP_PROMPT_FILES + 3):
+            path = directory / f"prompt-{i}.txt"
+            path.write_text(str(i))
+            os.utime(path, (i, i))
+        latest = save_prompt("last", directory)
+        remaining = sorted(directory.glob("prompt-*.txt"))
+        self.assertEqual(len(remaining), output.KEEP_PROMPT_FILES)
+        self.assertIn(latest, remaining)
+        self.assertFalse((directory / "prompt-0.txt").exists())
+
+
+class TestWriteOutput(unittest.TestCase):
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "prompt.txt"
+            write_output("プロンプト\n" * 10, str(path))
+            self.assertEqual(path.read_text(encoding="utf-8"), "プロンプト\n" * 10)
+
+    @unittest.skipIf(os.name == "nt", "uses a POSIX git setup")
+    def test_cli_pipes_prompt_to_stdout(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            subprocess.run(["git", "init", "-q"], cwd=tmp, check=True)
+            Path(tmp, "komitto.toml").write_text('[llm]\nhistory_limit = 0\n\n[cache]\nenabled = false\n')
+            Path(tmp, ".git/info/exclude").write_text("komitto.toml\n")
+            Path(tmp, "app.py").write_text("def main():\n    return 1\n")
+            subprocess.run(["git", "add", "app.py"], cwd=tmp, check=True)
+            result = subprocess.run([sys.executable, "-m", "komitto.main", "--output", "-"], cwd=tmp,
+                                    capture_output=True, text=True, encoding="utf-8")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('<file path="app.py">', result.stdout)
+        self.assertTrue(result.stdout.endswith("</changeset>"))
+
+
+if __name__ == "__main__":
+    unittest.main()
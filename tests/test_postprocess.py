@@ -0,0 +1,143 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from komitto.cache import Cache
+from komitto.llm.base import LLMClient
+from komitto.llm.events import Done, StreamMetrics, TextDelta, Usage
+from komitto.postprocess import (MessageRules, StreamCleaner, clean_events, clean_text, format_message, postprocess,
+                                 record_avoided, result_notes, validate)
+
+FENCED = "Here is the commit message:\n\n```text\nfeat(api): add pagination\n\nSupport cursors.\n```\n\nLet me know if you want changes."
+CONVENTIONAL = MessageRules(conventional=True, scopes=["api", "cli"])
+
+
+class RepairClient(LLMClient):
+    def __init__(self, reply):
+        self.reply = reply
+        self.requests = []
+
+    def generate_commit_message(self, prompt):
+        self.requests.append(prompt)
+        return self.reply, None
+
+
+class TestStreamCleaner(unittest.TestCase):
+    def test_fences_preamble_and_postamble_are_removed_at_any_split(self):
+        for size in (1, 3, 7, len(FENCED)):
+            cleaner = StreamCleaner()
+            out = "".join(cleaner.feed(FENCED[i:i + size]) for i in range(0, len(FENCED), size)) + cleaner.finish()
+            self.assertEqual(out.strip(), "feat(api): add pagination\n\nSupport cursors.", size)
+
+    def test_plain_text_streams_without_waiting_for_the_line(self):
+        cleaner = StreamCleaner()
+        self.assertEqual(cleaner.feed("feat: add"), "feat: add")
+        self.assertEqual(cleaner.feed(" x"), " x")
+        # 前置きになりうる書き出しと、フェンスになりうる行は保留する
+        cleaner = StreamCleaner()
+        self.assertEqual(cleaner.feed("Her"), "")
+        self.assertEqual(cleaner.feed("e is it:\n\nfix: y\n``"), "fix: y\n")
+        self.assertEqual(cleaner.finish(), "``")
+
+    def test_subject_that_looks_like_a_preamble_is_kept(self):
+        text = "Commit message cache: reuse entries\n\nBody line"
+        self.assertEqual(clean_text(text), text)
+        result = postprocess(text, MessageRules())
+        self.assertEqual(result.text, text)
+        self.assertFalse(result.regeneration_avoided)
+        # コロンで終わっても、空行かフェンスが続かなければ、あるいは唯一の行なら捨てない
+        self.assertEqual(clean_text("Sure, handle the following:\n- a"), "Sure, handle the following:\n- a")
+        self.assertEqual(clean_text("Here is the plan:"), "Here is the plan:")
+        self.assertEqual(clean_text("Here is the plan:\n\n"), "Here is the plan:\n\n")
+        # コミットメッセージに言及する前置きは、空行なしで件名が続いても捨てる
+        for size in (1, 4, 100):
+            cleaner = StreamCleaner()
+            text = "Here is the commit message:\nfeat: add x\n\nBody"
+            out = "".join(cleaner.feed(text[i:i + size]) for i in range(0, len(text), size)) + cleaner.finish()
+            self.assertEqual(out, "feat: add x\n\nBody", size)
+            self.assertTrue(cleaner.removed)
+        self.assertEqual(clean_text("Here is the commit message:"), "Here is the commit message:")
+
+    def test_clean_events_flushes_before_usage(self):
+        events = [TextDelta("```\nfix: a\n", 0.0), TextDelta("```", 0.0), Usage(1, 1, 2, 0.0), Done(0.0, StreamMetrics())]
+        out = list(clean_events(events, MessageRules()))
+        self.assertEqual("".join(e.text for e in out if isinstance(e, TextDelta)), "fix: a\n")
+        self.assertIsInstance(out[-1], Done)
+
+
+class TestFormatAndValidate(unittest.TestCase):
+    def test_body_is_wrapped_but_code_and_trailers_are_kept(self):
+        long = "This change " + "updates the pagination logic " * 5
+        text = "\n".join(["fix: handle empty pages.", "- " + long, "    code_line(" + "x" * 80 + ")",
+                          "Refs: https://example.com/" + "a" * 80])
+        formatted = format_message(text, CONVENTIONAL)
+        lines = formatted.split("\n")
+        self.assertEqual(lines[:2], ["fix: handle empty pages", ""])
+        self.assertTrue(all(len(line) <= 72 for line in lines[2:-2]))
+        self.assertTrue(lines[3].startswith("  "))
+        self.assertEqual(lines[-2:], text.split("\n")[-2:])
+
+    def test_conventional_rules(self):
+        self.assertEqual(validate("feat(api): add x", CONVENTIONAL), [])
+        self.assertEqual(len(validate("Add x", CONVENTIONAL)), 1)
+        self.assertIn("wip", validate("wip: x", CONVENTIONAL)[0])
+        self.assertIn("web", validate("feat(web): x", CONVENTIONAL)[0])
+        self.assertIn("80", validate("feat: " + "x" * 74, CONVENTIONAL)[0])
+        self.assertEqual(validate("Add x", MessageRules()), [])
+
+
+class TestPostprocess(unittest.TestCase):
+    def test_local_cleanup_needs_no_request(self):
+        client = RepairClient("unused")
+        result = postprocess(FENCED, CONVENTIONAL, client)
+        self.assertEqual(result.text, "feat(api): add pagination\n\nSupport cursors.")
+        self.assertEqual(client.requests, [])
+        self.assertTrue(result.regeneration_avoided)
+
+    def test_targeted_repair_sends_only_the_message(self):
+        client = RepairClient("```\nfeat(cli): add a flag to skip hooks\n\nBody.\n```")
+        raw = "Added a flag to skip hooks during the commit so that slow hooks do not block interactive use\n\nBody."
+        result = postprocess(raw, CONVENTIONAL, client)
+        self.assertEqual(result.text, "feat(cli): add a flag to skip hooks\n\nBody.")
+        self.assertTrue(result.repaired and result.regeneration_avoided)
+        self.assertEqual(len(client.requests), 1)
+        self.assertIn(raw.split("\n")[0], client.requests[0])
+        self.assertLess(len(client.requests[0]), 1000)
+
+    def test_failed_repair_keeps_the_message_and_reports(self):
+        result = postprocess("Add x", CONVENTIONAL, RepairClient("still wrong"))
+        self.assertEqual((result.text, result.repaired), ("Add x", False))
+        self.assertFalse(result.regeneration_avoided)
+        self.assertEqual(len(result_notes(result)), 1)
+
+    def test_cleanup_on_the_stream_counts_as_an_avoided_regeneration(self):
+        events = [TextDelta(FENCED[i:i + 5], 0.0) for i in range(0, len(FENCED), 5)] + [Usage(1, 1, 2, 0.0)]
+        cleaner = StreamCleaner()
+        text = "".join(e.text for e in clean_events(events, MessageRules(), cleaner) if isinstance(e, TextDelta))
+        self.assertTrue(cleaner.removed)
+        self.assertFalse(postprocess(text, MessageRules()).regeneration_avoided)
+        result = postprocess(text, MessageRules(), cleaned=cleaner.removed)
+        self.assertEqual(result.text, "feat(api): add pagination\n\nSupport cursors.")
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = Cache(Path(tmp) / "cache.sqlite3")
+            result_notes(result, cache)
+            self.assertEqual(record_avoided(cache), 2)
+            cache.close()
+        clean = StreamCleaner()
+        clean.feed("feat: a\n\nbody")
+        clean.finish()
+        self.assertFalse(clean.removed)
+
+    def test_avoided_regenerations_are_counted(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = Cache(Path(tmp) / "cache.sqlite3")
+            result = postprocess(FENCED, MessageRules())
+            result_notes(result, cache)
+            self.assertEqual(record_avoided(cache), 2)
+            cache.close()
+        self.assertIsNone(record_avoided(None))
+        self.assertEqual(clean_text("fix: a"), "fix: a")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from unittest import mock
+
+from komitto.history import LOG_SEPARATOR
+from komitto.preview import PromptPreview
+from komitto.prompt import SECTION_FILE, SECTION_HISTORY, build_prompt, split_diff
+from komitto.tokens import estimate_tokens
+
+DIFF = """diff --git app.py app.py
+index 1111111..2222222 100644
+--- app.py
++++ app.py
+@@ -1,2 +1,2 @@ def main():
+-    return 1
++    return 2
+@@ -10,2 +10,3 @@ class Handler:
++    def close(self):
++        pass
+diff --git docs.md docs.md
+index 3333333..4444444 100644
+--- docs.md
++++ docs.md
+@@ -1 +1 @@
+-old
++new
+"""
+
+LOGS = LOG_SEPARATOR.join([
+    "Commit: aaa\nDate: 2024-01-01\nMessage:\nfeat: add a\n\n[Files]\nA\ta.py",
+    "Commit: bbb\nDate: 2024-01-02\nMessage:\nfix: b\n\n[Files]\nM\tb.py",
+])
+
+
+def index_of(preview, kind, label=None):
+    return next(i for i, s in enumerate(preview.sections) if s.kind == kind and (label is None or s.label == label))
+
+
+class TestPromptPreview(unittest.TestCase):
+    def test_untouched_preview_matches_build_prompt(self):
+        preview = PromptPreview("SYSTEM", LOGS, "context", DIFF)
+        self.assertEqual(preview.assemble(), build_prompt("SYSTEM", LOGS, "context", DIFF))
+        app = preview.sections[index_of(preview, SECTION_FILE, "app.py")]
+        self.assertEqual([p.label for p in app.parts], ["@@ def main():", "@@ class Handler:"])
+        history = preview.sections[index_of(preview, SECTION_HISTORY)]
+        self.assertEqual([p.label for p in history.parts], ["Commit: aaa", "Commit: bbb"])
+
+    def test_excluded_parts_match_a_smaller_prompt(self):
+        preview = PromptPreview("SYSTEM", LOGS, "", DIFF)
+        preview.toggle(index_of(preview, SECTION_FILE, "docs.md"))
+        preview.toggle(index_of(preview, SECTION_HISTORY), 0)
+        app = index_of(preview, SECTION_FILE, "app.py")
+        preview.toggle(app, 1)
+
+        only_first_hunk = "\n".join(split_diff(DIFF)[0].lines[:6]) + "\n"
+        diff = f"diff --git app.py app.py\n{only_first_hunk}"
+        expected = build_prompt("SYSTEM", LOGS.split(LOG_SEPARATOR)[1], "", diff)
+        self.assertEqual(preview.assemble(), expected)
+        self.assertEqual(preview.excluded, 3)
+        self.assertEqual(preview.total_tokens, sum(estimate_tokens(s.text) + 1 for s in preview.sections if s.sent))
+
+        # 元に戻せば最初のプロンプトと同じになる
+        for args in [(index_of(preview, SECTION_FILE, "docs.md"),), (index_of(preview, SECTION_HISTORY), 0), (app, 1)]:
+            preview.toggle(*args)
+        self.assertEqual(preview.assemble(), build_prompt("SYSTEM", LOGS, "", DIFF))
+        self.assertEqual(preview.excluded, 0)
+
+    def test_toggle_renders_only_the_changed_section(self):
+        preview = PromptPreview("SYSTEM", None, "", DIFF)
+        with mock.patch("komitto.preview.estimate_tokens", wraps=estimate_tokens) as estimate, \
+                mock.patch("komitto.preview.render_chunks_xml") as render:
+            preview.toggle(index_of(preview, SECTION_FILE, "app.py"), 0)
+        self.assertEqual(estimate.call_count, 1)
+        render.assert_not_called()
+
+    def test_fixed_sections_cannot_be_excluded(self):
+        preview = PromptPreview("SYSTEM", None, "", DIFF)
+        before = preview.assemble()
+        preview.toggle(0)
+        self.assertEqual(preview.assemble(), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from komitto import profiling
+from komitto.profiling import finish_profiling, iterate, measure_import_time, stage, start_profiling
+
+
+def slow_items(n):
+    for i in range(n):
+        time.sleep(0.01)
+        yield i
+
+
+class TestProfiling(unittest.TestCase):
+    def tearDown(self):
+        finish_profiling()
+
+    def test_disabled_profiling_has_no_wrappers(self):
+        items = [1, 2]
+        self.assertIs(iterate("stream", items), items)
+        self.assertIs(stage("a"), stage("b"))
+        self.assertIsNone(finish_profiling())
+
+    def test_stages_record_time_memory_and_functions(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "out" / "profile.txt"
+            profiler = start_profiling(str(path))
+            with stage("build_prompt"):
+                data = [bytes(1000) + bytes([i % 256]) for i in range(2000)]
+                with stage("render"):
+                    sorted(data)
+            del data
+            for _ in iterate("stream", slow_items(3)):
+                with stage("render"):
+                    pass
+
+            stats = profiler.stages
+            self.assertEqual([stats["build_prompt"].calls, stats["render"].calls, stats["stream"].calls], [1, 4, 4])
+            self.assertGreater(stats["build_prompt"].peak, 2_000_000)
+            self.assertGreaterEqual(stats["stream"].wall, 0.03)
+            self.assertLess(stats["render"].wall, stats["stream"].wall)
+
+            with mock.patch.object(profiling, "measure_import_time", return_value=(12_000, [("komitto.main", 12_000, 500)])):
+                self.assertEqual(finish_profiling(), path)
+            report = path.read_text(encoding="utf-8")
+        self.assertIn("total: 12.0 ms", report)
+        self.assertIn("== Top functions: render ==", report)
+        self.assertIn("slow_items", report)
+        self.assertIsNone(profiling._profiler)
+
+    def test_import_time_is_parsed(self):
+        stderr = ("import time: self [us] | cumulative | imported package\n"
+                  "import time:       100 |        100 |   rich.text\n"
+                  "import time:       300 |        500 | komitto.main\n"
+                  "import time:        50 |         50 | json\n")
+        result = mock.Mock(stderr=stderr)
+        with mock.patch("komitto.profiling.subprocess.run", return_value=result):
+            total, modules = measure_import_time()
+        self.assertEqual(total, 550)
+        self.assertEqual(modules[0], ("komitto.main", 500, 300))
+
+
+if __name__ == "__main__":
+    unittest.main()
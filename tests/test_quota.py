@@ -0,0 +1,196 @@
+import json
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+from komitto.llm import quota
+from komitto.llm.base import CancellationToken, LLMCancelledError, LLMHTTPError
+from komitto.llm.local_client import OllamaClient, _POOL
+from komitto.llm.quota import QuotaManager, bucket_key
+
+# モックサーバーの上限: 毎秒 RATE リクエスト、瞬間的には CAPACITY まで
+RATE = 10.0
+CAPACITY = 5.0
+
+WORKER = """
+import json, sys
+from komitto.llm.base import LLMHTTPError
+from komitto.llm.local_client import OllamaClient
+base_url, quota_path, count = sys.argv[1], sys.argv[2], int(sys.argv[3])
+client = OllamaClient({"provider": "ollama", "base_url": base_url, "max_retries": 0,
+                       "rpm": %d, "quota_burst": 0.3, "quota_path": quota_path})
+waits = []
+client.on_quota_wait = waits.append
+ok = failed = 0
+for _ in range(count):
+    try:
+        client.generate("hi")
+        ok += 1
+    except LLMHTTPError:
+        failed += 1
+print(json.dumps({"ok": ok, "failed": failed, "waited": len(waits)}))
+""" % (RATE * 60)
+
+
+class LimitedHandler(BaseHTTPRequestHandler):
+    """Ollama の /api/chat を真似て、トークンバケットで毎秒 RATE リクエストに制限する"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        with server.lock:
+            now = time.monotonic()
+            server.tokens = min(CAPACITY, server.tokens + (now - server.updated) * RATE)
+            server.updated = now
+            allowed = server.tokens >= 1
+            if allowed:
+                server.tokens -= 1
+                server.accepted += 1
+            else:
+                server.rejected += 1
+
+        if not allowed:
+            data = b"rate limited"
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        # 本物の Ollama と同じく chunked で返す
+        data = json.dumps({"message": {"content": "ok"}, "done": True, "prompt_eval_count": 1, "eval_count": 1}).encode() + b"\n"
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n0\r\n\r\n")
+
+
+class TestQuotaManager(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "quota.sqlite3"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_processes_share_one_bucket_in_reservation_order(self):
+        # 同じファイルを開く2つのインスタンス = 2つのプロセス
+        a = QuotaManager("openai:k", rpm=60, tpm=6000, path=self.path, burst=2)
+        b = QuotaManager("openai:k", rpm=60, tpm=6000, path=self.path, burst=2)
+        other = QuotaManager("openai:other", rpm=60, path=self.path, burst=2)
+        waits = [a.reserve(10).wait, b.reserve(10).wait, a.reserve(10).wait, b.reserve(10).wait]
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertAlmostEqual(waits[2], 1.0, delta=0.1)
+        self.assertAlmostEqual(waits[3], 2.0, delta=0.1)
+        self.assertEqual(other.reserve(10).wait, 0.0)
+
+        # トークンの上限: 見込みより少なく使えば戻り、取り消した予約は丸ごと戻る
+        big = a.reserve(250)
+        self.assertAlmostEqual(big.wait, 3.0, delta=0.1)
+        a.release(big)
+        reservation = b.reserve(200)
+        b.settle(reservation, 20)
+        self.assertAlmostEqual(a.reserve(0).wait, 4.0, delta=0.1)
+
+        a.block(30)
+        self.assertGreater(b.reserve(0).wait, 29)
+
+    def test_config_and_keys(self):
+        self.assertIsNone(QuotaManager.from_config({"provider": "openai"}))
+        manager = QuotaManager.from_config({"provider": "openai", "api_key": "sk-secret", "rpm": 60,
+                                            "quota_path": str(self.path)})
+        self.assertNotIn("sk-secret", manager.key)
+        self.assertNotEqual(bucket_key({"provider": "openai", "api_key": "a"}), bucket_key({"provider": "openai", "api_key": "b"}))
+        self.assertEqual(bucket_key({"provider": "openai", "quota_key": "team"}), "team")
+
+    def test_cancel_while_queued_releases_the_reservation(self):
+        client = OllamaClient({"provider": "ollama", "rpm": 60, "quota_burst": 1, "quota_path": str(self.path)})
+        client.quota.reserve(0)
+        waits = []
+        token = CancellationToken()
+        client.on_quota_wait = lambda wait: (waits.append(wait), token.cancel())
+        with self.assertRaises(LLMCancelledError):
+            client.generate("hi", token)
+        self.assertAlmostEqual(waits[0], 1.0, delta=0.1)
+        self.assertAlmostEqual(client.quota.reserve(0).wait, 1.0, delta=0.1)
+
+    def test_connections_are_closed_after_each_operation(self):
+        opened = []
+        connect = sqlite3.connect
+
+        def tracking_connect(*args, **kwargs):
+            opened.append(connect(*args, **kwargs))
+            return opened[-1]
+
+        with mock.patch.object(quota.sqlite3, "connect", tracking_connect):
+            manager = QuotaManager("openai:k", rpm=60, tpm=6000, path=self.path)
+            manager.settle(manager.reserve(10), 5)
+        self.assertEqual(len(opened), 3)
+        for conn in opened:
+            with self.assertRaises(sqlite3.ProgrammingError):
+                conn.execute("SELECT 1")
+
+
+class TestQuotaAcrossProcesses(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), LimitedHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.tokens, self.server.updated = CAPACITY, time.monotonic()
+        self.server.accepted = self.server.rejected = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        _POOL.clear()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_without_quota_concurrent_requests_get_429(self):
+        client = OllamaClient({"provider": "ollama", "base_url": self.base_url, "max_retries": 0})
+        failures = []
+
+        def run():
+            try:
+                client.generate("hi")
+            except LLMHTTPError as e:
+                failures.append(e.status_code)
+
+        threads = [threading.Thread(target=run) for _ in range(24)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(failures)
+        self.assertEqual(set(failures), {429})
+
+    def test_many_processes_queue_instead_of_hitting_the_limit(self):
+        processes, per_process = 6, 4
+        quota_path = str(Path(self.tmp.name) / "quota.sqlite3")
+        workers = [subprocess.Popen([sys.executable, "-c", WORKER, self.base_url, quota_path, str(per_process)],
+                                    stdout=subprocess.PIPE, text=True) for _ in range(processes)]
+        results = [json.loads(worker.communicate(timeout=60)[0]) for worker in workers]
+
+        self.assertEqual(self.server.rejected, 0)
+        self.assertEqual(sum(r["ok"] for r in results), processes * per_process)
+        self.assertEqual(self.server.accepted, processes * per_process)
+        # 枠を待ったプロセスには待ち時間が通知されている
+        self.assertGreater(sum(r["waited"] for r in results), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
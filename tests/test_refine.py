@@ -0,0 +1,51 @@
+import unittest
+
+from komitto.llm.base import LLMClient
+from komitto.refine import Candidate, CandidateHistory, MODE_REFINE
+
+
+class EchoClient(LLMClient):
+    def generate_commit_message(self, prompt):
+        return prompt, None
+
+
+class TestCandidateHistory(unittest.TestCase):
+    def test_refine_keeps_conversation(self):
+        history = CandidateHistory("PROMPT")
+        history.add(Candidate(text="feat: first", messages=history.full_messages()))
+
+        messages = history.refine_messages("shorter")
+
+        self.assertEqual([m["role"] for m in messages], ["user", "assistant", "user"])
+        self.assertEqual(messages[0]["content"], "PROMPT")
+        self.assertEqual(messages[1]["content"], "feat: first")
+        self.assertIn("shorter", messages[2]["content"])
+
+    def test_flip_through_candidates(self):
+        history = CandidateHistory("PROMPT")
+        history.add(Candidate(text="a"))
+        history.add(Candidate(text="b", mode=MODE_REFINE, instruction="shorter"))
+
+        self.assertEqual(history.position(), "2/2")
+        self.assertEqual(history.previous().text, "a")
+        self.assertEqual(history.previous().text, "a")
+        self.assertEqual(history.next().text, "b")
+        self.assertEqual(history.next().text, "b")
+
+    def test_compare_to_full(self):
+        history = CandidateHistory("PROMPT")
+        history.add(Candidate(text="a", usage={"prompt_tokens": 1000}, elapsed=4.0))
+        refined = history.add(Candidate(text="b", mode=MODE_REFINE, usage={"prompt_tokens": 1020}, elapsed=1.0))
+
+        self.assertIn("1020 vs 1000", history.compare_to_full(refined))
+        self.assertEqual(history.compare_to_full(history.candidates[0]), "")
+
+    def test_default_stream_chat_flattens(self):
+        chunks = list(EchoClient().stream_chat([
+            {"role": "user", "content": "P"},
+            {"role": "assistant", "content": "A"},
+        ]))
+        self.assertEqual(chunks, [("[user]\nP\n\n[assistant]\nA", None)])
+
+if __name__ == '__main__':
+    unittest.main()
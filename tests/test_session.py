@@ -0,0 +1,138 @@
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import unittest
+from pathlib import Path
+
+from komitto.llm.base import LLMCancelledError
+from komitto.llm.events import TextDelta, Usage
+from komitto.session import (JOURNAL_NAME, ROTATED_NAME, SESSION_COMPARE, SESSION_SINGLE, STREAM_MAIN,
+                             SessionJournal, load_last_session)
+
+CONFIG = {"llm": {"provider": "openai", "model": "gpt-x", "api_key": "secret"}}
+
+
+def deltas(texts, fail=False):
+    for text in texts:
+        yield TextDelta(text, 0.0)
+    if fail:
+        raise LLMCancelledError()
+    yield Usage(10, 5, 15, 0.0)
+
+
+class TestSessionJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_candidates_and_interrupted_stream_are_restored(self):
+        journal = SessionJournal(self.dir)
+        journal.begin(SESSION_SINGLE, "/repo", "tree1", [(STREAM_MAIN, "PROMPT", {"model_name": "fast"}, CONFIG)])
+        list(journal.tap(deltas(["feat: ", "add x"]), STREAM_MAIN))
+        with self.assertRaises(LLMCancelledError):
+            list(journal.tap(deltas(["fix: ", "par"], fail=True), STREAM_MAIN, "refine", "shorter"))
+        journal.close()
+
+        session = load_last_session(self.dir, "/repo")
+        state = session.streams[STREAM_MAIN]
+        self.assertEqual([c["text"] for c in state.candidates], ["feat: add x"])
+        self.assertEqual((state.text, state.generating, state.latest), ("fix: par", True, "fix: par"))
+        self.assertEqual((state.options, state.model, session.tree), ({"model_name": "fast"}, "gpt-x", "tree1"))
+        self.assertEqual(session.load_prompt(self.dir, STREAM_MAIN), "PROMPT")
+        self.assertNotIn("secret", (self.dir / JOURNAL_NAME).read_text())
+        self.assertIsNone(load_last_session(self.dir, "/other"))
+
+    def test_postprocessed_text_replaces_the_streamed_candidate(self):
+        journal = SessionJournal(self.dir)
+        journal.begin(SESSION_SINGLE, "/repo", "t", [(STREAM_MAIN, "P", {}, CONFIG)])
+        list(journal.tap(deltas(["```\n", "feat: add x", "\n```"]), STREAM_MAIN))
+        journal.revise(STREAM_MAIN, "feat: add x")
+        list(journal.tap(deltas(["fix: y"]), STREAM_MAIN, "refine", "shorter"))
+        journal.revise(STREAM_MAIN, "fix: y")
+        self.assertEqual(journal.session.streams[STREAM_MAIN].candidates[0]["text"], "feat: add x")
+        journal.close()
+
+        state = load_last_session(self.dir).streams[STREAM_MAIN]
+        self.assertEqual([(c["text"], c["mode"]) for c in state.candidates],
+                         [("feat: add x", "full"), ("fix: y", "refine")])
+        # 整形で変わらなかった2件目は記録しない
+        self.assertEqual((self.dir / JOURNAL_NAME).read_text().count('"revise"'), 1)
+
+    def test_compare_selection_and_commit(self):
+        journal = SessionJournal(self.dir)
+        journal.begin(SESSION_COMPARE, "/repo", "t", [("a", "PA", {"context_name": "x"}, CONFIG),
+                                                       ("b", "PB", {"context_name": "y"}, CONFIG)])
+        list(journal.tap(deltas(["A"]), "a"))
+        list(journal.tap(deltas(["B"]), "b"))
+        journal.selected("b")
+        session = load_last_session(self.dir)
+        self.assertEqual((session.mode, session.selected, session.streams["a"].latest), (SESSION_COMPARE, "b", "A"))
+        self.assertEqual(session.load_prompt(self.dir, "b"), "PB")
+
+        journal.committed()
+        self.assertIsNone(load_last_session(self.dir))
+        journal.close()
+
+    def test_rotation_keeps_the_session_restorable(self):
+        journal = SessionJournal(self.dir, max_bytes=4000)
+        journal.begin(SESSION_SINGLE, "/repo", "t", [(STREAM_MAIN, "P", {}, CONFIG)])
+        texts = [f"token{i} " for i in range(2000)]
+        list(journal.tap(deltas(texts), STREAM_MAIN))
+        journal.close()
+
+        self.assertTrue((self.dir / ROTATED_NAME).exists())
+        # ローテーション直後のヘッダー（現在の状態のスナップショット）の分だけ上限を超えうる
+        self.assertLess((self.dir / JOURNAL_NAME).stat().st_size, 4000 + len("".join(texts)) + 1000)
+        session = load_last_session(self.dir)
+        self.assertEqual(session.streams[STREAM_MAIN].candidates[-1]["text"], "".join(texts))
+
+    def test_truncated_last_line_is_ignored(self):
+        journal = SessionJournal(self.dir)
+        journal.begin(SESSION_SINGLE, "/repo", "t", [(STREAM_MAIN, "P", {}, CONFIG)])
+        list(journal.tap(deltas(["ok"]), STREAM_MAIN))
+        journal.close()
+        with open(self.dir / JOURNAL_NAME, "a", encoding="utf-8") as f:
+            f.write('{"type": "delta", "id": "')
+        self.assertEqual(load_last_session(self.dir).streams[STREAM_MAIN].latest, "ok")
+
+    def test_killed_process_keeps_flushed_deltas(self):
+        script = textwrap.dedent(f"""
+            import os, time
+            from komitto.session import SessionJournal, FLUSH_INTERVAL
+            journal = SessionJournal({str(self.dir)!r})
+            journal.begin("single", "/repo", "t", [("main", "P", {{}}, {{}})])
+            journal.start("main")
+            for i in range(5):
+                journal.delta("main", f"part{{i}} ")
+                time.sleep(FLUSH_INTERVAL)
+            journal.delta("main", "tail")
+            os._exit(1)
+        """)
+        subprocess.run([sys.executable, "-c", script], check=False)
+        state = load_last_session(self.dir).streams[STREAM_MAIN]
+        self.assertTrue(state.generating)
+        self.assertTrue(state.text.startswith("part0 part1 part2 part3"))
+
+    def test_per_token_overhead_is_small(self):
+        texts = ["tok "] * 20000
+        start = time.perf_counter()
+        list(deltas(texts))
+        baseline = time.perf_counter() - start
+
+        journal = SessionJournal(self.dir, max_bytes=64 * 1024 * 1024)
+        journal.begin(SESSION_SINGLE, "/repo", "t", [(STREAM_MAIN, "P", {}, CONFIG)])
+        start = time.perf_counter()
+        list(journal.tap(deltas(texts), STREAM_MAIN))
+        journaled = time.perf_counter() - start
+        journal.close()
+        # 1トークンあたり数マイクロ秒（HTTP ストリームのトークン間隔は数ミリ秒）
+        self.assertLess((journaled - baseline) / len(texts), 50e-6)
+
+
+if __name__ == "__main__":
+    unittest.main()
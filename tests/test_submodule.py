@@ -0,0 +1,103 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from komitto import submodule
+from komitto.cache import Cache
+from komitto.git_utils import get_git_diff
+from komitto.prompt import build_prompt, split_diff
+from komitto.submodule import describe_submodules
+
+ENV = dict(os.environ, GIT_AUTHOR_NAME="a", GIT_AUTHOR_EMAIL="a@example.com",
+           GIT_COMMITTER_NAME="a", GIT_COMMITTER_EMAIL="a@example.com")
+
+
+def git(*args, cwd=None):
+    return subprocess.run(["git", "-c", "protocol.file.allow=always", *args], cwd=cwd, check=True,
+                          capture_output=True, text=True, env=ENV).stdout.strip()
+
+
+@unittest.skipIf(os.name == "nt", "uses a POSIX git setup")
+class TestSubmodules(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        root = Path(self.tmp.name)
+        self.libs = []
+        for name in ("liba", "libb"):
+            lib = root / name
+            lib.mkdir()
+            git("init", "-q", cwd=lib)
+            self.write_commit(lib, "core.c", "int x;\n", "initial")
+            self.libs.append(lib)
+
+        self.app = root / "app"
+        self.app.mkdir()
+        git("init", "-q", cwd=self.app)
+        for lib in self.libs:
+            git("submodule", "add", "-q", str(lib), f"deps/{lib.name}", cwd=self.app)
+        git("commit", "-qm", "add submodules", cwd=self.app)
+        os.chdir(self.app)
+        self.cache = Cache(root / "cache.sqlite3")
+
+    def tearDown(self):
+        self.cache.close()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def write_commit(self, repo, name, content, message):
+        Path(repo, name).write_text(content)
+        git("add", name, cwd=repo)
+        git("commit", "-qm", message, cwd=repo)
+
+    def bump(self, name, *messages):
+        checkout = self.app / "deps" / name
+        for i, message in enumerate(messages):
+            self.write_commit(checkout, f"f{i}.c", "x\n" * (i + 1), message)
+        git("add", f"deps/{name}")
+
+    def test_pointer_changes_become_submodule_elements(self):
+        old = git("rev-parse", "HEAD:deps/liba")
+        self.bump("liba", "feat: parse headers", "fix: off by one")
+        self.bump("libb", "docs: readme")
+
+        diff = get_git_diff()
+        prompt = build_prompt("SYSTEM", None, "", diff, cache=self.cache)
+        self.assertIn(f'<submodule path="deps/liba" old="{old[:12]}"', prompt)
+        self.assertIn('ahead="2" behind="0"', prompt)
+        self.assertIn("fix: off by one", prompt)
+        self.assertIn('<diffstat files="2" insertions="3" deletions="0">', prompt)
+        self.assertIn("+2 -0 f1.c", prompt)
+        self.assertIn("docs: readme", prompt)
+        self.assertNotIn("Subproject commit", prompt)
+
+        # 同じ (旧, 新) の組はサブモジュールの履歴をたどり直さない
+        with mock.patch.object(submodule, "collect_change") as collect:
+            self.assertEqual(build_prompt("SYSTEM", None, "", diff, cache=self.cache), prompt)
+        collect.assert_not_called()
+
+    def test_rewind_and_missing_objects(self):
+        checkout = self.app / "deps" / "liba"
+        old = git("rev-parse", "HEAD", cwd=checkout)
+        self.write_commit(checkout, "new.c", "y\n", "feat: newer")
+        git("add", "deps/liba")
+        git("commit", "-qm", "bump", cwd=self.app)
+        git("checkout", "-q", old, cwd=checkout)
+        git("add", "deps/liba")
+
+        fd = next(fd for fd in split_diff(get_git_diff()) if fd.path == "deps/liba")
+        self.assertTrue(fd.is_submodule)
+        changes = describe_submodules([(fd.path, fd.old_sha, fd.new_sha), ("deps/libb", "1" * 40, "2" * 40)],
+                                      str(self.app), self.cache)
+        self.assertEqual((changes["deps/liba"].ahead, changes["deps/liba"].behind), (0, 1))
+        self.assertEqual([line.split(" ", 1)[1] for line in changes["deps/liba"].removed], ["feat: newer"])
+        self.assertFalse(changes["deps/libb"].available)
+        # 取得できなかった組はキャッシュしない
+        self.assertEqual(self.cache.get_many(submodule.CACHE_NAMESPACE, [submodule.cache_key("1" * 40, "2" * 40)]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
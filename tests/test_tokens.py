@@ -0,0 +1,76 @@
+import time
+import unittest
+
+from komitto.prompt import SECTION_FILE, build_prompt, build_prompt_sections, split_diff
+from komitto.tokens import compaction_summaries, estimate_prompt, estimate_tokens, model_price, tokenizer_family
+
+DIFF = """diff --git big.py big.py
+index 1111111111111111111111111111111111111111..2222222222222222222222222222222222222222 100644
+--- big.py
++++ big.py
+@@ -0,0 +1,400 @@
+""" + "".join(f"+def handler_{i}(request):\n" for i in range(400)) + """diff --git small.py small.py
+index 3333333333333333333333333333333333333333..4444444444444444444444444444444444444444 100644
+--- small.py
++++ small.py
+@@ -1 +1 @@ def main():
+-    return 1
++    return 2
+"""
+
+CONFIG = {
+    "llm": {"provider": "openai", "model": "gpt-4o"},
+    "pricing": {"gpt-4o": {"input": 2.5, "output": 10.0}},
+}
+
+
+class TestEstimateTokens(unittest.TestCase):
+    def test_rough_counts(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("hello world"), 2)
+        # CJK text is about one token per character
+        self.assertEqual(estimate_tokens("日本語の説明"), 6)
+        prose = "The quick brown fox jumps over the lazy dog. " * 100
+        self.assertAlmostEqual(estimate_tokens(prose) / (len(prose) / 4), 1.0, delta=0.25)
+
+    def test_family_scale(self):
+        text = "def render(file_diff):\n    return file_diff.path\n" * 50
+        self.assertGreater(estimate_tokens(text, "anthropic"), estimate_tokens(text, "openai"))
+        self.assertEqual(tokenizer_family({"provider": "ollama"}), "llama")
+        self.assertEqual(tokenizer_family({"provider": "openai", "tokenizer": "gemini"}), "gemini")
+
+    def test_megabyte_prompt_is_fast(self):
+        text = DIFF * (1024 * 1024 // len(DIFF) + 1)
+        start = time.perf_counter()
+        estimate_tokens(text)
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+
+class TestPromptEstimate(unittest.TestCase):
+    def test_sections_match_prompt(self):
+        sections = build_prompt_sections("SYSTEM", "log", "context", DIFF)
+        self.assertEqual("\n".join(s.text for s in sections), build_prompt("SYSTEM", "log", "context", DIFF))
+        self.assertEqual([s.label for s in sections if s.kind == SECTION_FILE], ["big.py", "small.py"])
+
+    def test_price(self):
+        self.assertEqual(model_price(CONFIG), (2.5, 10.0))
+        self.assertEqual(model_price({"llm": {"provider": "ollama", "model": "qwen3"}}), (0.0, 0.0))
+        self.assertIsNone(model_price({"llm": {"provider": "openai", "model": "unknown"}}))
+
+    def test_compaction_fits_budget(self):
+        estimate = estimate_prompt(build_prompt_sections("SYSTEM", None, "", DIFF), CONFIG)
+        max_cost = estimate.cost / 3
+        summaries = compaction_summaries(split_diff(DIFF), estimate, max_cost)
+        self.assertEqual(list(summaries), ["big.py"])
+        self.assertIn("400", summaries["big.py"])
+
+        compacted = estimate_prompt(build_prompt_sections("SYSTEM", None, "", DIFF, summaries=summaries), CONFIG)
+        self.assertLessEqual(compacted.cost, max_cost)
+
+    def test_compaction_gives_up(self):
+        estimate = estimate_prompt(build_prompt_sections("SYSTEM", None, "", DIFF), CONFIG)
+        self.assertIsNone(compaction_summaries(split_diff(DIFF), estimate, 1e-9))
+
+
+if __name__ == "__main__":
+    unittest.main()